@@ -312,11 +312,13 @@ COMMAND_LINE_OPTIONS = {
     'backupDir':  ('',   '--backup-dir', 's', None, None, 'backup repository before start into dir'),
     'repair':     ('',   '--repair',     'b', False, None, 'repair repository before start (currently repairs broken indices)'),
     'resetIndex': ('',   '--reset-index','b', False, None, 're-create full-text index database and reset indexer to reindex from earliest version'),
+    'textindex':  ('',   '--textindex',  's', 'lucene', 'CHANDLERTEXTINDEX', 'full-text index to use, lucene or native; switching indexes rebuilds the new one in the background'),
     'mvcc':       ('',   '--mvcc',       'b', True, 'MVCC', 'run repository multi version concurrency control'),
     'nomvcc':     ('',   '--nomvcc',     'b', False, 'NOMVCC', 'run repository without multi version concurrency control'),
     'prune':      ('',   '--prune',      's', '10000', None, 'number of items in a view to prune to after each commit'),
     'version':    ('',   '--at',         's', None, None, 'version to open repository at'),
     'timezone':   ('',   '--tz',         's', None, None, 'timezone to initialize repository with if creating a new repository'),
+    'spans':      ('',   '--spans',      's', None, 'CHANDLERSPANS', 'time hot paths and write the timings to this file on exit, relative to the profile directory'),
     'prefs':      ('',   '--prefs',      's', 'chandler.prefs', None, 'path to prefs file that contains defaults for command line options, relative to profile directory'),
 }
 
@@ -634,10 +636,27 @@ def locateRepositoryDirectory(profileDir, options):
     return path
 
 
+def initSpans(options):
+    """
+    Enable the span profiler if requested and dump its report on exit.
+    """
+
+    from chandlerdb.util.Spans import profiler
+
+    if options.spans and not profiler.enabled:
+        import atexit
+
+        profiler.enabled = True
+        path = os.path.join(options.profileDir or '', options.spans)
+        atexit.register(profiler.dump, path)
+
+
 def initRepository(directory, options, allowSchemaView=False):
 
     from chandlerdb.persistence.DBRepository import DBRepository
 
+    initSpans(options)
+
     if options.uuids:
         input = file(options.uuids)
         loadUUIDs([UUID(uuid.strip()) for uuid in input if len(uuid) > 1])
@@ -658,6 +677,7 @@ def initRepository(directory, options, allowSchemaView=False):
              'exclusive': not options.nonexclusive,
              'memorylog': options.memorylog,
              'mvcc': options.mvcc and not options.nomvcc,
+             'textindex': options.textindex,
              'prune': int(options.prune),
              'logdir': options.logdir,
              'datadir': options.datadir,
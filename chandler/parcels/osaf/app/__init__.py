@@ -700,6 +700,14 @@ u"""Directions...
                 ),
                 autoView=False
             ),
+            webserver.Resource.update(parcel, "spansResource",
+                displayName=u'Hot Path Timings',
+                location=u"spans",
+                resourceClass=schema.importString(
+                    "osaf.servlets.spans.SpansResource"
+                ),
+                autoView=False
+            ),
         ]
     )
 
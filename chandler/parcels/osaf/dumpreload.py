@@ -17,7 +17,8 @@
 
 from __future__ import with_statement
 
-import logging, cPickle, sys, os, wx, tempfile
+import logging, cPickle, sys, os, wx, tempfile, time
+import struct, zlib, threading, Queue
 from osaf import sharing
 from osaf.sharing.eim import uri_registry, RecordClass
 from application import schema
@@ -92,7 +93,169 @@ class PickleSerializer(object):
             uri_registry[uri] = rtype
             return rtype
 
-def dump(rv, path, uuids=None, serializer=PickleSerializer,
+    @classmethod
+    def count(cls, input):
+        load = cls.loader(input)
+        i = 0
+        while load() is not None:
+            i += 1
+        return i
+
+
+class ChunkWriter(threading.Thread):
+    """ Pickles and compresses chunks of records on its own thread so that
+        serialization overlaps with the translator's export of the next
+        chunk. At most C{backlog} chunks are queued, bounding memory use. """
+
+    def __init__(self, output, serializer, backlog=4):
+        super(ChunkWriter, self).__init__(name="ChunkWriter")
+        self.setDaemon(True)
+
+        self.output = output
+        self.serializer = serializer
+        self.queue = Queue.Queue(backlog)
+        self.records = []
+        self.index = []
+        self.error = None
+
+        output.write(serializer.MAGIC)
+        self.start()
+
+    def run(self):
+        recordSerializer = self.serializer.recordSerializer
+        level = self.serializer.compressLevel
+        output = self.output
+
+        while True:
+            records = self.queue.get()
+            if records is None:
+                break
+            if self.error is not None:
+                continue   # keep draining so that the producer never blocks
+            try:
+                data = zlib.compress(recordSerializer.dumps(records), level)
+                self.index.append((output.tell(), len(records)))
+                output.write(struct.pack(self.serializer.HEADER,
+                                         len(records), len(data)))
+                output.write(data)
+            except Exception, e:
+                logger.exception("Error writing chunk")
+                self.error = e
+
+    def _put(self, records):
+        self.queue.put(records)
+        if self.error is not None:
+            raise self.error
+
+    def __call__(self, record):
+        if record is not None:
+            self.records.append(record)
+            if len(self.records) < self.serializer.chunkSize:
+                return
+
+        if self.records:
+            self._put(self.records)
+            self.records = []
+
+        if record is None:
+            self.close()
+            if self.error is not None:
+                raise self.error
+
+            # end of chunks, then the record index and its offset
+            output = self.output
+            output.write(struct.pack(self.serializer.HEADER, 0, 0))
+            offset = output.tell()
+            cPickle.dump(self.index, output, 2)
+            output.write(struct.pack(self.serializer.TRAILER, offset))
+
+    def close(self):
+        if self.isAlive():
+            self.queue.put(None)
+            self.join()
+
+
+class ChunkedSerializer(object):
+    """ Serializes to a header, followed by zlib compressed chunks of
+        C{chunkSize} pickled records each, followed by an index of the
+        offset and record count of every chunk.
+
+        Files written by L{PickleSerializer} are still loaded. """
+
+    MAGIC = "#chex-chunked 1\n"
+    HEADER = "!II"
+    TRAILER = "!Q"
+
+    recordSerializer = PickleSerializer
+    chunkSize = 1000
+    compressLevel = 6
+
+    @classmethod
+    def dumper(cls, output):
+        return ChunkWriter(output, cls)
+
+    @classmethod
+    def _isChunked(cls, input):
+        if input.read(len(cls.MAGIC)) == cls.MAGIC:
+            return True
+        input.seek(0)
+        return False
+
+    @classmethod
+    def loader(cls, input):
+        if not cls._isChunked(input):
+            return cls.recordSerializer.loader(input)
+
+        headerSize = struct.calcsize(cls.HEADER)
+        def iterRecords():
+            while True:
+                header = input.read(headerSize)
+                if len(header) < headerSize:
+                    raise EOFError, "truncated chunk header"
+                count, length = struct.unpack(cls.HEADER, header)
+                if count == 0:
+                    break
+                data = zlib.decompress(input.read(length))
+                for record in cls.recordSerializer.loads(data):
+                    yield record
+        records = iterRecords()
+
+        def load():
+            for record in records:
+                return record
+            return None
+
+        return load
+
+    @classmethod
+    def readIndex(cls, input):
+        """ Return the list of (offset, record count) of a chunked file's
+            chunks, or None if the file is not chunked """
+        if not cls._isChunked(input):
+            return None
+
+        trailerSize = struct.calcsize(cls.TRAILER)
+        input.seek(-trailerSize, 2)
+        offset, = struct.unpack(cls.TRAILER, input.read(trailerSize))
+        input.seek(offset)
+        return cPickle.load(input)
+
+    @classmethod
+    def count(cls, input):
+        index = cls.readIndex(input)
+        if index is None:
+            return cls.recordSerializer.count(input)
+        return sum(count for offset, count in index)
+
+
+def _rate(count, start):
+    elapsed = time.time() - start
+    if elapsed > 0:
+        return elapsed, count / elapsed
+    return elapsed, 0.0
+
+
+def dump(rv, path, uuids=None, serializer=ChunkedSerializer,
     activity=None, obfuscate=False):
     """
     Dumps EIM records to a file, file permissions 0600.
@@ -101,6 +264,7 @@ def dump(rv, path, uuids=None, serializer=PickleSerializer,
     if activity is not None:
         activity.started()
     translator = getTranslator()
+    start = time.time()
 
 
     trans = translator(rv)
@@ -144,36 +308,44 @@ def dump(rv, path, uuids=None, serializer=PickleSerializer,
     try:
         with os.fdopen(fd, 'wb') as output:
             dump = serializer.dumper(output)
-            count = len(aliases)
+            try:
+                count = len(aliases)
 
-            if activity is not None:
-                activity.update(msg=_(u"Exporting %(total)d items") % {'total':count}, totalWork=count)
-
-            recordCount = 0
-            for alias in aliases:
-                uuid = trans.getUUIDForAlias(alias)
-                item = rv.findUUID(uuid)
-                for record in trans.exportItem(item):
-                    recordCount += 1
-                    dump(record)
                 if activity is not None:
-                    activity.update(msg=_(u"Exported %(number)d records") % \
-                                    {'number':recordCount}, work=1)
-
-            if activity is not None:
-                activity.update(totalWork=None) # we don't know upcoming total work
+                    activity.update(msg=_(u"Exporting %(total)d items") % {'total':count}, totalWork=count)
+
+                recordCount = 0
+                for alias in aliases:
+                    uuid = trans.getUUIDForAlias(alias)
+                    item = rv.findUUID(uuid)
+                    for record in trans.exportItem(item):
+                        recordCount += 1
+                        dump(record)
+                    if activity is not None:
+                        activity.update(msg=_(u"Exported %(number)d records") % \
+                                        {'number':recordCount}, work=1)
 
-            for record in trans.finishExport():
                 if activity is not None:
-                    recordCount += 1
-                    activity.update(msg=_(u"Exporting additional record..."))
+                    activity.update(totalWork=None) # we don't know upcoming total work
 
-                dump(record)
+                for record in trans.finishExport():
+                    if activity is not None:
+                        recordCount += 1
+                        activity.update(msg=_(u"Exporting additional record..."))
 
-            dump(None)
-            del dump
+                    dump(record)
 
-        logger.info("Exported %d records from %d items", recordCount, count)
+                dump(None)
+            finally:
+                # stop the serializer's writer thread, if any, on error
+                close = getattr(dump, 'close', None)
+                if close is not None:
+                    close()
+                del dump
+
+        elapsed, rate = _rate(recordCount, start)
+        logger.info("Exported %d records from %d items in %.1f seconds (%.0f records/s)",
+                    recordCount, count, elapsed, rate)
         if activity is not None:
             activity.update(msg=_(u"Exported %(total)d records") % {'total':recordCount})
 
@@ -212,9 +384,10 @@ def dump(rv, path, uuids=None, serializer=PickleSerializer,
         raise
 
 
-def reload(rv, filename, serializer=PickleSerializer, activity=None,
-    testmode=False):
-    """ Loads EIM records from a file and applies them """
+def reload(rv, filename, serializer=ChunkedSerializer, activity=None,
+    testmode=False, commitEvery=1000):
+    """ Loads EIM records from a file and applies them, committing every
+        C{commitEvery} records """
 
     translator = getTranslator()
 
@@ -227,17 +400,13 @@ def reload(rv, filename, serializer=PickleSerializer, activity=None,
     if activity is not None:
         activity.update(totalWork=None, msg=_(u"Counting records..."))
         input = open(filename, "rb")
-        load = serializer.loader(input)
-        i = 0
-        while True:
-            record = load()
-            if not record:
-                break
-            i += 1
-        input.close()
-        activity.update(totalWork=i)
+        try:
+            activity.update(totalWork=serializer.count(input))
+        finally:
+            input.close()
 
 
+    start = time.time()
     trans = translator(rv)
     trans.startImport()
 
@@ -253,12 +422,14 @@ def reload(rv, filename, serializer=PickleSerializer, activity=None,
             i += 1
             if activity is not None:
                 activity.update(msg=_(u"Imported %(total)d records") % {'total':i}, work=1)
-            if i % 1000 == 0: # Commit every 1,000 records
+            if i % commitEvery == 0:
                 if activity is not None:
                     activity.update(msg=_(u"Saving..."))
                 rv.commit()
 
-        logger.info("Imported %d records", i)
+        elapsed, rate = _rate(i, start)
+        logger.info("Imported %d records in %.1f seconds (%.0f records/s)",
+                    i, elapsed, rate)
 
         del load
     finally:
@@ -327,21 +498,16 @@ def reload(rv, filename, serializer=PickleSerializer, activity=None,
         waitForDeferred(item.encryptPassword(pw, masterPassword=newMaster))
 
 
-def convertToTextFile(fromPath, toPath, serializer=PickleSerializer,
+def convertToTextFile(fromPath, toPath, serializer=ChunkedSerializer,
     activity=None):
 
     if activity is not None:
         activity.update(totalWork=None, msg=_(u"Counting records..."))
         input = open(fromPath, "rb")
-        load = serializer.loader(input)
-        i = 0
-        while True:
-            record = load()
-            if not record:
-                break
-            i += 1
-        input.close()
-        activity.update(totalWork=i)
+        try:
+            activity.update(totalWork=serializer.count(input))
+        finally:
+            input.close()
 
 
     input = open(fromPath, "rb")
@@ -20,6 +20,7 @@ import application.dialogs.RecurrenceDialog as RecurrenceDialog
 from osaf.pim import ContentItem, ContentCollection, isDead
 from osaf.usercollections import UserCollection
 from chandlerdb.item.Item import MissingClass
+from chandlerdb.util.Spans import profiler
 import wx
 import logging
 
@@ -860,7 +861,13 @@ class Block(schema.Item):
         if widget is not None:
             method = getattr (type (widget), 'wxSynchronizeWidget', None)
             if method is not None:
-                IgnoreSynchronizeWidget(True, method, widget)
+                # timed per widget class when the span profiler is enabled
+                name = 'synchronizeWidget.%s' % type (widget).__name__
+                profiler.enter (name)
+                try:
+                    IgnoreSynchronizeWidget(True, method, widget)
+                finally:
+                    profiler.exit (name)
 
     def getRootBlock(self):
         """
@@ -73,7 +73,9 @@ class DownloadVars(object):
         self.delList = []
 
         # The messages list contains a tuples:
-        # 0: Mail Request Tuple containing
+        # 0: The raw RFC822 text of the message, parsed
+        #    into a Mail Request by the MailWorker, or a
+        #    Mail Request Tuple containing
         #    0: headers dict decoded and converted to unicode
         #    1: body of the message ready for assigning to the
         #       ContentItem.body attribute or None
@@ -707,10 +709,13 @@ class AbstractDownloadClient(object):
         if __debug__:
             trace("_commitMail")
 
+        # The messages start being parsed in the background
+        # as soon as they are queued for the MailWorker
         self.mailWorker.queueRequest((mailworker.MAIL_REQUEST, 
                                       self,
                                       self.accountUUID,
-                                      self.vars.messages,
+                                      self.mailWorker.parseMessages(
+                                                       self.vars.messages),
                                       statusMessage,
                                       protocolArgs))
 
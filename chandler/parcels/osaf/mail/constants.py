@@ -108,6 +108,10 @@ DOWNLOAD_CHANDLER_MESSAGES = ChoiceFormat(_(u"1#%(accountName)s: %(numberTotal)s
 #
 DOWNLOAD_START_MESSAGES = ChoiceFormat(_(u"1#%(accountName)s: Downloading %(numberOfMessages)s message...|1<%(accountName)s: Downloading %(numberOfMessages)s messages..."))
 
+# Used when the messages queued while offline are sent
+# over a single SMTP session
+UPLOAD_START_MESSAGES = ChoiceFormat(_(u"1#%(accountName)s: Sending %(numberOfMessages)s message...|1<%(accountName)s: Sending %(numberOfMessages)s messages..."))
+
 POP_SEARCH_STATUS = _(u"%(accountName)s: Searching %(start)s - %(end)s of %(total)s messages...")
 
 IMAP_SEARCH_STATUS = _(u"%(accountName)s: Searching %(start)s - %(end)s of %(total)s messages in your '%(folderDisplayName)s'...")
@@ -134,10 +138,21 @@ VERBOSE = False
 # non-text attachments.
 IGNORE_ATTACHMENTS = True
 
+# The number of bytes of an attachment's encoded
+# payload decoded and written to its Lob at a time.
+ATTACHMENT_CHUNK_SIZE = 65536
+
 WAIT_FOR_COMMIT = False
 NOOP_INTERVAL = 10
 
 MAX_COMMIT = 500
+
+# The number of processes parsing downloaded
+# messages for the MailWorker. The processes are
+# forked when the Mail Service starts. None uses
+# one less than the number of processors and 0
+# parses on the MailWorker thread instead.
+PARSE_PROCESSES = 0
 MAILWORKER_PRUNE_SIZE = MAILSERVICE_PRUNE_SIZE = 500
 
 # This flag will signal whether to print
@@ -159,6 +174,23 @@ DEBUG_CLIENT_SERVER = 0
 # include in an IMAP search for Chandler Headers.
 MAX_IMAP_SEARCH_NUM = 350
 
+# The number of UID FETCH commands for message
+# sets kept queued on the IMAP connection so that
+# the server always has the next request to answer.
+IMAP_FETCH_WINDOW = 2
+
+# The bounds on the number of messages requested
+# in a single UID FETCH. The number adapts between
+# these to keep each fetch close to IMAP_FETCH_SECONDS.
+IMAP_FETCH_MIN = 5
+IMAP_FETCH_MAX = 250
+IMAP_FETCH_SECONDS = 2.0
+
+# The maximum number of message bodies left on
+# the server by a headers only download that are
+# fetched per folder on each sync.
+IMAP_BODY_PREFETCH = 500
+
 
 # The maximum number of message UID's to
 # scan on a POP server for Chandler Headers
@@ -13,6 +13,10 @@
 #   limitations under the License.
 
 
+from collections import deque
+from time import time
+import email
+
 #twisted imports
 import twisted.internet.reactor as reactor
 import twisted.internet.defer as defer
@@ -20,16 +24,16 @@ import twisted.mail.imap4 as imap4
 
 #Chandler imports
 from osaf.pim.mail import IMAPAccount
+from chandlerdb.util.RangeSet import RangeSet
 
 #Chandler Mail Service imports
 import errors
 import constants
 import base
 from utils import *
-import message
 import mailworker
 
-__all__ = ['IMAPClient']
+__all__ = ['IMAPClient', 'FetchBatchSize', 'getFetchedMessage']
 
 """
     TODO:
@@ -75,6 +79,22 @@ class FolderVars(base.DownloadVars):
         # method at the end of a search.
         self.lastSearchUID = 0
 
+        # The C{RangeSet} of IMAP UIDs of the folder
+        # that need no downloading, read from the
+        # IMAPFolder.seenUIDs attribute, the ranges
+        # of UIDs asked about from the server, the
+        # last one ending with None for '*' when the
+        # server did not return UIDNEXT, the highest
+        # UID known to be in use in the folder and
+        # the UIDs of the messages found to download.
+        # Once the folder is processed, the ranges
+        # asked about less the UIDs to download are
+        # commited to IMAPFolder.seenUIDs.
+        self.seenUIDs    = None
+        self.queriedUIDs = []
+        self.topUID      = 0
+        self.pendingUIDs = []
+
         # The index position of the
         # IMAP folder in the IMAPAccount.folders
         # sequence.
@@ -89,6 +109,88 @@ class FolderVars(base.DownloadVars):
         # and should be downloaded.
         self.foundUIDs  = []
 
+        # The number of messages of the current
+        # commit set not yet requested from the
+        # server, the number of UID FETCH requests
+        # awaiting a response and the time the last
+        # batch of messages arrived.
+        self.numToFetch  = 0
+        self.numFetching = 0
+        self.lastFetched = 0
+
+        # Whether only the headers of new messages
+        # are downloaded, whether the bodies left
+        # on the server by previous headers only
+        # downloads have been looked for yet and the
+        # UIDs of those bodies still to download.
+        self.headersOnly   = False
+        self.bodiesChecked = False
+        self.bodyUIDs      = None
+
+class FetchBatchSize(object):
+    """
+       Adapts the number of messages requested in
+       a single IMAP UID FETCH to the download rate
+       observed so that each fetch takes about
+       C{seconds}: small messages or a fast server
+       grow the batches, large messages or a slow
+       server shrink them.
+    """
+
+    def __init__(self, minimum=constants.IMAP_FETCH_MIN,
+                 maximum=constants.IMAP_FETCH_MAX,
+                 seconds=constants.IMAP_FETCH_SECONDS):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.seconds = seconds
+        self.size = minimum
+
+    def update(self, count, duration):
+        """
+           Records that C{count} messages were
+           downloaded in C{duration} seconds.
+        """
+        target = count / max(duration, 0.001) * self.seconds
+
+        # Move half way towards the target but
+        # never more than double at a time
+        size = min(int((self.size + target) / 2), self.size * 2)
+
+        self.size = max(self.minimum, min(self.maximum, size))
+
+
+def getFetchedMessage(fetchItems):
+    """
+       Returns a tuple containing the UID and
+       the RFC822 text of a message from the parsed
+       items of its UID FETCH BODY.PEEK[] response or
+       None if the response did not contain both.
+
+       The order of the items varies by server:
+           Courier IMAP: UID n BODY[] text
+           Microsoft Exchange: BODY[] text UID n
+    """
+    uid = text = None
+    i = 0
+
+    while i < len(fetchItems) - 1:
+        name = str(fetchItems[i]).upper()
+
+        if name == 'BODY' and i + 2 < len(fetchItems):
+            # BODY is followed by its section and the text
+            text = fetchItems[i + 2]
+            i += 3
+        else:
+            if name == 'UID':
+                uid = int(fetchItems[i + 1])
+            i += 2
+
+    if uid is None or text is None:
+        return None
+
+    return uid, text
+
+
 class _TwistedIMAP4Client(imap4.IMAP4Client):
     """
     Overrides C{imap4.IMAP4Client} to add Chandler specific functionality
@@ -264,6 +366,10 @@ class IMAPClient(base.AbstractDownloadClient):
     clientType   = "IMAPClient"
     factoryType  = IMAPClientFactory
     defaultPort  = 143
+
+    # The number of messages per UID FETCH, adapted
+    # to the download rate over the life of the client
+    fetchSize = None
     
     def createChandlerFolders(self, callback, reconnect):
         if __debug__:
@@ -683,27 +789,33 @@ class IMAPClient(base.AbstractDownloadClient):
         if __debug__:
             trace("_getNextFolder")
 
-        if self.vars.lastSearchUID:
-            # If a last search uid was 
-            # set for the folder then
-            # save this information on the 
-            # IMAPFolder item.
-            # We only want to commit the last search
-            # uid once all searched mail has been 
-            # processed. The last search uid differs
-            # from lastUID in that the search uid may
-            # point to a mail message which was never
-            # downloaded since it did not meet the 
-            # search criteria. It is important to delay
-            # saving of this search uid till the last 
-            # possible moment since once commited no
-            # mail will be search lower than this uid.
-            # This fixes the case where the highest search
-            # uid was getting commited but an error or
-            # shutdown happened before the action was 
+        if not self.vars.bodiesChecked and self._fetchPendingBodies():
+            # Once the bodies have been downloaded
+            # _getNextFolder is called again
+            return None
+
+        if self.vars.queriedUIDs:
+            # Save the UIDs asked about from the server
+            # that are not being downloaded on the
+            # IMAPFolder item: messages that did not
+            # meet the search criteria, that are flagged
+            # \Deleted or that are no longer on the server.
+            # Since IMAP UIDs are never reused, they are
+            # not asked about again. The UIDs of the
+            # messages downloaded are saved along with
+            # the messages by the MailWorker.
+            # It is important to delay saving of these
+            # uids till the last possible moment since
+            # once commited they will not be searched
+            # again. This fixes the case where the highest
+            # search uid was getting commited but an error
+            # or shutdown happened before the action was
             # completed.
-            imapTuple = (self.vars.folderItem.itsUUID,
-                         self.vars.lastSearchUID + 1)
+            lastSearchUID = self.vars.lastSearchUID and \
+                            self.vars.lastSearchUID + 1 or None
+
+            imapTuple = (self.vars.folderItem.itsUUID, lastSearchUID,
+                         self._getCheckedUIDs())
 
             self.mailWorker.queueRequest((mailworker.UID_REQUEST, self,
                                          self.accountUUID, imapTuple))
@@ -789,7 +901,29 @@ class IMAPClient(base.AbstractDownloadClient):
         if not self.vars.lastUID > 0:
            self.vars.lastUID = 1
 
-        msgSet = imap4.MessageSet(self.vars.lastUID, None)
+        # Only ask the server about the UIDs that were
+        # never seen: the gaps left by previous syncs
+        # and the UIDs above the highest one seen.
+        seen = self.vars.seenUIDs = self.vars.folderItem.getSeenUIDs()
+
+        if msgs.get('UIDNEXT'):
+            self.vars.topUID = int(msgs['UIDNEXT']) - 1
+            queried = seen.unselectedRanges(1, self.vars.topUID)
+
+        else:
+            last = seen.ranges and seen.ranges[-1][1] or 0
+            queried = seen.unselectedRanges(1, last)
+            queried.append((last + 1, None))
+
+        if not queried:
+            return self._getNextFolder()
+
+        self.vars.queriedUIDs = queried
+
+        msgSet = imap4.MessageSet()
+
+        for first, last in queried:
+            msgSet.add(first, last)
 
         if self.vars.folderItem.folderType == "CHANDLER_HEADERS":
             return self.proto.fetchUID(msgSet, uid=1
@@ -804,29 +938,29 @@ class IMAPClient(base.AbstractDownloadClient):
         if __debug__:
             trace("_searchForChandlerHeaders")
 
-        for uidDict in msgs.values():
-           uid = int(uidDict['UID'])
-
-           if uid >= self.vars.lastUID:
-               # Microsoft Exchange Server returnes UID's
-               # less than the value in self.vars.lastUID.
-               # This violates RFC 3501 and results in
-               # Chandler messages being re-downloaded on
-               # each sync.
-               #
-               # Exchange Example:
-               #     >>> C: 0004 UID FETCH 3:* (UID)
-               #     >>> S: * 2 FETCH (UID 2)
-               self.vars.searchUIDs.append(uid)
-
-        # Sort the uids since the ordering returned from the
-        # dict may not be sequential
-        self.vars.searchUIDs.sort()
+        uids = [int(uidDict['UID']) for uidDict in msgs.itervalues()]
+
+        if uids:
+            self.vars.topUID = max(self.vars.topUID, max(uids))
+
+        # Microsoft Exchange Server returnes UID's
+        # outside of the requested set. This violates
+        # RFC 3501 and results in Chandler messages
+        # being re-downloaded on each sync, so only
+        # the uids never seen are searched.
+        #
+        # Exchange Example:
+        #     >>> C: 0004 UID FETCH 3:* (UID)
+        #     >>> S: * 2 FETCH (UID 2)
+        #
+        # The uids are returned sorted since the ordering
+        # returned from the dict may not be sequential
+        self.vars.searchUIDs = self.vars.seenUIDs.unselectedIndexes(uids)
 
         size = len(self.vars.searchUIDs)
 
         if size == 0:
-            # There are no uids greater than the lastUID so
+            # There are no uids that were never seen so
             # scan the next folder
             return self._getNextFolder()
 
@@ -862,6 +996,25 @@ class IMAPClient(base.AbstractDownloadClient):
 
         return None
 
+    def _getCheckedUIDs(self):
+        # Return the ranges of UIDs asked about from the
+        # server that were not found to download, bounded
+        # by the highest UID known to be in use.
+        checked = RangeSet()
+        top = self.vars.topUID
+
+        for first, last in self.vars.queriedUIDs:
+            if last is None or last > top:
+                last = top
+
+            if first <= last:
+                checked.selectRange((first, last))
+
+        for uid in self.vars.pendingUIDs:
+            checked.unSelectRange(uid)
+
+        return checked.ranges
+
     def _printSearchNum(self, start, end, total):
         if self.statusMessages:
             setStatusMessage(constants.IMAP_SEARCH_STATUS %
@@ -964,37 +1117,48 @@ class IMAPClient(base.AbstractDownloadClient):
         if fromSearch:
             # If this method was called as the
             # result of a search for Chandler
-            # Headers then the lastUID will
-            # be the highest UID of all messages
-            # searched and the delete flag will not
+            # Headers then the message UIDs were
+            # already checked against the seen UIDs
+            # and the delete flag will not
             # be set because the query results exclude
-            # deleted messages. In this case don't compare the
-            # message UID to the lastUID and don't
+            # deleted messages. In this case don't check
+            # the message UID against the seen UIDs and don't
             # check if the message has the \Deleted flag set.
             for message in msgs.itervalues():
                 self.vars.pending.append([int(message['UID']),
                                           message['FLAGS']])
 
         else:
-            lastUID = self.vars.lastUID
+            seen = self.vars.seenUIDs
 
             for message in msgs.itervalues():
                 uid = int(message['UID'])
 
-                if uid < lastUID:
-                    # If the UID is less than the lastUID
+                if uid > self.vars.topUID:
+                    self.vars.topUID = uid
+
+                if seen.isSelected(uid):
+                    # If the UID was already seen
                     # then skip the message
                     continue
 
                 if not "\\Deleted" in message['FLAGS']:
                     self.vars.pending.append([uid, message['FLAGS']])
 
+        # The UIDs of messages left on the server
+        # because of downloadMax are not seen either
+        self.vars.pendingUIDs = [uid for uid, flags in self.vars.pending]
+
 
         self.vars.totalToDownload = len(self.vars.pending)
 
         if self.vars.totalToDownload == 0:
             return self._getNextFolder()
 
+        folder = self.vars.folderItem
+        self.vars.headersOnly = folder.headersOnly and \
+                                folder.folderType == "MAIL"
+
         max = self.vars.folderItem.downloadMax
         downloaded = self.vars.folderItem.downloaded
 
@@ -1010,6 +1174,10 @@ class IMAPClient(base.AbstractDownloadClient):
             self.vars.pending = self.vars.pending[:max - downloaded]
             self.vars.totalToDownload = len(self.vars.pending)
 
+        # Messages are taken off the front of the
+        # pending queue in batches
+        self.vars.pending = deque(self.vars.pending)
+
         if self.statusMessages:
             # This is a PyICU.ChoiceFormat class
             txt = constants.DOWNLOAD_START_MESSAGES.format(
@@ -1029,6 +1197,12 @@ class IMAPClient(base.AbstractDownloadClient):
         for n messages up to the dynamically calculated commit number
         fetch the mail from the IMAP server. If no message pending
         calls actionCompleted() to clean up client resources.
+
+        The messages are requested in batches with one
+        UID FETCH per message set. Up to IMAP_FETCH_WINDOW
+        batches are queued on the connection at once so
+        that the server does not wait on the client between
+        batches.
         """
         if __debug__:
             trace("_getNextMessageSet")
@@ -1046,83 +1220,148 @@ class IMAPClient(base.AbstractDownloadClient):
         if self.vars.numToDownload > commitNumber:
             self.vars.numToDownload = commitNumber
 
-        m = self.vars.pending.pop(0)
+        if self.fetchSize is None:
+            self.fetchSize = FetchBatchSize()
 
-        # Set peek=True (RFC3501 BODY.PEEK) to
-        # prevent the IMAP server from marking
-        # messages as \Seen.
-        self.proto.fetchSpecific(str(m[0]), uid=True, peek=True
-                      ).addCallback(self._fetchMessage, m
-                      ).addErrback(self.catchErrors)
+        # The number of messages of this commit
+        # set not yet requested from the server
+        self.vars.numToFetch = self.vars.numToDownload
+        self.vars.lastFetched = time()
+
+        for i in xrange(constants.IMAP_FETCH_WINDOW):
+            if not self._fetchNextBatch():
+                break
 
         # Returning None here instead of the deferred prevents
         # deferreds from over flowing the stack and causing a
         # core dump.
         return None
 
+    def _fetchNextBatch(self):
+        if __debug__:
+            trace("_fetchNextBatch")
+
+        num = min(self.fetchSize.size, self.vars.numToFetch)
+
+        if num == 0:
+            return False
+
+        pending = self.vars.pending
+        batch = [pending.popleft() for i in xrange(num)]
+        self.vars.numToFetch -= num
+
+        msgSet = imap4.MessageSet()
+
+        for m in batch:
+            msgSet.add(m[0])
+
+        # Set peek=True (RFC3501 BODY.PEEK) to
+        # prevent the IMAP server from marking
+        # messages as \Seen.
+        if self.vars.headersOnly:
+            d = self.proto.fetchSpecific(msgSet, uid=True, peek=True,
+                                         headerType='HEADER')
+        else:
+            d = self.proto.fetchSpecific(msgSet, uid=True, peek=True)
+
+        d.addCallback(self._fetchMessages, batch, time())
+        d.addErrback(self.catchErrors)
+
+        self.vars.numFetching += 1
+
+        return True
 
-    def _fetchMessage(self, msgs, curMessage):
+    def _fetchMessages(self, msgs, batch, requested, full=False):
         if __debug__:
-            trace("_fetchMessage")
+            trace("_fetchMessages")
+
+        self.vars.numFetching -= 1
 
         if self.cancel:
-            return self._actionCompleted()
+            # Wait for the other queued fetches
+            # before disconnecting
+            if self.vars.numFetching == 0:
+                return self._actionCompleted()
 
-        msg = msgs.keys()[0]
+            return None
 
-        #Check if the uid of the message is greater than
-        #last message fetched
-        if curMessage[0] > self.vars.lastUID:
-            self.vars.lastUID = curMessage[0]
+        # The time the server spent on this batch
+        # starts when it was requested or, if queued
+        # behind another batch, when that one arrived.
+        now = time()
+        self.fetchSize.update(len(batch),
+                              now - max(requested, self.vars.lastFetched))
+        self.vars.lastFetched = now
 
+        fetched = {}
 
-        # Store in a local variable the returned
-        # server data in the dict for
-        # quicker look up and easy reference.
-        mArray = msgs[msg][0]
+        for fetchItems in msgs.itervalues():
+            # Store in a local variable the returned
+            # server data in the dict for
+            # quicker look up and easy reference.
+            res = getFetchedMessage(fetchItems[0])
 
-        if str(mArray[3]).upper() == 'UID':
-            # The UID information was returned
-            # by the server *after* the RFC822 message.
-            # Example: Microsoft Exchange IMAP Server
-            msg = mArray[2]
-        else:
-            # The UID information was returned
-            # by the server *before* the RFC822 message.
-            # Example: Courier IMAP Server
-            msg = mArray[4]
+            if res is not None:
+                fetched[res[0]] = res[1]
+
+        # The messages with Chandler headers are
+        # converted from their EIMML or ICS attachment
+        # so they are downloaded again in full when
+        # only their headers were downloaded
+        refetch = []
+
+        for m in batch:
+            uid = m[0]
 
-        self.vars.messages.append(
+            #Check if the uid of the message is greater than
+            #last message fetched
+            if uid > self.vars.lastUID:
+                self.vars.lastUID = uid
+
+            msg = fetched.get(uid)
+
+            if msg is not None and self.vars.headersOnly and not full and \
+               hasChandlerHeaders(email.message_from_string(msg)):
+                refetch.append(m)
+                continue
+
+            if msg is not None:
+                self.vars.messages.append(
                      # Tuple containing
-                     #     0: Mail Request
+                     #     0: RFC822 text parsed by the MailWorker
                      #     1: IMAP UID of message
-                     (message.previewQuickParse(msg), curMessage[0])
+                     (msg, uid)
                 )
 
-        # this value is used to determine
-        # when to post a MAIL_REQUEST to
-        # the MailWorker.
-        self.vars.numDownloaded += 1
-
-        # This value is used to calculate the
-        # commit number
-        self.totalDownloaded += 1
-
-        #XXX figure out what to do here
-        #if self.vars.folderItem.deleteOnDownload:
-        #    # If the user elects to delete mail
-        #    # from the IMAP Server that has been
-        #    # downloaded to Chandler from this
-        #    # IMAP folder then add the message UID
-        #    # to the delete list. The \\Deleted flag
-        #    # flag will be added to the message on the
-        #    # IMAP Server after the corresponding MailStamp
-        #    # has been committed to the Repository.
-        #    self.vars.delList.append(curMessage[0])
+            # A message missing from the response was
+            # expunged since the flags were fetched.
+            # It still counts towards the commit set.
+
+            # this value is used to determine
+            # when to post a MAIL_REQUEST to
+            # the MailWorker.
+            self.vars.numDownloaded += 1
+
+            # This value is used to calculate the
+            # commit number
+            self.totalDownloaded += 1
+
+        if refetch:
+            msgSet = imap4.MessageSet()
+
+            for m in refetch:
+                msgSet.add(m[0])
+
+            d = self.proto.fetchSpecific(msgSet, uid=True, peek=True)
+            d.addCallback(self._fetchMessages, refetch, time(), True)
+            d.addErrback(self.catchErrors)
+
+            self.vars.numFetching += 1
 
         if self.vars.numDownloaded == self.vars.numToDownload:
             imapFolderInfo = (self.vars.folderItem.itsUUID, 
-                              self.vars.lastUID + 1)
+                              self.vars.lastUID + 1,
+                              self.vars.headersOnly)
 
             args = self._getStatusStats()
             args["folderDisplayName"] = self.vars.folderItem.displayName
@@ -1136,21 +1375,107 @@ class IMAPClient(base.AbstractDownloadClient):
             # the self.vars.messages queue
             self.vars.totalDownloaded = args["end"]
         else:
-            m = self.vars.pending.pop(0)
-
-            # Set peek=True (RFC3501 BODY.PEEK) to
-            # prevent the IMAP server from marking
-            # messages as \Seen.
-            d = self.proto.fetchSpecific(str(m[0]), uid=True, peek=True)
-
-            d.addCallback(self._fetchMessage, m)
-            d.addErrback(self.catchErrors)
+            # Keep the window of queued fetches full
+            self._fetchNextBatch()
 
         # Returning None here instead of the Deferred prevents
         # deferreds from over flowing the stack and causing a
         # core dump.
         return None
 
+    def _fetchPendingBodies(self):
+        """
+        Starts downloading the bodies of messages
+        whose headers only were downloaded by
+        previous syncs of the current folder.
+
+        Returns False if there are none.
+        """
+        if __debug__:
+            trace("_fetchPendingBodies")
+
+        self.vars.bodiesChecked = True
+
+        # Pick up the pending bodies
+        # committed by the MailWorker
+        self.view.refresh()
+
+        pendingBodies = self.vars.folderItem.pendingBodies
+
+        if not pendingBodies:
+            return False
+
+        uids = [int(uid) for uid in pendingBodies.iterkeys()]
+        uids.sort()
+
+        self.vars.bodyUIDs = deque(uids[:constants.IMAP_BODY_PREFETCH])
+
+        if self.fetchSize is None:
+            self.fetchSize = FetchBatchSize()
+
+        self._fetchNextBodies()
+
+        return True
+
+    def _fetchNextBodies(self):
+        if __debug__:
+            trace("_fetchNextBodies")
+
+        if self.cancel:
+            return self._actionCompleted()
+
+        bodyUIDs = self.vars.bodyUIDs
+        num = min(self.fetchSize.size, len(bodyUIDs))
+
+        if num == 0:
+            return self._getNextFolder()
+
+        batch = [bodyUIDs.popleft() for i in xrange(num)]
+
+        msgSet = imap4.MessageSet()
+
+        for uid in batch:
+            msgSet.add(uid)
+
+        d = self.proto.fetchSpecific(msgSet, uid=True, peek=True)
+
+        d.addCallback(self._fetchBodies, batch, time())
+        d.addErrback(self.catchErrors)
+
+        return None
+
+    def _fetchBodies(self, msgs, batch, requested):
+        if __debug__:
+            trace("_fetchBodies")
+
+        if self.cancel:
+            return self._actionCompleted()
+
+        self.fetchSize.update(len(batch), time() - requested)
+
+        fetched = {}
+
+        for fetchItems in msgs.itervalues():
+            res = getFetchedMessage(fetchItems[0])
+
+            if res is not None:
+                fetched[res[0]] = res[1]
+
+        bodies = [(fetched[uid], uid) for uid in batch if uid in fetched]
+
+        # The messages expunged from the server are
+        # passed on so that the MailWorker stops
+        # waiting for their body
+        expunged = [uid for uid in batch if uid not in fetched]
+
+        self.mailWorker.queueRequest((mailworker.BODY_REQUEST, self,
+                                      self.accountUUID,
+                                      self.mailWorker.parseMessages(bodies),
+                                      self.vars.folderItem.itsUUID,
+                                      expunged))
+
+        return self._fetchNextBodies()
+
     def nextAction(self):
         if __debug__:
             trace("nextAction")
@@ -18,10 +18,17 @@ from chandlerdb.persistence.RepositoryView import otherViewWins
 import twisted.internet.reactor as reactor
 import logging
 
+try:
+    from multiprocessing import Pool, TimeoutError, cpu_count
+except ImportError:     # python 2.5
+    Pool = None
+
 #Chandler mail imports
 import constants
-from utils import setStatusMessage, trace, alert, alertMailError
+from utils import setStatusMessage, trace, alert, alertMailError, \
+                  hasChandlerHeaders
 import message
+from osaf.pim import isDead, MailStamp
 
 """
 NEXT:
@@ -61,6 +68,7 @@ Performance Profiling Post-1.0:
 """
 
 MAIL_REQUEST = "MAIL"
+BODY_REQUEST = "BODY"
 DONE_REQUEST = "DONE"
 ERROR_REQUEST = "ERROR"
 UID_REQUEST = "UID"
@@ -72,6 +80,7 @@ COMMIT_REQUEST = "COMMIT"
 
 COMMANDS = {
     MAIL_REQUEST: "processMail",
+    BODY_REQUEST: "processBodies",
     UID_REQUEST: "processUIDS",
     DONE_REQUEST: "processDone",
     ERROR_REQUEST: "processError",
@@ -79,6 +88,86 @@ COMMANDS = {
     COMMIT_REQUEST: "processCommit",
 }
 
+def parseMessage(text):
+    """
+    Parses the RFC822 text of a downloaded message into a
+    Mail Request tuple or returns None if the message can
+    not be parsed. This runs in the parsing processes.
+    """
+    try:
+        return message.previewQuickParse(text)
+    except Exception:
+        return None
+
+class ParsedMessages(object):
+    """
+    The Mail Requests of downloaded messages.
+
+    Messages still in RFC822 text form are parsed by a
+    pool of processes as soon as the instance is created
+    or, without a pool, by the MailWorker thread when
+    the requests are needed. Only the conversion of the
+    Mail Requests to Items happens in the MailWorker.
+    """
+
+    # The number of seconds between checks for
+    # the MailWorker shutting down while waiting
+    # for the pool to parse the messages
+    WAIT_INTERVAL = 0.5
+
+    def __init__(self, messages, pool=None, processes=1, worker=None):
+        # A list of tuples containing:
+        #    0: RFC822 text or Mail Request
+        #    1: Protocol specific UID
+        self.messages = messages
+        self.worker = worker
+        self.result = None
+
+        if pool is not None:
+            texts = [m[0] for m in messages if isinstance(m[0], str)]
+
+            if texts:
+                chunksize = max(len(texts) / (processes * 4), 1)
+                self.result = pool.map_async(parseMessage, texts,
+                                             chunksize)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def get(self):
+        """
+        Returns a list of tuples containing the Mail Request
+        or None if the message could not be parsed and the
+        Protocol specific UID of each message.
+
+        Returns None if the MailWorker starts shutting
+        down while the messages are being parsed.
+        """
+        if self.result is not None:
+            while True:
+                try:
+                    parsed = iter(self.result.get(self.WAIT_INTERVAL))
+                    break
+                except TimeoutError:
+                    if self.worker is not None and \
+                       self.worker.shuttingDown:
+                        return None
+        else:
+            parsed = None
+
+        mRequests = []
+
+        for mRequest, uid in self.messages:
+            if isinstance(mRequest, str):
+                if parsed is not None:
+                    mRequest = parsed.next()
+                else:
+                    mRequest = parseMessage(mRequest)
+
+            mRequests.append((mRequest, uid))
+
+        return mRequests
+
 class DownloadTracker(object):
     def __init__(self):
         self.totalDownloaded = 0
@@ -96,11 +185,48 @@ class MailWorker(RepositoryWorker):
         super(MailWorker, self).__init__(name, repository)
         self.CACHE = {}
         self.shuttingDown = False
+        self.parsePool = None
+        self.parseProcesses = 0
+
+    def start(self):
+        # The parsing processes are forked once, before
+        # the MailWorker and the Mail Clients start
+        processes = constants.PARSE_PROCESSES
+
+        if Pool is not None and processes != 0:
+            if processes is None:
+                processes = max(cpu_count() - 1, 1)
+
+            self.parsePool = Pool(processes)
+            self.parseProcesses = processes
+
+        super(MailWorker, self).start()
 
     def shutdown(self):
         self.shuttingDown = True
+
+        # A MailWorker waiting on messages being parsed
+        # returns within ParsedMessages.WAIT_INTERVAL
         self.terminate()
 
+        if self.parsePool is not None:
+            self.parsePool.terminate()
+            self.parsePool = None
+
+    def parseMessages(self, messages):
+        """
+        Called by the Mail Clients in the Twisted thread.
+        Starts parsing downloaded messages in the background
+        and returns the L{ParsedMessages} to queue for the
+        MailWorker.
+        """
+        pool = self.parsePool
+
+        if self.shuttingDown:
+            pool = None
+
+        return ParsedMessages(messages, pool, self.parseProcesses, self)
+
     def isEmpty(self):
         return self._requests.empty()
 
@@ -160,7 +286,7 @@ class MailWorker(RepositoryWorker):
         #    0: cmd
         #    1: Mail Client
         #    2: accountUUID
-        #    3: a tuple containing:
+        #    3: a ParsedMessages instance for a list of tuples containing:
         #        0: message requests
         #        1: any protocol specific server UID info
         #    4. Status bar message to display on commit
@@ -168,6 +294,7 @@ class MailWorker(RepositoryWorker):
         #        IMAP = tuple containing
         #            0: imap folder UID
         #            1: last UID of downloaded messages
+        #            2: whether only headers were downloaded
         #
         #        Pop = None
         #
@@ -180,7 +307,11 @@ class MailWorker(RepositoryWorker):
 
         dt = self.getDownloadTracker(account)
 
-        mRequests = request[3]
+        # Wait for the messages to be parsed
+        mRequests = request[3].get()
+
+        if mRequests is None:
+            return None
 
         # The status bar message to display on commit 
         msg = request[4]
@@ -188,9 +319,18 @@ class MailWorker(RepositoryWorker):
         numToProcess = len(mRequests)
         numError = 0
 
+        # The UIDs of the messages converted to Items
+        # or deliberately ignored. The UIDs of messages
+        # that failed to be converted are not seen so
+        # they are downloaded again by the next sync.
+        processedUIDs = []
+
+        headersOnly = False
+
         if protocol == "IMAP":
             # This is the IMAPFolder item
             args = view.findUUID(request[5][0])
+            headersOnly = request[5][2]
 
         elif protocol == "POP":
             args = None
@@ -204,8 +344,20 @@ class MailWorker(RepositoryWorker):
                         pass
                     return None
 
-                self.processMessage(view, protocol, client, account,
-                                    mRequest, dt, args)
+                statusCode, repMessage = self.processMessage(view, protocol,
+                                                             client, account,
+                                                             mRequest, dt, args)
+
+                if statusCode != -1:
+                    processedUIDs.append(mRequest[1])
+
+                if headersOnly and repMessage is not None and \
+                   not hasChandlerHeaders(mRequest[0][0]):
+                    # The body is downloaded by a later sync.
+                    # Messages with Chandler headers were
+                    # downloaded in full.
+                    args.pendingBodies[str(mRequest[1])] = \
+                                          repMessage.itsItem.itsUUID
             except Exception, e:
                 # This is a recoverable exception related to conversion of
                 # the mail message to an Item. Any processing errors
@@ -223,7 +375,11 @@ class MailWorker(RepositoryWorker):
             # In this case we don't want to save the lastMessageUID since
             # this will prevent the messages from being downloaded and
             # processed again once the error or bug is resolved.
-            if protocol == "IMAP":
+            if protocol == "IMAP" and processedUIDs:
+                # Folders without seenUIDs treat the UIDs below
+                # lastMessageUID as seen so it is only stored
+                # along with seen UIDs.
+                args.addSeenUIDs(processedUIDs)
                 args.lastMessageUID = request[5][1]
 
             setStatusMessage(msg)
@@ -244,17 +400,22 @@ class MailWorker(RepositoryWorker):
             trace("processMessage")
 
         # mRequest
-        #     0: Mail Request Tuple
+        #     0: Mail Request Tuple or None if the message could not be parsed
         #         0: headers of the email decoded and converted to Unicode
         #         1: body of the message as displayed in the ContentItem.body attribute or None
         #         2. decoded and carriage return stripped eimml attachment or None
         #         3: decoded and carriage return stripped ics attachment or None
         #     1: Protocol specific UID
 
-        headers, body, eimml, ics = mRequest[0]
+        if mRequest[0] is None:
+            logging.error("Unable to parse downloaded message %s", mRequest[1])
+            statusCode, repMessage = -1, None
 
-        statusCode, repMessage = message.previewQuickConvert(view, headers,
-                                                             body, eimml, ics)
+        else:
+            headers, body, eimml, ics = mRequest[0]
+
+            statusCode, repMessage = message.previewQuickConvert(view, headers,
+                                                                 body, eimml, ics)
 
         if statusCode == 1:
             # If the message contained an eimml attachment
@@ -334,6 +495,65 @@ class MailWorker(RepositoryWorker):
 
         dt.totalDownloaded += 1
 
+        if statusCode == 1:
+            return statusCode, repMessage
+
+        return statusCode, None
+
+    def processBodies(self, view, protocol, client,
+                      account, request):
+        if __debug__:
+            trace("processBodies")
+
+        # request
+        #    0: cmd
+        #    1: Mail Client
+        #    2: accountUUID
+        #    3: a ParsedMessages instance for a list of tuples containing:
+        #        0: message request or None if the message
+        #           could not be parsed
+        #        1: IMAP UID of the message
+        #    4: imap folder UUID
+        #    5: IMAP UIDs of the messages no longer on the server
+
+        if self.shuttingDown:
+            return None
+
+        mRequests = request[3].get()
+
+        if mRequests is None:
+            return None
+
+        folder = view.findUUID(request[4])
+        pendingBodies = folder.pendingBodies
+
+        for uid in request[5]:
+            pendingBodies.pop(str(uid), None)
+
+        for mRequest, uid in mRequests:
+            key = str(uid)
+            uuid = pendingBodies.get(key)
+
+            if uuid is None:
+                continue
+
+            if mRequest is None:
+                # The body is downloaded again by the next sync
+                logging.error("Unable to parse downloaded message %s", uid)
+                continue
+
+            del pendingBodies[key]
+
+            item = view.findUUID(uuid)
+
+            if item is not None and not isDead(item):
+                body = mRequest[1]
+
+                if body:
+                    MailStamp(item).body = body
+
+        view.commit()
+
 
     def processUIDS(self, view, protocol, client, 
                     account, request):
@@ -347,7 +567,9 @@ class MailWorker(RepositoryWorker):
         #   3: proocol specific info
         #       IMAP = tuple containing
         #           0: imap folder UUID
-        #           1: UID of last message
+        #           1: UID of last message searched or None
+        #           2: list of ranges of UIDs that need
+        #              no downloading
         #
         #       POP =  List of UIDS of seen messages
 
@@ -358,8 +580,15 @@ class MailWorker(RepositoryWorker):
             imapFolderUUID = request[3][0]
             imapFolder = view.findUUID(imapFolderUUID)
 
+            lastUID = request[3][1]
+
+            # Store the UIDs searched, flagged \Deleted or
+            # no longer on the server for the IMAPFolder
+            imapFolder.addSeenUIDs(ranges=request[3][2])
+
             # Store the last message UID for the IMAPFolder
-            imapFolder.lastMessageUID = request[3][1]
+            if lastUID is not None and lastUID > imapFolder.lastMessageUID:
+                imapFolder.lastMessageUID = lastUID
 
         elif protocol == "POP":
             uids = request[3]
@@ -1255,11 +1255,6 @@ def __handleBinary(view, mimePart, parentMIMEContainer,
 
     mimeBinary = MIMEBinary(itsView=view)
 
-    # Get the attachments data
-    data = mimePart.get_payload(decode=True)
-    assert data is not None, "__handleBinary data is None"
-
-    mimeBinary.filesize = len(data)
     mimeBinary.filename = __getFileName(mimePart, counter)
     mimeBinary.mimeType = contype
 
@@ -1271,8 +1266,12 @@ def __handleBinary(view, mimePart, parentMIMEContainer,
         if result[0] is not None:
             mimeBinary.mimeType = result[0]
 
-    mimeBinary.data = dataToBinary(mimeBinary, "data", data,
-                                   mimeBinary.mimeType)
+    # Decode the attachments data into the Lob a chunk at a
+    # time instead of decoding the whole payload in memory
+    chunks = payloadChunks(mimePart, constants.ATTACHMENT_CHUNK_SIZE)
+
+    mimeBinary.data, mimeBinary.filesize = \
+        chunksToBinary(mimeBinary, "data", chunks, mimeBinary.mimeType)
 
     parentMIMEContainer.mimeParts.append(mimeBinary.itsItem)
 
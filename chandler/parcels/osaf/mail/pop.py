@@ -529,11 +529,12 @@ class POPClient(base.AbstractDownloadClient):
             return self._actionCompleted()
 
         if not mRequest:
-            mRequest = message.previewQuickParse("\n".join(msg))
+            # The MailWorker parses the message text
+            mRequest = "\n".join(msg)
 
         self.vars.messages.append(
                             # Tuple containing
-                            # 0: Mail Request
+                            # 0: Mail Request or RFC822 text
                             # 1: POP UID of message
                             (mRequest, uid)
                             )
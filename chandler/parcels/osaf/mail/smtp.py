@@ -23,6 +23,7 @@ from M2Crypto.SSL.Checker import WrongHost
 
 #python imports
 import cStringIO as StringIO
+from collections import deque
 
 #PyICU imports
 
@@ -56,7 +57,7 @@ class _TwistedESMTPSender(smtp.ESMTPSender):
         #twisted.internet.address.IPv4Address Object
         ipAddr = self.transport.getHost()
 
-        if ipAddr:
+        if getattr(ipAddr, 'host', None):
             # Get the IPv4 address and use instead
             # of the DNS name for EHLO / HELO
             # commands.
@@ -110,6 +111,108 @@ class _TwistedESMTPSender(smtp.ESMTPSender):
 
         return smtp.ESMTPSender.smtpState_from(self, code, resp)
 
+    def getMailFrom(self):
+        """Returns the sender of the next message of the
+           factory's batch or C{None} once all the messages
+           have been sent, at which point Twisted sends the
+           'QUIT' command. Twisted sends a 'RSET' command
+           between messages.
+        """
+        message = self.factory.nextMessage()
+
+        if message is None:
+            return None
+
+        return str(message[0])
+
+    def getMailTo(self):
+        return self.factory.current[1]
+
+    def getMailData(self):
+        return self.factory.current[2]
+
+    def sentMail(self, code, resp, numOk, addresses, log):
+        smtp.ESMTPSender.sentMail(self, code, resp, numOk, addresses, log)
+        self.factory.messageSent()
+
+
+class _TwistedESMTPSenderFactory(smtp.ESMTPSenderFactory):
+    """Sends a batch of messages over a single ESMTP session.
+
+       Each message is a (from_addr, to_addrs, file, deferred) tuple
+       and its deferred fires with the result of sending it. Connection
+       errors are retried for the message being sent. Once its retries
+       are exhausted the rest of the batch fails with the same error.
+       If the session is lost after the server acknowledged a message
+       the rest of the batch is sent over a new session.
+    """
+
+    protocol = _TwistedESMTPSender
+    testing  = False
+
+    def __init__(self, username, password, messages, retries, timeout,
+                 heloFallback, requireAuthentication,
+                 requireTransportSecurity):
+
+        from_addr, to_addrs, msg, deferred = messages[0]
+
+        # Note that we cheat with the context factory here (value=1),
+        # because ssl.connectSSL does it automatically, and in the
+        # case of STARTTLS we override esmtpState_starttls above
+        # to supply the correct SSL context.
+        smtp.ESMTPSenderFactory.__init__(self, username, password,
+                                         from_addr, to_addrs, msg,
+                                         deferred, retries, timeout,
+                                         1, heloFallback,
+                                         requireAuthentication,
+                                         requireTransportSecurity)
+
+        self.messages = deque(messages)
+        self.current = self.messages.popleft()
+
+    def nextMessage(self):
+        """Returns the message being sent, taking the next
+           message off the batch once the previous one was sent.
+        """
+        if self.current is None and self.messages:
+            self.current = self.messages.popleft()
+            self.file, self.result = self.current[2:]
+
+            # Connection errors are retried until the
+            # server acknowledges the new message
+            self.sendFinished = 0
+
+        return self.current
+
+    def messageSent(self):
+        self.current = None
+
+    def _processConnectionError(self, connector, err):
+        if self.current is not None and not self.current[3].called:
+            # The session was lost while sending a message
+            smtp.ESMTPSenderFactory._processConnectionError(self, connector,
+                                                            err)
+
+            if not self.current[3].called:
+                # The message is being retried
+                return
+
+            # The retries are exhausted, the rest of
+            # the batch fails with the same error
+            self.current = None
+
+            while self.messages:
+                self.messages.popleft()[3].errback(err)
+
+            return
+
+        # The server acknowledged the last message sent
+        # so the rest of the batch is sent over a new session
+        self.current = None
+
+        if self.nextMessage() is not None:
+            connector.connect()
+
 class SMTPClient(object):
     """Sends a Chandler mail message via SMTP"""
 
@@ -139,6 +242,10 @@ class SMTPClient(object):
         self.mailMessage = None
         self.shuttingDown = False
 
+        # The (MailStamp, deferred) pairs of the
+        # queued messages being sent in a batch
+        self.batch = None
+
     def sendMail(self, mailMessage):
         """
            Sends a mail message via SMTP using the C{SMTPAccount}
@@ -192,6 +299,11 @@ class SMTPClient(object):
         if __debug__:
             trace("_commit")
 
+        self._commitView()
+
+        return self._actionCompleted()
+
+    def _commitView(self):
         try:
             self.view.commit()
         except VersionConflictError, e1:
@@ -203,8 +315,6 @@ class SMTPClient(object):
             trace(e)
             raise
 
-        return self._actionCompleted()
-
     def _actionCompleted(self):
         if __debug__:
             trace("_actionCompleted")
@@ -228,6 +338,7 @@ class SMTPClient(object):
 
     def _resetClient(self):
         self.mailMessage = None
+        self.batch = None
         self.displayed  = False
         self.cancel = False
         self.callback = None
@@ -328,7 +439,92 @@ class SMTPClient(object):
         d.addCallback(self._mailSuccessCheck)
         d.addErrback(self._mailFailure)
 
-        self._sendingMail(sender.emailAddress, self._getRcptTo(), messageText, d)
+        self._sendingMail([(sender.emailAddress, self._getRcptTo(),
+                            messageText, d)])
+
+    def _prepareForBatch(self, mailMessageUUIDs):
+        """Sends the mail messages taken off the Queue over a single
+           SMTP session using the Twisted Asych Reactor"""
+
+        if __debug__:
+            trace("_prepareForBatch")
+
+        if self.cancel:
+            return self._resetClient()
+
+        # Refresh our view before retrieving Account info
+        self.view.refresh()
+
+        self._getAccount()
+
+        # The isOnline check is performed in the Twisted thread
+        # so pass in a view.
+        if self.mailMessage is not None or \
+           not Globals.mailService.isOnline(self.view):
+            # Put the messages back in the Queue
+            for mUUID in mailMessageUUIDs:
+                self._prepareForSend(mUUID)
+
+            return
+
+        self.batch = []
+        messages = []
+
+        for mUUID in mailMessageUUIDs:
+            try:
+                msg = self._getMailMessage(mUUID)
+                mailStampOccurrence, masterMailStamp = \
+                                     getRecurrenceMailStamps(msg)
+            except Exception, e:
+                if __debug__:
+                    trace(e)
+
+                continue
+
+            # The MailStamp methods used to build the message
+            # refer to self.mailMessage which also marks the
+            # SMTPClient as sending
+            self.mailMessage = masterMailStamp
+            d = defer.Deferred()
+
+            try:
+                # handles all MailStamp level logic  to support general
+                # sending of mail as well as edit / update workflows
+                masterMailStamp.outgoingMessage()
+
+                sender = masterMailStamp.getSender()
+
+                # use the individual occurrence, not the master, bug 9499
+                messageText = kindToMessageText(mailStampOccurrence)
+
+                messages.append((sender.emailAddress, self._getRcptTo(),
+                                 messageText, d))
+            except Exception, e:
+                if __debug__:
+                    trace(e)
+
+                d.errback(e)
+
+            self.batch.append((masterMailStamp, d))
+
+        if not self.batch:
+            return self._resetClient()
+
+        # The results of the whole batch are
+        # recorded with a single commit
+        dl = defer.DeferredList([d for m, d in self.batch],
+                                consumeErrors=True)
+        dl.addCallback(self._batchSent)
+
+        if messages:
+            # This is a PyICU.ChoiceFormat class
+            txt = constants.UPLOAD_START_MESSAGES.format(len(messages))
+
+            setStatusMessage(txt % \
+                             {"accountName": self.account.displayName,
+                              "numberOfMessages": len(messages)})
+
+            self._sendingMail(messages)
 
     def _testAccountSettings(self):
         if __debug__:
@@ -351,10 +547,13 @@ class SMTPClient(object):
         d.addCallback(self._testSuccess)
         d.addErrback(self._testFailure)
 
-        self._sendingMail("", [], "", d, True)
+        self._sendingMail([("", [], "", d)], True)
 
 
-    def _sendingMail(self, from_addr, to_addrs, messageText, deferred, testing=False):
+    def _sendingMail(self, messages, testing=False):
+        """Sends the (from_addr, to_addrs, messageText, deferred)
+           messages over a single SMTP session"""
+
         if __debug__:
             trace("_sendingMail")
 
@@ -388,20 +587,16 @@ class SMTPClient(object):
         if self.account.connectionSecurity == 'TLS':
             securityRequired = True
 
-        msg = StringIO.StringIO(messageText)
+        messages = [(from_addr, to_addrs, StringIO.StringIO(messageText),
+                     deferred)
+                    for from_addr, to_addrs, messageText, deferred in messages]
 
         def callback(password):
-            # Note that we cheat with the context factory here (value=1),
-            # because ssl.connectSSL does it automatically, and in the
-            # case of STARTTLS we override esmtpState_starttls above
-            # to supply the correct SSL context.
-            factory = smtp.ESMTPSenderFactory(username, password, from_addr,
-                                              to_addrs, msg,
-                                              deferred, retries, timeout,
-                                              1, heloFallback, authRequired,
-                                              securityRequired)
-
-            factory.protocol = _TwistedESMTPSender
+            factory = _TwistedESMTPSenderFactory(username, password,
+                                                 messages, retries, timeout,
+                                                 heloFallback, authRequired,
+                                                 securityRequired)
+
             factory.testing  = testing
 
             # Convert the Unicode hostname to an str
@@ -486,6 +681,73 @@ class SMTPClient(object):
 
         return self._commit()
 
+    def _batchSent(self, results):
+        """Records the result of sending each message of a batch
+           and commits them at once"""
+
+        if __debug__:
+            trace("_batchSent")
+
+        # The isOnline check is performed in the Twisted thread
+        # so pass in a view.
+        if self.shuttingDown or not Globals.mailService.isOnline(self.view) or \
+           self.cancel:
+            return self._resetClient()
+
+        # Refresh our view before adding items to our mail Messages
+        # and commit.
+        self.view.refresh()
+
+        sent = []
+        retry = []
+        sslError = None
+
+        for (mailMessage, d), (success, result) in zip(self.batch, results):
+            self.mailMessage = mailMessage
+
+            if success:
+                if result[0] == len(result[1]):
+                    self._mailSuccess(result)
+                else:
+                    self._recordRecipientErrors(result)
+
+            elif self.displayedRecoverableSSLErrorDialog(result.value,
+                                                         dryRun=True):
+                # The message is sent again if the user
+                # accepts the certificate
+                retry.append(mailMessage.itsItem.itsUUID)
+                sslError = result.value
+                continue
+
+            else:
+                self._recordError(result.value)
+
+            sent.append(mailMessage)
+
+        self._commitView()
+
+        for mailMessage in sent:
+            if mailMessage.itsItem.error:
+                key = "displaySMTPSendError"
+            else:
+                key = "displaySMTPSendSuccess"
+
+            NotifyUIAsync(mailMessage, None, key, self.account)
+
+        if retry:
+            self.reconnect = lambda: reactor.callFromThread(
+                                        self._prepareForBatch, retry)
+            self.displayedRecoverableSSLErrorDialog(sslError)
+
+            # Clear the status bar message
+            setStatusMessage(u"")
+
+        else:
+            #see if there are any messages in the queue to send
+            self._processQueue()
+
+        self._resetClient()
+
 
     def _mailSuccess(self, result):
         """If the message was send successfully update the
@@ -518,6 +780,9 @@ class SMTPClient(object):
         except:
             pass
 
+        self._recordRecipientErrors(result)
+
+    def _recordRecipientErrors(self, result):
         errors = []
 
         for recipient in result[1]:
@@ -729,29 +994,32 @@ class SMTPClient(object):
         self._processQueue()
 
     def _processQueue(self):
-        """If there are messages send the next one in the Queue
-           and we have not displayed the Add Certificate Dialog"""
+        """If there are messages in the Queue send them over
+           a single SMTP session"""
 
         self.view.refresh()
 
-        size = len(self.account.messageQueue)
+        queue = self.account.messageQueue
+
+        if len(queue):
+            mUUIDs = []
 
-        if size:
-            for i in xrange(0, size):
-                item = self.account.messageQueue.pop()
-                # Commit the popping of a MailStamped Item
-                # from the queue
-                self.view.commit()
+            while len(queue):
+                item = queue.pop()
 
                 if item is not None and item.isLive():
-                    mUUID = item.itsUUID
+                    mUUIDs.append(item.itsUUID)
 
-                    if __debug__:
-                        trace("SMTPClient sending next message in Queue %s" % mUUID)
+            # Commit the popping of the MailStamped Items
+            # from the queue
+            self.view.commit()
+
+            if mUUIDs:
+                if __debug__:
+                    trace("SMTPClient sending %s messages in Queue" % len(mUUIDs))
 
-                    # Yield to Twisted Event Loop
-                    reactor.callLater(0, self._prepareForSend, mUUID)
-                    break
+                # Yield to Twisted Event Loop
+                reactor.callLater(0, self._prepareForBatch, mUUIDs)
 
     def _getRcptTo(self):
         """Get all the recipients of this message (to, cc, bcc, originators)"""
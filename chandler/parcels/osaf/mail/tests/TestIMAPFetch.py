@@ -0,0 +1,51 @@
+import unittest
+from osaf.mail.imap import FetchBatchSize, getFetchedMessage
+
+class FetchTestCase(unittest.TestCase):
+    def testUIDBeforeBody(self):
+        # Courier IMAP
+        self.failUnlessEqual(
+            getFetchedMessage(['UID', '12', 'BODY', [], 'text']),
+            (12, 'text')
+        )
+
+    def testUIDAfterBody(self):
+        # Microsoft Exchange
+        self.failUnlessEqual(
+            getFetchedMessage(['BODY', [], 'text', 'UID', '12']),
+            (12, 'text')
+        )
+
+    def testFlags(self):
+        self.failUnlessEqual(
+            getFetchedMessage(['FLAGS', ['\\Seen'], 'UID', '3',
+                               'BODY', [], 'text']),
+            (3, 'text')
+        )
+
+        # An unsolicited flags update has no body
+        self.failUnlessEqual(
+            getFetchedMessage(['FLAGS', ['\\Seen'], 'UID', '3']),
+            None
+        )
+
+    def testBatchSize(self):
+        size = FetchBatchSize(minimum=5, maximum=100, seconds=1.0)
+        self.failUnlessEqual(size.size, 5)
+
+        # A fast server grows the batches, at most doubling each time
+        size.update(5, 0.01)
+        self.failUnlessEqual(size.size, 10)
+
+        for i in xrange(10):
+            size.update(size.size, 0.01)
+        self.failUnlessEqual(size.size, 100)
+
+        # A slow server shrinks them back to the minimum
+        for i in xrange(10):
+            size.update(size.size, 10.0)
+        self.failUnlessEqual(size.size, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from osaf.mail.mailworker import ParsedMessages, parseMessage, Pool, \
+                                TimeoutError
+
+TEXT = """\
+From: sender@example.com
+To: test@example.com
+Subject: Parse me
+Message-ID: <1@example.com>
+
+The body
+"""
+
+class ParsedMessagesTestCase(unittest.TestCase):
+    def checkParsed(self, mRequests):
+        self.failUnlessEqual([uid for mRequest, uid in mRequests], [1, 2])
+
+        headers, body, eimml, ics = mRequests[0][0]
+        self.failUnlessEqual(headers['Subject'], u"Parse me")
+        self.failUnless(u"The body" in body)
+
+        # Already parsed requests are passed through
+        self.failUnlessEqual(mRequests[1][0], ('parsed', None, None, None))
+
+    def testParseInWorker(self):
+        messages = [(TEXT, 1), (('parsed', None, None, None), 2)]
+        self.checkParsed(ParsedMessages(messages).get())
+
+    def testParseInPool(self):
+        if Pool is None:
+            return
+
+        pool = Pool(2)
+        try:
+            messages = [(TEXT, 1), (('parsed', None, None, None), 2)]
+            self.checkParsed(ParsedMessages(messages, pool, 2).get())
+        finally:
+            pool.terminate()
+
+    def testShutdown(self):
+        if Pool is None:
+            return
+
+        class worker(object):
+            shuttingDown = False
+
+        class result(object):
+            def get(self, timeout):
+                worker.shuttingDown = True
+                raise TimeoutError
+
+        parsed = ParsedMessages([(TEXT, 1)], worker=worker)
+        parsed.result = result()
+
+        # Waiting on the pool ends when the MailWorker shuts down
+        self.failUnless(parsed.get() is None)
+
+    def testParseError(self):
+        self.failUnless(parseMessage(None) is None)
+
+
+if __name__ == "__main__":
+    unittest.main()
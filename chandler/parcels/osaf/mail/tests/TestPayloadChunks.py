@@ -0,0 +1,66 @@
+import unittest, email, base64, quopri
+from osaf.mail.utils import payloadChunks
+
+def mimePart(encoding, payload):
+    return email.message_from_string(
+        "Content-Type: application/octet-stream\n"
+        "Content-Transfer-Encoding: %s\n\n%s" %(encoding, payload))
+
+class PayloadChunksTestCase(unittest.TestCase):
+    DATA = "".join([chr(i % 256) for i in xrange(300000)])
+    TEXT = ("caf\xe9 = cr\xe8me " * 1000 + "\n") * 20
+
+    def decode(self, part, chunkSize=4096):
+        return "".join(payloadChunks(part, chunkSize))
+
+    def testBase64(self):
+        payload = base64.encodestring(self.DATA)
+
+        for chunkSize in (4, 1000, 4096, len(payload)):
+            self.failUnlessEqual(self.decode(mimePart("base64", payload),
+                                             chunkSize), self.DATA)
+
+    def testBase64StrayCharacters(self):
+        payload = base64.encodestring(self.DATA)
+        payload = "%s!%s\r\n\t*%s" %(payload[:1001], payload[1001:5003],
+                                      payload[5003:])
+        part = mimePart("base64", payload)
+
+        self.failUnlessEqual(part.get_payload(decode=True), self.DATA)
+        self.failUnlessEqual(self.decode(part), self.DATA)
+
+    def testBase64BadPadding(self):
+        # A truncated payload is decoded as far as possible
+        payload = base64.encodestring(self.DATA)[:-4]
+        self.failUnless(self.DATA.startswith(
+                        self.decode(mimePart("base64", payload))))
+
+        # A payload that can not be decoded is left to get_payload
+        part = mimePart("base64", "a===\nQUJD\n")
+        self.failUnlessEqual(self.decode(part, 4),
+                             part.get_payload(decode=True))
+
+        # A payload failing partway through is truncated
+        part = mimePart("base64", "QUJD\na===\nQUJD\n")
+        self.failUnlessEqual(self.decode(part, 4), "ABC")
+
+    def testQuotedPrintable(self):
+        payload = quopri.encodestring(self.TEXT)
+
+        for chunkSize in (4, 1000, 4096, len(payload)):
+            self.failUnlessEqual(self.decode(mimePart("quoted-printable",
+                                                      payload),
+                                             chunkSize), self.TEXT)
+
+    def testQuotedPrintableMalformed(self):
+        part = mimePart("quoted-printable", "bad =ZZ value=\nnext =\n=4")
+        self.failUnlessEqual(self.decode(part, 4),
+                             part.get_payload(decode=True))
+
+    def testOtherEncoding(self):
+        part = mimePart("8bit", self.TEXT)
+        self.failUnlessEqual(self.decode(part), self.TEXT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from cStringIO import StringIO
+
+from twisted.internet import defer
+from twisted.protocols import basic, loopback
+
+from osaf.mail.smtp import _TwistedESMTPSenderFactory
+
+MESSAGE = """\
+From: sender@example.com
+To: to%(i)d@example.com
+Subject: Message %(i)d
+
+Body %(i)d
+"""
+
+class SinkServer(basic.LineReceiver):
+    """
+    A local SMTP sink accepting every message it is sent.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.messages = []
+        self.data = None
+
+    def connectionMade(self):
+        self.sendLine("220 localhost ESMTP sink")
+
+    def lineReceived(self, line):
+        if self.data is not None:
+            if line == ".":
+                self.messages.append("\r\n".join(self.data))
+                self.data = None
+                self.sendLine("250 OK")
+            else:
+                self.data.append(line)
+            return
+
+        command = line.split(" ", 1)[0].split(":", 1)[0].upper()
+        self.commands.append(command)
+
+        if command == "EHLO":
+            self.sendLine("250-localhost")
+            self.sendLine("250 8BITMIME")
+        elif command == "DATA":
+            self.data = []
+            self.sendLine("354 End data with <CR><LF>.<CR><LF>")
+        elif command == "QUIT":
+            self.sendLine("221 Bye")
+            self.transport.loseConnection()
+        else:
+            self.sendLine("250 OK")
+
+
+class SMTPBatchTestCase(unittest.TestCase):
+    def testBatch(self):
+        results = []
+        messages = []
+
+        for i in xrange(3):
+            d = defer.Deferred()
+            d.addCallback(results.append)
+
+            messages.append(("sender@example.com", ["to%d@example.com" % i],
+                             StringIO(MESSAGE % {'i': i}), d))
+
+        factory = _TwistedESMTPSenderFactory(None, None, messages, 0, 30,
+                                             True, False, False)
+        server = SinkServer()
+
+        loopback.loopback(server, factory.buildProtocol(None))
+
+        # All the messages are sent over a single session
+        self.failUnlessEqual(len(server.messages), 3)
+        self.failUnlessEqual(server.commands.count("EHLO"), 1)
+        self.failUnlessEqual(server.commands.count("MAIL"), 3)
+        self.failUnless(server.commands.count("RSET") >= 2)
+        self.failUnless("Body 2" in server.messages[2])
+
+        self.failUnlessEqual([numOk for numOk, addresses in results],
+                             [1, 1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
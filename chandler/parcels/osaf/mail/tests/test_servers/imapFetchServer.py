@@ -0,0 +1,314 @@
+#!/usr/bin/python
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+A fake IMAP server serving an INBOX of generated messages from memory.
+
+Unlike imapTestServer.py, which scripts protocol errors, this server
+implements enough of IMAP4rev1 through the Twisted IMAP4Server for mail
+to be downloaded from it, with an optional delay before each command is
+processed to simulate the round-trip latency of a remote server.
+
+Usage: imapFetchServer.py [count] [latency in ms] [message size] [attachments]
+
+Log in with user "test" and password "test".
+"""
+
+import sys
+from cStringIO import StringIO
+from base64 import encodestring
+
+from zope.interface import implements
+from twisted.internet import reactor, protocol
+from twisted.mail import imap4
+from twisted.cred import portal, checkers
+
+USER = "test"
+PASS = "test"
+
+PORT = 1432
+
+MESSAGE = """\
+From: Sender %(uid)d <sender%(uid)d@example.com>
+To: test@example.com
+Subject: Message %(uid)d
+Date: Tue, 01 Jan 2008 12:00:00 +0000
+Message-ID: <%(uid)d@imapFetchServer>
+MIME-Version: 1.0
+Content-Type: text/plain; charset="us-ascii"
+
+%(body)s
+"""
+
+MULTIPART = """\
+From: Sender %(uid)d <sender%(uid)d@example.com>
+To: test@example.com
+Subject: Message %(uid)d
+Date: Tue, 01 Jan 2008 12:00:00 +0000
+Message-ID: <%(uid)d@imapFetchServer>
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="%(boundary)s"
+
+--%(boundary)s
+Content-Type: text/plain; charset="us-ascii"
+
+%(body)s
+%(attachments)s--%(boundary)s--
+"""
+
+ATTACHMENT = """\
+--%(boundary)s
+Content-Type: application/octet-stream; name="attachment%(n)d.bin"
+Content-Transfer-Encoding: base64
+Content-Disposition: attachment; filename="attachment%(n)d.bin"
+
+%(data)s
+"""
+
+
+def makeMessage(uid, size=2048, attachments=0):
+    """
+    Generate the text of message C{uid}, with CRLF line endings.
+
+    @param size: the approximate size of the text body in bytes
+    @param attachments: the number of base64 encoded attachments of
+                        about C{size} bytes to add to the message
+    """
+    body = ("x" * 71 + "\r\n") * max(size / 73, 1)
+
+    if not attachments:
+        return MESSAGE.replace("\n", "\r\n") % {'uid': uid, 'body': body}
+
+    boundary = "=_boundary_%d" % uid
+    parts = []
+
+    for n in xrange(1, attachments + 1):
+        data = encodestring(("attachment %d of message %d " % (n, uid)) *
+                            max(size / 32, 1))
+        parts.append(ATTACHMENT % {'boundary': boundary, 'n': n,
+                                   'data': data.rstrip()})
+
+    text = MULTIPART % {'uid': uid, 'body': body.replace("\r\n", "\n"),
+                        'boundary': boundary, 'attachments': ''.join(parts)}
+
+    return text.replace("\n", "\r\n")
+
+
+class Message(object):
+    implements(imap4.IMessage, imap4.IMessageFile)
+
+    def __init__(self, uid, text):
+        self.uid = uid
+        self.text = text
+        self.flags = []
+
+    def open(self):
+        return StringIO(self.text)
+
+    def getUID(self):
+        return self.uid
+
+    def getFlags(self):
+        return self.flags
+
+    def getInternalDate(self):
+        return "Tue, 01 Jan 2008 12:00:00 +0000"
+
+    def getHeaders(self, negate, *names):
+        headers = {}
+        names = [name.lower() for name in names]
+
+        for line in self.text.split("\r\n\r\n", 1)[0].split("\r\n"):
+            name, value = line.split(":", 1)
+
+            if (name.lower() in names) != negate:
+                headers[name] = value.strip()
+
+        return headers
+
+    def getBodyFile(self):
+        return StringIO(self.text.split("\r\n\r\n", 1)[1])
+
+    def getSize(self):
+        return len(self.text)
+
+    def isMultipart(self):
+        return False
+
+    def getSubPart(self, part):
+        raise IndexError(part)
+
+
+class Mailbox(object):
+    implements(imap4.IMailbox)
+
+    def __init__(self, count=1000, size=2048, attachments=0):
+        self.messages = []
+
+        for uid in xrange(1, count + 1):
+            text = makeMessage(uid, size, attachments)
+            self.messages.append(Message(uid, text))
+
+    def getUIDValidity(self):
+        return 1
+
+    def getUIDNext(self):
+        return len(self.messages) + 1
+
+    def getUID(self, message):
+        return self.messages[message - 1].uid
+
+    def getMessageCount(self):
+        return len(self.messages)
+
+    def getRecentCount(self):
+        return 0
+
+    def getUnseenCount(self):
+        return len(self.messages)
+
+    def getFlags(self):
+        return ("\\Seen", "\\Deleted")
+
+    def getHierarchicalDelimiter(self):
+        return "/"
+
+    def isWriteable(self):
+        return True
+
+    def requestStatus(self, names):
+        return imap4.statusRequestHelper(self, names)
+
+    def addListener(self, listener):
+        pass
+
+    def removeListener(self, listener):
+        pass
+
+    def fetch(self, messages, uid):
+        # UIDs are the message sequence numbers
+        try:
+            messages.last = len(self.messages)
+        except ValueError:
+            pass
+
+        for num in messages:
+            if 0 < num <= len(self.messages):
+                yield num, self.messages[num - 1]
+
+    def store(self, messages, flags, mode, uid):
+        result = {}
+
+        for num, message in self.fetch(messages, uid):
+            if mode == 0:
+                message.flags = list(flags)
+            elif mode > 0:
+                message.flags.extend([f for f in flags
+                                      if f not in message.flags])
+            else:
+                message.flags = [f for f in message.flags if f not in flags]
+            result[num] = message.flags
+
+        return result
+
+    def expunge(self):
+        return []
+
+    def destroy(self):
+        pass
+
+
+class Realm(object):
+    implements(portal.IRealm)
+
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+
+    def requestAvatar(self, avatarId, mind, *interfaces):
+        account = imap4.MemoryAccount(avatarId)
+        account.addMailbox("INBOX", self.mailbox)
+
+        return imap4.IAccount, account, lambda: None
+
+
+class IMAPFetchServer(imap4.IMAP4Server):
+    """
+    Delays the processing of each command by the factory's latency.
+    """
+
+    def lineReceived(self, line):
+        latency = self.factory.latency
+
+        if latency:
+            reactor.callLater(latency, imap4.IMAP4Server.lineReceived,
+                              self, line)
+        else:
+            imap4.IMAP4Server.lineReceived(self, line)
+
+
+class IMAPFetchServerFactory(protocol.Factory):
+
+    protocol = IMAPFetchServer
+
+    def __init__(self, count=1000, latency=0.0, size=2048, attachments=0):
+        """
+        @param count: the number of messages in the INBOX
+        @param latency: the delay, in seconds, before processing a command
+        @param size: the approximate size of each message body in bytes
+        @param attachments: the number of attachments of each message
+        """
+        checker = checkers.InMemoryUsernamePasswordDatabaseDontUse()
+        checker.addUser(USER, PASS)
+
+        self.portal = portal.Portal(Realm(Mailbox(count, size, attachments)),
+                                    [checker])
+        self.latency = latency
+
+    def buildProtocol(self, addr):
+        p = self.protocol()
+        p.factory = self
+        p.portal = self.portal
+
+        return p
+
+
+def listen(port=PORT, count=1000, latency=0.0, size=2048, attachments=0):
+    """
+    Start serving on C{port}, 0 for any free port, in the running reactor.
+
+    @return: the listening port
+    """
+    return reactor.listenTCP(port, IMAPFetchServerFactory(count, latency,
+                                                          size, attachments),
+                             interface="127.0.0.1")
+
+
+def main():
+    args = sys.argv[1:]
+
+    count = args and int(args[0]) or 1000
+    latency = len(args) > 1 and float(args[1]) / 1000 or 0.0
+    size = len(args) > 2 and int(args[2]) or 2048
+    attachments = len(args) > 3 and int(args[3]) or 0
+
+    listen(PORT, count, latency, size, attachments)
+
+    print "Serving %d messages on port %d with %dms latency" % \
+          (count, PORT, latency * 1000)
+
+    reactor.run()
+
+if __name__ == '__main__':
+    main()
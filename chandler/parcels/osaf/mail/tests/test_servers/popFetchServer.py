@@ -0,0 +1,155 @@
+#!/usr/bin/python
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+A fake POP3 server serving a maildrop of generated messages from memory.
+
+The messages are the ones served by imapFetchServer.py. The Twisted POP3
+protocol implements enough of POP3 for mail to be downloaded from it,
+with an optional delay before each command is processed to simulate the
+round-trip latency of a remote server.
+
+Usage: popFetchServer.py [count] [latency in ms] [message size] [attachments]
+
+Log in with user "test" and password "test".
+"""
+
+import sys
+from cStringIO import StringIO
+
+from zope.interface import implements
+from twisted.internet import reactor, protocol
+from twisted.mail import pop3
+from twisted.cred import portal, checkers
+
+from imapFetchServer import makeMessage
+
+USER = "test"
+PASS = "test"
+
+PORT = 1110
+
+
+class Mailbox(object):
+    implements(pop3.IMailbox)
+
+    def __init__(self, count=1000, size=2048, attachments=0):
+        self.messages = [makeMessage(uid, size, attachments)
+                         for uid in xrange(1, count + 1)]
+        self.deleted = set()
+
+    def listMessages(self, index=None):
+        if index is not None:
+            return len(self.messages[index])
+
+        return [i in self.deleted and 0 or len(text)
+                for i, text in enumerate(self.messages)]
+
+    def getMessage(self, index):
+        return StringIO(self.messages[index])
+
+    def getUidl(self, index):
+        return "%d@popFetchServer" % (index + 1)
+
+    def deleteMessage(self, index):
+        self.deleted.add(index)
+
+    def undeleteMessages(self):
+        self.deleted.clear()
+
+    def sync(self):
+        # Messages are never removed so that every run
+        # downloads the same maildrop
+        self.deleted.clear()
+
+
+class Realm(object):
+    implements(portal.IRealm)
+
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+
+    def requestAvatar(self, avatarId, mind, *interfaces):
+        return pop3.IMailbox, self.mailbox, lambda: None
+
+
+class POPFetchServer(pop3.POP3):
+    """
+    Delays the processing of each command by the factory's latency.
+    """
+
+    def lineReceived(self, line):
+        latency = self.factory.latency
+
+        if latency:
+            reactor.callLater(latency, pop3.POP3.lineReceived, self, line)
+        else:
+            pop3.POP3.lineReceived(self, line)
+
+
+class POPFetchServerFactory(protocol.Factory):
+
+    protocol = POPFetchServer
+
+    def __init__(self, count=1000, latency=0.0, size=2048, attachments=0):
+        """
+        @param count: the number of messages in the maildrop
+        @param latency: the delay, in seconds, before processing a command
+        @param size: the approximate size of each message body in bytes
+        @param attachments: the number of attachments of each message
+        """
+        checker = checkers.InMemoryUsernamePasswordDatabaseDontUse()
+        checker.addUser(USER, PASS)
+
+        self.portal = portal.Portal(Realm(Mailbox(count, size, attachments)),
+                                    [checker])
+        self.latency = latency
+
+    def buildProtocol(self, addr):
+        p = self.protocol()
+        p.factory = self
+        p.portal = self.portal
+
+        return p
+
+
+def listen(port=PORT, count=1000, latency=0.0, size=2048, attachments=0):
+    """
+    Start serving on C{port}, 0 for any free port, in the running reactor.
+
+    @return: the listening port
+    """
+    return reactor.listenTCP(port, POPFetchServerFactory(count, latency,
+                                                         size, attachments),
+                             interface="127.0.0.1")
+
+
+def main():
+    args = sys.argv[1:]
+
+    count = args and int(args[0]) or 1000
+    latency = len(args) > 1 and float(args[1]) / 1000 or 0.0
+    size = len(args) > 2 and int(args[2]) or 2048
+    attachments = len(args) > 3 and int(args[3]) or 0
+
+    listen(PORT, count, latency, size, attachments)
+
+    print "Serving %d messages on port %d with %dms latency" % \
+          (count, PORT, latency * 1000)
+
+    reactor.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+A fake ESMTP server accepting and discarding every message it is sent.
+
+Unlike smtpTestServer.py, which scripts protocol errors, this server
+implements ESMTP through the Twisted ESMTP protocol and counts the
+sessions, messages and bytes it receives, with an optional delay before
+each command is processed to simulate the round-trip latency of a
+remote server.
+
+Usage: smtpSinkServer.py [latency in ms]
+"""
+
+import sys
+
+from zope.interface import implements
+from twisted.internet import reactor, defer
+from twisted.mail import smtp
+
+PORT = 2525
+
+
+class Message(object):
+    implements(smtp.IMessage)
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.size = 0
+
+    def lineReceived(self, line):
+        self.size += len(line) + 2
+
+    def eomReceived(self):
+        self.factory.received(self.size)
+        return defer.succeed(None)
+
+    def connectionLost(self):
+        pass
+
+
+class Delivery(object):
+    implements(smtp.IMessageDelivery)
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def receivedHeader(self, helo, origin, recipients):
+        return None
+
+    def validateFrom(self, helo, origin):
+        return origin
+
+    def validateTo(self, user):
+        return lambda: Message(self.factory)
+
+
+class SMTPSinkServer(smtp.ESMTP):
+    """
+    Delays the processing of each command by the factory's latency.
+    """
+
+    def lineReceived(self, line):
+        latency = self.factory.latency
+
+        if latency:
+            reactor.callLater(latency, smtp.ESMTP.lineReceived, self, line)
+        else:
+            smtp.ESMTP.lineReceived(self, line)
+
+
+class SMTPSinkServerFactory(smtp.SMTPFactory):
+
+    protocol = SMTPSinkServer
+
+    def __init__(self, latency=0.0):
+        """
+        @param latency: the delay, in seconds, before processing a command
+        """
+        smtp.SMTPFactory.__init__(self)
+
+        self.latency = latency
+        self.delivery = Delivery(self)
+
+        # The number of sessions opened, the number of
+        # messages and bytes received and the callbacks
+        # waiting for a number of messages
+        self.sessions = 0
+        self.messages = 0
+        self.bytes = 0
+        self.waiting = []
+
+    def buildProtocol(self, addr):
+        p = smtp.SMTPFactory.buildProtocol(self, addr)
+        p.factory = self
+        p.delivery = self.delivery
+        self.sessions += 1
+
+        return p
+
+    def received(self, size):
+        self.messages += 1
+        self.bytes += size
+
+        for count, d in self.waiting[:]:
+            if self.messages >= count:
+                self.waiting.remove((count, d))
+                d.callback(self.messages)
+
+    def waitForMessages(self, count):
+        """
+        @return: a deferred firing once C{count} messages were received
+        """
+        if self.messages >= count:
+            return defer.succeed(self.messages)
+
+        d = defer.Deferred()
+        self.waiting.append((count, d))
+
+        return d
+
+
+def listen(port=PORT, latency=0.0):
+    """
+    Start serving on C{port}, 0 for any free port, in the running reactor.
+
+    @return: the listening port
+    """
+    return reactor.listenTCP(port, SMTPSinkServerFactory(latency),
+                             interface="127.0.0.1")
+
+
+def main():
+    args = sys.argv[1:]
+
+    latency = args and float(args[0]) / 1000 or 0.0
+
+    listen(PORT, latency)
+
+    print "Accepting mail on port %d with %dms latency" % \
+          (PORT, latency * 1000)
+
+    reactor.run()
+
+if __name__ == '__main__':
+    main()
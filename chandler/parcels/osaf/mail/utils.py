@@ -20,23 +20,27 @@ Mail Domain (SMTP, IMAP4, POP3) and message parsing
 
 #python imports
 import email.Utils as Utils
-import os, logging, time, random
+import os, logging, time, random, re
 from time import mktime
 from datetime import datetime, timedelta
 import PyICU
 import sys
 import sgmllib
+import binascii
+from quopri import decodestring as qpDecode
 from twisted.mail import smtp
 
 #Chandler imports
 import application.Globals as Globals
+import constants
 from chandlerdb.util.Lob import Lob
 from i18n import ChandlerMessageFactory as _
 
 __all__ = ['log', 'trace', 'disableTwistedTLS', 'getEmptyDate',
            'dateIsEmpty', 'alert', 'alertMailError', 'NotifyUIAsync',
            'datetimeToRFC2822Date', 'RFC2822DateToDatetime', 'createMessageID',
-           'hasValue', 'isString', 'dataToBinary', 'binaryToData', 'stripHTML',
+           'hasValue', 'isString', 'dataToBinary', 'chunksToBinary',
+           'binaryToData', 'payloadChunks', 'hasChandlerHeaders', 'stripHTML',
            'setStatusMessage', 'callMethodInUIThread']
 
 
@@ -291,6 +295,125 @@ def dataToBinary(mailMessage, attribute, data,
                              compression=compression)
 
 
+def chunksToBinary(mailMessage, attribute, chunks,
+                   mimeType="application/octet-stream",
+                   compression='bz2', indexed=False):
+    """
+    Writes an iterable of data chunks to a C{Lob} one chunk at
+    a time. Returns the C{Lob} and the number of bytes written.
+    """
+
+    lob = dataToBinary(mailMessage, attribute, None, mimeType,
+                       compression, indexed)
+
+    out = lob.getOutputStream(compression)
+    size = 0
+
+    for chunk in chunks:
+        size += len(chunk)
+        out.write(chunk)
+
+    out.close()
+
+    return lob, size
+
+
+_nonBase64 = re.compile('[^A-Za-z0-9+/=]+')
+
+def payloadChunks(mimePart, chunkSize):
+    """
+    Yields the decoded payload of a non-multipart
+    C{email.Message} in chunks of at most about chunkSize
+    bytes of encoded data, without decoding the whole
+    payload at once.
+
+    Base64 and quoted-printable payloads are decoded
+    chunk by chunk. Other payloads are returned by
+    C{email.Message.get_payload} as a single chunk.
+
+    Characters outside the base64 alphabet are ignored.
+    A base64 payload that still can not be decoded is
+    returned by C{email.Message.get_payload}, undecoded,
+    or is truncated if part of it was already decoded.
+    """
+
+    payload = mimePart.get_payload()
+    cte = mimePart.get('content-transfer-encoding', '').lower()
+
+    if not isinstance(payload, str) or cte not in ('base64',
+                                                   'quoted-printable'):
+        yield mimePart.get_payload(decode=True)
+        return
+
+    size = len(payload)
+    start = 0
+
+    if cte == 'base64':
+        # Base64 decodes groups of four characters
+        # so the ones left over from a chunk are
+        # decoded with the next one.
+        leftover = ''
+        decoded = 0
+
+        try:
+            while start < size:
+                data = leftover + \
+                       _nonBase64.sub('', payload[start:start+chunkSize])
+                start += chunkSize
+
+                end = len(data) - len(data) % 4
+                leftover = data[end:]
+
+                if end:
+                    chunk = binascii.a2b_base64(data[:end])
+                    decoded += len(chunk)
+                    yield chunk
+
+        except binascii.Error:
+            if decoded:
+                # The chunks already decoded can not be taken
+                # back so the rest of the payload is dropped
+                log.warning("Unable to decode the base64 payload of %s "
+                            "past %d bytes", mimePart.get_content_type(),
+                            decoded)
+            else:
+                yield mimePart.get_payload(decode=True)
+            return
+
+        if leftover:
+            # Incorrect padding
+            try:
+                yield binascii.a2b_base64(leftover + '=' * (-len(leftover) % 4))
+            except binascii.Error:
+                pass
+
+    else:
+        # Quoted-printable decodes line by line
+        # so chunks are split after a newline.
+        while start < size:
+            end = payload.rfind('\n', start, start + chunkSize) + 1
+
+            if end <= start:
+                end = payload.find('\n', start + chunkSize) + 1 or size
+
+            yield qpDecode(payload[start:end])
+            start = end
+
+
+def hasChandlerHeaders(headers):
+    """
+    Returns True if the C{email.Message} or the headers
+    of one contain a header added by Chandler.
+    """
+    prefix = constants.CHANDLER_HEADER_PREFIX.lower()
+
+    for key in headers.keys():
+        if key.lower().startswith(prefix):
+            return True
+
+    return False
+
+
 def binaryToData(binary):
     """
     Converts a C{Lob} to data.
@@ -314,6 +314,11 @@ def installParcel(parcel, oldVersion=None):
                     monitor=(EventStamp.startTime, EventStamp.allDay,
                              EventStamp.anyTime, EventStamp.duration),
                     kind=ContentItem.getKind(view))
+    EventStamp.addIndex(events, 'effectiveInterval', 'interval',
+                    interval=(eventComparator, 'getEffectiveInterval'),
+                    monitor=(EventStamp.startTime, EventStamp.allDay,
+                             EventStamp.anyTime, EventStamp.duration),
+                    kind=ContentItem.getKind(view))
 
     # floatingEvents need to be reindexed in effectiveStart and effectiveEnd
     # when the floating timezone changes
@@ -366,6 +371,11 @@ def installParcel(parcel, oldVersion=None):
                         method=(eventComparator, 'cmpRecurEnd'),
                         monitor=(EventStamp.recurrenceEnd,))
 
+    EventStamp.addIndex(masterEvents, 'recurrenceInterval', 'interval',
+                        interval=(eventComparator, 'getRecurrenceInterval'),
+                        monitor=(EventStamp.startTime, EventStamp.allDay,
+                                 EventStamp.anyTime, EventStamp.recurrenceEnd))
+
     EventStamp.addIndex(masterEvents, 'effectiveStart', 'subindex',
                           superindex=(events, events.__collection__,
                                       'effectiveStart'))
@@ -104,6 +104,9 @@ def ensureIndexed(coll):
 zero_delta = timedelta(0)
 LONG_TIME  = timedelta(7)
 
+# number of events loaded per batch when iterating range query results
+RANGE_READAHEAD = 64
+
 def getKeysInRange(view, startVal, startAttrName, startIndex, startColl,
                          endVal,   endAttrName,   endIndex,   endColl,
                          filterColl = None, filterIndex = None, useTZ=True,
@@ -227,6 +230,26 @@ def getKeysInRange(view, startVal, startAttrName, startIndex, startColl,
            and key not in ignores:
             yield key
 
+def getKeysInInterval(startVal, endVal, coll, intervalIndex,
+                      filterColl=None, filterIndex=None):
+    """
+    Yield keys for events overlapping [startVal, endVal), sorted by start,
+    using an C{interval} index on coll.
+
+    Unlike L{getKeysInRange}, this doesn't need to look up event values
+    while searching, and long events need no special treatment.
+    intervalIndex and filterIndex are the names (strings) of indexes on the
+    relevant collections.
+    """
+
+    if filterColl is not None:
+        _filterIndex = filterColl.getIndex(filterIndex)
+
+    index = coll.getIndex(intervalIndex)
+    for key in index.iterOverlapping(startVal, endVal):
+        if filterColl is None or key in _filterIndex:
+            yield key
+
 def isDayEvent(event):
     """
     Determines whether an event has "dayness"; i.e. whether you would want
@@ -305,17 +328,22 @@ def eventsInRange(view, start, end, filterColl = None, dayItems=True,
 
     startIndex = 'effectiveStart'
     endIndex   = 'effectiveEnd'
+    intervalIndex = 'effectiveInterval'
     
     searchStart, searchEnd = adjustSearchTimes(start, end, tzprefs.showUI)
     
     allEvents  = EventStamp.getCollection(view)
     longEvents = pim_ns.longEvents
-    keys = getKeysInRange(view, start, 'effectiveStartTime', startIndex,
-                          allEvents, end,'effectiveEndTime', endIndex,
-                          allEvents, filterColl, '__adhoc__', tzprefs.showUI,
-                          longDelta = LONG_TIME, longCollection=longEvents)
-    for key in keys:
-        item = view[key]
+    if tzprefs.showUI and allEvents.hasIndex(intervalIndex):
+        keys = getKeysInInterval(start, end, allEvents, intervalIndex,
+                                 filterColl, '__adhoc__')
+    else:
+        keys = getKeysInRange(view, start, 'effectiveStartTime', startIndex,
+                              allEvents, end,'effectiveEndTime', endIndex,
+                              allEvents, filterColl, '__adhoc__',
+                              tzprefs.showUI, longDelta = LONG_TIME,
+                              longCollection=longEvents)
+    for item in view.iterItems(keys, RANGE_READAHEAD):
         event = EventStamp(item)
         # Should probably assert has_stamp(event, EventStamp)
         if (has_stamp(event, EventStamp) and
@@ -337,13 +365,18 @@ def recurringEventsInRange(view, start, end, filterColl=None,
 
     startIndex = 'effectiveStart'
     endIndex   = 'recurrenceEnd'
+    intervalIndex = 'recurrenceInterval'
 
     masterEvents = pim_ns.masterEvents
-    keys = getKeysInRange(view, searchStart, 'effectiveStartTime', startIndex,
-                          masterEvents, end, 'recurrenceEnd', endIndex,
-                          masterEvents, filterColl, '__adhoc__')
-    for key in keys:
-        masterEvent = EventStamp(view[key])
+    if masterEvents.hasIndex(intervalIndex):
+        keys = getKeysInInterval(searchStart, end, masterEvents, intervalIndex,
+                                 filterColl, '__adhoc__')
+    else:
+        keys = getKeysInRange(view, searchStart, 'effectiveStartTime',
+                              startIndex, masterEvents, end, 'recurrenceEnd',
+                              endIndex, masterEvents, filterColl, '__adhoc__')
+    for item in view.iterItems(keys, RANGE_READAHEAD):
+        masterEvent = EventStamp(item)
         for event in masterEvent.getOccurrencesBetween(start, end):
             # One or both of dayItems and timedItems must be
             # True. If both, then there's no need to test the
@@ -363,27 +396,39 @@ def iterBusyInfo(view, start, end, filterColl=None):
     startIndex = 'effectiveStart'
     endIndex   = 'effectiveEnd'
     recurEndIndex   = 'recurrenceEnd'
+    intervalIndex = 'effectiveInterval'
+    recurIntervalIndex = 'recurrenceInterval'
 
     allEvents  = EventStamp.getCollection(view)
     longEvents = pim_ns.longEvents
-    keys = getKeysInRange(view, searchStart, 'effectiveStartTime', startIndex,
-                          allEvents, searchEnd, 'effectiveEndTime', endIndex,
-                          allEvents, filterColl, '__adhoc__', tzprefs.showUI,
-                          longDelta = LONG_TIME, longCollection=longEvents)
-    for key in keys:
-        event = EventStamp(view[key])
+    if tzprefs.showUI and allEvents.hasIndex(intervalIndex):
+        keys = getKeysInInterval(searchStart, searchEnd, allEvents,
+                                 intervalIndex, filterColl, '__adhoc__')
+    else:
+        keys = getKeysInRange(view, searchStart, 'effectiveStartTime',
+                              startIndex, allEvents, searchEnd,
+                              'effectiveEndTime', endIndex, allEvents,
+                              filterColl, '__adhoc__', tzprefs.showUI,
+                              longDelta = LONG_TIME, longCollection=longEvents)
+    for item in view.iterItems(keys, RANGE_READAHEAD):
+        event = EventStamp(item)
         assert has_stamp(event, EventStamp)
         if event.rruleset is None:
             for fb in event.iterBusyInfo(start, end):
                 yield fb
 
     masterEvents = pim_ns.masterEvents
-    keys = getKeysInRange(view, searchStart, 'effectiveStartTime', startIndex,
-                          masterEvents, end, 'recurrenceEnd', recurEndIndex,
-                          masterEvents, filterColl, '__adhoc__')
+    if masterEvents.hasIndex(recurIntervalIndex):
+        keys = getKeysInInterval(searchStart, end, masterEvents,
+                                 recurIntervalIndex, filterColl, '__adhoc__')
+    else:
+        keys = getKeysInRange(view, searchStart, 'effectiveStartTime',
+                              startIndex, masterEvents, end, 'recurrenceEnd',
+                              recurEndIndex, masterEvents, filterColl,
+                              '__adhoc__')
 
-    for key in keys:
-        masterEvent = EventStamp(view[key])
+    for item in view.iterItems(keys, RANGE_READAHEAD):
+        masterEvent = EventStamp(item)
         for fb in masterEvent.iterBusyInfo(start, end):
             yield fb
 
@@ -1044,6 +1089,20 @@ class EventStamp(Stamp):
             dtstart = self.getEffectiveStartTime()
             return self.rruleset.createDateUtilFromRule(dtstart, *args, **kw)
 
+    def getRecurrenceExpansion(self):
+        """Return the cached expansion of self.rruleset.
+
+        @see: L{Recurrence.RecurrenceRuleSet.getExpansion}
+        @return: C{Recurrence.RecurrenceExpansion}
+
+        """
+        first = self.getFirstInRule()
+        if first != self:
+            return first.getRecurrenceExpansion()
+        else:
+            dtstart = self.getEffectiveStartTime()
+            return self.rruleset.getExpansion(dtstart)
+
     def setRuleFromDateUtil(self, rule):
         """Set self.rruleset from rule.  Rule may be an rrule or rruleset.
 
@@ -1243,7 +1302,7 @@ class EventStamp(Stamp):
         if self.rruleset is None:
             return
 
-        ruleset = first.createDateUtilFromRule()
+        expansion = first.getRecurrenceExpansion()
         
         # exact means this is a search for a specific recurrenceID
         exact = after is not None and after == before
@@ -1270,8 +1329,13 @@ class EventStamp(Stamp):
             start = self.effectiveStartTime
 
         def iterRecurrenceIDs():
-            # iterate over the ruleset just once, or iteration will be O(n^2)
-            ruleset_iterator = iter(ruleset)
+            # iterate over the cached expansion just once, starting at the
+            # first recurrenceID that can match, or iteration will be O(n^2)
+            if after is not None:
+                prep_start = min(after, start) if not exact else after
+            else:
+                prep_start = None
+            ruleset_iterator = expansion.iterRecurrenceIDs(prep_start)
             def next_in_ruleset():
                 try:
                     return ruleset_iterator.next()
@@ -1280,8 +1344,7 @@ class EventStamp(Stamp):
 
             current = next_in_ruleset()
             if after is not None:
-                # prep ruleset_iterator, move its position to after
-                prep_start = min(after, start) if not exact else after
+                # ruleset_iterator is already positioned at prep_start
                 while current is not None and current < prep_start:
                     current = next_in_ruleset()
                 if (exact or (inclusive and (after <= start))):
@@ -2589,6 +2652,17 @@ class EventComparator(schema.Item):
     cmpEndTime, cmpEndTime_init = makeCompareMethod(getFn=EventStamp._getEffectiveEndTime)
     cmpRecurEnd, cmpRecurEnd_init = makeCompareMethod(attr=EventStamp.recurrenceEnd)
 
+    def getEffectiveInterval(self, index, uuid):
+        view = self.itsView
+        return (EventStamp._getEffectiveStartTime(uuid, view),
+                EventStamp._getEffectiveEndTime(uuid, view))
+
+    def getRecurrenceInterval(self, index, uuid):
+        view = self.itsView
+        recurrenceEnd = view.findInheritedValues(
+            uuid, (EventStamp.recurrenceEnd.name, None))[0]
+        return (EventStamp._getEffectiveStartTime(uuid, view), recurrenceEnd)
+
 def setEventDateTime(item, startTime, endTime, typeFlag):
     """
     Sets the startTime and the endTime of the item (CalendarEvent) depending on the typeFlag.
@@ -25,6 +25,7 @@ __parcel__ = "osaf.pim.calendar"
 from application import schema
 from osaf.pim import items
 from datetime import datetime
+from bisect import bisect_left
 import dateutil.rrule
 from dateutil.rrule import rrule, rruleset
 from chandlerdb.item.PersistentCollections import PersistentList
@@ -527,6 +528,53 @@ class RecurrenceRule(items.ContentItem):
         self.untilIsDate = False
 
 
+class RecurrenceExpansion(object):
+    """
+    The recurrenceIDs of a C{dateutil.rrule.rruleset}, expanded lazily.
+
+    Expanding a ruleset is expensive and has to start over from dtstart
+    every time the ruleset is iterated. A RecurrenceExpansion remembers
+    the recurrenceIDs already computed so that repeated range queries only
+    pay for the part of the recurrence not expanded yet.
+    """
+
+    def __init__(self, ruleset):
+        self._iterator = iter(ruleset)
+        self.recurrenceIDs = []
+        self.exhausted = False
+
+    def _expand(self):
+        """Compute the next recurrenceID, return C{False} if none remain."""
+        if not self.exhausted:
+            try:
+                self.recurrenceIDs.append(self._iterator.next())
+                return True
+            except StopIteration:
+                self.exhausted = True
+                self._iterator = None
+        return False
+
+    def iterRecurrenceIDs(self, start=None):
+        """Yield recurrenceIDs in order, starting with the first >= start.
+
+        @param start: The earliest recurrenceID to yield, or C{None}
+        @type  start: C{datetime}
+
+        """
+        recurrenceIDs = self.recurrenceIDs
+        if start is None:
+            i = 0
+        else:
+            while ((not recurrenceIDs or recurrenceIDs[-1] < start) and
+                   self._expand()):
+                pass
+            i = bisect_left(recurrenceIDs, start)
+
+        while i < len(recurrenceIDs) or self._expand():
+            yield recurrenceIDs[i]
+            i += 1
+
+
 class RecurrenceRuleSet(items.ContentItem):
     """
     A collection of recurrence and exclusion rules, dates, and exclusion dates.
@@ -561,6 +609,7 @@ class RecurrenceRuleSet(items.ContentItem):
     @schema.observer(rrules, exrules, rdates, exdates)
     def onRuleSetChanged(self, op, name):
         """If the RuleSet changes, update the associated event."""
+        self._expansion = None
         if not getattr(self, '_ignoreValueChanges', False):
             if self.hasLocalAttributeValue('events'):
                 pimNs = schema.ns("osaf.pim", self.itsView)
@@ -584,6 +633,32 @@ class RecurrenceRuleSet(items.ContentItem):
         except AttributeError:
             setattr(self, rrulesorexrules, [rule])
 
+    def getExpansion(self, dtstart):
+        """Return a cached L{RecurrenceExpansion} of this ruleset.
+
+        The expansion is shared by all callers until the ruleset, one of its
+        rules, dtstart or the default timezone changes.
+
+        @param dtstart: The start time for the recurrence rule
+        @type  dtstart: C{datetime}
+
+        @rtype: L{RecurrenceExpansion}
+
+        """
+        key = (dtstart, dtstart.tzinfo, self.itsView.tzinfo.default,
+               self.itsVersion,
+               tuple(rule.itsVersion for rule in getattr(self, 'rrules', [])),
+               tuple(rule.itsVersion for rule in getattr(self, 'exrules', [])))
+
+        cached = getattr(self, '_expansion', None)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        expansion = RecurrenceExpansion(self.createDateUtilFromRule(dtstart))
+        self._expansion = (key, expansion)
+
+        return expansion
+
     def createDateUtilFromRule(self, dtstart,
                                ignoreIsCount=True,
                                convertFloating=False,
@@ -80,6 +80,34 @@ class TestEventIndexing(TimeZoneTestCase):
         self.assertEqual(daysEvents[2], self.pacificEvent)
         self.assertEqual(daysEvents[3], self.hawaiiEvent)
 
+    def testIntervalIndex(self):
+        """The interval index should find the same events as the range search."""
+        longEvent = self._createEvent(self.midnight - timedelta(days=10))
+        longEvent.duration = timedelta(days=10, hours=2)
+        laterEvent = self._createEvent(self.midnight + timedelta(days=3))
+
+        view = self.view
+        allEvents = EventStamp.getCollection(view)
+        start, end = self.midnight, self.midnight + timedelta(1)
+
+        keys = list(Calendar.getKeysInInterval(start, end, allEvents,
+                                               'effectiveInterval'))
+        self.assert_(longEvent.itsItem.itsUUID in keys)
+        self.assert_(laterEvent.itsItem.itsUUID not in keys)
+
+        expected = set(Calendar.getKeysInRange(view, start,
+            'effectiveStartTime', 'effectiveStart', allEvents, end,
+            'effectiveEndTime', 'effectiveEnd', allEvents,
+            longDelta=Calendar.LONG_TIME,
+            longCollection=schema.ns('osaf.pim', view).longEvents))
+        self.assertEqual(set(keys), expected)
+
+        # moving an event should reindex its interval
+        laterEvent.startTime = self.midnight + timedelta(hours=5)
+        keys = list(Calendar.getKeysInInterval(start, end, allEvents,
+                                               'effectiveInterval'))
+        self.assert_(laterEvent.itsItem.itsUUID in keys)
+
     def testMergeTZSameOffset(self):
         """
         Verify that when python lies to us about datetime/time values being
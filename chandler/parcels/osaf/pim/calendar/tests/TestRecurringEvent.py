@@ -1287,6 +1287,29 @@ class RecurringEventTest(testcase.SharedSandboxTestCase):
                                    self.start + timedelta(minutes=30))
         self.failIf(second.rruleset.rrules.first().hasLocalAttributeValue('until'))
         
+    def testRecurrenceExpansion(self):
+        event = self.event
+        event.rruleset = self._createRuleSetItem('weekly')
+
+        expansion = event.getRecurrenceExpansion()
+        self.failUnless(expansion is event.getRecurrenceExpansion())
+
+        after = self.start + timedelta(days=20)
+        before = self.start + timedelta(days=40)
+        occurrences = event.getOccurrencesBetween(after, before)
+        self.failUnlessEqual(3, len(occurrences))
+        self.failUnless(expansion is event.getRecurrenceExpansion())
+        self.failIf(expansion.exhausted)
+
+        self.failUnlessEqual(self.weekly['count'],
+                             len(list(expansion.iterRecurrenceIDs())))
+        self.failUnless(expansion.exhausted)
+
+        # changing the rule drops the cached expansion
+        event.rruleset.rrules.first().until = self.start + timedelta(days=14)
+        self.failIf(expansion is event.getRecurrenceExpansion())
+        self.failUnlessEqual(3, len(event.getOccurrencesBetween(None, None)))
+
     def testRecurrenceEnd(self):
         event = self.event
         event.startTime = datetime(2006, 11, 11, 13,
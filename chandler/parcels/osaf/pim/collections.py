@@ -20,12 +20,14 @@ from application import schema
 from chandlerdb.util.c import Nil
 from chandlerdb.item.Sets import (
     Set, MultiUnion, Union, MultiIntersection, Intersection, Difference,
-    KindSet, ExpressionFilteredSet, MethodFilteredSet, EmptySet
+    KindSet, ExpressionFilteredSet, MethodFilteredSet, EmptySet,
+    BiSet, MultiSet
 )
 from chandlerdb.item.Collection import Collection
+from chandlerdb.item.Item import override
 
 from osaf.pim.items import ContentItem
-import itertools
+import itertools, time
 
 # Common attribute for collection inclusions
 inclusions = schema.Sequence(inverse=ContentItem.collections, initialValue=[])
@@ -410,9 +412,51 @@ class ListCollection(ContentCollection):
                 item.delete(True)
 
 
+# The name of the index holding the members of a materialized collection
+MEMBERSHIP_INDEX = '__membership__'
+
+def _getViewStatistics(view):
+
+    # the membership maintenance counters of the wrapper collections of a
+    # view, by UUID, kept on the view since a view is used by one thread
+    # at a time
+    try:
+        return view._membershipStatistics
+    except AttributeError:
+        view._membershipStatistics = {}
+        return view._membershipStatistics
+
+def getMembershipStatistics(view):
+    """
+    Return the membership maintenance statistics of the wrapper collections
+    in C{view}, most expensive first, as a list of C{(collection, stats)}.
+    """
+    statistics = _getViewStatistics(view)
+    result = []
+    for uuid in statistics.keys():
+        collection = view.findUUID(uuid)
+        if collection is None:
+            del statistics[uuid]
+        else:
+            result.append((collection, collection.getMembershipStatistics()))
+
+    result.sort(key=lambda (collection, stats): (stats['rebuildTime'],
+                                                 stats['adds'] +
+                                                 stats['removes']),
+                reverse=True)
+    return result
+
+
 class WrapperCollection(ContentCollection):
     """
     A class for collections wrapping other collections
+
+    If C{materialize} is C{True}, the members of a collection combining
+    several sources are kept in a persistent index on its set. Membership
+    tests, iteration and length then no longer walk the set's expression
+    and additions notified by sources are applied without consulting the
+    other sources. The index is rebuilt only when sources are added or
+    removed.
     """
 
     __metaclass__ = schema.CollectionClass
@@ -428,12 +472,66 @@ class WrapperCollection(ContentCollection):
     # this collection gets deleted if autoDelete is True.
     autoDelete = schema.One(schema.Boolean, defaultValue=False)
 
+    # Whether to keep the members of a combined set in an index
+    materialize = False
+
     schema.addClouds(copying=schema.Cloud(byCloud=[sources]))
 
     def __setup__(self):
-        self._sourcesChanged_('add')
+        self._materialize(self._sourcesChanged_('add'))
         self.watchCollection(self, 'sources', '_sourcesChanged')
 
+    def _materialize(self, set):
+
+        if self.materialize and isinstance(set, (BiSet, MultiSet)):
+            stats = self._getStatistics()
+            start = time.time()
+            set.addIndex(MEMBERSHIP_INDEX, 'numeric')
+            stats['rebuilds'] += 1
+            stats['rebuildTime'] += time.time() - start
+
+    def _getStatistics(self):
+
+        statistics = _getViewStatistics(self.itsView)
+        stats = statistics.get(self.itsUUID)
+        if stats is None:
+            stats = statistics[self.itsUUID] = {
+                'adds': 0, 'removes': 0, 'rebuilds': 0, 'rebuildTime': 0.0 }
+
+        return stats
+
+    def onItemDelete(self, view, isDeferring):
+        super(WrapperCollection, self).onItemDelete(view, isDeferring)
+        if not isDeferring:
+            _getViewStatistics(view).pop(self.itsUUID, None)
+
+    def getMembershipStatistics(self):
+        """
+        Return a dictionary of this collection's membership maintenance
+        counters: the number of members, whether they are materialized, the
+        number of additions and removals applied and the number and total
+        time, in seconds, of membership rebuilds.
+        """
+        stats = dict(self._getStatistics())
+        set = getattr(self, self.__collection__)
+        stats['materialized'] = bool(set.hasIndex(MEMBERSHIP_INDEX))
+        stats['size'] = len(set)
+
+        return stats
+
+    @override(ContentCollection)
+    def _collectionChanged(self, op, change, name, other, dirties):
+
+        if (self.materialize and change == 'collection' and
+            name == self.__collection__):
+            if op == 'add':
+                self._getStatistics()['adds'] += 1
+            elif op == 'remove':
+                self._getStatistics()['removes'] += 1
+
+        super(WrapperCollection, self)._collectionChanged(op, change, name,
+                                                          other, dirties)
+
     def _sourcesChanged(self, op, item, attribute, sourceId, dirties):
 
         if op in ('add', 'remove'):
@@ -449,6 +547,8 @@ class WrapperCollection(ContentCollection):
                     view._notifyChange(sourceChanged, 'add', 'collection',
                                        source, name, False, uuid, dirties,
                                        actualSource)
+                # materialize once the new source's members were notified
+                self._materialize(set)
 
             elif op == 'remove':
                 set = getattr(self, self.__collection__)
@@ -459,6 +559,7 @@ class WrapperCollection(ContentCollection):
                                        source, name, False, uuid, dirties,
                                        actualSource)
                 set = self._sourcesChanged_(op)
+                self._materialize(set)
 
                 if self.autoDelete and type(set) is EmptySet:
                     self.delete()
@@ -518,6 +619,8 @@ class DifferenceCollection(WrapperCollection):
     instances to be differenced.
     """
 
+    materialize = True
+
     def _sourcesChanged_(self, op):
 
         sources = self.sources
@@ -551,6 +654,8 @@ class UnionCollection(WrapperCollection):
     ContentCollections.
     """
 
+    materialize = True
+
     def _sourcesChanged_(self, op):
 
         sources = self.sources
@@ -579,6 +684,8 @@ class IntersectionCollection(WrapperCollection):
     least two ContentCollections.
     """
 
+    materialize = True
+
     def _sourcesChanged(self, op, item, attribute, sourceId, dirties):
 
         if op in ('add', 'remove'):
@@ -598,6 +705,7 @@ class IntersectionCollection(WrapperCollection):
                                                'remove', 'collection',
                                                name, uuid, ())
                 set = self._sourcesChanged_(op)
+                self._materialize(set)
                 if wasEmpty and not type(set) is EmptySet:
                     for uuid in set.iterkeys():
                         view._notifyChange(_collectionChanged,
@@ -607,6 +715,7 @@ class IntersectionCollection(WrapperCollection):
             elif (op == 'remove' and
                   not type(getattr(self, name)) is EmptySet):
                 set = self._sourcesChanged_(op)
+                self._materialize(set)
                 sourceSet = getattr(source, source.__collection__)
                 if type(set) is EmptySet:
                     for uuid in sourceSet.iterkeys():
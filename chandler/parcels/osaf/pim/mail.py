@@ -34,6 +34,7 @@ import items, notes, stamping, collections, itertools
 import email.Utils as Utils
 import re as re
 from chandlerdb.util.c import Empty
+from chandlerdb.util.RangeSet import RangeSet
 import PyICU
 
 from i18n import ChandlerMessageFactory as _
@@ -1249,10 +1250,66 @@ class IMAPFolder(items.ContentItem):
         initialValue = 0,
     )
 
+    headersOnly = schema.One(
+        schema.Boolean,
+        doc = 'Whether to download only the headers of new messages in a MAIL folder, leaving their bodies to be downloaded in the background by later syncs.',
+        initialValue = False,
+    )
+
+    pendingBodies = schema.Mapping(
+        schema.UUID,
+        doc = 'The UUIDs of the mail items whose body has yet to be downloaded, keyed by the IMAP UID of their message.',
+        initialValue = {},
+    )
+
+    seenUIDs = schema.Sequence(
+        schema.Integer,
+        doc = 'The IMAP UIDs that need no downloading, because their message was downloaded, searched or is not on the server, as a flat list of first and last UIDs of ranges.',
+        initialValue = [],
+    )
+
     parentAccount = schema.One(
         IMAPAccount, initialValue = None, inverse = IMAPAccount.folders,
     ) # Inverse ofIMAPAccount.folders sequence
 
+    def getSeenUIDs(self):
+        """
+        Return the IMAP UIDs of the folder needing no download
+        as a C{RangeSet}.
+
+        Folders synced before C{seenUIDs} existed start out with
+        the UIDs below C{lastMessageUID}.
+        """
+        seen = RangeSet()
+        uids = self.seenUIDs
+
+        if uids:
+            seen.ranges = [(uids[i], uids[i + 1])
+                           for i in xrange(0, len(uids), 2)]
+
+        elif self.lastMessageUID > 1:
+            seen.selectRange((1, self.lastMessageUID - 1))
+
+        return seen
+
+    def addSeenUIDs(self, uids=(), ranges=()):
+        """
+        Add IMAP UIDs and ranges of UIDs to C{seenUIDs}.
+        """
+        seen = self.getSeenUIDs()
+
+        for first, last in ranges:
+            seen.selectRange((first, last))
+
+        seen.selectIndexes(uids)
+
+        flat = []
+        for first, last in seen.ranges:
+            flat.append(first)
+            flat.append(last)
+
+        self.seenUIDs = flat
+
 
 class POPAccount(IncomingAccount):
     accountProtocol = "POP"
@@ -181,6 +181,49 @@ class CollectionTests(CollectionTestCase):
 
         print [ i for i in u ]
 
+    def testMaterializedUnion(self):
+        """
+        Test the membership index of a UnionCollection
+        """
+        b3 = ListCollection('b3', itsView=self.view)
+        u = UnionCollection('u', itsView=self.view,
+                            sources=[ self.b1, self.b2, b3 ])
+        self.view.watchCollectionQueue(self.nh, u, 'queuedChange')
+
+        self.failUnless(u.set.hasIndex(MEMBERSHIP_INDEX))
+        stats = u.getMembershipStatistics()
+        self.failUnless(stats['materialized'])
+        self.assertEqual(stats['size'], 0)
+
+        self.b1.add(self.i)
+        self.b2.add(self.i)
+        self.view.dispatchQueuedNotifications()
+        self.failUnless(self.nh.checkLog("add", u, self.i))
+        self.assertEqual(u.getMembershipStatistics()['adds'], 1)
+
+        self.b1.remove(self.i)
+        self.failUnless(self.i in u)
+        self.b2.remove(self.i)
+        self.view.dispatchQueuedNotifications()
+        self.failUnless(self.nh.checkLog("remove", u, self.i))
+        self.failIf(self.i in u)
+
+        b3.add(self.i1)
+        u.removeSource(self.b2)
+        self.failUnless(u.set.hasIndex(MEMBERSHIP_INDEX))
+        self.assertEqual(list(u), [self.i1])
+
+        stats = u.getMembershipStatistics()
+        self.assertEqual(stats['removes'], 1)
+        self.assertEqual(stats['rebuilds'], 2)
+        self.failUnless(u in [c for c, s in getMembershipStatistics(self.view)])
+
+        # statistics are kept by view and dropped with their collection
+        uuid = u.itsUUID
+        self.failUnless(uuid in self.view._membershipStatistics)
+        u.delete()
+        self.failIf(uuid in self.view._membershipStatistics)
+
     def testDifference(self):
         """
         Test DifferenceCollection
@@ -0,0 +1,65 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from cStringIO import StringIO
+from cgi import escape
+
+from osaf import webserver
+from chandlerdb.util.Spans import profiler
+
+
+class SpansResource(webserver.AuthenticatedResource):
+    """
+    The span profiler's timings of hot paths and its recent slow operations.
+
+    Query arguments:
+        - C{enable=1} or C{enable=0} turns span recording on or off
+        - C{reset=1} forgets the timings recorded so far
+        - C{format=text} returns the plain text report
+    """
+
+    isLeaf = True
+
+    def render_GET(self, request):
+
+        enable = request.args.get('enable', [None])[0]
+        if enable is not None:
+            profiler.enabled = enable not in ('0', 'false', 'False')
+
+        if request.args.get('reset', [None])[0]:
+            profiler.reset()
+
+        output = StringIO()
+        profiler.report(output)
+        report = output.getvalue()
+
+        if request.args.get('format', [None])[0] == 'text':
+            request.setHeader('Content-Type', 'text/plain')
+            return report
+
+        if profiler.enabled:
+            status = "Recording, <a href='?enable=0'>stop</a>"
+        else:
+            status = "Not recording, <a href='?enable=1'>start</a>"
+
+        return """<html>
+<head>
+  <title>Chandler Hot Path Timings</title>
+  <link rel='stylesheet' href='/site.css' type='text/css' />
+</head>
+<body>
+<h1>Chandler Hot Path Timings</h1>
+<p>%s | <a href='?reset=1'>reset</a> | <a href='?format=text'>text</a></p>
+<pre>%s</pre>
+</body></html>""" %(status, escape(report))
@@ -15,6 +15,7 @@
 
 __all__ = [
     'ChandlerServerHandle',
+    'ConcurrentRequests',
     'WebDAVTester',
     'checkAccess',
     'createCosmoAccount',
@@ -32,7 +33,8 @@ import zanshin.http
 import M2Crypto
 import chandlerdb
 import twisted.internet.error as error
-from twisted.internet import reactor
+from twisted.internet import reactor, defer
+from twisted.python.failure import Failure
 
 import application.Utility as Utility
 from application import schema
@@ -40,8 +42,11 @@ from osaf.framework.certstore import ssl
 from osaf.activity import ActivityAborted
 from osaf import messages
 import threading
+import time
 import logging
 import urllib
+import Queue
+from collections import deque
 from i18n import ChandlerMessageFactory as _
 from osaf.mail.utils import callMethodInUIThread
 from osaf.framework.twisted import waitForDeferred
@@ -53,6 +58,14 @@ class ChandlerServerHandle(zanshin.webdav.ServerHandle):
         self.resourcesByPath = {}   # Caches resources indexed by path
         self.factory = createHTTPFactory(host, port, username, password, useSSL,
                                          repositoryView)
+        self.settings = (host, port, username, password, useSSL,
+                         repositoryView)
+
+    def copy(self):
+        """
+        Return a handle to the same server with a connection of its own.
+        """
+        return type(self)(*self.settings)
 
     def addRequest(self, request):
         # Make all requests going through this ServerHandle have a
@@ -112,6 +125,90 @@ class ChandlerServerHandle(zanshin.webdav.ServerHandle):
                 raise error.SSLError(err)
         
 
+class ConcurrentRequests(object):
+    """
+    Requests issued concurrently over a pool of connections to a server,
+    at most one request in flight per connection.
+
+    Requests are added from the calling thread and issued in the Twisted
+    thread. Their results are returned to the calling thread in the order
+    in which they complete so that they can be processed while the other
+    requests are still in flight.
+
+    A request is a callable, called in the Twisted thread with the
+    connection to issue it over, usually a L{ChandlerServerHandle}, and
+    returning a deferred or a result. It must not access the repository.
+    """
+
+    def __init__(self, connections):
+        self.pending = 0    # the requests added and not yet returned
+        self.waited = 0.0   # the time spent blocking for results
+        self._idle = list(connections)
+        self._waiting = deque()
+        self._results = Queue.Queue()
+
+    def add(self, key, request):
+        """
+        Add a request whose result is returned with C{key}.
+        """
+        self.pending += 1
+        reactor.callFromThread(self._add, key, request)
+
+    def next(self, block=True):
+        """
+        Return the key and the result of the next request to complete.
+
+        If C{block} is C{False} and no request has completed, return
+        C{None}. If the request failed, its error is raised.
+        """
+        if not self.pending:
+            raise StopIteration
+
+        try:
+            if block:
+                start = time.time()
+                key, result = self._results.get()
+                self.waited += time.time() - start
+            else:
+                key, result = self._results.get_nowait()
+        except Queue.Empty:
+            return None
+
+        self.pending -= 1
+        if isinstance(result, Failure):
+            result.raiseException()
+
+        return key, result
+
+    def __iter__(self):
+        while self.pending:
+            yield self.next()
+
+    def cancel(self):
+        """
+        Drop the requests not yet issued and the results not yet returned.
+        """
+        if self.pending:
+            self.pending = 0
+            reactor.callFromThread(self._waiting.clear)
+
+    def _add(self, key, request):
+        self._waiting.append((key, request))
+        self._issue()
+
+    def _issue(self):
+        while self._waiting and self._idle:
+            key, request = self._waiting.popleft()
+            connection = self._idle.pop()
+            d = defer.maybeDeferred(request, connection)
+            d.addBoth(self._complete, key, connection)
+
+    def _complete(self, result, key, connection):
+        self._idle.append(connection)
+        self._results.put((key, result))
+        self._issue()
+
+
 def connectFactory(factory, host, port, timeout):
     if getattr(factory, 'startTLS', False):
         return ssl.connectSSL(host, port, factory, factory.repositoryView,
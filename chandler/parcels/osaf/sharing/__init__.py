@@ -50,6 +50,7 @@ from itemcentric import *
 from serialize import *
 from ootb import *
 from viewpool import *
+from scheduler import *
 from ics import *
 from ICalendar import *
 from stateless import *
@@ -231,8 +232,10 @@ def scheduleNow(rv, *args, **kwds):
 
 
 current_activity = None
+current_scheduler = None
 
-# ...set to an Activity object when sharing work is performed; interrupt( ) can
+# ...set to an Activity object when sharing work is performed, or to the
+# SyncScheduler running the activities of concurrent syncs; interrupt( ) can
 # be called from any thread -- it simply asks the activity to abort.  The next
 # time the code which is carrying out the activity calls acitivity.update( ),
 # the activity will raise an ActivityAborted.
@@ -242,7 +245,7 @@ def interrupt(graceful=True):
         at the moment is allowed to complete.  If graceful=False, stop the
         current Share in the middle of whatever it's doing.
     """
-    global interrupt_flag, current_activity
+    global interrupt_flag, current_activity, current_scheduler
 
     if graceful:
         interrupt_flag = GRACEFUL_STOP # allow the current sync( ) to complete
@@ -250,6 +253,8 @@ def interrupt(graceful=True):
         interrupt_flag = IMMEDIATE_STOP # interrupt current sync( )
         if current_activity is not None:
             current_activity.requestAbort()
+        if current_scheduler is not None:
+            current_scheduler.requestAbort()
 
 
 
@@ -290,6 +295,7 @@ class BackgroundSyncHandler:
         # This method must return True -- no raising exceptions!
 
         global interrupt_flag, running_status, current_activity
+        global current_scheduler
 
         if running_status != IDLE:
             # busy
@@ -353,43 +359,28 @@ class BackgroundSyncHandler:
 
             shares = getSyncableShares(self.rv, collection)
 
-            for share in shares:
-
-                if interrupt_flag != PROCEED: # interruption
-                    raise ActivityAborted(_(u"Cancelled by user"))
-
-                callCallbacks(UPDATE, msg="Syncing collection '%s'" %
-                    share.contents.displayName)
-
-                try:
-                    activity = Activity("Sync: %s" % share.contents.displayName)
-                    activity.started()
-                    altView = viewpool.getView(self.rv.repository)
-                    altShare = altView.findUUID(share.itsUUID)
-                    current_activity = activity
-                    stats.extend(altShare.sync(modeOverride=modeOverride,
-                        activity=activity, forceUpdate=forceUpdate))
-                    altView.commit(mergeFunction)
-                    viewpool.releaseView(altView)
-                    current_activity = None
-                    activity.completed()
-
-                except ActivityAborted:
-                    logger.exception("Syncing cancelled")
-                    altView.cancel()
-                    viewpool.releaseView(altView)
-                    raise
-
-                except Exception, e:
-                    logger.exception("Error syncing collection")
-                    altView.cancel()
-                    viewpool.releaseView(altView)
-                    share.error, share.errorDetails = errors.formatException(e)
+            # Independent shares are synced concurrently, each in its own
+            # view from the view pool
+            scheduler = current_scheduler = SyncScheduler(self.rv)
+            try:
+                results = scheduler.run(shares,
+                    interrupted=lambda: interrupt_flag != PROCEED,
+                    modeOverride=modeOverride, forceUpdate=forceUpdate)
+            finally:
+                current_scheduler = None
+
+            for uuid, shareStats, error, details in results:
+                if error is None:
+                    stats.extend(shareStats)
+                else:
+                    share = self.rv.findUUID(uuid)
+                    share.error, share.errorDetails = details
                     share.lastAttempt = datetime.datetime.now(tz)
                     stats.extend( [ { 'collection' : share.contents.itsUUID,
-                                    'error' : str(e) } ] )
-                    activity.failed(e)
-                    current_activity = None
+                                    'error' : str(error) } ] )
+
+            if scheduler.aborted is not None:
+                raise scheduler.aborted
 
 
             try:
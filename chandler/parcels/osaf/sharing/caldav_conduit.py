@@ -18,15 +18,27 @@ __all__ = [
 
 import PyICU
 import webdav_conduit
+import zanshin.http
+import twisted.web.http as http
+import xml.etree.cElementTree as ElementTree
+from zanshin.util import PackElement
+from zanshin.webdav import CALDAV_NAMESPACE
+from xml.sax.saxutils import escape
+import urllib, urlparse
 from i18n import ChandlerMessageFactory as _
 from osaf.pim.calendar.TimeZone import serializeTimeZone
 from osaf.pim import EventStamp
-import time
 from utility import splitUUID, getMasterAlias
 import logging
 
 logger = logging.getLogger(__name__)
 
+MULTIGET = """<?xml version="1.0" encoding="utf-8" ?>
+<C:calendar-multiget xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+<D:prop><D:getetag/><C:calendar-data/></D:prop>
+%s
+</C:calendar-multiget>
+"""
 
 
 class CalDAVRecordSetConduit(webdav_conduit.WebDAVRecordSetConduit):
@@ -53,14 +65,109 @@ class CalDAVRecordSetConduit(webdav_conduit.WebDAVRecordSetConduit):
         return "%s.ics" % uuid
 
 
-    def putResource(self, text, path, etag=None, debug=False):
-        resource = self._resourceFromPath(path)
-        start = time.time()
-        self._getServerHandle().blockUntil(resource.put, text,
-            checkETag=False, contentType="text/calendar")
-        end = time.time()
-        self.networkTime += (end - start)
-        return resource.etag.strip('"') # .mac puts quotes around the etag
+    def _putResource(self, resource, text):
+        return resource.put(text, checkETag=False, contentType="text/calendar")
+
+    # The number of resources got with each calendar-multiget REPORT
+    multigetSize = 50
+
+    def getResourceBatch(self, paths):
+        """
+        Get resources with calendar-multiget REPORTs of C{multigetSize}
+        resources each, falling back to GETs for the resources missing
+        from the responses or when the server doesn't support it.
+        """
+        paths = list(paths)
+        if len(paths) < 2:
+            for result in super(CalDAVRecordSetConduit,
+                                self).getResourceBatch(paths):
+                yield result
+            return
+
+        requests = self._getConcurrentRequests()
+        try:
+            for i in xrange(0, len(paths), self.multigetSize):
+                batch = tuple(paths[i:i + self.multigetSize])
+                requests.add(batch, self._multigetRequest(batch))
+
+            for batch, resp in requests:
+                results, missing = self._parseMultiget(batch, resp)
+                for result in results:
+                    yield result
+                if missing:
+                    for result in super(CalDAVRecordSetConduit,
+                                        self).getResourceBatch(missing):
+                        yield result
+        finally:
+            self._releaseConcurrentRequests(requests)
+
+    def _multigetRequest(self, paths):
+        # the request is called in the Twisted thread, hence the paths
+        # are looked up beforehand
+        quote = lambda path: urllib.quote(self._resourcePath(path).encode('utf-8'))
+        collectionPath = quote(u"")
+        hrefs = "".join("<D:href>%s</D:href>" % escape(quote(path))
+                        for path in paths)
+        body = MULTIGET % hrefs
+        extraHeaders = { 'Depth': '1',
+                         'Content-Type': 'text/xml; charset="utf-8"' }
+        ticket = getattr(self, 'ticket', False)
+        if ticket:
+            extraHeaders['Ticket'] = ticket
+
+        def request(serverHandle):
+            d = serverHandle.addRequest(zanshin.http.Request('REPORT',
+                                                             collectionPath,
+                                                             extraHeaders,
+                                                             body))
+            d.addErrback(self._requestFailed, collectionPath)
+            return d
+
+        return request
+
+    def _parseMultiget(self, paths, resp):
+        # return the (path, text, etag) of the resources in a multiget
+        # response and the paths missing from it
+
+        if resp.status != http.MULTI_STATUS:
+            logger.debug("calendar-multiget not supported (HTTP status %d)",
+                         resp.status)
+            return (), paths
+
+        missing = dict((self._resourcePath(path).encode('utf-8'), path)
+                       for path in paths)
+        results = []
+
+        xml = ElementTree.XML(resp.body)
+        for response in xml.getiterator(PackElement("response")):
+            href = response.findtext(PackElement("href"), "").strip()
+            href = urllib.unquote(urlparse.urlparse(href)[2])
+            path = missing.get(href)
+            if path is None:
+                continue
+
+            status = response.findtext(PackElement("status"), "").split()
+            if status[1:2] == ['404']:
+                del missing[href]
+                results.append((path, None, None))
+                continue
+
+            for propstat in response.findall(PackElement("propstat")):
+                prop = propstat.find(PackElement("prop"))
+                if prop is None:
+                    continue
+                text = prop.findtext(PackElement("calendar-data",
+                                                 CALDAV_NAMESPACE))
+                etag = prop.findtext(PackElement("getetag"))
+                if text and etag:
+                    if isinstance(text, unicode):
+                        text = text.encode('utf-8')
+                    del missing[href]
+                    # .mac puts quotes around the etag
+                    results.append((path, text, etag.strip('"')))
+                    break
+
+        return results, missing.values()
 
     def findClusters(self, toSend):
         """
@@ -109,6 +109,7 @@ class HTTPMixin(BaseConduit):
 
     def onItemLoad(self, view=None):
         self.serverHandle = None
+        self.serverHandleCopies = None
 
     def _getSettings(self, withPassword=True):
         password = None
@@ -146,8 +147,28 @@ class HTTPMixin(BaseConduit):
 
         return self.serverHandle
 
+    def _getServerHandles(self, count):
+        """
+        Return C{count} handles to the server, each with a connection of
+        its own, the first one being the conduit's server handle.
+
+        The copies are kept, and their connections reused, until the
+        server handle is released.
+        """
+        serverHandle = self._getServerHandle()
+        copies = getattr(self, 'serverHandleCopies', None)
+
+        if copies is None:
+            copies = self.serverHandleCopies = []
+
+        while len(copies) < count - 1:
+            copies.append(serverHandle.copy())
+
+        return [serverHandle] + copies[:count - 1]
+
     def _releaseServerHandle(self):
         self.serverHandle = None
+        self.serverHandleCopies = None
 
 
     def getLocation(self, privilege=None):
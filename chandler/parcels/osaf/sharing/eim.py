@@ -19,13 +19,14 @@ __all__ = [
     'add_converter', 'subtype', 'typedef', 'field', 'key', 'NoChange',
     'Record', 'RecordSet', 'Diff', 'lookupSchemaURI', 'Filter', 'Translator',
     'exporter', 'TimestampType', 'IncompatibleTypes', 'Inherit',
-    'sort_records', 'format_field', 'global_formatters',
+    'sort_records', 'format_field', 'global_formatters', 'RecordCache',
 ]
 
 from symbols import Symbol, NOT_GIVEN  # XXX change this to peak.util.symbols
 from simplegeneric import generic
 from weakref import WeakValueDictionary
-import linecache, decimal, datetime
+from collections import deque
+import linecache, decimal, datetime, threading
 from application import schema
 from chandlerdb.util.c import UUID
 from chandlerdb.persistence.RepositoryView import currentview
@@ -901,9 +902,57 @@ class TranslatorClass(type):
 
 
 
+class RecordCache(object):
+    """A bounded cache of the records exported for items
+
+    The records of an item are kept along with the export key they were
+    computed for, see `Translator.getExportKey()`, and are only returned
+    for the same key. A newer key replaces the item's entry, and the
+    oldest entries are evicted once there are more than `size` of them.
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.hits = self.misses = 0
+        self._entries = {}
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, uuid, key):
+        """Return the records cached for `uuid` under `key`, or None"""
+        entry = self._entries.get(uuid)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, uuid, key, records):
+        with self._lock:
+            if uuid not in self._entries:
+                self._queue.append(uuid)
+            self._entries[uuid] = (key, records)
+            while len(self._queue) > self.size:
+                self._entries.pop(self._queue.popleft(), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._queue.clear()
+
+
+
 class Translator:
     """Base class for import/export between Items and Records"""
     __metaclass__ = TranslatorClass
+
+    # A RecordCache shared by all instances, across views and shares, or
+    # None for exported records not to be cached
+    recordCache = None
+
     def __init__(self, rv):
         self.rv = rv
         self.loadQueue = {}
@@ -951,9 +1000,38 @@ class Translator:
             for stamp in pim.Stamp(item).stamps:
                 yield stamp, pim.Stamp
 
+    def getExportKey(self, item):
+        """Return a key for the state `item` is exported from, or None
+
+        The key must change whenever the records exported for `item` would,
+        usually by including the versions of `item` and of the items its
+        exporters read. Records are cached only if a key is returned.
+        """
+        return None
+
     def exportItem(self, item):
         """Export an item and its stamps, if any"""
 
+        cache = self.recordCache
+        if cache is not None:
+            key = self.getExportKey(item)
+            if key is not None:
+                key = (self.__class__, key)
+                records = cache.get(item.itsUUID, key)
+                if records is None:
+                    records = tuple(self._exportItem(item))
+                    # exporters may have changed the item
+                    if not item.isDirty():
+                        cache.put(item.itsUUID, key, records)
+                for record in records:
+                    yield record
+                return
+
+        for record in self._exportItem(item):
+            yield record
+
+    def _exportItem(self, item):
+
         for item, skipType in self._exportablesFor(item):
 
             try:
@@ -18,9 +18,10 @@ from osaf.sharing import eim, errors
 from osaf.sharing.simplegeneric import generic
 from osaf.pim.calendar.TimeZone import convertToICUtzinfo
 import base64, decimal, re
+from cStringIO import StringIO
 from dateutil.parser import parse as dateutilparser
 from xml.etree.cElementTree import (
-    Element, SubElement, tostring, fromstring
+    Element, SubElement, tostring, fromstring, iterparse
 )
 
 
@@ -37,48 +38,71 @@ xmlUnfriendly = re.compile("[\x00-\x08|\x0b|\x0c|\x0e-\x1f]")
 
 
 
+# The converters registered for each type of value, so that they can be
+# looked up once per field instead of being dispatched for every value
+_serializers = {}
+_deserializers = {}
+
+def _lookupConverter(generic, converters, typeinfo):
+    for t in type(typeinfo).__mro__:
+        converter = converters.get(t)
+        if converter is not None:
+            return converter
+
+    return generic
+
+
+
+
 @generic
 def serializeValue(typeinfo, rv, value):
     """Serialize a value based on typeinfo"""
     raise NotImplementedError("Unrecognized type:", typeinfo)
 
-@serializeValue.when_type(eim.BytesType)
+def serializer(t):
+    """Register the serializer of values of type t"""
+    def decorate(f):
+        _serializers[t] = f
+        return serializeValue.when_type(t)(f)
+    return decorate
+
+@serializer(eim.BytesType)
 def serialize_bytes(typeinfo, rv, value):
     if value is None:
         return None, "bytes"
     return base64.b64encode(value), "bytes"
 
-@serializeValue.when_type(eim.IntType)
+@serializer(eim.IntType)
 def serialize_int(typeinfo, rv, value):
     if value is None:
         return None, "integer"
     return str(value), "integer"
 
-@serializeValue.when_type(eim.TextType)
+@serializer(eim.TextType)
 def serialize_text(typeinfo, rv, value):
     if value is None:
         return None, "text"
     return value, "text"
 
-@serializeValue.when_type(eim.BlobType)
+@serializer(eim.BlobType)
 def serialize_blob(typeinfo, rv, value):
     if value is None:
         return None, "blob"
     return base64.b64encode(value), "blob"
 
-@serializeValue.when_type(eim.ClobType)
+@serializer(eim.ClobType)
 def serialize_clob(typeinfo, rv, value):
     if value is None:
         return None, "clob"
     return value, "clob"
 
-@serializeValue.when_type(eim.DateType)
+@serializer(eim.DateType)
 def serialize_date(typeinfo, rv, value):
     if value is None:
         return None, "datetime"
     return value.isoformat(), "datetime"
 
-@serializeValue.when_type(eim.DecimalType)
+@serializer(eim.DecimalType)
 def serialize_decimal(typeinfo, rv, value):
     if value is None:
         return None, "decimal"
@@ -92,31 +116,38 @@ def deserializeValue(typeinfo, rv, text):
     """Deserialize text based on typeinfo"""
     raise NotImplementedError("Unrecognized type:", typeinfo)
 
-@deserializeValue.when_type(eim.BytesType)
+def deserializer(t):
+    """Register the deserializer of values of type t"""
+    def decorate(f):
+        _deserializers[t] = f
+        return deserializeValue.when_type(t)(f)
+    return decorate
+
+@deserializer(eim.BytesType)
 def deserialize_bytes(typeinfo, rv, text):
     return base64.b64decode(text)
 
-@deserializeValue.when_type(eim.IntType)
+@deserializer(eim.IntType)
 def deserialize_int(typeinfo, rv, text):
     return int(text)
 
-@deserializeValue.when_type(eim.TextType)
+@deserializer(eim.TextType)
 def deserialize_text(typeinfo, rv, text):
     return text
 
-@deserializeValue.when_type(eim.BlobType)
+@deserializer(eim.BlobType)
 def deserialize_blob(typeinfo, rv, text):
     return base64.b64decode(text)
 
-@deserializeValue.when_type(eim.ClobType)
+@deserializer(eim.ClobType)
 def deserialize_clob(typeinfo, rv, text):
     return text
 
-@deserializeValue.when_type(eim.DecimalType)
+@deserializer(eim.DecimalType)
 def deserialize_decimal(typeinfo, rv, text):
     return decimal.Decimal(text)
 
-@deserializeValue.when_type(eim.DateType)
+@deserializer(eim.DateType)
 def deserialize_date(typeinfo, rv, text):
     return convertToICUtzinfo(rv, dateutilparser(text))
 
@@ -129,167 +160,290 @@ keyURI = "{%s}key" % eimURI
 typeURI = "{%s}type" % eimURI
 deletedURI = "{%s}deleted" % eimURI
 
+
+_recordFields = {}
+
+def _getRecordFields(recordClass):
+    """
+    Return a tuple of (field, isKey, serialize, deserialize) for each field
+    of a record class, the converters of their types being looked up once.
+    """
+    try:
+        return _recordFields[recordClass]
+    except KeyError:
+        fields = tuple([(field, isinstance(field, eim.key),
+                         _lookupConverter(serializeValue, _serializers,
+                                          field.typeinfo),
+                         _lookupConverter(deserializeValue, _deserializers,
+                                          field.typeinfo))
+                        for field in recordClass.__fields__])
+        _recordFields[recordClass] = fields
+        return fields
+
+
+# EIMML is written the way ElementTree's tostring() writes it: as us-ascii
+# with character references, ns0 being the prefix of the EIM namespace and
+# ns1 the one of the record namespace declared by each record element.
+
+def _escapeText(text):
+    if isinstance(text, str):
+        text = text.decode('utf-8')
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return text.encode('us-ascii', 'xmlcharrefreplace')
+
+def _escapeAttribute(value):
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    elif not isinstance(value, unicode):
+        value = unicode(value)
+    value = value.replace("&", "&amp;").replace("<", "&lt;")
+    value = value.replace(">", "&gt;").replace("\"", "&quot;")
+    value = value.replace("\n", "&#10;")
+    return value.encode('us-ascii', 'xmlcharrefreplace')
+
+def _writeElement(write, tag, attrs, xmlns=None, text=None):
+    # attributes in lexical order of their qualified names,
+    # followed by the namespace declaration
+    write("<%s" % tag)
+    for name, qname, value in sorted(attrs):
+        write(' %s="%s"' % (qname, _escapeAttribute(value)))
+    if xmlns is not None:
+        write(' %s="%s"' % xmlns)
+    if text:
+        write(">%s</%s>" % (_escapeText(text), tag))
+    else:
+        write(" />")
+
 class EIMMLSerializer(object):
 
     @classmethod
     def serialize(cls, rv, recordSets, rootName="collection", **extra):
         """ Convert a list of record sets to XML text """
 
+        output = StringIO()
+        cls.write(rv, recordSets, output, rootName, **extra)
 
-        rootElement = Element("{%s}%s" % (eimURI, rootName), **extra)
+        return output.getvalue()
+
+    @classmethod
+    def write(cls, rv, recordSets, output, rootName="collection", **extra):
+        """
+        Write a list of record sets as XML to a file-like object.
+
+        Each record set is written as it is converted instead of building
+        the whole document in memory first.
+        """
+
+        write = lambda text: output.write(xmlUnfriendly.sub("", text))
+        output.write("<?xml version='1.0' encoding='UTF-8'?>")
+
+        rootAttrs = [(name, name, value) for name, value in extra.iteritems()]
+        rootXmlns = ("xmlns:ns0", eimURI)
 
         # Sorting by uuid here to guarantee we send masters before
         # modifications (for the benefit of Cosmo).  If we ever change
         # the recurrenceID uuid scheme, this will have to be updated.
         uuids = recordSets.keys()
         uuids.sort()
+
+        if not uuids:
+            _writeElement(write, "ns0:%s" % rootName, rootAttrs, rootXmlns)
+            return
+
+        write("<ns0:%s" % rootName)
+        for name, qname, value in sorted(rootAttrs):
+            write(' %s="%s"' % (qname, _escapeAttribute(value)))
+        write(' %s="%s">' % rootXmlns)
+
         for uuid in uuids:
             recordSet = recordSets[uuid]
+            attrs = [("uuid", "uuid", uuid)]
 
             if recordSet is not None:
 
-                recordSetElement = SubElement(rootElement,
-                    "{%s}recordset" % eimURI, uuid=uuid)
+                records = [cls._writeRecord(rv, record, False)
+                           for record in eim.sort_records(recordSet.inclusions)]
+                records.extend([cls._writeRecord(rv, record, True)
+                                for record in list(recordSet.exclusions)])
 
-                for record in eim.sort_records(recordSet.inclusions):
-                    recordElement = SubElement(recordSetElement,
-                        "{%s}record" % (record.URI))
+                if records:
+                    write('<ns0:recordset uuid="%s">' % _escapeAttribute(uuid))
+                    write("".join(records))
+                    write("</ns0:recordset>")
+                else:
+                    _writeElement(write, "ns0:recordset", attrs)
 
-                    for field in record.__fields__:
-                        value = record[field.offset]
+            else: # item deletion indicated
 
-                        if value is eim.NoChange:
-                            continue
+                attrs.append((deletedURI, "ns0:deleted", "true"))
+                _writeElement(write, "ns0:recordset", attrs)
 
-                        else:
+        write("</ns0:%s>" % rootName)
 
-                            attrs = { }
+    @classmethod
+    def _writeRecord(cls, rv, record, deleted):
+        """ Return the XML text of a record """
 
-                            if value is eim.Inherit:
-                                serialized, typeName = serializeValue(
-                                        field.typeinfo, rv, None)
-                                attrs["missing"] = "true"
+        fields = []
+        write = fields.append
 
-                            else:
-                                serialized, typeName = serializeValue(
-                                        field.typeinfo, rv, value)
-                                if value == "":
-                                    attrs["empty"] = "true"
+        for field, isKey, serialize, deserialize in \
+                _getRecordFields(type(record)):
 
-                            if typeName is not None:
-                                attrs[typeURI] = typeName
+            if deleted and not isKey:
+                continue
 
-                            if isinstance(field, eim.key):
-                                attrs[keyURI] = "true"
+            value = record[field.offset]
 
-                            fieldElement = SubElement(recordElement,
-                                "{%s}%s" % (record.URI, field.name),
-                                **attrs)
+            if value is eim.NoChange:
+                continue
 
-                            fieldElement.text = serialized
+            attrs = []
 
-                for record in list(recordSet.exclusions):
-                    attrs = { deletedURI : "true"}
-                    recordElement = SubElement(recordSetElement,
-                        "{%s}record" % (record.URI), **attrs)
+            if value is eim.Inherit:
+                serialized, typeName = serialize(field.typeinfo, rv, None)
+                attrs.append(("missing", "missing", "true"))
 
-                    for field in record.__fields__:
-                        if isinstance(field, eim.key):
-                            value = record[field.offset]
-                            serialized, typeName = serializeValue(
-                                field.typeinfo, rv, record[field.offset])
-                            attrs = { keyURI : 'true' }
-                            if typeName is not None:
-                                attrs[typeURI] = typeName
-                            if value == "":
-                                attrs["empty"] = "true"
-                            fieldElement = SubElement(recordElement,
-                                "{%s}%s" % (record.URI, field.name),
-                                **attrs)
-                            fieldElement.text = serialized
+            else:
+                serialized, typeName = serialize(field.typeinfo, rv, value)
+                if value == "":
+                    attrs.append(("empty", "empty", "true"))
 
-            else: # item deletion indicated
+            if typeName is not None:
+                attrs.append((typeURI, "ns0:type", typeName))
 
-                attrs = { deletedURI : "true"}
-                recordSetElement = SubElement(rootElement,
-                    "{%s}recordset" % eimURI, uuid=uuid, **attrs)
+            if isKey:
+                attrs.append((keyURI, "ns0:key", "true"))
 
+            _writeElement(write, "ns1:%s" % field.name, attrs,
+                          text=serialized)
 
-        xmlString = xmlUnfriendly.sub("", tostring(rootElement))
-        return "<?xml version='1.0' encoding='UTF-8'?>%s" % xmlString
+        text = []
+        attrs = []
+        if deleted:
+            attrs.append((deletedURI, "ns0:deleted", "true"))
+        xmlns = ("xmlns:ns1", record.URI)
+
+        if fields:
+            text.append("<ns1:record")
+            for name, qname, value in attrs:
+                text.append(' %s="%s"' % (qname, value))
+            text.append(' %s="%s">' % xmlns)
+            text.extend(fields)
+            text.append("</ns1:record>")
+        else:
+            _writeElement(text.append, "ns1:record", attrs, xmlns)
+
+        return "".join(text)
 
     @classmethod
     def deserialize(cls, rv, text, **kwargs):
         """ Parse XML text into a list of record sets """
 
+        recordSets = {}
         try:
-            rootElement = fromstring(text) # xml parser
+            extra, records = cls.parse(rv, StringIO(text))
+            for uuid, recordSet in records:
+                recordSets[uuid] = recordSet
         except Exception, e:
             errors.annotate(e, "Couldn't parse XML",
                 details=text[:5000].encode("string_escape"))
             raise
 
-        recordSets = {}
-        for recordSetElement in rootElement:
-            uuid = recordSetElement.get("uuid")
+        return recordSets, extra
 
-            deleted = recordSetElement.get(deletedURI)
-            if deleted and deleted.lower() == "true":
-                recordSet = None
+    @classmethod
+    def parse(cls, rv, input):
+        """
+        Parse XML from a file-like object incrementally.
 
-            else:
-                inclusions = []
-                exclusions = []
+        Return the attributes of the root element and an iterator over
+        (uuid, record set) pairs, each record set being converted as soon
+        as its element is parsed and then discarded.
+        """
 
-                for recordElement in recordSetElement:
-                    ns, name = recordElement.tag[1:].split("}")
+        events = iterparse(input, ("start", "end"))
+        event, rootElement = events.next()
 
-                    recordClass = eim.lookupSchemaURI(ns)
-                    if recordClass is None:
-                        continue    # XXX handle error?  logging?
+        return dict(rootElement.items()), cls._iterRecordSets(rv, events,
+                                                              rootElement)
 
-                    values = []
-                    for field in recordClass.__fields__:
-                        for fieldElement in recordElement:
-                            ns, name = fieldElement.tag[1:].split("}")
-                            if field.name == name:
-                                empty = fieldElement.get("empty")
-                                missing = fieldElement.get("missing")
-                                if empty and empty.lower() == "true":
-                                    value = ""
-                                elif missing and missing.lower() == "true":
-                                    value = eim.Inherit
-                                else:
-                                    if fieldElement.text is None:
-                                        value = None
-                                    else:
-                                        value = deserializeValue(
-                                            field.typeinfo, rv,
-                                            fieldElement.text)
-                                break
-                        else:
-                            value = eim.NoChange
+    @classmethod
+    def _iterRecordSets(cls, rv, events, rootElement):
 
-                        values.append(value)
+        depth = 0
+        for event, element in events:
+            if event == "start":
+                depth += 1
+                continue
 
-                    record = recordClass(*values)
+            depth -= 1
+            if depth == 0:
+                recordSetElement = element
+                uuid = recordSetElement.get("uuid")
+                recordSet = cls._readRecordSet(rv, recordSetElement)
+                rootElement.clear()
 
-                    deleted = recordElement.get(deletedURI)
-                    if deleted and deleted.lower() == "true":
-                        if record is eim.NoChange:
-                            record = recordClass(*
-                                [(eim.Inherit if v is eim.NoChange else v)
-                                for v in values]
-                            )
-                        exclusions.append(record)
+                yield uuid, recordSet
+
+    @classmethod
+    def _readRecordSet(cls, rv, recordSetElement):
+        """ Convert a recordset element into a record set """
+
+        deleted = recordSetElement.get(deletedURI)
+        if deleted and deleted.lower() == "true":
+            return None
+
+        inclusions = []
+        exclusions = []
+
+        for recordElement in recordSetElement:
+            ns, name = recordElement.tag[1:].split("}")
+
+            recordClass = eim.lookupSchemaURI(ns)
+            if recordClass is None:
+                continue    # XXX handle error?  logging?
+
+            fieldElements = {}
+            for fieldElement in recordElement:
+                ns, name = fieldElement.tag[1:].split("}")
+                fieldElements.setdefault(name, fieldElement)
+
+            values = []
+            for field, isKey, serialize, deserialize in \
+                    _getRecordFields(recordClass):
+                fieldElement = fieldElements.get(field.name)
+                if fieldElement is None:
+                    value = eim.NoChange
+                else:
+                    empty = fieldElement.get("empty")
+                    missing = fieldElement.get("missing")
+                    if empty and empty.lower() == "true":
+                        value = ""
+                    elif missing and missing.lower() == "true":
+                        value = eim.Inherit
+                    elif fieldElement.text is None:
+                        value = None
                     else:
-                        inclusions.append(record)
+                        value = deserialize(field.typeinfo, rv,
+                                            fieldElement.text)
 
-                recordSet = eim.Diff(inclusions, exclusions)
+                values.append(value)
 
-            recordSets[uuid] = recordSet
+            record = recordClass(*values)
 
-        return recordSets, dict(rootElement.items())
+            deleted = recordElement.get(deletedURI)
+            if deleted and deleted.lower() == "true":
+                if record is eim.NoChange:
+                    record = recordClass(*
+                        [(eim.Inherit if v is eim.NoChange else v)
+                        for v in values]
+                    )
+                exclusions.append(record)
+            else:
+                inclusions.append(record)
+
+        return eim.Diff(inclusions, exclusions)
 
 
 
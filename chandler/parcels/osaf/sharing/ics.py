@@ -25,6 +25,8 @@ from chandlerdb.persistence.RepositoryView import currentview
 from i18n import ChandlerMessageFactory as _
 from hashlib import md5
 from itertools import chain
+from tempfile import TemporaryFile
+from shutil import copyfileobj
 import logging
 
 from vobject.base import textLineToContentLine, Component, ContentLine
@@ -441,6 +443,55 @@ def setHigherSequence(vevents):
     for vevent in vevents:
         vevent.sequence.value = str(highestSequence + 1)
 
+def masterInfo(vobj):
+    """
+    Return what converting a modification needs to know about its master,
+    a C{(duration, anyTime, allDay)} tuple.
+    """
+    dtstart = getattr(vobj, 'dtstart', None)
+    anyTime = getattr(dtstart, 'x_osaf_anytime_param', '') == 'TRUE'
+    allDay = (not anyTime and dtstart is not None and
+              type(dtstart.value) == date)
+
+    return vobj.getChildValue('duration'), anyTime, allDay
+
+def iterComponents(lines):
+    """
+    Tokenize iCalendar lines into the components of their calendars.
+
+    Yield a C{(name, header, text)} tuple for each component found at the
+    top level of a VCALENDAR, where C{name} is the upper-cased component
+    name, C{header} the list of the calendar's property lines read so far
+    and C{text} the component's lines, verbatim.  Components are not
+    parsed, so only one of them is held in memory at a time.
+    """
+    header = None
+    component = None
+    depth = 0
+
+    for line in lines:
+        key = line.rstrip('\r\n').upper()
+        if component is not None:
+            component.append(line)
+            if key.startswith('BEGIN:'):
+                depth += 1
+            elif key.startswith('END:'):
+                depth -= 1
+                if depth == 0:
+                    yield name, header, ''.join(component)
+                    component = None
+        elif key.startswith('BEGIN:'):
+            if header is None:
+                header = []
+            else:
+                name = key[6:].strip()
+                component = [line]
+                depth = 1
+        elif key.startswith('END:'):
+            header = None
+        elif header is not None and key:
+            header.append(line)
+
 
 class ICSSerializer(object):
 
@@ -507,6 +558,56 @@ class ICSSerializer(object):
         #handle icalendarExtra
         return cal
 
+    @classmethod
+    def serializeStream(cls, view, output, clusters, **extra):
+        """
+        Serialize clusters of record sets to an iCalendar stream.
+
+        Each cluster, a dictionary of record sets for a master and its
+        modifications, is converted and serialized on its own so that only
+        one cluster's vobjects are in memory at a time.  Serialized
+        components are spooled to a temporary file while the VTIMEZONEs
+        they use are collected, the VTIMEZONEs are then written to
+        C{output} ahead of the other components.
+
+        @param output: a file-like object open for writing
+        @param clusters: an iterable of record set dictionaries
+        """
+
+        timezones = []
+        properties = []
+        seen = set()
+
+        spool = TemporaryFile()
+        try:
+            for recordSets in clusters:
+                text = cls.recordSetsToVObject(view, recordSets).serialize()
+                lines = text.splitlines(True)
+                header = None
+                for name, header, component in iterComponents(lines):
+                    if name == 'VTIMEZONE':
+                        if component not in seen:
+                            seen.add(component)
+                            timezones.append(component)
+                    else:
+                        spool.write(component)
+                for line in header or ():
+                    name = line.split(':', 1)[0].split(';', 1)[0].lower()
+                    if name not in top_level_understood and line not in seen:
+                        seen.add(line)
+                        properties.append(line)
+
+            lines = cls.recordSetsToVObject(view, {}, **extra).serialize()
+            lines = lines.splitlines(True)
+            output.writelines(lines[:-1])       # up to END:VCALENDAR
+            output.writelines(properties)
+            output.writelines(timezones)
+            spool.seek(0)
+            copyfileobj(spool, output)
+            output.write(lines[-1])
+        finally:
+            spool.close()
+
     @classmethod
     def deserialize(cls, view, text, silentFailure=True):
         """
@@ -530,7 +631,7 @@ class ICSSerializer(object):
         for vobj in getattr(calendar, 'vevent_list', []):
             uid = vobj.getChildValue('uid')
             if vobj.getChildValue('recurrence_id') is None:
-                masters[uid] = vobj
+                masters[uid] = masterInfo(vobj)
 
         uid_to_uuid_map = {}
         
@@ -539,283 +640,403 @@ class ICSSerializer(object):
                                 getattr(calendar, 'vtodo_list', [])
                             ):
             try:
-                recurrenceID = vobj.getChildValue('recurrence_id')
-                summary      = vobj.getChildValue('summary', eim.NoChange)
-                description  = vobj.getChildValue('description', eim.NoChange)
-                status       = vobj.getChildValue('status', eim.NoChange)
-                duration     = vobj.getChildValue('duration')
-                uid          = vobj.getChildValue('uid')
-                dtstart      = vobj.getChildValue('dtstart')
-                location     = vobj.getChildValue('location', eim.NoChange)
-                
-                # bug 10821, Google serializes modifications with no master;
-                # treat these as normal events, not modifications
-                if not masters.get(uid):
-                    recurrenceID = None
-                
-                # can't just compare recurrenceID and dtstart, timezone could
-                # have changed, and comparing floating to non-floating would
-                # raise an exception
-                if recurrenceID is None:
-                    dtstart_changed = True
-                elif dtstart is None:
-                    dtstart_changed = False
-                elif type(recurrenceID) == date or type(dtstart) == date:
-                    dtstart_changed = recurrenceID != dtstart
-                else:
-                    dtstart_changed = (dtstart.tzinfo != recurrenceID.tzinfo or
-                                       dtstart != recurrenceID)
-                    
-                if status is not eim.NoChange:
-                    status = status.upper()
-
-                start_obj = getattr(vobj, 'dtstart', None)
-
-                isVtodo = (vobj.name == 'VTODO')
-                osafStarred = vobj.getChildValue('x_osaf_starred')
-                if osafStarred:
-                    osafStarred = (u"TRUE" == osafStarred.upper())
-
-                if dtstart is None or isVtodo:
-                    # due takes precedence over dtstart
-                    due = vobj.getChildValue('due')
-                    if due is not None:
-                        dtstart = due
-                        start_obj = getattr(vobj, 'due', None)
-                    
-                anyTime = False
-                if dtstart is not None:
-                    anyTimeParam = getattr(start_obj, 'x_osaf_anytime_param',
-                                           '')
-                    anyTime = anyTimeParam.upper() == 'TRUE'
+                uuid, recordSet = cls.vobjToRecordSet(view, calendar, vobj,
+                                      masters.get(vobj.getChildValue('uid')),
+                                      uid_to_uuid_map)
+            except vobject.base.VObjectError, e:
+                icalendarLines = text.splitlines()
+                logger.error("Exception when importing icalendar, first 300 lines: \n%s"
+                             % "\n".join(icalendarLines[:300]))
+                logger.exception("import failed to import one event with exception: %s" % str(e))
+                if not silentFailure:
+                    raise
+            else:
+                if uuid is not None:
+                    recordSets[uuid] = recordSet
+
+        return recordSets, extra
 
-                isDate = type(dtstart) == date
-                allDay = isDate and not anyTime
+    @classmethod
+    def iterDeserialize(cls, view, lines, batchSize=500, silentFailure=True):
+        """
+        Parse an iCalendar stream into batches of record sets.
 
-                
-                emitEvent = (dtstart is not None)
-                
-                if duration is None:
-                    dtend = vobj.getChildValue('dtend')
-                
-                    def getDifference(left, right):
-                        leftIsDate = (type(left) == date)
-                        rightIsDate = (type(right) == date)
-                        
-                        if leftIsDate:
-                            if rightIsDate:
-                                return left - right
-                            else:
-                                left = forceToDateTime(view, left)
-                                
-                        elif rightIsDate:
-                            right = forceToDateTime(view, right)
-        
-                        return makeNaiveteMatch(view,
-                                                left, right.tzinfo) - right
-                        
-                    if dtend is not None and dtstart is not None:
-                        duration = getDifference(dtend, dtstart)
-                            
-                    elif anyTime or isDate:
-                        duration = timedelta(1)
-                    else:
-                        duration = timedelta(0)
-
-                # handle the special case of a midnight-to-midnight floating
-                # event, treat it as allDay, bug 9579
-                if (not isDate and dtstart is not None and
-                      dtstart.tzinfo is None and dtstart.time() == midnight and
-                      duration.days >= 1 and
-                      duration == timedelta(duration.days)):
-                    allDay = True
-                
-                if isDate:
-                    dtstart = forceToDateTime(view, dtstart)
-                    # originally, duration was converted to Chandler's notion of
-                    # all day duration, but this step will be done by the
-                    # translator
-                    #duration -= oneDay
-
-                if dtstart is not None:
-                    dtstart = convertToICUtzinfo(view, dtstart)
-                    dtstart = toICalendarDateTime(view, dtstart, allDay, anyTime)
-    
-                # convert to EIM value
-                duration = toICalendarDuration(duration)                
+        Unlike L{deserialize}, the calendar is never parsed as a whole.
+        Each VEVENT or VTODO is parsed on its own, along with the
+        calendar's properties, and converted right away.  VTIMEZONEs are
+        expected to precede the components using them.
 
-                uuid = UUIDFromICalUID(view, uid_to_uuid_map, uid)
+        Modifications read before their master are held until it is read;
+        those left without one are converted as regular events, as in
+        L{deserialize}.  Top level properties not understood are only kept
+        with items while a single UID has been read.
 
-                valarm = getattr(vobj, 'valarm', None)
-                
-                if valarm is not None:
-                    remValue        = valarm.getChildValue('trigger')
-                    remDuration     = valarm.getChildValue('duration')
-                    remRepeat       = valarm.getChildValue('repeat')
-                    remDescription  = valarm.getChildValue('description',
-                                                           "Event Reminder")
-                    trigger = None
-                    
-                    if remValue is not None:
-                        if type(remValue) is datetime:
-                            icutzinfoValue = convertToICUtzinfo(view, remValue)
-                            trigger = toICalendarDateTime(view, icutzinfoValue, False)
-                        else:
-                            assert type(remValue) is timedelta
-                            trigger = toICalendarDuration(remValue)
-                            
-                    if remDuration is not None:
-                        remDuration = toICalendarDuration(remDuration)
-                        
-                    if remRepeat is not None:
-                        remRepeat = int(remRepeat)
+        @param lines: iCalendar lines, such as an open file
+        @param batchSize: the maximum number of record sets per batch
+        @return: a generator of C{(recordSets, extra)} tuples, at least one
+        """
 
-                recurrence = {}
-            
-                for rule_name in ('rrule', 'exrule'):
-                    rules = []
-                    for line in vobj.contents.get(rule_name, []):
-                        rules.append(line.value)
-                    recurrence[rule_name] = (":".join(rules) if len(rules) > 0 
-                                             else eim.NoChange)
+        recordSets = {}
+        extra = {'forceDateTriage' : True}
+
+        masters = {}
+        pending = {}
+        uid_to_uuid_map = {}
+        firstUID = None
+        singleUID = True
+
+        for name, header, text in iterComponents(lines):
+            if name not in ('VEVENT', 'VTODO', 'VTIMEZONE'):
+                continue
+
+            try:
+                # parsing a VTIMEZONE registers its tzid with vobject
+                calendar = vobject.readOne(''.join(chain(
+                    ['BEGIN:VCALENDAR\r\n'], header,
+                    [text, 'END:VCALENDAR\r\n'])),
+                    validate=False, ignoreUnreadable=True)
+            except vobject.base.VObjectError, e:
+                logger.error("Exception when importing icalendar component:\n%s", text)
+                logger.exception("import failed to import one event with exception: %s" % str(e))
+                if not silentFailure:
+                    raise
+                continue
+
+            if name == 'VTIMEZONE':
+                continue
+
+            if 'name' not in extra:
+                calname = calendar.getChildValue('x_wr_calname')
+                if calname is not None:
+                    extra['name'] = calname
+
+            vobj = calendar.contents[name.lower()][0]
+            uid = vobj.getChildValue('uid')
+
+            if name == 'VEVENT' and singleUID:
+                if firstUID is None:
+                    firstUID = (uid or '').upper()
+                elif firstUID != (uid or '').upper():
+                    singleUID = False
+            if not singleUID:
+                for key in calendar.contents.keys():
+                    if key.lower() not in top_level_understood:
+                        del calendar.contents[key]
+
+            if name == 'VTODO':
+                vobjs = [(calendar, vobj, masters.get(uid))]
+            elif vobj.getChildValue('recurrence_id') is None:
+                master = masters[uid] = masterInfo(vobj)
+                vobjs = [(calendar, vobj, master)]
+                vobjs.extend((c, v, master) for c, v in pending.pop(uid, ()))
+            elif uid in masters:
+                vobjs = [(calendar, vobj, masters[uid])]
+            else:
+                pending.setdefault(uid, []).append((calendar, vobj))
+                continue
+
+            for calendar, vobj, master in vobjs:
+                cls._convertVobj(view, calendar, vobj, master,
+                                 uid_to_uuid_map, recordSets, silentFailure)
+
+            if len(recordSets) >= batchSize:
+                yield recordSets, extra
+                recordSets = {}
+
+        for vobjs in pending.itervalues():
+            for calendar, vobj in vobjs:
+                cls._convertVobj(view, calendar, vobj, None,
+                                 uid_to_uuid_map, recordSets, silentFailure)
+
+        yield recordSets, extra
+
+    @classmethod
+    def _convertVobj(cls, view, calendar, vobj, master, uid_to_uuid_map,
+                     recordSets, silentFailure):
+
+        try:
+            uuid, recordSet = cls.vobjToRecordSet(view, calendar, vobj, master,
+                                                  uid_to_uuid_map)
+        except vobject.base.VObjectError, e:
+            logger.error("Exception when importing icalendar component %s",
+                         vobj.getChildValue('uid'))
+            logger.exception("import failed to import one event with exception: %s" % str(e))
+            if not silentFailure:
+                raise
+        else:
+            if uuid is not None:
+                recordSets[uuid] = recordSet
+
+    @classmethod
+    def vobjToRecordSet(cls, view, calendar, vobj, master, uid_to_uuid_map):
+        """
+        Convert one VEVENT or VTODO into a record set.
+
+        C{master} is the L{masterInfo} of the master of C{vobj}, or C{None}.
+        Return a C{(uuid, recordSet)} tuple, C{(None, None)} for skipped
+        modifications.
+        """
+
+        recurrenceID = vobj.getChildValue('recurrence_id')
+        summary      = vobj.getChildValue('summary', eim.NoChange)
+        description  = vobj.getChildValue('description', eim.NoChange)
+        status       = vobj.getChildValue('status', eim.NoChange)
+        duration     = vobj.getChildValue('duration')
+        uid          = vobj.getChildValue('uid')
+        dtstart      = vobj.getChildValue('dtstart')
+        location     = vobj.getChildValue('location', eim.NoChange)
+        
+        # bug 10821, Google serializes modifications with no master;
+        # treat these as normal events, not modifications
+        if master is None:
+            recurrenceID = None
+        
+        # can't just compare recurrenceID and dtstart, timezone could
+        # have changed, and comparing floating to non-floating would
+        # raise an exception
+        if recurrenceID is None:
+            dtstart_changed = True
+        elif dtstart is None:
+            dtstart_changed = False
+        elif type(recurrenceID) == date or type(dtstart) == date:
+            dtstart_changed = recurrenceID != dtstart
+        else:
+            dtstart_changed = (dtstart.tzinfo != recurrenceID.tzinfo or
+                               dtstart != recurrenceID)
             
-                for date_name in ('rdate', 'exdate'):
-                    dates = []
-                    for line in vobj.contents.get(date_name, []):
-                        dates.extend(line.value)
-                    if len(dates) > 0:
-                        if not (allDay or anyTime):
-                            dates = [convertToICUtzinfo(view, dt)
-                                     for dt in dates]
-                        dt_value = toICalendarDateTime(view, dates, allDay, anyTime)
-                    else:
-                        dt_value = eim.NoChange
-                    recurrence[date_name] = dt_value
+        if status is not eim.NoChange:
+            status = status.upper()
+
+        start_obj = getattr(vobj, 'dtstart', None)
+
+        isVtodo = (vobj.name == 'VTODO')
+        osafStarred = vobj.getChildValue('x_osaf_starred')
+        if osafStarred:
+            osafStarred = (u"TRUE" == osafStarred.upper())
+
+        if dtstart is None or isVtodo:
+            # due takes precedence over dtstart
+            due = vobj.getChildValue('due')
+            if due is not None:
+                dtstart = due
+                start_obj = getattr(vobj, 'due', None)
             
+        anyTime = False
+        if dtstart is not None:
+            anyTimeParam = getattr(start_obj, 'x_osaf_anytime_param',
+                                   '')
+            anyTime = anyTimeParam.upper() == 'TRUE'
 
-                if recurrenceID is not None:
-                    range = getattr(vobj.recurrence_id, 'range_param', 'THIS')
-                    if range != 'THIS':
-                        logger.info("Skipping a THISANDFUTURE or "
-                                    "THISANDPRIOR modification")
-                        continue
-                    
-                    dateValue = allDay or anyTime
-                    recurrenceID = forceToDateTime(view, recurrenceID)
-                    recurrenceID = convertToICUtzinfo(view, recurrenceID)
-                    if recurrenceID.tzinfo != view.tzinfo.floating:
-                        recurrenceID = recurrenceID.astimezone(view.tzinfo.UTC)
-                    rec_string = translator.formatDateTime(view, recurrenceID,
-                                                           dateValue, dateValue)
-
-                    uuid += ":" + rec_string
-                    master = masters[uid]
-                    uid = eim.Inherit
-                    if (master.getChildValue('duration') == 
-                          vobj.getChildValue('duration')):
-                        duration = eim.Inherit
-                    masterAnyTime = (getattr(master.dtstart, 
-                                          'x_osaf_anytime_param', '') == 'TRUE')
-                    
-                    masterAllDay = (not masterAnyTime and 
-                                    type(master.dtstart.value) == date)
-                    
-                    if (masterAllDay == allDay and masterAnyTime == anyTime and
-                        not dtstart_changed):
-                        dtstart = eim.Inherit
-                
-                triage = eim.NoChange
-                needsReply = eim.NoChange
+        isDate = type(dtstart) == date
+        allDay = isDate and not anyTime
+
+        
+        emitEvent = (dtstart is not None)
+        
+        if duration is None:
+            dtend = vobj.getChildValue('dtend')
+        
+            def getDifference(left, right):
+                leftIsDate = (type(left) == date)
+                rightIsDate = (type(right) == date)
                 
-                if isVtodo and status is not eim.NoChange:
-                    status = status.lower()
-                    code = vtodo_status_to_triage_code.get(status, "100")
-                    completed = vobj.getChildValue('completed')
-                    if completed is not None:
-                        if type(completed) == date:
-                            completed = TimeZone.forceToDateTime(view, completed)
-                        timestamp = str(Triageable.makeTriageStatusChangedTime(view, completed))
+                if leftIsDate:
+                    if rightIsDate:
+                        return left - right
                     else:
-                        timestamp = getattr(vobj.status, 'x_osaf_changed_param',
-                                            "0.0")
-                    auto = getattr(vobj.status, 'x_osaf_auto_param', 'FALSE')
-                    auto = ("1" if auto == 'TRUE' else "0")
-                    triage =  code + " " + timestamp + " " + auto
-                    
-                    needsReply = (1 if status == 'needs-action' else 0)
+                        left = forceToDateTime(view, left)
+                        
+                elif rightIsDate:
+                    right = forceToDateTime(view, right)
 
-                    # VTODO's status doesn't correspond to EventRecord's status
-                    status = eim.NoChange
+                return makeNaiveteMatch(view,
+                                        left, right.tzinfo) - right
                 
-                icalExtra = eim.NoChange
-                if not isVtodo:
-                    # not processing VTODOs
-                    icalExtra = extractUnrecognized(calendar, vobj)
-                    if icalExtra is None:
-                        icalExtra = ''
-                    else:
-                        icalExtra = icalExtra.serialize().decode('utf-8')
-
-                records = [model.NoteRecord(uuid,
-                                            description,  # body
-                                            uid,          # icalUid
-                                            None,         # icalProperties
-                                            None,         # icalParameters
-                                            icalExtra,    # icalExtra
-                                            ),
-                           model.ItemRecord(uuid, 
-                                            summary,        # title
-                                            triage,         # triage
-                                            eim.NoChange,   # createdOn
-                                            eim.NoChange,   # hasBeenSent (TODO)
-                                            needsReply,     # needsReply (TODO)
-                                            eim.NoChange,   # read
-                                            )]
-                if emitEvent:
-                    records.append(model.EventRecord(uuid,
-                                            dtstart,
-                                            duration,
-                                            location,
-                                            recurrence['rrule'],   # rrule
-                                            recurrence['exrule'],  # exrule
-                                            recurrence['rdate'],   # rdate
-                                            recurrence['exdate'],  # exdate
-                                            status,                # status
-                                            eim.NoChange    # lastPastOccurrence
-                                            ))
-                if osafStarred:
-                    records.append(model.TaskRecord(uuid))
-                           
-                if valarm is not None:
-                    records.append(
-                           model.DisplayAlarmRecord(
-                                             uuid,
-                                             remDescription,
-                                             trigger,
-                                             remDuration,
-                                             remRepeat
-                                             ))
-                else:
-                    records.append(
-                        model.DisplayAlarmRecord(
-                            uuid,
-                            None,
-                            None,
-                            None,
-                            None))
+            if dtend is not None and dtstart is not None:
+                duration = getDifference(dtend, dtstart)
+                    
+            elif anyTime or isDate:
+                duration = timedelta(1)
+            else:
+                duration = timedelta(0)
+
+        # handle the special case of a midnight-to-midnight floating
+        # event, treat it as allDay, bug 9579
+        if (not isDate and dtstart is not None and
+              dtstart.tzinfo is None and dtstart.time() == midnight and
+              duration.days >= 1 and
+              duration == timedelta(duration.days)):
+            allDay = True
+        
+        if isDate:
+            dtstart = forceToDateTime(view, dtstart)
+            # originally, duration was converted to Chandler's notion of
+            # all day duration, but this step will be done by the
+            # translator
+            #duration -= oneDay
 
-                recordSets[uuid] = RecordSet(records)
+        if dtstart is not None:
+            dtstart = convertToICUtzinfo(view, dtstart)
+            dtstart = toICalendarDateTime(view, dtstart, allDay, anyTime)
 
+        # convert to EIM value
+        duration = toICalendarDuration(duration)                
 
-            except vobject.base.VObjectError, e:
-                icalendarLines = text.splitlines()
-                logger.error("Exception when importing icalendar, first 300 lines: \n%s"
-                             % "\n".join(icalendarLines[:300]))
-                logger.exception("import failed to import one event with exception: %s" % str(e))
-                if not silentFailure:
-                    raise
+        uuid = UUIDFromICalUID(view, uid_to_uuid_map, uid)
 
-        return recordSets, extra
+        valarm = getattr(vobj, 'valarm', None)
+        
+        if valarm is not None:
+            remValue        = valarm.getChildValue('trigger')
+            remDuration     = valarm.getChildValue('duration')
+            remRepeat       = valarm.getChildValue('repeat')
+            remDescription  = valarm.getChildValue('description',
+                                                   "Event Reminder")
+            trigger = None
+            
+            if remValue is not None:
+                if type(remValue) is datetime:
+                    icutzinfoValue = convertToICUtzinfo(view, remValue)
+                    trigger = toICalendarDateTime(view, icutzinfoValue, False)
+                else:
+                    assert type(remValue) is timedelta
+                    trigger = toICalendarDuration(remValue)
+                    
+            if remDuration is not None:
+                remDuration = toICalendarDuration(remDuration)
+                
+            if remRepeat is not None:
+                remRepeat = int(remRepeat)
+
+        recurrence = {}
+    
+        for rule_name in ('rrule', 'exrule'):
+            rules = []
+            for line in vobj.contents.get(rule_name, []):
+                rules.append(line.value)
+            recurrence[rule_name] = (":".join(rules) if len(rules) > 0 
+                                     else eim.NoChange)
+    
+        for date_name in ('rdate', 'exdate'):
+            dates = []
+            for line in vobj.contents.get(date_name, []):
+                dates.extend(line.value)
+            if len(dates) > 0:
+                if not (allDay or anyTime):
+                    dates = [convertToICUtzinfo(view, dt)
+                             for dt in dates]
+                dt_value = toICalendarDateTime(view, dates, allDay, anyTime)
+            else:
+                dt_value = eim.NoChange
+            recurrence[date_name] = dt_value
+    
+
+        if recurrenceID is not None:
+            range = getattr(vobj.recurrence_id, 'range_param', 'THIS')
+            if range != 'THIS':
+                logger.info("Skipping a THISANDFUTURE or "
+                            "THISANDPRIOR modification")
+                return None, None
+            
+            dateValue = allDay or anyTime
+            recurrenceID = forceToDateTime(view, recurrenceID)
+            recurrenceID = convertToICUtzinfo(view, recurrenceID)
+            if recurrenceID.tzinfo != view.tzinfo.floating:
+                recurrenceID = recurrenceID.astimezone(view.tzinfo.UTC)
+            rec_string = translator.formatDateTime(view, recurrenceID,
+                                                   dateValue, dateValue)
+
+            uuid += ":" + rec_string
+            masterDuration, masterAnyTime, masterAllDay = master
+            uid = eim.Inherit
+            if masterDuration == vobj.getChildValue('duration'):
+                duration = eim.Inherit
+            
+            if (masterAllDay == allDay and masterAnyTime == anyTime and
+                not dtstart_changed):
+                dtstart = eim.Inherit
+        
+        triage = eim.NoChange
+        needsReply = eim.NoChange
+        
+        if isVtodo and status is not eim.NoChange:
+            status = status.lower()
+            code = vtodo_status_to_triage_code.get(status, "100")
+            completed = vobj.getChildValue('completed')
+            if completed is not None:
+                if type(completed) == date:
+                    completed = TimeZone.forceToDateTime(view, completed)
+                timestamp = str(Triageable.makeTriageStatusChangedTime(view, completed))
+            else:
+                timestamp = getattr(vobj.status, 'x_osaf_changed_param',
+                                    "0.0")
+            auto = getattr(vobj.status, 'x_osaf_auto_param', 'FALSE')
+            auto = ("1" if auto == 'TRUE' else "0")
+            triage =  code + " " + timestamp + " " + auto
+            
+            needsReply = (1 if status == 'needs-action' else 0)
+
+            # VTODO's status doesn't correspond to EventRecord's status
+            status = eim.NoChange
+        
+        icalExtra = eim.NoChange
+        if not isVtodo:
+            # not processing VTODOs
+            icalExtra = extractUnrecognized(calendar, vobj)
+            if icalExtra is None:
+                icalExtra = ''
+            else:
+                icalExtra = icalExtra.serialize().decode('utf-8')
+
+        records = [model.NoteRecord(uuid,
+                                    description,  # body
+                                    uid,          # icalUid
+                                    None,         # icalProperties
+                                    None,         # icalParameters
+                                    icalExtra,    # icalExtra
+                                    ),
+                   model.ItemRecord(uuid, 
+                                    summary,        # title
+                                    triage,         # triage
+                                    eim.NoChange,   # createdOn
+                                    eim.NoChange,   # hasBeenSent (TODO)
+                                    needsReply,     # needsReply (TODO)
+                                    eim.NoChange,   # read
+                                    )]
+        if emitEvent:
+            records.append(model.EventRecord(uuid,
+                                    dtstart,
+                                    duration,
+                                    location,
+                                    recurrence['rrule'],   # rrule
+                                    recurrence['exrule'],  # exrule
+                                    recurrence['rdate'],   # rdate
+                                    recurrence['exdate'],  # exdate
+                                    status,                # status
+                                    eim.NoChange    # lastPastOccurrence
+                                    ))
+        if osafStarred:
+            records.append(model.TaskRecord(uuid))
+                   
+        if valarm is not None:
+            records.append(
+                   model.DisplayAlarmRecord(
+                                     uuid,
+                                     remDescription,
+                                     trigger,
+                                     remDuration,
+                                     remRepeat
+                                     ))
+        else:
+            records.append(
+                model.DisplayAlarmRecord(
+                    uuid,
+                    None,
+                    None,
+                    None,
+                    None))
+
+        return uuid, RecordSet(records)
 
 class VObjectSerializer(ICSSerializer):
     serialize = ICSSerializer.recordSetsToVObject
@@ -16,18 +16,21 @@ from __future__ import with_statement
 from osaf import pim
 from osaf.timemachine import getNow
 from osaf.pim import TriageEnum
-import conduits, errors, eim, shares, model, utility
+import conduits, errors, eim, shares, model, utility, WebDAV
 from model import EventRecord, ItemRecord
 from utility import (splitUUID, getDateUtilRRuleSet, fromICalendarDateTime,
                      checkTriageOnly, getMasterAlias, code_to_triagestatus,
                      mergeFunction)
 from i18n import ChandlerMessageFactory as _
-import logging
+import logging, threading
 from itertools import chain
+from bisect import bisect_right
 from application import schema
 from chandlerdb.item.Item import Item
 from chandlerdb.util.c import UUID
+from chandlerdb.util.Spans import profiler
 import dateutil
+from twisted.internet import reactor, defer
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +64,151 @@ def setReadOnlyMode(active):
 
 
 
+class _Journal(object):
+    """
+    The C{(version, uuid)} pairs, in version order, of the members of one
+    collection changed after C{fromVersion} up to C{toVersion}.
+    """
+
+    def __init__(self, fromVersion):
+
+        self.fromVersion = fromVersion
+        self.toVersion = fromVersion
+        self.versions = []
+        self.uuids = []
+
+    def __len__(self):
+
+        return len(self.versions)
+
+    def append(self, version, uuid):
+
+        self.versions.append(version)
+        self.uuids.append(uuid)
+
+    def getChanges(self, fromVersion, toVersion):
+
+        start = bisect_right(self.versions, fromVersion)
+        end = bisect_right(self.versions, toVersion, start)
+
+        return set(self.uuids[start:end])
+
+    def compact(self, version):
+
+        if version > self.fromVersion:
+            count = bisect_right(self.versions, version)
+            del self.versions[:count]
+            del self.uuids[:count]
+            self.fromVersion = version
+
+
+class ChangeJournal(object):
+    """
+    A journal of the members of shared collections changed at each
+    repository version.
+
+    Each range of repository history is scanned once for all the
+    collections in the journal instead of once per share, and only the
+    changes to members of these collections are kept. Finding the items
+    changed in a share since its previous sync is then proportional to the
+    changes in its collection instead of to all the changes in the
+    repository.
+
+    Sharing views don't dispatch notifications, so the journal is fed from
+    the repository history: it is not persisted itself and, after a
+    restart, the first sync of a collection rebuilds its part of the
+    journal with one scan of the history since that sync. The changes
+    every share of a collection has synced are compacted away.
+    """
+
+    # a collection whose shares stop syncing is dropped from the journal
+    # rather than have its changes grow without bound
+    maxChanges = 100000
+
+    def __init__(self):
+
+        self._lock = threading.RLock()
+        self._journals = {}
+
+    def getChanges(self, view, collection, fromVersion):
+        """
+        Return the UUIDs of the members of C{collection} changed after
+        C{fromVersion} up to and including the version of C{view}.
+
+        Items that changed while members but have since been removed from
+        C{collection} or deleted are not returned.
+
+        @param view: the view the changes are visible in
+        @param collection: a collection in C{view}
+        @param fromVersion: the repository version after which to look
+        @return: a C{set} of UUIDs
+        """
+
+        uCollection = collection.itsUUID
+        toVersion = view.itsVersion
+
+        with self._lock:
+            journal = self._journals.get(uCollection)
+            if journal is None or fromVersion < journal.fromVersion:
+                journal = self._journals[uCollection] = _Journal(fromVersion)
+
+            self._update(view, toVersion)
+
+            return set(uItem for uItem in journal.getChanges(fromVersion,
+                                                             toVersion)
+                       if uItem in collection)
+
+    def _update(self, view, toVersion):
+
+        journals = []
+        for uCollection, journal in self._journals.items():
+            if journal.toVersion < toVersion:
+                collection = view.find(uCollection)
+                if collection is None:
+                    del self._journals[uCollection]
+                else:
+                    journals.append((journal, collection))
+
+        if journals:
+            fromVersion = min(journal.toVersion for journal, x in journals)
+            for uItem, version in view.mapHistoryKeys(fromVersion=fromVersion,
+                                                      toVersion=toVersion):
+                for journal, collection in journals:
+                    if version > journal.toVersion and uItem in collection:
+                        journal.append(version, uItem)
+
+            for journal, collection in journals:
+                journal.toVersion = toVersion
+                if len(journal) > self.maxChanges:
+                    del self._journals[collection.itsUUID]
+
+    def compact(self, collection):
+        """
+        Drop the changes to C{collection} every established share of it
+        has synced, as recorded by their conduits' C{lastVersion}.
+        """
+
+        versions = [share.conduit.lastVersion
+                    for share in getattr(shares.SharedItem(collection),
+                                         'shares', ())
+                    if share.established and
+                       isinstance(share.conduit, RecordSetConduit)]
+
+        if versions:
+            with self._lock:
+                journal = self._journals.get(collection.itsUUID)
+                if journal is not None:
+                    journal.compact(min(versions))
+
+    def clear(self):
+
+        with self._lock:
+            self._journals.clear()
+
+
+changeJournal = ChangeJournal()
+
+
 class RecordSetConduit(conduits.BaseConduit):
 
     translator = schema.One(schema.Class)
@@ -83,9 +231,14 @@ class RecordSetConduit(conduits.BaseConduit):
 
         rv = self.itsView
 
-        stats = self._sync(modeOverride=modeOverride,
-            activity=activity, forceUpdate=forceUpdate,
-            debug=debug)
+        # the phases of _sync() are timed as spans nested in 'sync'
+        profiler.enter('sync')
+        try:
+            stats = self._sync(modeOverride=modeOverride,
+                activity=activity, forceUpdate=forceUpdate,
+                debug=debug)
+        finally:
+            profiler.exit('sync')
 
         if activity:
             activity.update(msg="Saving...", totalWork=None)
@@ -195,6 +348,8 @@ class RecordSetConduit(conduits.BaseConduit):
         triageFilter += model.readFilter
         triageFilter += model.occurrenceDeletion
 
+        profiler.enter('fetch')
+
         if receive:
 
             _callback(msg="Fetching changes", totalWork=None)
@@ -384,6 +539,9 @@ class RecordSetConduit(conduits.BaseConduit):
             inbound = {}
             isDiff = True
 
+        profiler.exit('fetch')
+        profiler.enter('export')
+
         _callback(msg="Checking for local changes", totalWork=None)
 
         # Generate records for all local items to be merged -- those that
@@ -399,13 +557,10 @@ class RecordSetConduit(conduits.BaseConduit):
                 locallyChangedUuids.add(item.itsUUID)
 
         else:
-            # This loop tries to avoid loading any non-dirty items:
-            # When statistics logging is added, we can verify this loop is doing
-            # what we expect
-            for changedUuid, x in rv.mapHistoryKeys(fromVersion=version,
-                toVersion=rv.itsVersion):
-                if changedUuid in share.contents:
-                    locallyChangedUuids.add(changedUuid)
+            # The change journal avoids loading any non-dirty items and
+            # scanning the repository history once per share
+            locallyChangedUuids.update(changeJournal.getChanges(rv,
+                share.contents, version))
 
 
         localCount = len(locallyChangedUuids)
@@ -575,6 +730,9 @@ class RecordSetConduit(conduits.BaseConduit):
 
         filter = self.getFilter()
 
+        profiler.exit('export')
+        profiler.enter('merge')
+
         # Merge
         toApply = {}
         toSend = {}
@@ -744,6 +902,9 @@ class RecordSetConduit(conduits.BaseConduit):
                 updateConflicts(state, translator.getUUIDForAlias(alias))
 
 
+        profiler.exit('merge')
+        profiler.enter('apply')
+
         if receive:
 
             # Unmodify before applying other changes:
@@ -949,6 +1110,8 @@ class RecordSetConduit(conduits.BaseConduit):
                 # fix bug 11733, updateTriageStatus when deleting occurrences
                 pim.EventStamp(rv.findUUID(masterAlias)).updateTriageStatus()
 
+        profiler.exit('apply')
+
         # For each item that was in the collection before but is no longer,
         # remove its state; if sending, add an empty recordset to toSend
         # TODO: Optimize by removing item loading
@@ -997,6 +1160,8 @@ class RecordSetConduit(conduits.BaseConduit):
             _callback(msg="%d local removal(s) detected" % removeCount,
                 totalWork=None)
 
+        profiler.enter('send')
+
         # Send if there is something to send or even if this is just an
         # initial publish of an empty collection:
         if send and (toSend or not share.established or localNameChange):
@@ -1040,6 +1205,8 @@ class RecordSetConduit(conduits.BaseConduit):
             logger.info("Nothing to send")
 
 
+        profiler.exit('send')
+
         for alias in statesToRemove:
             logger.info("Removing state: %s", alias)
             self.removeState(alias)
@@ -1058,7 +1225,8 @@ class RecordSetConduit(conduits.BaseConduit):
         self.lastVersion = rv.itsVersion
 
         share.established = True
-        
+        changeJournal.compact(share.contents)
+
         # Reset _allTickets
         try:
             del self._allTickets
@@ -1311,6 +1479,10 @@ class MonolithicRecordSetConduit(RecordSetConduit):
 
 class ResourceRecordSetConduit(RecordSetConduit):
 
+    # The number of requests kept in flight by getResourceBatch() and
+    # putResourceBatch(), 1 for transferring resources one at a time
+    maxRequests = 1
+
     def getRecords(self, debug=False, activity=None):
         # Get and return records, extra
         doLog = logger.info if debug else logger.debug
@@ -1358,19 +1530,21 @@ class ResourceRecordSetConduit(RecordSetConduit):
             activity.update(msg="%d resources to get" % fetchCount,
                 totalWork=fetchCount, workDone=0)
 
+        # Resources are deserialized as they are received while the others
+        # are still being fetched
         i = 0
-        for path in toFetch:
+        for path, text, etag in self.getResourceBatch(toFetch):
             if activity:
                 i += 1
                 activity.update(msg="Getting %d of %d" % (i, fetchCount),
                     work=1)
-            try:
-                text, etag = self.getResource(path)
-            except errors.NotFound:
+
+            if text is None:
                 # Google doesn't reliably provide accurate URLs, sometimes
                 # they contain extra slashes (so the resource isn't really
                 # a DEPTH:1 child), and sometimes even using the URL gives a 404
-                inbound[alias] = None
+                if path in paths:
+                    inbound[paths[path][0]] = None
                 doLog("404 from server for [%s], deleting", path)
                 continue
 
@@ -1407,44 +1581,158 @@ class ResourceRecordSetConduit(RecordSetConduit):
             activity.update(msg="Sending %d resources" % sendCount,
                 totalWork=sendCount, workDone=0)
 
-        i = 0
-        for cluster in clusters:
-            alias, deleteFlag = cluster[0]
-            state = self.getState(alias)
-            path = getattr(state, "path", None)
-            etag = getattr(state, "etag", None)
+        # The states to update with the path and etag of each resource put
+        states = {}
 
-            if activity:
-                i += 1
-                activity.update(msg="Sending %d of %d" % (i, sendCount),
-                    work=1)
-
-            if deleteFlag:
-                # delete the resource
-                if path:
-                    self.deleteResource(path, etag)
-                    doLog("Deleting path %s", path)
-            else:
-                if not path:
-                    # need to compute a path
-                    pathid = alias if self.pathMatchesUUID else UUID().str16()
-                    path = self.getPath(pathid)
+        def resources():
+            i = 0
+            for cluster in clusters:
+                alias, deleteFlag = cluster[0]
+                state = self.getState(alias)
+                path = getattr(state, "path", None)
+                etag = getattr(state, "etag", None)
+
+                if activity:
+                    i += 1
+                    activity.update(msg="Sending %d of %d" % (i, sendCount),
+                        work=1)
+
+                if deleteFlag:
+                    # delete the resource
+                    if path:
+                        doLog("Deleting path %s", path)
+                        yield path, None, etag
+                else:
+                    if not path:
+                        # need to compute a path
+                        pathid = alias if self.pathMatchesUUID else UUID().str16()
+                        path = self.getPath(pathid)
 
-                clusterRecordsets = {}
-                for alias, deleteFlag in cluster:
-                    state = self.getState(alias)
-                    # recordsets needs to include the entire recordset, not diffs
-                    clusterRecordsets[alias] = state.agreed + state.pending
-                    doLog("Full resource records: %s", clusterRecordsets[alias])
-
-                text = self.serializer.serialize(self.itsView, clusterRecordsets,
-                                                 **extra)
-                doLog("Sending to server [%s]", text)
-                etag = self.putResource(text, path, etag, debug=debug)
+                    clusterRecordsets = {}
+                    for alias, deleteFlag in cluster:
+                        state = self.getState(alias)
+                        # recordsets needs to include the entire recordset, not diffs
+                        clusterRecordsets[alias] = state.agreed + state.pending
+                        doLog("Full resource records: %s", clusterRecordsets[alias])
+
+                    text = self.serializer.serialize(self.itsView,
+                                                     clusterRecordsets, **extra)
+                    doLog("Sending to server [%s]", text)
+                    states[path] = state
+                    yield path, text, etag
+
+        # Resources are serialized while the previous ones are being sent
+        for path, etag in self.putResourceBatch(resources(), debug=debug):
+            state = states.pop(path, None)
+            if state is not None:
                 state.path = path
                 state.etag = etag
                 doLog("Put path %s, etag now %s", path, etag)
 
+    def getResourceBatch(self, paths):
+        """
+        Get resources, yielding a C{(path, text, etag)} tuple for each as
+        soon as it is received. C{text} and C{etag} are C{None} when the
+        resource is not found.
+
+        With C{maxRequests} greater than one, up to C{maxRequests} requests
+        made by L{getResourceRequest} are kept in flight.
+        """
+        if self.maxRequests <= 1:
+            for path in paths:
+                try:
+                    result = self.getResource(path)
+                except errors.NotFound:
+                    result = None
+                if result is None:
+                    yield path, None, None
+                else:
+                    text, etag = result
+                    yield path, text, etag
+            return
+
+        requests = self._getConcurrentRequests()
+        try:
+            for path in paths:
+                requests.add(path, self.getResourceRequest(path))
+
+            for path, result in requests:
+                if result is None:
+                    yield path, None, None
+                else:
+                    text, etag = result
+                    yield path, text, etag
+        finally:
+            self._releaseConcurrentRequests(requests)
+
+    def putResourceBatch(self, resources, debug=False):
+        """
+        Put each C{(path, text, etag)} of C{resources}, deleting it when
+        C{text} is C{None}, and yield a C{(path, etag)} tuple as each
+        completes. C{etag} is C{None} for deleted resources.
+
+        With C{maxRequests} greater than one, up to C{maxRequests} requests
+        made by L{putResourceRequest} or L{deleteResourceRequest} are kept
+        in flight while C{resources} is iterated.
+        """
+        if self.maxRequests <= 1:
+            for path, text, etag in resources:
+                if text is None:
+                    self.deleteResource(path, etag)
+                    yield path, None
+                else:
+                    yield path, self.putResource(text, path, etag, debug=debug)
+            return
+
+        requests = self._getConcurrentRequests()
+        try:
+            for path, text, etag in resources:
+                if text is None:
+                    requests.add(path, self.deleteResourceRequest(path, etag))
+                else:
+                    requests.add(path, self.putResourceRequest(text, path,
+                                                               etag))
+
+                # don't let more than a few resources wait to be sent
+                while requests.pending:
+                    block = requests.pending > 2 * self.maxRequests
+                    result = requests.next(block)
+                    if result is None:
+                        break
+                    yield result
+
+            for result in requests:
+                yield result
+        finally:
+            self._releaseConcurrentRequests(requests)
+
+    def getResourceRequest(self, path):
+        """
+        Return a request for L{WebDAV.ConcurrentRequests} getting a
+        resource. Its result is C{(text, etag)} or C{None} if not found.
+        """
+        raise NotImplementedError
+
+    def putResourceRequest(self, text, path, etag=None):
+        """
+        Return a request for L{WebDAV.ConcurrentRequests} putting a
+        resource. Its result is the new etag.
+        """
+        raise NotImplementedError
+
+    def deleteResourceRequest(self, path, etag=None):
+        """
+        Return a request for L{WebDAV.ConcurrentRequests} deleting a
+        resource. Its result is C{None}.
+        """
+        raise NotImplementedError
+
+    def _getConcurrentRequests(self):
+        return WebDAV.ConcurrentRequests([None] * self.maxRequests)
+
+    def _releaseConcurrentRequests(self, requests):
+        requests.cancel()
+
 
     def newState(self, alias):
         state = ResourceState(itsView=self.itsView, peer=self.share)
@@ -1643,36 +1931,72 @@ class InMemoryMonolithicRecordSetConduit(MonolithicRecordSetConduit):
 
 class InMemoryResourceRecordSetConduit(ResourceRecordSetConduit):
 
+    # The simulated round-trip time, in seconds, of the requests kept in
+    # flight when maxRequests is greater than 1
+    latency = 0.0
+
     def getResource(self, path):
+        return self._getResource(self._getCollection(), path)
+
+    def putResource(self, text, path, etag=None, debug=False):
+        doLog = logger.info if debug else logger.debug
+        etag = self._putResource(self._getCollection(), text, path, etag)
+        doLog("Put [%s]", text)
+        return etag
+
+    def deleteResource(self, path, etag=None):
+        self._deleteResource(self._getCollection(), path, etag)
+
+    def getResourceRequest(self, path):
+        return self._request(self._getResource, path)
+
+    def putResourceRequest(self, text, path, etag=None):
+        return self._request(self._putResource, text, path, etag)
+
+    def deleteResourceRequest(self, path, etag=None):
+        return self._request(self._deleteResource, path, etag)
+
+    def _request(self, method, *args):
+        # called in the Twisted thread, hence the collection and
+        # the latency are looked up beforehand
         coll = self._getCollection()
+        latency = self.latency
+
+        def request(connection):
+            d = defer.Deferred()
+            reactor.callLater(latency, d.callback, None)
+            return d.addCallback(lambda ignore: method(coll, *args))
+
+        return request
+
+    @staticmethod
+    def _getResource(coll, path):
         if coll['resources'].has_key(path):
             text, etag = coll['resources'][path]
             return text, str(etag)
 
-    def putResource(self, text, path, etag=None, debug=False):
-        doLog = logger.info if debug else logger.debug
+    @staticmethod
+    def _putResource(coll, text, path, etag=None):
         if etag is None:
             etag = 0
         else:
             etag = int(etag)
 
-        coll = self._getCollection()
         if coll['resources'].has_key(path):
             oldText, oldTag = coll['resources'][path]
             if etag != oldTag:
                 raise errors.TokenMismatch("Mismatched etags on PUT")
         coll['etag'] += 1
         coll['resources'][path] = (text, coll['etag'])
-        doLog("Put [%s]", text)
         return str(coll['etag'])
 
-    def deleteResource(self, path, etag=None):
+    @staticmethod
+    def _deleteResource(coll, path, etag=None):
         if etag is None:
             etag = 0
         else:
             etag = int(etag)
 
-        coll = self._getCollection()
         if coll['resources'].has_key(path):
             oldText, oldTag = coll['resources'][path]
             if etag != oldTag:
@@ -0,0 +1,234 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+from __future__ import with_statement
+
+__all__ = [
+    'SyncScheduler',
+    'getSyncTimings',
+]
+
+import threading, logging, time, datetime
+from collections import deque
+
+from chandlerdb.persistence.Repository import RepositoryThread
+from osaf.activity import Activity, ActivityAborted
+from i18n import ChandlerMessageFactory as _
+import errors, viewpool
+from callbacks import callCallbacks, UPDATE
+from utility import mergeFunction
+
+logger = logging.getLogger(__name__)
+
+
+# The timing of the latest sync of each share, by share UUID
+_timings = {}
+_timingsLock = threading.Lock()
+
+def getSyncTimings():
+    """
+    Return the timing of the latest sync of each share in this session.
+
+    @return: a dictionary, by share UUID, of dictionaries with the time the
+             sync started, as seconds since the epoch, its duration in
+             seconds and whether it succeeded
+    """
+    with _timingsLock:
+        return dict((uuid, dict(timing)) for uuid, timing in _timings.items())
+
+
+class SyncScheduler(object):
+    """
+    Sync a number of shares concurrently, each in a view of the view pool.
+
+    Shares are synced by at most C{maxWorkers} worker threads, in the
+    order of how stale they would be by the time their sync completes:
+    the time since their last successful sync plus the duration of their
+    previous sync, which mostly measures the latency of their server.
+    Slow shares are thus started early instead of holding up the end of
+    the cycle.
+
+    Shares of the same collection are not independent, they are synced one
+    after the other by the same worker. Each sync is committed with
+    L{mergeFunction}, as soon as it completes, and its view is returned to
+    the pool.
+    """
+
+    maxWorkers = 4
+
+    def __init__(self, rv, maxWorkers=None):
+        """
+        @param rv: the view the shares to sync are in
+        @param maxWorkers: the number of shares synced at the same time,
+                           C{maxWorkers} by default
+        """
+
+        self.rv = rv
+        if maxWorkers is not None:
+            self.maxWorkers = maxWorkers
+
+        self.activities = set()
+        self.results = []
+        self.aborted = None
+
+        self._jobs = deque()
+        self._lock = threading.Lock()
+
+    def prioritize(self, shares):
+        """
+        Group C{shares} by collection, in the order they are to be synced.
+
+        @return: a list of lists of C{(share UUID, collection name)} pairs
+        """
+
+        now = datetime.datetime.now(self.rv.tzinfo.default)
+        groups = {}
+
+        for share in shares:
+            uuid = share.itsUUID
+            name = share.contents.displayName
+
+            # shares never synced successfully go first
+            lastSuccess = getattr(share, 'lastSuccess', None)
+            if lastSuccess is None:
+                priority = (True, 0.0)
+            else:
+                age = now - lastSuccess
+                staleness = age.days * 86400.0 + age.seconds
+                with _timingsLock:
+                    timing = _timings.get(uuid)
+                if timing is not None:
+                    staleness += timing['seconds']
+                priority = (False, staleness)
+
+            group = groups.setdefault(share.contents.itsUUID,
+                                      [(False, 0.0), []])
+            group[0] = max(group[0], priority)
+            group[1].append((uuid, name))
+
+        groups = groups.values()
+        groups.sort(key=lambda group: group[0], reverse=True)
+
+        return [group[1] for group in groups]
+
+    def run(self, shares, interrupted=None, **kwds):
+        """
+        Sync C{shares} and wait for all their syncs to complete.
+
+        The keyword arguments are passed on to L{Share.sync}. No more syncs
+        are started once one is aborted or once C{interrupted()} returns
+        C{True}, C{aborted} is then set to the L{ActivityAborted} error.
+
+        @param shares: the shares to sync, in C{self.rv}
+        @param interrupted: a callable checked before each sync
+        @return: a list of C{(share UUID, stats, error, error details)}
+                 tuples, in the order the syncs completed, with C{None}
+                 stats or C{None} error and error details
+        """
+
+        self._interrupted = interrupted or (lambda: False)
+        self._kwds = kwds
+        self._jobs.extend(self.prioritize(shares))
+
+        count = min(self.maxWorkers, len(self._jobs))
+        if count <= 1:
+            self._work()
+        else:
+            threads = [RepositoryThread(name='__sync__', target=self._work)
+                       for i in xrange(count)]
+            for thread in threads:
+                thread.setDaemon(True)
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        return self.results
+
+    def requestAbort(self):
+        """
+        Abort the syncs in progress. May be called from any thread.
+        """
+
+        with self._lock:
+            self._jobs.clear()
+            for activity in self.activities:
+                activity.requestAbort()
+
+    def _stopping(self):
+
+        if self.aborted is None and self._interrupted():
+            self.aborted = ActivityAborted(_(u"Cancelled by user"))
+
+        return self.aborted is not None
+
+    def _work(self):
+
+        while not self._stopping():
+            with self._lock:
+                if not self._jobs:
+                    break
+                job = self._jobs.popleft()
+
+            for uShare, name in job:
+                if self._stopping():
+                    break
+                self._sync(uShare, name)
+
+    def _sync(self, uShare, name):
+
+        callCallbacks(UPDATE, msg="Syncing collection '%s'" % name)
+
+        activity = Activity("Sync: %s" % name)
+        activity.started()
+        with self._lock:
+            self.activities.add(activity)
+
+        started = time.time()
+        succeeded = False
+        result = None
+        altView = viewpool.getView(self.rv.repository)
+
+        try:
+            altShare = altView.findUUID(uShare)
+            stats = altShare.sync(activity=activity, **self._kwds)
+            altView.commit(mergeFunction)
+
+        except ActivityAborted, e:
+            logger.exception("Syncing cancelled")
+            altView.cancel()
+            self.aborted = e
+
+        except Exception, e:
+            logger.exception("Error syncing collection")
+            altView.cancel()
+            result = (uShare, None, e, errors.formatException(e))
+            activity.failed(e)
+
+        else:
+            succeeded = True
+            result = (uShare, stats, None, None)
+            activity.completed()
+
+        viewpool.releaseView(altView)
+        duration = time.time() - started
+
+        with self._lock:
+            self.activities.discard(activity)
+            if result is not None:
+                self.results.append(result)
+
+        with _timingsLock:
+            _timings[uShare] = { 'started': started, 'seconds': duration,
+                                 'succeeded': succeeded }
+
+        logger.info("Synced %s in %.2f seconds", name, duration)
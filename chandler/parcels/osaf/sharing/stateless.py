@@ -21,20 +21,33 @@ __all__ = [
 
 import logging
 import os.path
+from itertools import chain
 from osaf import pim
 import eim, translator, ics, errors
 from i18n import ChandlerMessageFactory as _
 
 logger = logging.getLogger(__name__)
 
+def iterDeserialize(rv, serializerClass, input, batchSize):
+    """
+    Deserialize an open file into batches of record sets, incrementally if
+    the serializer supports it.
+    """
+
+    deserializer = getattr(serializerClass, 'iterDeserialize', None)
+    if deserializer is None:
+        yield serializerClass.deserialize(rv, input.read())
+    else:
+        for inbound, extra in deserializer(rv, input, batchSize):
+            yield inbound, extra
+
+
 def importFile(rv, path, collection=None, activity=None,
     translatorClass=translator.SharingTranslator,
     serializerClass=ics.ICSSerializer,
-    filters=None, debug=False):
+    filters=None, debug=False, batchSize=500):
 
     input = open(path, "r")
-    text = input.read()
-    input.close()
     
     with rv.reindexingDeferred():
 
@@ -50,37 +63,50 @@ def importFile(rv, path, collection=None, activity=None,
     
         if activity:
             activity.update(msg=_(u"Parsing file..."), totalWork=None)
-        inbound, extra = serializerClass.deserialize(rv, text)
-    
-        total = len(inbound)
-        if activity:
-            activity.update(totalWork=total)
-    
+
+        def addItems(aliases):
+            # return the aliases of items not imported yet, such as
+            # modifications waiting for their master
+            missing = []
+            for alias in aliases:
+                uuid = trans.getUUIDForAlias(alias)
+                if uuid:
+                    item = rv.findUUID(uuid)
+                    if item is not None:
+                        collection.add(item)
+                        pim.setTriageStatus(item, 'auto')
+                        item_to_change = getattr(item, 'inheritFrom', item)
+                        item_to_change.read = True
+                        continue
+                missing.append(alias)
+            return missing
+
+        # record sets are imported, and their items added to the
+        # collection, one batch at a time
+        missing = []
         trans.startImport()
-        for alias, rs in inbound.items():
-            trans.importRecords(filter(rs))
-            if activity:
-                activity.update(work=1, msg=_(u"Importing items..."))
+        try:
+            for inbound, extra in iterDeserialize(rv, serializerClass, input,
+                                                  batchSize):
+                for alias, rs in inbound.iteritems():
+                    trans.importRecords(filter(rs))
+                    if activity:
+                        activity.update(work=1, msg=_(u"Importing items..."))
+
+                if collection is None:
+                    name = extra.get('name', _(u"Untitled"))
+                    collection = pim.SmartCollection(itsView=rv,
+                                                     displayName=name)
+
+                missing = addItems(chain(missing, inbound))
+        finally:
+            input.close()
 
         showTZDialog = getattr(trans, 'timezonePromptRequested', False)
 
         trans.finishImport()
-    
-        
-    
-        if collection is None:
-            name = extra.get('name', _(u"Untitled"))
-            collection = pim.SmartCollection(itsView=rv, displayName=name)
-    
-        for alias in inbound:
-            uuid = trans.getUUIDForAlias(alias)
-            if uuid:
-                item = rv.findUUID(uuid)
-                if item is not None:
-                    collection.add(item)
-                    pim.setTriageStatus(item, 'auto')
-                    item_to_change = getattr(item, 'inheritFrom', item)
-                    item_to_change.read = True
+
+        addItems(missing)
     
         if activity:
             activity.update(totalWork=None, msg=_(u"Importing complete."))
@@ -115,23 +141,54 @@ def exportFile(rv, path, collection, activity=None,
     if activity:
         activity.update(totalWork=total)
 
-    outbound = { }
-    for item in collection:
-        if (isinstance(item, pim.Note) and
-            pim.EventStamp(item).isTriageOnlyModification()):
-            continue # skip triage-only modifications
-        
-        alias = trans.getAliasForItem(item)
-        outbound[alias] = filter(eim.RecordSet(trans.exportItem(item)))
-        if activity:
-            activity.update(work=1, msg=_(u"Exporting items..."))
-
-    text = serializerClass.serialize(rv, outbound, name=collection.displayName,
-                                     monolithic=True)
-
-    output = open(path, "wb")
-    output.write(text)
-    output.close()
+    def iterClusters():
+        # a recurring event's modifications are exported along with it,
+        # modifications in the collection without their master bring it
+        masters = set()
+        for item in collection:
+            if isinstance(item, pim.Note):
+                master = pim.EventStamp(item).modificationFor
+                if master is not None:
+                    if master in collection or master.itsUUID in masters:
+                        continue
+                    masters.add(master.itsUUID)
+                    item = master
+                items = [item]
+                for mod in pim.EventStamp(item).modifications or ():
+                    if (mod in collection and
+                        not pim.EventStamp(mod).isTriageOnlyModification()):
+                        items.append(mod)
+                if master is not None and len(items) == 1:
+                    continue
+            else:
+                items = [item]
+
+            recordSets = {}
+            for item in items:
+                alias = trans.getAliasForItem(item)
+                recordSets[alias] = filter(eim.RecordSet(trans.exportItem(item)))
+                if activity:
+                    activity.update(work=1, msg=_(u"Exporting items..."))
+            yield recordSets
+
+    serializeStream = getattr(serializerClass, 'serializeStream', None)
+    if serializeStream is None:
+        outbound = { }
+        for recordSets in iterClusters():
+            outbound.update(recordSets)
+        text = serializerClass.serialize(rv, outbound,
+                                         name=collection.displayName,
+                                         monolithic=True)
+        output = open(path, "wb")
+        output.write(text)
+        output.close()
+    else:
+        output = open(path, "wb")
+        try:
+            serializeStream(rv, output, iterClusters(),
+                            name=collection.displayName, monolithic=True)
+        finally:
+            output.close()
 
     if activity:
         activity.update(totalWork=None, msg=_(u"Exporting complete."))
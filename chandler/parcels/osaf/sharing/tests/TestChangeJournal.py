@@ -0,0 +1,122 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+import unittest
+from osaf import pim, sharing
+from osaf.sharing import recordset_conduit, translator, eimml
+from util import testcase
+
+class ChangeJournalTestCase(testcase.SingleRepositoryTestCase):
+
+    def setUp(self):
+        super(ChangeJournalTestCase, self).setUp()
+
+        view = self.view
+        self.journal = recordset_conduit.ChangeJournal()
+
+        self.collA = pim.ListCollection(itsView=view, displayName="a")
+        self.collB = pim.ListCollection(itsView=view, displayName="b")
+        self.note1 = pim.Note(itsView=view, displayName="one")
+        self.note2 = pim.Note(itsView=view, displayName="two")
+        self.note3 = pim.Note(itsView=view, displayName="three")
+        self.collA.add(self.note1)
+        self.collB.add(self.note2)
+        view.commit()
+
+    def testChanges(self):
+        view = self.view
+        journal = self.journal
+        version = view.itsVersion
+
+        self.assertEqual(journal.getChanges(view, self.collA, version), set())
+        self.assertEqual(journal.getChanges(view, self.collB, version), set())
+
+        self.note1.displayName = "uno"
+        self.note3.displayName = "tres"
+        view.commit()
+
+        self.note2.displayName = "dos"
+        view.commit()
+
+        # both collections are brought up to date by the same scan
+        self.assertEqual(journal.getChanges(view, self.collA, version),
+                         set([self.note1.itsUUID]))
+        self.assertEqual(journal.getChanges(view, self.collB, version),
+                         set([self.note2.itsUUID]))
+        self.assertEqual(journal.getChanges(view, self.collB,
+                                            view.itsVersion - 1),
+                         set([self.note2.itsUUID]))
+        self.assertEqual(journal.getChanges(view, self.collA,
+                                            view.itsVersion - 1), set())
+
+        # asking for older changes rebuilds a collection's journal
+        self.assertEqual(journal.getChanges(view, self.collA, 0),
+                         set([self.note1.itsUUID]))
+
+    def testRemoved(self):
+        view = self.view
+        journal = self.journal
+        version = view.itsVersion
+
+        self.collA.add(self.note3)
+        view.commit()
+        self.note1.displayName = "uno"
+        self.note3.displayName = "tres"
+        view.commit()
+        self.assertEqual(journal.getChanges(view, self.collA, version),
+                         set([self.note1.itsUUID, self.note3.itsUUID]))
+
+        # changed members no longer in the collection are left out
+        self.collA.remove(self.note1)
+        view.commit()
+        self.assertEqual(journal.getChanges(view, self.collA, version),
+                         set([self.note3.itsUUID]))
+
+        uNote3 = self.note3.itsUUID
+        self.note3.delete()
+        view.commit()
+        self.assertEqual(journal.getChanges(view, self.collA, version), set())
+        self.assertEqual(view.findUUID(uNote3), None)
+
+    def testCompact(self):
+        view = self.view
+        journal = self.journal
+        version = view.itsVersion
+
+        conduit = recordset_conduit.InMemoryDiffRecordSetConduit("conduit",
+            itsView=view, shareName="journal",
+            translator=translator.SharingTranslator,
+            serializer=eimml.EIMMLSerializer)
+        share = sharing.Share("share", itsView=view, contents=self.collA,
+                              conduit=conduit, established=True)
+        conduit.lastVersion = version
+        view.commit()
+
+        self.note1.displayName = "uno"
+        view.commit()
+        self.assertEqual(journal.getChanges(view, self.collA, version),
+                         set([self.note1.itsUUID]))
+
+        # every share of collA synced up to the current version
+        conduit.lastVersion = view.itsVersion
+        journal.compact(self.collA)
+        self.assertEqual(len(journal._journals[self.collA.itsUUID]), 0)
+
+        self.assertEqual(journal.getChanges(view, self.collA, version),
+                         set([self.note1.itsUUID]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+import unittest, random
+from osaf import sharing
+from round_trip import RoundTripTestCase
+
+from osaf.sharing import recordset_conduit, translator, eimml, WebDAV
+from application import Utility
+from twisted.internet import reactor, defer
+
+
+class ConcurrentRequestsTestCase(unittest.TestCase):
+
+    def runTest(self):
+        Utility.initTwisted(None)
+
+        inFlight = []
+        maxInFlight = []
+
+        def makeRequest(i):
+            def request(connection):
+                inFlight.append(connection)
+                maxInFlight.append(len(inFlight))
+                d = defer.Deferred()
+                reactor.callLater(random.random() * 0.01, d.callback, i)
+                def done(result):
+                    inFlight.remove(connection)
+                    if i == 13:
+                        raise ValueError(i)
+                    return result * 2
+                return d.addCallback(done)
+            return request
+
+        requests = WebDAV.ConcurrentRequests(["a", "b", "c"])
+        for i in xrange(20):
+            requests.add(i, makeRequest(i))
+
+        results = {}
+        failures = 0
+        while requests.pending:
+            try:
+                key, result = requests.next()
+            except ValueError:
+                failures += 1
+            else:
+                results[key] = result
+
+        self.assertEqual(failures, 1)
+        self.assertEqual(len(results), 19)
+        self.assertEqual(results[19], 38)
+        self.assert_(max(maxInFlight) <= 3)
+
+
+class EIMResourceRecordSetConcurrentTestCase(RoundTripTestCase):
+    """
+    The round trip of the in-memory resource conduit, with resources
+    transferred concurrently and completing out of order.
+    """
+
+    def runTest(self):
+        Utility.initTwisted(None)
+
+        cls = recordset_conduit.InMemoryResourceRecordSetConduit
+        saved = cls.maxRequests, cls.latency
+        cls.maxRequests, cls.latency = 4, 0.005
+        try:
+            self.RoundTripRun()
+        finally:
+            cls.maxRequests, cls.latency = saved
+
+    def PrepareShares(self):
+
+        view0 = self.views[0]
+        coll0 = self.coll
+        conduit = recordset_conduit.InMemoryResourceRecordSetConduit(
+            "conduit", itsView=view0,
+            shareName="concurrentCollection",
+            translator=translator.SharingTranslator,
+            serializer=eimml.EIMMLSerializer
+        )
+        self.share0 = sharing.Share("share", itsView=view0,
+            contents=coll0, conduit=conduit)
+
+
+        view1 = self.views[1]
+        conduit = recordset_conduit.InMemoryResourceRecordSetConduit(
+            "conduit", itsView=view1,
+            shareName="concurrentCollection",
+            translator=translator.SharingTranslator,
+            serializer=eimml.EIMMLSerializer
+        )
+        self.share1 = sharing.Share("share", itsView=view1,
+            conduit=conduit)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -283,6 +283,84 @@ class ICalendarTestCase(SharedSandboxTestCase):
         self.assertEqual(event.rruleset.exdates[0].tzinfo,
                          self.view.tzinfo.getInstance('US/Central'))
 
+    def testStreamingImport(self):
+        path = self.getTestResourcePath(u'Recurrence.ics')
+        batches = list(ics.ICSSerializer.iterDeserialize(self.view,
+                                                         file(path), 1))
+        recordSets = {}
+        for inbound, extra in batches:
+            self.assert_(len(inbound) <= 1)
+            recordSets.update(inbound)
+        self.assertEqual(extra['name'], u'Work')
+
+        inbound, extra = ics.ICSSerializer.deserialize(self.view,
+                                                       file(path).read())
+        self.assertEqual(len(recordSets), len(inbound))
+
+        mods = [alias for alias in recordSets if ':' in alias]
+        self.assertEqual(len(mods), 1)
+        self.assert_(mods[0].split(':')[0] in recordSets)
+
+    def testStreamingExport(self):
+        self.Import(self.view, u'RecurrenceWithTimezone.ics')
+        filename = u"streaming_export.ics"
+
+        try:
+            sharing.exportFile(self.view, os.path.join(".", filename),
+                               self.importedCollection)
+
+            lines = [line.strip() for line in file(filename, 'rb')]
+            self.assertEqual(lines[0], 'BEGIN:VCALENDAR')
+            self.assertEqual(lines[-1], 'END:VCALENDAR')
+            self.assertEqual(lines.count('BEGIN:VCALENDAR'), 1)
+            if 'BEGIN:VTIMEZONE' in lines:
+                last = len(lines) - lines[::-1].index('BEGIN:VTIMEZONE')
+                self.assert_(last < lines.index('BEGIN:VEVENT'))
+
+            cal = vobject.readComponents(file(filename, 'rb')).next()
+            self.assertEqual(cal.getChildValue('x_wr_calname'), u'Work')
+            self.assert_(len(cal.vevent_list) > 0)
+        finally:
+            os.remove(filename)
+
+    def testExportModificationWithoutMaster(self):
+        startTime = datetime.datetime(2006, 4, 17, 13,
+                                      tzinfo=self.view.tzinfo.floating)
+        rruleset = RecurrenceRuleSet(
+            itsParent=self.sandbox,
+            rrules=[RecurrenceRule(itsParent=self.sandbox, freq="weekly")]
+        )
+        event = pim.CalendarEvent(
+            itsParent=self.sandbox,
+            startTime=startTime,
+            duration=datetime.timedelta(hours=1),
+            summary=u'Weekly meeting',
+            allDay=False,
+            anyTime=False,
+        )
+        event.rruleset = rruleset
+
+        occurrence = event.getRecurrenceID(startTime.replace(day=24))
+        occurrence.changeThis(pim.EventStamp.startTime.name,
+                              startTime.replace(day=25))
+
+        # only the modification is in the exported collection
+        collection = ListCollection(itsParent=self.sandbox,
+                                    displayName=u'Modification')
+        collection.add(occurrence.itsItem)
+        filename = u"modification_export.ics"
+
+        try:
+            sharing.exportFile(self.view, os.path.join(".", filename),
+                               collection)
+
+            cal = vobject.readComponents(file(filename, 'rb')).next()
+            self.assertEqual(len(cal.vevent_list), 2)
+            self.assertEqual(len([vevent for vevent in cal.vevent_list
+                                  if hasattr(vevent, 'recurrence_id')]), 1)
+        finally:
+            os.remove(filename)
+
     def testImportRecurrenceAndTriageStatus(self):
         self.Import(self.view, u'Recurrence.ics')
         event = pim.EventStamp(sharing.findUID(self.view,
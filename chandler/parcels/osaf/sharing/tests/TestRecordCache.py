@@ -0,0 +1,83 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+import unittest
+from osaf import pim, sharing
+from osaf.sharing import eim, translator
+from util import testcase
+
+class RecordCacheTestCase(testcase.SingleRepositoryTestCase):
+
+    def setUp(self):
+        super(RecordCacheTestCase, self).setUp()
+
+        self.cache = eim.RecordCache(size=2)
+        self.saved = translator.SharingTranslator.recordCache
+        translator.SharingTranslator.recordCache = self.cache
+
+    def tearDown(self):
+        translator.SharingTranslator.recordCache = self.saved
+
+    def testExport(self):
+        view = self.view
+        t = translator.SharingTranslator(view)
+
+        note = pim.Note(itsView=view, displayName="cached", body="body")
+
+        # uncommitted changes aren't cached
+        records = list(t.exportItem(note))
+        self.assertEqual(len(self.cache), 0)
+
+        view.commit()
+        self.assertEqual(list(t.exportItem(note)), records)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(list(t.exportItem(note)), records)
+        self.assertEqual(self.cache.hits, 1)
+
+        # another translator shares the cache
+        other = translator.SharingTranslator(view)
+        self.assertEqual(list(other.exportItem(note)), records)
+        self.assertEqual(self.cache.hits, 2)
+
+        note.displayName = "changed"
+        view.commit()
+        changed = list(t.exportItem(note))
+        self.assertNotEqual(changed, records)
+        self.assertEqual(changed[0].title, u"changed")
+        self.assertEqual(self.cache.misses, 2)
+
+        # the dump translator doesn't cache
+        dump = translator.DumpTranslator(view)
+        self.assertEqual(list(dump.exportItem(note)), changed)
+        self.assertEqual(self.cache.misses, 2)
+
+    def testEviction(self):
+        view = self.view
+        t = translator.SharingTranslator(view)
+
+        notes = [pim.Note(itsView=view, displayName=str(i))
+                 for i in xrange(3)]
+        view.commit()
+
+        for note in notes:
+            list(t.exportItem(note))
+
+        self.assertEqual(len(self.cache), 2)
+        list(t.exportItem(notes[0]))
+        self.assertEqual(self.cache.hits, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+import unittest
+from osaf import pim, sharing
+from osaf.sharing import recordset_conduit, translator, eimml, scheduler
+from util import testcase
+
+class SyncSchedulerTestCase(testcase.SingleRepositoryTestCase):
+
+    def makeShare(self, name, collection=None):
+        view = self.view
+
+        if collection is None:
+            collection = pim.ListCollection(itsView=view, displayName=name)
+            collection.add(pim.Note(itsView=view, displayName=name))
+
+        conduit = recordset_conduit.InMemoryDiffRecordSetConduit(
+            itsView=view, shareName=name,
+            translator=translator.SharingTranslator,
+            serializer=eimml.EIMMLSerializer
+        )
+        share = sharing.Share(itsView=view, contents=collection,
+                              conduit=conduit)
+        share.create()
+
+        return share
+
+    def testRun(self):
+        view = self.view
+
+        shares = [self.makeShare("scheduler%d" % i) for i in xrange(4)]
+        # shares of the same collection are synced by the same worker
+        shares.append(self.makeShare("scheduler4", shares[0].contents))
+        view.commit()
+
+        syncs = scheduler.SyncScheduler(view, maxWorkers=3)
+        groups = syncs.prioritize(shares)
+        self.assertEqual(len(groups), 4)
+        self.assertEqual(sum([len(group) for group in groups]), 5)
+
+        results = syncs.run(shares)
+        self.assertEqual(syncs.aborted, None)
+        self.assertEqual(len(results), 5)
+        for uuid, stats, error, details in results:
+            self.assertEqual(error, None)
+
+        view.refresh()
+        timings = scheduler.getSyncTimings()
+        for share in shares:
+            self.assert_(share.established)
+            self.assert_(timings[share.itsUUID]['succeeded'])
+
+        # shares never synced before go first
+        share = self.makeShare("scheduler5")
+        view.commit()
+        groups = scheduler.SyncScheduler(view).prioritize(shares + [share])
+        self.assertEqual(groups[0], [(share.itsUUID, "scheduler5")])
+
+    def testInterrupt(self):
+        view = self.view
+
+        shares = [self.makeShare("interrupted%d" % i) for i in xrange(2)]
+        view.commit()
+
+        syncs = scheduler.SyncScheduler(view, maxWorkers=2)
+        results = syncs.run(shares, interrupted=lambda: True)
+        self.assertEqual(results, [])
+        self.assert_(isinstance(syncs.aborted, sharing.ActivityAborted))
+
+
+if __name__ == "__main__":
+    unittest.main()
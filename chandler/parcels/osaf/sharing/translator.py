@@ -350,6 +350,10 @@ class SharingTranslator(eim.Translator):
 
     obfuscation = False
 
+    # Export the records of an item once per change, not once per sync of
+    # every share containing it
+    recordCache = eim.RecordCache()
+
     def startImport(self):
         super(SharingTranslator, self).startImport()
         tzprefs = schema.ns("osaf.pim", self.rv).TimezonePrefs
@@ -438,6 +442,63 @@ class SharingTranslator(eim.Translator):
 
 
 
+    def getExportKey(self, item):
+        # The versions of the item and of the items its records are computed
+        # from: its master, reminders, last modifier, location, recurrence
+        # rules and email addresses. Records of uncommitted changes aren't
+        # cached, their items' versions being those before the changes.
+
+        repository = self.rv.repository
+        if repository is None or not isinstance(item, pim.ContentItem):
+            return None
+
+        master = getattr(item, 'inheritFrom', None)
+        items = [item]
+        if master is not None:
+            items.append(master)
+
+        items.extend(getattr(item, 'reminders', ()))
+        items.append(getattr(item, 'lastModifiedBy', None))
+
+        timeKey = None
+        if pim.has_stamp(item, EventStamp):
+            event = EventStamp(item)
+            items.append(getattr(event, 'location', None))
+            rruleset = getattr(event, 'rruleset', None)
+            if rruleset is not None:
+                items.append(rruleset)
+                items.extend(getattr(rruleset, 'rrules', ()))
+                items.extend(getattr(rruleset, 'exrules', ()))
+
+            # The records also depend on the current time: the triage status
+            # of a modification is Inherit while it matches its automatic
+            # one and a master's lastPastOccurrence moves along with now
+            if isinstance(item, Occurrence):
+                timeKey = event.simpleAutoTriage()
+            elif event.occurrenceFor is None and rruleset is not None:
+                now = getNow(self.rv.tzinfo.default)
+                expansion = event.getRecurrenceExpansion()
+                for timeKey in expansion.iterRecurrenceIDs(now):
+                    break
+
+        if pim.has_stamp(item, pim.MailStamp):
+            mailStamp = pim.MailStamp(item)
+            for name in ('fromAddress', 'replyToAddress', 'previousSender'):
+                items.append(getattr(mailStamp, name, None))
+            for name in ('toAddress', 'ccAddress', 'bccAddress',
+                         'originators'):
+                items.extend(getattr(mailStamp, name, None) or ())
+
+        versions = []
+        for other in items:
+            if other is not None:
+                if other.isDirty():
+                    return None
+                versions.append(other.itsVersion)
+
+        return (repository.itsUUID, self.obfuscation, self.rv.tzinfo.default,
+                timeKey, tuple(versions))
+
     def obfuscate(self, text):
         if text in (eim.Inherit, eim.NoChange):
             return text
@@ -1733,6 +1794,9 @@ class DumpTranslator(SharingTranslator):
     }
     name_to_path = dict([[v, k] for k, v in path_to_name.items()])
 
+    # Dumps export every item once
+    recordCache = None
+
 
     approvedClasses = (
         pim.Note, Password, pim.SmartCollection, shares.Share,
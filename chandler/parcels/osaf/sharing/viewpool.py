@@ -13,36 +13,53 @@
 #   limitations under the License.
 
 
+from __future__ import with_statement
+
 __all__ = [ 'getView', 'releaseView' ]
 
+import threading
+
 from utility import mergeFunction
 
-AVAILABLE = 0
-IN_USE    = 1
+# The views not in use, by repository, and the views in use, by id, with
+# their repository. Views are checked out and in by concurrent sync
+# threads, under the lock, without searching the pool.
+available = {}
+inUse = {}
+lock = threading.Lock()
 
-views = []
 name = "viewpool-%d"
 highest = 0
 
 def getView(repo):
-    global views, highest
-
-    for i, (view, status) in enumerate(views):
-        if status == AVAILABLE:
-            views[i] = (view, IN_USE)
-            view.cancel( )
-            view.refresh( )
-            return view
-
-    view = repo.createView(name=name%highest, pruneSize=500, notify=False,
-        mergeFn=mergeFunction)
-    views.append((view, IN_USE))
-    highest += 1
+    global highest
+
+    with lock:
+        views = available.get(repo)
+        if views:
+            # the most recently released view has the warmest item cache
+            view = views.pop()
+        else:
+            view = None
+            viewName = name%highest
+            highest += 1
+
+    if view is None:
+        view = repo.createView(name=viewName, pruneSize=500, notify=False,
+            mergeFn=mergeFunction)
+    else:
+        # outside the lock, not to hold up other threads' views
+        view.cancel( )
+        view.refresh( )
+
+    with lock:
+        inUse[id(view)] = (view, repo)
+
     return view
 
 def releaseView(rv):
-    global views
 
-    for i, (view, status) in enumerate(views):
-        if rv is view:
-            views[i] = (view, AVAILABLE)
+    with lock:
+        view, repo = inUse.pop(id(rv), (None, None))
+        if view is not None:
+            available.setdefault(repo, []).append(view)
@@ -17,7 +17,7 @@ __all__ = [
     'WebDAVMonolithicRecordSetConduit',
 ]
 
-import conduits, errors, utility
+import conduits, errors, utility, WebDAV
 import zanshin, M2Crypto.BIO, twisted.web.http, urlparse
 import twisted.internet.error
 from recordset_conduit import (
@@ -33,13 +33,20 @@ logger = logging.getLogger(__name__)
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = =
 
 
+def getTicketedResource(serverHandle, resourcePath, ticket):
+    resource = serverHandle.getResource(resourcePath)
+
+    if ticket:
+        resource.ticketId = ticket
+    return resource
+
+
 class DAVConduitMixin(conduits.HTTPMixin):
 
     def _getSharePath(self):
         return "/" + self._getSettings(withPassword=False)[2]
 
-    def _resourceFromPath(self, path):
-        serverHandle = self._getServerHandle()
+    def _resourcePath(self, path):
         sharePath = self._getSharePath()
 
         if sharePath == u"/":
@@ -51,11 +58,12 @@ class DAVConduitMixin(conduits.HTTPMixin):
                 resourcePath += "/"
             resourcePath += path
 
-        resource = serverHandle.getResource(resourcePath)
+        return resourcePath
 
-        if getattr(self, 'ticket', False):
-            resource.ticketId = self.ticket
-        return resource
+    def _resourceFromPath(self, path):
+        return getTicketedResource(self._getServerHandle(),
+                                   self._resourcePath(path),
+                                   getattr(self, 'ticket', False))
 
     def exists(self):
 
@@ -333,6 +341,10 @@ class WebDAVRecordSetConduit(ResourceRecordSetConduit, DAVConduitMixin):
 
         return stats
 
+    # The number of requests kept in flight, each over its own
+    # keep-alive connection, when getting or putting resources
+    maxRequests = 4
+
     def getResource(self, path):
         # return text, etag
         resource = self._resourceFromPath(path)
@@ -352,26 +364,19 @@ class WebDAVRecordSetConduit(ResourceRecordSetConduit, DAVConduitMixin):
         except M2Crypto.BIO.BIOError, err:
             raise errors.CouldNotConnect(_(u"Unable to connect to server: %(error)s") % {'error': err})
 
-        if resp.status == twisted.web.http.NOT_FOUND:
+        result = self._gotResource(resp, resource)
+        if result is None:
             message = _(u"Path %(path)s not found.") % {'path': resource.path}
             raise errors.NotFound(message)
 
-        if resp.status in (twisted.web.http.UNAUTHORIZED,
-                           twisted.web.http.FORBIDDEN):
-            message = _(u"Not authorized to GET %(path)s.") % {'path': resource.path}
-            raise errors.NotAllowed(message)
-
-        text = resp.body
-        etag = resource.etag.strip('"') # .mac puts quotes around the etag
-        return text, etag
+        return result
 
 
     def putResource(self, text, path, etag=None, debug=False):
         # return etag
         resource = self._resourceFromPath(path)
         start = time.time()
-        self._getServerHandle().blockUntil(resource.put, text,
-            checkETag=False)
+        self._getServerHandle().blockUntil(self._putResource, resource, text)
         end = time.time()
         self.networkTime += (end - start)
         return resource.etag.strip('"') # .mac puts quotes around the etag
@@ -381,12 +386,99 @@ class WebDAVRecordSetConduit(ResourceRecordSetConduit, DAVConduitMixin):
     def deleteResource(self, path, etag=None):
         resource = self._resourceFromPath(path)
         resp = self._getServerHandle().blockUntil(resource.delete)
+        self._deletedResource(resp)
+
+
+    # The requests below are called in the Twisted thread, hence what
+    # they need from the repository is looked up beforehand
+
+    def getResourceRequest(self, path):
+        resourcePath = self._resourcePath(path)
+        ticket = getattr(self, 'ticket', False)
+
+        def request(serverHandle):
+            resource = getTicketedResource(serverHandle, resourcePath, ticket)
+            d = resource.get()
+            d.addCallback(self._gotResource, resource)
+            d.addErrback(self._requestFailed, path)
+            return d
+
+        return request
+
+    def putResourceRequest(self, text, path, etag=None):
+        resourcePath = self._resourcePath(path)
+        ticket = getattr(self, 'ticket', False)
+
+        def request(serverHandle):
+            resource = getTicketedResource(serverHandle, resourcePath, ticket)
+            d = self._putResource(resource, text)
+            # .mac puts quotes around the etag
+            d.addCallback(lambda resp: resource.etag.strip('"'))
+            d.addErrback(self._requestFailed, path)
+            return d
 
+        return request
+
+    def deleteResourceRequest(self, path, etag=None):
+        resourcePath = self._resourcePath(path)
+        ticket = getattr(self, 'ticket', False)
+
+        def request(serverHandle):
+            resource = getTicketedResource(serverHandle, resourcePath, ticket)
+            d = resource.delete()
+            d.addCallback(self._deletedResource)
+            d.addErrback(self._requestFailed, path)
+            return d
+
+        return request
+
+    def _getConcurrentRequests(self):
+        return WebDAV.ConcurrentRequests(
+            self._getServerHandles(self.maxRequests))
+
+    def _releaseConcurrentRequests(self, requests):
+        super(WebDAVRecordSetConduit,
+              self)._releaseConcurrentRequests(requests)
+        self.networkTime += requests.waited
+
+    def _putResource(self, resource, text):
+        return resource.put(text, checkETag=False)
+
+    def _gotResource(self, resp, resource):
+        # return text, etag or None if not found
+
+        if resp.status == twisted.web.http.NOT_FOUND:
+            return None
+
+        if resp.status in (twisted.web.http.UNAUTHORIZED,
+                           twisted.web.http.FORBIDDEN):
+            message = _(u"Not authorized to GET %(path)s.") % {'path': resource.path}
+            raise errors.NotAllowed(message)
+
+        text = resp.body
+        etag = resource.etag.strip('"') # .mac puts quotes around the etag
+        return text, etag
+
+    def _deletedResource(self, resp):
         if not 200 <= resp.status < 300:
             raise errors.SharingError("%s (HTTP status %d)" % (resp.message,
                 resp.status),
                 details="Received [%s]" % resp.body)
 
+    def _requestFailed(self, failure, path):
+        # translate connection errors as getResource() does
+        err = failure.value
+
+        if isinstance(err, twisted.internet.error.ConnectionDone):
+            errors.annotate(err, _(u"Server reported incorrect Content-Length for %(itemPath)s.") % \
+                            {"itemPath": path}, details=str(err))
+        elif isinstance(err, zanshin.webdav.ConnectionError):
+            raise errors.CouldNotConnect(_(u"Unable to connect to server: %(error)s") % {'error': err})
+        elif isinstance(err, M2Crypto.BIO.BIOError):
+            raise errors.CouldNotConnect(_(u"Unable to connect to server: %(error)s") % {'error': err})
+
+        return failure
+
 
 
     def getResources(self):
@@ -569,5 +569,63 @@ class DumpReloadTestCase(testcase.DualRepositoryTestCase):
 
 
 
+class ChunkedSerializerTestCase(unittest.TestCase):
+
+    def _dump(self, serializer, filename, records):
+        output = open(filename, "wb")
+        try:
+            dump = serializer.dumper(output)
+            for record in records:
+                dump(record)
+            dump(None)
+        finally:
+            output.close()
+
+    def _load(self, serializer, filename):
+        input = open(filename, "rb")
+        try:
+            self.assertEqual(serializer.count(input), len(self.records))
+            input.seek(0)
+            load = serializer.loader(input)
+            records = []
+            while True:
+                record = load()
+                if record is None:
+                    break
+                records.append(record)
+            return records
+        finally:
+            input.close()
+
+    def setUp(self):
+        self.filename = "tmp_chunked_file"
+        self.records = [(i, u"record %d" % i) for i in xrange(23)]
+
+    def tearDown(self):
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
+
+    def testChunks(self):
+        class serializer(dumpreload.ChunkedSerializer):
+            chunkSize = 5
+
+        self._dump(serializer, self.filename, self.records)
+        self.assertEqual(self._load(serializer, self.filename), self.records)
+
+        input = open(self.filename, "rb")
+        try:
+            index = serializer.readIndex(input)
+        finally:
+            input.close()
+        self.assertEqual([count for offset, count in index], [5, 5, 5, 5, 3])
+
+    def testPickleCompatibility(self):
+        self._dump(dumpreload.PickleSerializer, self.filename, self.records)
+        self.assertEqual(self._load(dumpreload.ChunkedSerializer,
+                                    self.filename), self.records)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,82 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Compare the throughput of regular and bulk commits of many new items.
+
+Each run creates a fresh repository, loads the cineguide pack, creates
+C{count} new movies all referring to the same director and commits them.
+"""
+
+import os, shutil
+
+from time import time
+
+from chandlerdb.persistence.DBRepository import DBRepository
+
+
+def measure(dbHome, count, bulk):
+
+    if os.path.exists(dbHome):
+        shutil.rmtree(dbHome)
+
+    repository = DBRepository(dbHome)
+    repository.create()
+    view = repository.view
+
+    view.loadPack('data/packs/cineguide.pack', package='tests')
+    view.commit()
+
+    movie = view.findPath('//CineGuide/KHepburn').movies.first()
+    kind = movie.itsKind
+    parent = movie.itsParent
+    director = movie.director
+
+    for i in xrange(count):
+        kind.newItem(None, parent, title='Movie %d' % (i),
+                     frenchTitle='Film %d' % (i), director=director)
+
+    before = time()
+    if bulk:
+        view.commit(notify=False, bulk=True)
+    else:
+        view.commit()
+    duration = time() - before
+
+    repository.close()
+    shutil.rmtree(dbHome)
+
+    return duration
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-c", "--count", dest="count", type="int",
+                      default=10000, help="the number of items to commit")
+    parser.add_option("-d", "--dbhome", dest="dbHome", default="__bulk__",
+                      help="the scratch repository directory")
+
+    (options, args) = parser.parse_args()
+    count = options.count
+
+    results = []
+    for bulk in (False, True):
+        duration = measure(options.dbHome, count, bulk)
+        results.append(duration)
+        print "%-8s %d items in %.3fs, %d items/s" %(bulk and 'bulk' or 'regular', count, duration, round(count / max(duration, 0.001)))
+
+    if results[1]:
+        print "speedup: %.2fx" %(results[0] / results[1])
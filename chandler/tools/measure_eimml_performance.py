@@ -0,0 +1,249 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+EIMML serialization benchmark.
+
+A synthetic collection of notes and events is exported to record sets in
+a scratch profile directory and the record sets are converted to and from
+EIMML by the EIMMLSerializer:
+
+    - write and parse, streaming to and from a file
+    - serialize and deserialize, to and from a string in memory
+
+The timings, the size of the EIMML and the growth of the process' peak
+RSS during each phase are written as JSON. The peak RSS only grows, so
+the streaming phases are run first. Use -p to run a single phase per
+process instead. Run from CHANDLERHOME:
+
+    RunPython tools/measure_eimml_performance.py -n 5000 -e 5000
+"""
+
+import sys, os, shutil, tempfile
+
+from time import time
+from datetime import datetime, timedelta
+from optparse import OptionParser
+
+from measure_repository_performance import dumps, peakRSS, text
+
+
+PHASES = ('write', 'parse', 'serialize', 'deserialize')
+
+
+class Benchmark(object):
+    """
+    A synthetic collection and the timings of its conversion to and from
+    EIMML.
+    """
+
+    def __init__(self, view, notes=5000, events=5000, phases=PHASES):
+
+        self.view = view
+        self.notes = notes
+        self.events = events
+        self.phases = phases
+        self.timings = {}
+
+    def measure(self, name, count, fn, *args):
+        """
+        Time a call to C{fn} and record its duration under C{name}.
+
+        If C{count} is C{None}, the call's return value is used as count.
+        """
+
+        rss = peakRSS()
+        before = time()
+        result = fn(*args)
+        duration = time() - before
+
+        if count is None:
+            count = result
+
+        timing = { 'seconds': duration, 'count': count }
+        if count and duration:
+            timing['rate'] = count / duration
+        if rss is not None:
+            timing['peakRSSGrowth'] = peakRSS() - rss
+
+        self.timings[name] = timing
+        self.view.logger.info("benchmark: %s, %d in %s", name, count or 0,
+                              timedelta(seconds=duration))
+
+        return result
+
+    def populate(self):
+
+        from osaf import pim
+
+        view = self.view
+        items = []
+
+        for i in xrange(self.notes):
+            items.append(pim.Note(itsView=view, displayName=text(i, 3),
+                                  body=text(i, 50)))
+
+        start = datetime(2008, 1, 1, 9, tzinfo=view.tzinfo.default)
+        for i in xrange(self.events):
+            event = pim.CalendarEvent(itsView=view, displayName=text(i, 3),
+                                      body=text(i, 20),
+                                      startTime=start + timedelta(hours=i),
+                                      duration=timedelta(hours=1))
+            items.append(event.itsItem)
+
+        view.commit()
+        self.items = items
+
+        return len(items)
+
+    def export(self):
+
+        from osaf.sharing import eim, translator
+
+        trans = translator.SharingTranslator(self.view)
+        recordSets = {}
+
+        for item in self.items:
+            alias = trans.getAliasForItem(item)
+            recordSets[alias] = eim.RecordSet(trans.exportItem(item))
+
+        self.recordSets = recordSets
+
+        return len(recordSets)
+
+    def write(self):
+
+        from osaf.sharing.eimml import EIMMLSerializer
+
+        output = file(self.path, 'wb')
+        try:
+            EIMMLSerializer.write(self.view, self.recordSets, output)
+        finally:
+            output.close()
+
+        self.size = os.path.getsize(self.path)
+
+        return len(self.recordSets)
+
+    def parse(self):
+
+        from osaf.sharing.eimml import EIMMLSerializer
+
+        count = 0
+        input = file(self.path, 'rb')
+        try:
+            extra, recordSets = EIMMLSerializer.parse(self.view, input)
+            for uuid, recordSet in recordSets:
+                count += 1
+        finally:
+            input.close()
+
+        return count
+
+    def serialize(self):
+
+        from osaf.sharing.eimml import EIMMLSerializer
+
+        text = EIMMLSerializer.serialize(self.view, self.recordSets)
+        self.size = len(text)
+
+        output = file(self.path, 'wb')
+        output.write(text)
+        output.close()
+
+        return len(self.recordSets)
+
+    def deserialize(self):
+
+        from osaf.sharing.eimml import EIMMLSerializer
+
+        input = file(self.path, 'rb')
+        text = input.read()
+        input.close()
+
+        recordSets, extra = EIMMLSerializer.deserialize(self.view, text)
+
+        return len(recordSets)
+
+    def run(self):
+
+        fd, self.path = tempfile.mkstemp(suffix='.xml', prefix='eimml')
+        os.close(fd)
+
+        try:
+            self.measure('populate', None, self.populate)
+            self.measure('export', None, self.export)
+
+            if 'write' not in self.phases:
+                # the EIMML parsed is written without being measured
+                self.write()
+
+            for phase in PHASES:
+                if phase in self.phases:
+                    self.measure(phase, None, getattr(self, phase))
+        finally:
+            os.remove(self.path)
+
+        return { 'parameters': { 'notes': self.notes,
+                                 'events': self.events,
+                                 'phases': list(self.phases) },
+                 'timings': self.timings,
+                 'size': self.size,
+                 'peakRSS': peakRSS(),
+                 'platform': sys.platform,
+                 'time': time() }
+
+
+if __name__ == '__main__':
+
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-n", "--notes", dest="notes", type="int",
+                      default=5000, help="the number of notes to create")
+    parser.add_option("-e", "--events", dest="events", type="int",
+                      default=5000, help="the number of events to create")
+    parser.add_option("-p", "--phases", dest="phases",
+                      default=",".join(PHASES),
+                      help="the comma separated phases to measure")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="the JSON results file, stdout by default")
+
+    (options, args) = parser.parse_args()
+
+    # the chandler command line options are parsed again by startup()
+    del sys.argv[1:]
+
+    # startup() changes the current directory to CHANDLERHOME
+    if options.output:
+        options.output = os.path.abspath(options.output)
+
+    from tools import headless
+
+    profileDir = tempfile.mkdtemp(prefix='benchmark')
+    try:
+        view = headless.startup(create=True, profileDir=profileDir)
+        benchmark = Benchmark(view, options.notes, options.events,
+                              options.phases.split(','))
+        results = benchmark.run()
+        view.repository.close()
+    finally:
+        shutil.rmtree(profileDir, True)
+
+    results = dumps(results, indent=2)
+    if options.output:
+        output = file(options.output, 'w')
+        output.write(results)
+        output.write('\n')
+        output.close()
+    else:
+        print results
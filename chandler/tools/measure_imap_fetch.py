@@ -0,0 +1,165 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Compare downloading an IMAP folder with one UID FETCH per message to the
+batched, pipelined fetching of the IMAP client.
+
+The folder is served from memory by the fake IMAP server of the mail tests
+with a simulated latency on every command. Run from CHANDLERHOME:
+
+    RunPython tools/measure_imap_fetch.py -c 2000 -l 20
+"""
+
+import sys, os
+
+from time import time
+from optparse import OptionParser
+
+sys.path.insert(0, 'parcels')
+sys.path.insert(0, os.path.join('parcels', 'osaf', 'mail', 'tests',
+                                'test_servers'))
+
+from twisted.internet import reactor, defer
+from twisted.internet.protocol import ClientCreator
+from twisted.mail import imap4
+
+from osaf.mail import constants
+from osaf.mail.imap import FetchBatchSize, getFetchedMessage
+import imapFetchServer
+
+
+class Download(object):
+    """
+    Fetch the bodies of a list of UIDs, either one per request or in
+    adaptive batches with up to IMAP_FETCH_WINDOW requests queued.
+    """
+
+    def __init__(self, proto, uids, pipelined):
+
+        self.proto = proto
+        self.pending = list(uids)
+        self.pipelined = pipelined
+        self.sizer = FetchBatchSize()
+        self.outstanding = 0
+        self.count = 0
+        self.bytes = 0
+        self.done = defer.Deferred()
+
+    def start(self):
+
+        self.started = self.last = time()
+
+        window = self.pipelined and constants.IMAP_FETCH_WINDOW or 1
+        for i in xrange(window):
+            self.fetchNext()
+
+        return self.done
+
+    def fetchNext(self):
+
+        if not self.pending:
+            if not self.outstanding:
+                self.done.callback(time() - self.started)
+            return
+
+        size = self.pipelined and self.sizer.size or 1
+        batch = self.pending[:size]
+        del self.pending[:size]
+
+        msgSet = imap4.MessageSet()
+        for uid in batch:
+            msgSet.add(uid)
+
+        self.outstanding += 1
+        d = self.proto.fetchSpecific(msgSet, uid=True, peek=True)
+        d.addCallback(self.fetched, len(batch), time())
+        d.addErrback(self.done.errback)
+
+    def fetched(self, msgs, count, requested):
+
+        self.outstanding -= 1
+
+        now = time()
+        self.sizer.update(count, now - max(requested, self.last))
+        self.last = now
+
+        for fetchItems in msgs.itervalues():
+            res = getFetchedMessage(fetchItems[0])
+            if res is not None:
+                self.count += 1
+                self.bytes += len(res[1])
+
+        self.fetchNext()
+
+
+def measure(proto, count, pipelined, results):
+
+    def report(duration):
+        name = pipelined and 'pipelined' or 'single'
+        rate = download.count / max(duration, 0.001)
+        results.append(duration)
+        print "%-10s %d messages (%d kbytes) in %.3fs, %d messages/s" %(name, download.count, download.bytes >> 10, duration, round(rate))
+        return proto
+
+    download = Download(proto, xrange(1, count + 1), pipelined)
+    return download.start().addCallback(report)
+
+
+def run(options):
+
+    port = imapFetchServer.listen(0, options.count, options.latency / 1000.0,
+                                  options.size)
+    results = []
+
+    def login(proto):
+        d = proto.login(imapFetchServer.USER, imapFetchServer.PASS)
+        d.addCallback(lambda _: proto.select('INBOX'))
+        d.addCallback(lambda _: proto)
+        return d
+
+    def done(result):
+        if len(results) == 2 and results[1]:
+            print "speedup: %.2fx" %(results[0] / results[1])
+        port.stopListening()
+        reactor.stop()
+        return result
+
+    def failed(failure):
+        failure.printTraceback()
+
+    d = ClientCreator(reactor, imap4.IMAP4Client).connectTCP(
+        '127.0.0.1', port.getHost().port)
+    d.addCallback(login)
+    d.addCallback(measure, options.count, False, results)
+    d.addCallback(measure, options.count, True, results)
+    d.addCallback(lambda proto: proto.logout())
+    d.addErrback(failed)
+    d.addBoth(done)
+
+
+if __name__ == '__main__':
+
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-c", "--count", dest="count", type="int",
+                      default=1000, help="the number of messages to download")
+    parser.add_option("-l", "--latency", dest="latency", type="float",
+                      default=10.0, help="the server latency in milliseconds")
+    parser.add_option("-s", "--size", dest="size", type="int",
+                      default=2048, help="the size of messages in bytes")
+
+    (options, args) = parser.parse_args()
+
+    reactor.callWhenRunning(run, options)
+    reactor.run()
@@ -0,0 +1,457 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Mail service benchmark.
+
+Synthetic mailboxes of parameterized size and MIME complexity are served
+from memory by the fake IMAP and POP3 servers of the mail tests, and a
+local SMTP sink accepts outgoing mail. The IMAPClient, POPClient and
+SMTPClient download and send through a MailWorker into a repository in a
+scratch profile, the same way they do in Chandler.
+
+For each protocol the messages per second, the number of repository
+commits, the number and duration of the calls to each stage of
+processing and the process' peak RSS are written as JSON so that
+changes to the commit sizes of calculateCommitNumber or to message
+parsing can be compared. Run from CHANDLERHOME:
+
+    RunPython tools/measure_mail_performance.py -c 1000 -l 5 -a 1
+"""
+
+import sys, os, shutil, tempfile, threading
+
+from time import time
+from optparse import OptionParser
+
+from measure_repository_performance import dumps, peakRSS
+
+sys.path.insert(0, os.path.join('parcels', 'osaf', 'mail', 'tests',
+                                'test_servers'))
+
+
+class Stages(object):
+    """
+    The number of calls to each stage of mail processing and the time
+    spent in them. Stages are timed from the Twisted, MailWorker and
+    main threads.
+    """
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def add(self, name, duration):
+
+        self.lock.acquire()
+        try:
+            count, seconds = self.stages.get(name, (0, 0.0))
+            self.stages[name] = (count + 1, seconds + duration)
+        finally:
+            self.lock.release()
+
+    def count(self, name):
+
+        return self.stages.get(name, (0, 0.0))[0]
+
+    def timed(self, name, fn):
+        """
+        Return a wrapper of C{fn} timing its calls as stage C{name}.
+        """
+
+        def timed(*args, **kwds):
+            before = time()
+            try:
+                return fn(*args, **kwds)
+            finally:
+                self.add(name, time() - before)
+
+        return timed
+
+    def reset(self):
+
+        self.lock.acquire()
+        try:
+            self.stages.clear()
+        finally:
+            self.lock.release()
+
+    def results(self):
+
+        results = {}
+        for name, (count, seconds) in self.stages.iteritems():
+            results[name] = { 'count': count,
+                              'seconds': seconds,
+                              'latency': count and seconds / count }
+
+        return results
+
+
+def measuredMailWorker(stages):
+    """
+    Return a C{MailWorker} timing its processing of requests and
+    signaling the end of each download.
+    """
+
+    from osaf.mail.mailworker import MailWorker
+
+    class MeasuredMailWorker(MailWorker):
+
+        def __init__(self, name, repository):
+
+            super(MeasuredMailWorker, self).__init__(name, repository)
+            self.done = threading.Event()
+
+            for name in ('processMail', 'processBodies', 'processUIDS',
+                         'processMessage'):
+                setattr(self, name, stages.timed(name, getattr(self, name)))
+
+        def processDone(self, *args):
+
+            try:
+                super(MeasuredMailWorker, self).processDone(*args)
+            finally:
+                self.done.set()
+
+        def processError(self, *args):
+
+            try:
+                super(MeasuredMailWorker, self).processError(*args)
+            finally:
+                self.done.set()
+
+    return MeasuredMailWorker
+
+
+def measuredSMTPClient():
+    """
+    Return a C{SMTPClient} signaling when it is done sending a batch.
+    """
+
+    from osaf.mail.smtp import SMTPClient
+
+    class MeasuredSMTPClient(SMTPClient):
+
+        def __init__(self, view, account):
+
+            super(MeasuredSMTPClient, self).__init__(view, account)
+            self.done = threading.Event()
+
+        def _batchSent(self, results):
+
+            try:
+                return super(MeasuredSMTPClient, self)._batchSent(results)
+            finally:
+                self.done.set()
+
+    return MeasuredSMTPClient
+
+
+class Benchmark(object):
+    """
+    Mail downloaded from and sent to local fake servers.
+    """
+
+    def __init__(self, view, count=1000, latency=5.0, size=2048,
+                 attachments=0, commit=None, headersOnly=False,
+                 protocols=('imap', 'pop', 'smtp'), timeout=600.0):
+
+        self.view = view
+        self.count = count
+        self.latency = latency
+        self.size = size
+        self.attachments = attachments
+        self.commit = commit
+        self.headersOnly = headersOnly
+        self.protocols = protocols
+        self.timeout = timeout
+        self.stages = Stages()
+        self.timings = {}
+
+    def listen(self, fn, *args):
+        """
+        Start a fake server in the Twisted thread and return its port.
+        """
+
+        from twisted.internet import reactor, threads
+
+        return threads.blockingCallFromThread(reactor, fn, *args)
+
+    def instrument(self):
+        """
+        Time message parsing and the repository commits of every view.
+        """
+
+        from osaf.mail import mailworker, base
+
+        ParsedMessages = mailworker.ParsedMessages
+        ParsedMessages.get = self.stages.timed('parse', ParsedMessages.get)
+
+        viewClass = type(self.view)
+        commit = viewClass.commit
+        stages = self.stages
+
+        def timedCommit(view, *args, **kwds):
+            before = time()
+            try:
+                return commit(view, *args, **kwds)
+            finally:
+                stages.add('commit %s' %(view.name), time() - before)
+
+        viewClass.commit = timedCommit
+
+        if self.commit:
+            number = self.commit
+            base.AbstractDownloadClient.calculateCommitNumber = \
+                lambda client: number
+
+    def startMailService(self):
+
+        from application import Globals, Utility
+        from osaf.mail.mailservice import MailService
+        from osaf.mail import constants
+        from chandlerdb.persistence.RepositoryView import otherViewWins
+
+        view = self.view
+        repository = view.repository
+
+        # The mail clients check whether the mail service is online
+        Globals.mailService = MailService(view)
+        Globals.mailService.takeOnline()
+
+        Utility.initTwisted(view)
+
+        self.worker = measuredMailWorker(self.stages)("MailWorker Thread",
+                                                      repository)
+        self.worker.start()
+
+        self.clientView = repository.createView("Twisted Thread Client View",
+                                                notify=False,
+                                                mergeFn=otherViewWins,
+                                                pruneSize=constants.MAILSERVICE_PRUNE_SIZE)
+
+    def stopMailService(self):
+
+        from application import Utility
+
+        self.worker.shutdown()
+        Utility.stopTwisted()
+
+    def createAccount(self, cls, port, **kwds):
+
+        from osaf.framework.password import Password
+        from osaf.framework.twisted import waitForDeferred
+
+        view = self.view
+        account = cls(itsView=view, displayName=u'%s Benchmark' %(cls.__name__),
+                      host=u'127.0.0.1', port=port, username=u'test',
+                      password=Password(itsView=view),
+                      connectionSecurity='NONE', numRetries=0,
+                      isActive=True, **kwds)
+        waitForDeferred(account.password.encryptPassword(u'test'))
+        view.commit()
+
+        return account
+
+    def record(self, name, count, duration, **kwds):
+
+        timing = { 'seconds': duration, 'count': count,
+                   'stages': self.stages.results() }
+        if count and duration:
+            timing['rate'] = count / duration
+        timing.update(kwds)
+
+        self.timings[name] = timing
+        self.view.logger.info("benchmark: %s, %d messages in %.3fs",
+                              name, count, duration)
+
+    def download(self, name, client):
+
+        stages = self.stages
+        worker = self.worker
+
+        stages.reset()
+        worker.done.clear()
+
+        before = time()
+        client.getMail()
+        worker.done.wait(self.timeout)
+        duration = time() - before
+
+        self.record(name, stages.count('processMessage'), duration)
+
+    def measureIMAP(self):
+
+        import imapFetchServer
+        from osaf.pim.mail import IMAPAccount
+        from osaf.mail.imap import IMAPClient
+
+        port = self.listen(imapFetchServer.listen, 0, self.count,
+                           self.latency / 1000.0, self.size, self.attachments)
+        try:
+            account = self.createAccount(IMAPAccount, port.getHost().port)
+            for folder in account.folders:
+                folder.headersOnly = self.headersOnly
+            self.view.commit()
+
+            self.download('imap', IMAPClient(self.clientView, account,
+                                             self.worker))
+        finally:
+            self.listen(port.stopListening)
+
+    def measurePOP(self):
+
+        import popFetchServer
+        from osaf.pim.mail import POPAccount
+        from osaf.mail.pop import POPClient
+
+        port = self.listen(popFetchServer.listen, 0, self.count,
+                           self.latency / 1000.0, self.size, self.attachments)
+        try:
+            account = self.createAccount(POPAccount, port.getHost().port)
+
+            self.download('pop', POPClient(self.clientView, account,
+                                           self.worker))
+        finally:
+            self.listen(port.stopListening)
+
+    def measureSMTP(self):
+
+        import smtpSinkServer
+        from osaf.pim.mail import SMTPAccount, MailMessage, EmailAddress
+
+        view = self.view
+        port = self.listen(smtpSinkServer.listen, 0, self.latency / 1000.0)
+        try:
+            sender = EmailAddress.getEmailAddress(view, u'test@example.com',
+                                                  u'Benchmark')
+            account = self.createAccount(SMTPAccount, port.getHost().port,
+                                         useAuth=False, fromAddress=sender)
+
+            for i in xrange(self.count):
+                recipient = EmailAddress.getEmailAddress(view,
+                                            u'recipient%d@example.com' %(i))
+                message = MailMessage(itsView=view,
+                                      subject=u'Message %d' %(i),
+                                      body=u'x' * self.size)
+                message.fromAddress = sender
+                message.toAddress = [recipient]
+                account.messageQueue.insert(0, message.itsItem)
+            view.commit()
+
+            self.stages.reset()
+            client = measuredSMTPClient()(self.clientView, account)
+
+            before = time()
+            client.takeOnline()
+            client.done.wait(self.timeout)
+            duration = time() - before
+
+            factory = port.factory
+            self.record('smtp', factory.messages, duration,
+                        sessions=factory.sessions, bytes=factory.bytes)
+        finally:
+            self.listen(port.stopListening)
+
+    def run(self):
+
+        self.instrument()
+        self.startMailService()
+        try:
+            if 'imap' in self.protocols:
+                self.measureIMAP()
+            if 'pop' in self.protocols:
+                self.measurePOP()
+            if 'smtp' in self.protocols:
+                self.measureSMTP()
+        finally:
+            self.stopMailService()
+
+        return { 'parameters': { 'count': self.count,
+                                 'latency': self.latency,
+                                 'size': self.size,
+                                 'attachments': self.attachments,
+                                 'commit': self.commit,
+                                 'headersOnly': self.headersOnly,
+                                 'protocols': list(self.protocols) },
+                 'timings': self.timings,
+                 'peakRSS': peakRSS(),
+                 'platform': sys.platform,
+                 'time': time() }
+
+
+if __name__ == '__main__':
+
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-c", "--count", dest="count", type="int",
+                      default=1000, help="the number of messages per protocol")
+    parser.add_option("-l", "--latency", dest="latency", type="float",
+                      default=5.0, help="the server latency in milliseconds")
+    parser.add_option("-s", "--size", dest="size", type="int",
+                      default=2048, help="the size of message bodies in bytes")
+    parser.add_option("-a", "--attachments", dest="attachments", type="int",
+                      default=0, help="the number of attachments per message")
+    parser.add_option("-k", "--keep-attachments", dest="keepAttachments",
+                      action="store_true", default=False,
+                      help="store attachments instead of ignoring them")
+    parser.add_option("-n", "--commit", dest="commit", type="int",
+                      default=None,
+                      help="the number of messages per commit, "
+                           "calculateCommitNumber() by default")
+    parser.add_option("-H", "--headers-only", dest="headersOnly",
+                      action="store_true", default=False,
+                      help="download IMAP headers only")
+    parser.add_option("-p", "--protocols", dest="protocols",
+                      default="imap,pop,smtp",
+                      help="the comma separated protocols to measure")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="the JSON results file, stdout by default")
+
+    (options, args) = parser.parse_args()
+
+    # the chandler command line options are parsed again by startup()
+    del sys.argv[1:]
+
+    # startup() changes the current directory to CHANDLERHOME
+    if options.output:
+        options.output = os.path.abspath(options.output)
+
+    from tools import headless
+
+    profileDir = tempfile.mkdtemp(prefix='benchmark')
+    try:
+        view = headless.startup(create=True, profileDir=profileDir)
+
+        if options.keepAttachments:
+            from osaf.mail import message
+            message.IGNORE_ATTACHMENTS = False
+
+        benchmark = Benchmark(view, options.count, options.latency,
+                              options.size, options.attachments,
+                              options.commit, options.headersOnly,
+                              options.protocols.split(','))
+        results = benchmark.run()
+        view.repository.close()
+    finally:
+        shutil.rmtree(profileDir, True)
+
+    results = dumps(results, indent=2)
+    if options.output:
+        output = file(options.output, 'w')
+        output.write(results)
+        output.write('\n')
+        output.close()
+    else:
+        print results
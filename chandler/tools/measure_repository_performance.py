@@ -0,0 +1,349 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Repository layer benchmark suite.
+
+A synthetic repository of notes, events, mail messages and collections of
+parameterized sizes is created in a scratch profile directory and the
+latency of the main repository operations is measured against it:
+
+    - create, commit and bulk commit of new items
+    - commit of changes, then refresh and merge of them into another view
+    - kind query and full-text indexing and search
+    - pruning of the item cache and compaction of the repository
+
+The timings, the parameters used and the process' peak RSS are written
+as JSON so that runs can be compared over time. Run from CHANDLERHOME:
+
+    RunPython tools/measure_repository_performance.py -n 1000 -o out.json
+
+The full-text indexing and search timings of the Lucene and native
+full-text indexes are compared by running it with -t lucene and -t
+native.
+"""
+
+import sys, os, shutil, tempfile
+
+from time import time
+from datetime import datetime, timedelta
+from optparse import OptionParser
+
+try:
+    from json import dumps
+except ImportError:         # python 2.5
+
+    def dumps(value, indent=None, level=0):
+
+        if isinstance(value, dict):
+            if not value:
+                return '{}'
+            prefix = '\n' + ' ' * ((indent or 0) * (level + 1))
+            items = ['%s%s: %s' %(prefix, dumps(str(key)),
+                                  dumps(v, indent, level + 1))
+                     for key, v in sorted(value.iteritems())]
+            return '{%s%s}' %(','.join(items),
+                              '\n' + ' ' * ((indent or 0) * level))
+        if isinstance(value, (list, tuple)):
+            return '[%s]' %(', '.join([dumps(v, indent, level)
+                                       for v in value]))
+        if isinstance(value, basestring):
+            return '"%s"' %(value.replace('\\', '\\\\').replace('"', '\\"'))
+        if isinstance(value, bool):
+            return value and 'true' or 'false'
+        if value is None:
+            return 'null'
+
+        return repr(value)
+
+try:
+    from resource import getrusage, RUSAGE_SELF
+except ImportError:         # windows
+    getrusage = None
+
+
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur',
+         'adipiscing', 'elit', 'sed', 'eiusmod', 'tempor', 'incididunt')
+
+
+def text(i, count):
+
+    return u' '.join([WORDS[(i + n) % len(WORDS)] for n in xrange(count)])
+
+
+def peakRSS():
+    """
+    Return the peak resident set size of this process in kbytes, if known.
+    """
+
+    if getrusage is None:
+        return None
+
+    rss = getrusage(RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':    # bytes, not kbytes
+        rss >>= 10
+
+    return rss
+
+
+class Benchmark(object):
+    """
+    A synthetic repository and the timings of operations run against it.
+    """
+
+    def __init__(self, view, notes=1000, events=1000, mails=1000,
+                 collections=10, changes=100, textIndex='lucene'):
+
+        self.view = view
+        self.textIndex = textIndex
+        self.notes = notes
+        self.events = events
+        self.mails = mails
+        self.collections = collections
+        self.changes = changes
+        self.timings = {}
+
+    def measure(self, name, count, fn, *args):
+        """
+        Time a call to C{fn} and record its duration under C{name}.
+
+        If C{count} is C{None}, the call's return value is used as count.
+        """
+
+        before = time()
+        result = fn(*args)
+        duration = time() - before
+
+        if count is None:
+            count = result
+
+        timing = { 'seconds': duration, 'count': count }
+        if count and duration:
+            timing['rate'] = count / duration
+
+        self.timings[name] = timing
+        self.view.logger.info("benchmark: %s, %d in %s", name, count or 0,
+                              timedelta(seconds=duration))
+
+        return result
+
+    def populate(self):
+
+        from osaf import pim
+        from osaf.pim.mail import MailMessage
+        from osaf.pim.calendar.Recurrence import \
+            RecurrenceRule, RecurrenceRuleSet
+
+        view = self.view
+        items = []
+
+        for i in xrange(self.notes):
+            items.append(pim.Note(itsView=view, displayName=text(i, 3),
+                                  body=text(i, 50)))
+
+        start = datetime(2008, 1, 1, 9, tzinfo=view.tzinfo.default)
+        for i in xrange(self.events):
+            event = pim.CalendarEvent(itsView=view, displayName=text(i, 3),
+                                      body=text(i, 20),
+                                      startTime=start + timedelta(hours=i),
+                                      duration=timedelta(hours=1))
+            if i % 10 == 0:
+                rule = RecurrenceRule(None, itsView=view, freq='weekly')
+                ruleSet = RecurrenceRuleSet(None, itsView=view)
+                ruleSet.addRule(rule)
+                event.rruleset = ruleSet
+            items.append(event.itsItem)
+
+        for i in xrange(self.mails):
+            message = MailMessage(itsView=view, displayName=text(i, 5),
+                                  body=text(i, 200))
+            items.append(message.itsItem)
+
+        if self.collections:
+            collections = [pim.ListCollection(itsView=view,
+                                              displayName=u'collection %d' %(i))
+                           for i in xrange(self.collections)]
+            for i, item in enumerate(items):
+                collections[i % self.collections].add(item)
+
+        return len(items) + self.collections
+
+    def populateBulk(self):
+
+        from osaf import pim
+
+        view = self.view
+        for i in xrange(self.notes):
+            pim.Note(itsView=view, displayName=text(i, 3), body=text(i, 50))
+
+        return self.notes
+
+    def commit(self, view=None, **kwds):
+
+        view = view or self.view
+        count = len(view._log)
+        view.commit(**kwds)
+
+        return count
+
+    def change(self, other):
+        """
+        Change items in both views, different attributes in each so that
+        refreshing C{other} merges the changes without conflicts.
+        """
+
+        from osaf import pim
+
+        uuids = []
+        for note in pim.Note.iterItems(self.view):
+            uuids.append(note.itsUUID)
+            if len(uuids) == self.changes:
+                break
+
+        for uuid in uuids:
+            other.find(uuid).body = u'changed in %s' %(other)
+        for uuid in uuids:
+            self.view.find(uuid).displayName = u'changed in %s' %(self.view)
+
+        return len(uuids)
+
+    def kindQuery(self):
+
+        from osaf import pim
+
+        count = 0
+        for note in pim.Note.iterItems(self.view):
+            count += 1
+
+        return count
+
+    def index(self):
+
+        self.view.repository.notifyIndexer(True)
+        return None
+
+    def search(self, query=WORDS[0]):
+
+        count = 0
+        for item in self.view.searchItems(query):
+            count += 1
+
+        return count
+
+    def prune(self, size):
+
+        evicted = 0
+        while True:
+            count = self.view.prune(size)
+            if not count:
+                break
+            evicted += count
+
+        return evicted
+
+    def compact(self):
+
+        self.view.repository.compact()
+        return None
+
+    def run(self):
+
+        view = self.view
+
+        self.measure('create', None, self.populate)
+        self.measure('commit', None, self.commit)
+
+        self.populateBulk()
+        self.measure('bulkCommit', None, lambda: self.commit(bulk=True))
+
+        other = view.repository.createView('benchmark')
+        count = self.change(other)
+        self.measure('changeCommit', count, self.commit)
+        self.measure('refresh', count, other.refresh)
+        self.measure('mergeCommit', None, self.commit, other)
+        self.measure('refreshMerged', count, view.refresh)
+        other.closeView()
+
+        self.measure('kindQuery', None, self.kindQuery)
+        self.measure('index', None, self.index)
+        self.measure('search', None, self.search)
+        self.measure('searchBoolean', None, self.search,
+                     '+%s +%s -%s' %(WORDS[1], WORDS[2], WORDS[3]))
+        self.measure('searchPhrase', None, self.search,
+                     '"%s %s"' %(WORDS[4], WORDS[5]))
+        self.measure('prune', None, self.prune, max(len(view._registry) / 10, 1))
+        self.measure('compact', None, self.compact)
+
+        return { 'parameters': { 'notes': self.notes,
+                                 'events': self.events,
+                                 'mails': self.mails,
+                                 'collections': self.collections,
+                                 'changes': self.changes,
+                                 'textindex': self.textIndex },
+                 'timings': self.timings,
+                 'peakRSS': peakRSS(),
+                 'platform': sys.platform,
+                 'time': time() }
+
+
+if __name__ == '__main__':
+
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-n", "--notes", dest="notes", type="int",
+                      default=1000, help="the number of notes to create")
+    parser.add_option("-e", "--events", dest="events", type="int",
+                      default=1000, help="the number of events to create")
+    parser.add_option("-m", "--mails", dest="mails", type="int",
+                      default=1000, help="the number of messages to create")
+    parser.add_option("-c", "--collections", dest="collections", type="int",
+                      default=10, help="the number of collections to create")
+    parser.add_option("-x", "--changes", dest="changes", type="int",
+                      default=100, help="the number of items to merge")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="the JSON results file, stdout by default")
+    parser.add_option("-t", "--textindex", dest="textindex",
+                      default="lucene",
+                      help="the full-text index to use, lucene or native")
+
+    (options, args) = parser.parse_args()
+
+    # the chandler command line options are parsed again by startup()
+    del sys.argv[1:]
+
+    # startup() changes the current directory to CHANDLERHOME
+    if options.output:
+        options.output = os.path.abspath(options.output)
+
+    from tools import headless
+
+    profileDir = tempfile.mkdtemp(prefix='benchmark')
+    try:
+        view = headless.startup(create=True, profileDir=profileDir,
+                                textindex=options.textindex)
+        benchmark = Benchmark(view, options.notes, options.events,
+                              options.mails, options.collections,
+                              options.changes, options.textindex)
+        results = benchmark.run()
+        view.repository.close()
+    finally:
+        shutil.rmtree(profileDir, True)
+
+    results = dumps(results, indent=2)
+    if options.output:
+        output = file(options.output, 'w')
+        output.write(results)
+        output.write('\n')
+        output.close()
+    else:
+        print results
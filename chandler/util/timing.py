@@ -53,63 +53,44 @@ Example::
     Totals:                          1460  8.429  0.006
 
 
+The sections are spans of the L{chandlerdb.util.Spans} profiler kept by
+this module, so timed sections may nest and may be timed in several
+threads at once. When the application's span profiler is enabled, with
+the --spans command line option, its report also covers the hot paths
+of the repository, the user interface and sharing.
+
 Gotchas::
 
-    - Recursion isn't handled (you will get an assert if you try to
-      call begin() on the same label without an intervening end())
     - The grand total will be inflated if any of the timed sections
       are nested.
 """
 
-import time
 import version
 
-trackers = {}
-
-class Tracker(object):
-
-    def __init__(self, name):
-        self.name = name
-        self.count = 0
-        self.totalTime = 0.0
-        self.prevBeginTime = None
-
-    def begin(self):
-        if self.prevBeginTime is not None:
-            print "Begin called without twice without intervening end %s" % self.name
-            # raise "Begin called without twice without intervening end %s" % self.name
-        self.prevBeginTime = time.time()
-        self.count += 1
+from chandlerdb.util.Spans import Profiler, Histogram
 
-    def end(self):
-        if self.prevBeginTime is None:
-            print "End called without a Begin on %s" % self.name
-            # raise "End called without a Begin on %s" % self.name
-        duration = time.time() - self.prevBeginTime
-        self.totalTime += duration
-        self.prevBeginTime = None
-
-    def results(self):
-        return (self.name, self.count, self.totalTime, self.totalTime / self.count)
+profiler = Profiler(enabled=True, slowCount=0)
 
 def begin(name):
-    if not trackers.has_key(name):
-        trackers[name] = Tracker(name)
-    trackers[name].begin()
+    profiler.enter(name)
 
 def end(name):
-    if not trackers.has_key(name):
-        print "End called without a Begin on %s" % name
-        # raise "End called without a Begin on %s" % name
-    trackers[name].end()
+    profiler.exit(name)
 
 def reset():
-    global trackers
-    trackers = {}
-    totalCounts = 0
-    totalTime = 0.0
+    profiler.reset()
+
+def _collect(node, histograms):
+    for name, child in node.children.iteritems():
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.merge(child.histogram)
+        _collect(child, histograms)
+    return histograms
 
 def results(verbose=True):
+    trackers = _collect(profiler.getTree(), {})
     keys = trackers.keys()
     keys.sort()
 
@@ -124,10 +105,10 @@ def results(verbose=True):
         print bannerFormat % ("Operation", "Rev #", "Total")
         print lines
     for key in keys:
-        (name, count, time, avg) = trackers[key].results()
-        totalCounts += count
-        totalTime += time
-        print dataFormat % (name, revision, time / 60)
+        histogram = trackers[key]
+        totalCounts += histogram.count
+        totalTime += histogram.total
+        print dataFormat % (key, revision, histogram.total / 60)
     if verbose:
         print lines
         print dataFormat % ("Totals:", revision, totalTime / 60)
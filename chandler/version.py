@@ -24,7 +24,7 @@ _version = { 'release': '1.0.4',
 # with your name (and some helpful text). The comment's really there just to
 # cause Subversion to warn you of a conflict when you update, in case someone 
 # else changes it at the same time you do (that's why it's on the same line).
-app_version = "501" # grant: Week start menu
+app_version = "505" # IMAP folder seen UID ranges
 
 
 
@@ -16,6 +16,7 @@
 from chandlerdb.persistence.c import Record
 from chandlerdb.item.ItemError import *
 from chandlerdb.util.c import Nil, Default
+from chandlerdb.util.Spans import profiler
 from chandlerdb.item.Indexes import __index_classes__
 
 
@@ -135,6 +136,16 @@ class Indexed(object):
               faster to do this check than to compute or fetch the actual
               values from the database.
 
+            - C{interval}: an index of keys with a C{(start, end)} interval
+              value, sorted by start then end. The interval is the return
+              value of a method invoked on a third party item. The item and
+              the name of the method are provided as a tuple with the
+              C{interval} keyword. The method is expected to accept two
+              arguments, the index object and a C{UUID} key. The intervals
+              are cached with the keys and keys whose interval overlaps a
+              range can be found with the index's C{iterOverlapping} method
+              without examining every key.
+
             - C{subindex}: an index that is a subset of another index whose
               keys are following the order of the superindex. The set the
               subindex is indexing must be a subset of the set the
@@ -146,7 +157,8 @@ class Indexed(object):
         indexes with the C{monitor} keyword. Likewise, which attributes to
         monitor for the C{compare} and C{method} types of indexes can be
         specified with one or more attribute names in a tuple via the
-        C{monitor} keyword.
+        C{monitor} keyword. This applies to the C{interval} type of index as
+        well.
 
         The C{attribute} and C{string} sorted indexes treat a missing or
         C{None} value as infinitely large.
@@ -516,7 +528,14 @@ class Indexed(object):
         @return: a C{UUID} key or C{None} if no match was found
         """
 
-        return self._indexes[indexName].findKey(mode, callable, *args)
+        if not profiler.enabled:
+            return self._indexes[indexName].findKey(mode, callable, *args)
+
+        profiler.enter('findInIndex')
+        try:
+            return self._indexes[indexName].findKey(mode, callable, *args)
+        finally:
+            profiler.exit('findInIndex')
 
     def getByIndex(self, indexName, position):
         """
@@ -638,15 +657,20 @@ class Indexed(object):
         for key in self.getIndex(indexName).iterkeys(first, last):
             yield key
 
-    def iterindexvalues(self, indexName, first=None, last=None):
+    def iterindexvalues(self, indexName, first=None, last=None, readAhead=0):
 
-        for key in self.iterindexkeys(indexName, first, last):
-            yield self[key]
+        if readAhead:
+            keys = self.iterindexkeys(indexName, first, last)
+            for item in self.itsView.iterItems(keys, readAhead):
+                yield item
+        else:
+            for key in self.iterindexkeys(indexName, first, last):
+                yield self[key]
 
-    def iterindexitems(self, indexName, first=None, last=None):
+    def iterindexitems(self, indexName, first=None, last=None, readAhead=0):
 
-        for key in self.iterindexkeys(indexName, first, last):
-            yield (key, self[key])
+        for item in self.iterindexvalues(indexName, first, last, readAhead):
+            yield (item.itsUUID, item)
 
     def resolveIndex(self, indexName, position):
 
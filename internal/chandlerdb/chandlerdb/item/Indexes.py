@@ -15,6 +15,8 @@
 
 from itertools import izip
 from traceback import format_exc
+from bisect import bisect_left, insort
+from datetime import timedelta
 
 from chandlerdb.item.c import CIndex, DelegatingIndex
 from chandlerdb.persistence.c import Record
@@ -1109,6 +1111,225 @@ class MethodIndex(SortedIndex):
         return offset + 2
 
 
+class IntervalIndex(SortedIndex):
+    """
+    An index of keys with a C{(start, end)} interval value.
+
+    The interval of a key is computed by a method invoked on a third party
+    item, provided with the C{interval} keyword as an C{(item, methodName)}
+    tuple. The method is invoked with the index and a key and is expected
+    to return a C{(start, end)} tuple. A C{None} start or end is treated as
+    unbounded.
+
+    Keys are sorted by start, then end. The intervals are cached next to
+    the keys so that comparisons don't fetch values once a key's interval
+    is known. The cache entry of a key is refreshed when it is reindexed.
+
+    To answer overlap queries without visiting every key, intervals are
+    also bucketed by the binary magnitude of their duration, each bucket
+    sorted by start. Finding the keys overlapping C{[start, end)} then
+    requires one binary search per bucket plus the matches, see
+    L{iterOverlapping}.
+    """
+
+    def __init__(self, valueMap, index, **kwds):
+
+        super(IntervalIndex, self).__init__(valueMap, index, **kwds)
+
+        if not kwds.get('loading', False):
+            item, methodName = kwds.pop('interval')
+            self._interval = (item.itsUUID, methodName)
+
+        self._intervals = {}
+        self._buckets = None
+        self._unbounded = None
+
+    def getIndexType(self):
+
+        return 'interval'
+    
+    def getInitKeywords(self):
+
+        kwds = super(IntervalIndex, self).getInitKeywords()
+        kwds['interval'] = self._interval
+
+        return kwds
+
+    def getInterval(self, key):
+
+        interval = self._intervals.get(key)
+        if interval is None:
+            uItem, methodName = self._interval
+            item = self._valueMap.itsView[uItem]
+            interval = getattr(item, methodName)(self, key)
+            self._intervals[key] = interval
+
+        return interval
+
+    def compare(self, k0, k1, vals):
+
+        # None sorts as infinitely large, as with attribute indexes
+        for v0, v1 in izip(self.getInterval(k0), self.getInterval(k1)):
+            if v0 is v1:
+                continue
+            if v0 is None:
+                return 1
+            if v1 is None:
+                return -1
+            if v0 == v1:
+                continue
+            if v0 > v1:
+                return 1
+            return -1
+
+        return 0
+
+    def _bucket(self, start, end):
+
+        delta = end - start
+        seconds = delta.days * 86400 + delta.seconds + 1
+
+        if seconds <= 0:
+            return 0
+
+        return int(seconds).bit_length()
+
+    def _forget(self, key):
+
+        interval = self._intervals.pop(key, None)
+        if interval is None or self._buckets is None:
+            return
+
+        start, end = interval
+        if start is None or end is None:
+            self._unbounded.discard(key)
+        else:
+            bucket = self._buckets[self._bucket(start, end)]
+            i = bisect_left(bucket, (start, end, key))
+            if i < len(bucket) and bucket[i][2] == key:
+                del bucket[i]
+
+    def _learn(self, key):
+
+        start, end = self.getInterval(key)
+        if self._buckets is None:
+            return
+
+        if start is None or end is None:
+            self._unbounded.add(key)
+        else:
+            bucket = self._bucket(start, end)
+            buckets = self._buckets
+            if bucket not in buckets:
+                buckets[bucket] = [(start, end, key)]
+            else:
+                insort(buckets[bucket], (start, end, key))
+
+    def _build(self):
+
+        self._buckets = {}
+        self._unbounded = set()
+        for key in self.iterkeys():
+            self._learn(key)
+
+    def insertKey(self, key, ignore=None, selected=False, _setadd=False):
+
+        self._forget(key)
+        super(IntervalIndex, self).insertKey(key, ignore, selected, _setadd)
+        self._learn(key)
+
+    def moveKey(self, key, ignore=None, insertMissing=None):
+
+        self._forget(key)
+        super(IntervalIndex, self).moveKey(key, ignore, insertMissing)
+        if key in self._index:
+            self._learn(key)
+
+    def moveKeys(self, keys, ignore=None, insertMissing=None):
+
+        if not isinstance(keys, set):
+            keys = set(keys)
+
+        for key in keys:
+            self._forget(key)
+        super(IntervalIndex, self).moveKeys(keys, ignore, insertMissing)
+        for key in keys:
+            if key in self._index:
+                self._learn(key)
+
+    def removeKey(self, key):
+
+        self._forget(key)
+        return self._index.removeKey(key)
+
+    def removeKeys(self, keys):
+
+        for key in keys:
+            self._forget(key)
+        return super(IntervalIndex, self).removeKeys(keys)
+
+    def clear(self):
+
+        self._intervals.clear()
+        self._buckets = None
+        self._unbounded = None
+        self._index.clear()
+
+    def iterOverlapping(self, start, end):
+        """
+        Iterate the keys whose interval overlaps C{[start, end)}.
+
+        A key overlaps if it starts before C{end} and ends after C{start}.
+        A key with a zero length interval also overlaps if it ends at
+        C{start}. A C{None} start or end is unbounded. Keys are returned in
+        index order.
+
+        @param start: the start of the range
+        @param end: the end of the range
+        """
+
+        if self._buckets is None:
+            self._build()
+
+        keys = []
+        for key in self._unbounded:
+            s, e = self._intervals[key]
+            if (s is None or s < end) and (e is None or start < e):
+                keys.append(key)
+
+        for bucket, intervals in self._buckets.iteritems():
+            try:
+                lowest = start - timedelta(seconds=1 << bucket)
+                i = bisect_left(intervals, (lowest,))
+            except OverflowError:
+                i = 0
+            for s, e, key in intervals[i:]:
+                if not s < end:
+                    break
+                if start < e or s == e and start <= e:
+                    keys.append(key)
+
+        keys.sort(key=self._index.getPosition)
+
+        return iter(keys)
+
+    def _writeValue(self, itemWriter, record, version):
+
+        super(IntervalIndex, self)._writeValue(itemWriter, record, version)
+
+        uItem, methodName = self._interval
+        record += (Record.UUID, uItem,
+                   Record.SYMBOL, methodName)
+
+    def _readValue(self, itemReader, offset, data):
+
+        offset = super(IntervalIndex, self)._readValue(itemReader,
+                                                       offset, data)
+        self._interval = data[offset:offset+2]
+
+        return offset + 2
+
+
 class SubIndex(SortedIndex):
 
     def getIndexType(self):
@@ -1129,4 +1350,5 @@ __index_classes__ = { 'attribute': AttributeIndex,
                       'string': StringIndex,
                       'compare': CompareIndex,
                       'method': MethodIndex,
+                      'interval': IntervalIndex,
                       'subindex': SubIndex }
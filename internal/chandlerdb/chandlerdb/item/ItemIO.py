@@ -200,6 +200,9 @@ class ItemReader(object):
     def isDeleted(self):
         raise NotImplementedError, "%s.isDeleted" %(type(self))
 
+    def getSize(self):
+        return 0
+
 
 class ItemPurger(object):
 
@@ -773,7 +773,9 @@ class RefList(LinkedMap, Indexed):
     def countKeys(self):
         return self._count
 
-    def iterItems(self):
+    def iterItems(self, readAhead=0):
+        if readAhead:
+            return self.itsView.iterItems(self.iterkeys(), readAhead)
         return self.itervalues()
 
     def iterKeys(self):
@@ -110,7 +110,10 @@ class AbstractSet(ItemValue, Indexed):
 
         return (item.itsUUID for item in self.__iter__(excludeIndexes))
 
-    def iterItems(self):
+    def iterItems(self, readAhead=0):
+
+        if readAhead:
+            return self.itsView.iterItems(self.iterkeys(), readAhead)
 
         return self.itervalues()
 
@@ -903,6 +906,15 @@ class Union(BiSet):
         left = self._left
         right = self._right
 
+        # an index holds the current members, an addition to either source
+        # is a change only if it is not a member already
+        index = self._anIndex()
+        if (index is not None and
+            'add' in (leftOp, rightOp) and 'remove' not in (leftOp, rightOp)):
+            if other in index:
+                return None
+            return 'add'
+
         if (leftOp == 'add' and not self._sourceContains(other, right) or
             rightOp == 'add' and not self._sourceContains(other, left)):
             return 'add'
@@ -1218,6 +1230,14 @@ class MultiUnion(MultiSet):
 
     def _op(self, ops, other):
 
+        # an index holds the current members, an addition to any source
+        # is a change only if it is not a member already
+        index = self._anIndex()
+        if index is not None and 'add' in ops and 'remove' not in ops:
+            if other in index:
+                return None
+            return 'add'
+
         sources = self._sources
         for op, source in izip(ops, sources):
             if op is not None:
@@ -23,3 +23,6 @@ class Indexable(object):
 
     def indexValue(self, view, uItem, uAttribute, uValue, version):
         raise NotImplementedError, '%s.indexValue' %(type(self))
+
+    def getIndexedText(self):
+        raise NotImplementedError, '%s.getIndexedText' %(type(self))
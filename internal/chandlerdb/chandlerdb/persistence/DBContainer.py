@@ -34,6 +34,57 @@ from chandlerdb.persistence.RepositoryError import \
 NONE_PAIR = (None, None)
 
 
+class RecordBuffer(object):
+    """
+    A per-transaction buffer of records to write during a bulk commit.
+
+    Records are collected per db instead of being written as they're
+    produced. When flushed, each db's records are sorted by key and written
+    in key order so that consecutive puts land on neighbouring btree pages.
+    Records put under the same key are written in the order they were put.
+    """
+
+    def __init__(self, store):
+
+        self.store = store
+        self._dbs = {}
+        self._count = 0
+
+    def __len__(self):
+
+        return self._count
+
+    def put_record(self, db, key, value):
+
+        records = self._dbs.get(db)
+        if records is None:
+            self._dbs[db] = records = []
+
+        sortKey = tuple([isuuid(v) and v._uuid or v for v in key.data])
+        records.append((sortKey, self._count, key, value))
+        self._count += 1
+
+        return key.size + value.size
+
+    def flush(self):
+
+        txn = self.store.txn
+        for db, records in self._dbs.iteritems():
+            records.sort()
+            for sortKey, i, key, value in records:
+                db.put_record(key, value, txn)
+
+        count = self._count
+        self.clear()
+
+        return count
+
+    def clear(self):
+
+        self._dbs.clear()
+        self._count = 0
+
+
 class DBContainer(object):
 
     def __init__(self, store):
@@ -149,6 +200,10 @@ class DBContainer(object):
         if db is None:
             db = self._db
 
+        buffer = self.store._threaded.get('buffer')
+        if buffer is not None:
+            return buffer.put_record(db, key, value)
+
         db.put_record(key, value, self.store.txn)
         return key.size + value.size
 
@@ -1008,10 +1063,11 @@ class ItemContainer(DBContainer):
                     else:
                         raise
 
-            def findItem(_self, version, uuid):
+            def findItem(_self, version, uuid,
+                         dataTypes=ItemContainer.ITEM_TYPES):
 
                 while True:
-                    v, i = _self._find(version, uuid, ItemContainer.ITEM_TYPES)
+                    v, i = _self._find(version, uuid, dataTypes)
                     if v is True:
                         continue
                     if i is None:
@@ -1063,6 +1119,17 @@ class ItemContainer(DBContainer):
 
         return False
 
+    def filterValues(self, view, version, uItem, uValues):
+
+        # one item lookup for several values of the same item
+        version, item = self.c.findItem(view, version, uItem,
+                                        ItemContainer.VALUES_TYPES)
+        if item is not None:
+            values = item[-1]
+            return [uValue for uValue in uValues if uValue in values]
+
+        return []
+
     def findValue(self, view, version, uuid, hash, exact=False):
 
         if exact:
@@ -1464,6 +1531,16 @@ class ValueContainer(DBContainer):
     def openC(self):
         self.c = CValueContainer(self._db, self.store)
 
+    def saveValue(self, uItem, uValue, record):
+
+        buffer = self.store._threaded.get('buffer')
+        if buffer is not None:
+            return buffer.put_record(self._db,
+                                     Record(Record.UUID, uItem,
+                                            Record.UUID, uValue), record)
+
+        return self.c.saveValue(uItem, uValue, record)
+
     def purgeValue(self, txn, counter, uItem, uValue):
 
         self.delete(uItem._uuid + uValue._uuid, txn)
@@ -33,11 +33,12 @@ from chandlerdb.persistence.RepositoryError import \
 
 class DBItemWriter(ItemWriter):
 
-    def __init__(self, store, view):
+    def __init__(self, store, view, dirties=True):
 
         super(DBItemWriter, self).__init__()
 
         self.store = store
+        self.dirties = dirties
         self.valueBuffer = []
         self.dataBuffer = []
         self.toindex = view.isBackgroundIndexed()
@@ -62,6 +63,14 @@ class DBItemWriter(ItemWriter):
         else:
             prevKind = None
 
+        # new items written without dirties are only seen as new by the
+        # history of other views, not as a list of changed attributes
+        if self.dirties or not item.isNew():
+            dirtyValues = item._values._getDirties()
+            dirtyRefs = item._references._getDirties()
+        else:
+            dirtyValues = dirtyRefs = ()
+
         size = super(DBItemWriter, self).writeItem(item, version)
         size += self.store._items.saveItem(item.itsUUID, version,
                                            self.uKind, prevKind,
@@ -69,8 +78,7 @@ class DBItemWriter(ItemWriter):
                                            self.uParent, self.name,
                                            self.moduleName, self.className,
                                            self.values,
-                                           item._values._getDirties(),
-                                           item._references._getDirties())
+                                           dirtyValues, dirtyRefs)
 
         return size
 
@@ -276,7 +284,7 @@ class DBItemWriter(ItemWriter):
             indexRecord += (Record.UUID, uuid)
         record += (Record.RECORD, indexRecord)
 
-        return self.store._values.c.saveValue(item.itsUUID, uValue, record)
+        return self.store._values.saveValue(item.itsUUID, uValue, record)
 
     def indexValue(self, view, value, uItem, uAttr, uValue, version):
 
@@ -420,7 +428,7 @@ class DBItemWriter(ItemWriter):
             indexRecord += (Record.UUID, uuid)
         record += (Record.RECORD, indexRecord)
 
-        size += self.store._values.c.saveValue(item.itsUUID, uValue, record)
+        size += self.store._values.saveValue(item.itsUUID, uValue, record)
 
         return size
 
@@ -753,6 +761,7 @@ class DBItemReader(ItemReader, DBValueReader):
         self.store = store
         self.uItem = uItem
         self.version = version
+        self.size = item.size
 
         (self.uKind, self.status, self.uParent, values, x,
          self.name, self.moduleName, self.className) = item.data
@@ -827,6 +836,9 @@ class DBItemReader(ItemReader, DBValueReader):
     def getVersion(self):
         return self.version
 
+    def getSize(self):
+        return self.size
+
     def isDeleted(self):
         return (self.status & CItem.DELETED) != 0
 
@@ -896,6 +908,7 @@ class DBItemReader(ItemReader, DBValueReader):
                                                   DBValueReader.VALUE_TYPES)
         for record in records.itervalues():
             uAttr, vFlags, data = record.data
+            self.size += record.size
 
             if withSchema:
                 attribute = None
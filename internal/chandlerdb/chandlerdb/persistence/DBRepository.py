@@ -36,9 +36,9 @@ from chandlerdb.persistence.RepositoryView import otherViewWins
 from chandlerdb.persistence.DBRepositoryView import DBRepositoryView
 from chandlerdb.persistence.DBContainer import \
     RefContainer, NamesContainer, ACLContainer, IndexesContainer, \
-    ItemContainer, ValueContainer, VersionContainer, CommitsContainer
+    ItemContainer, ValueContainer, VersionContainer, CommitsContainer, \
+    RecordBuffer
 from chandlerdb.persistence.FileContainer import LOBContainer
-from chandlerdb.persistence.LuceneContainer import IndexContainer
 from chandlerdb.persistence.DBItemIO import \
     DBItemReader, DBItemPurger, DBValueReader, DBItemWriter, DBItemUndo
 
@@ -1053,6 +1053,18 @@ class DBRepository(OnDemandRepository):
         if self._indexer is not None:
             self._indexer.notify(wait)
 
+    def getIndexBacklog(self):
+        """
+        Get the number of committed versions not yet full text indexed.
+        """
+
+        store = self.store
+        txnStatus = store.startTransaction(None)
+        try:
+            return store.getVersion() - store.getIndexVersion()
+        finally:
+            store.abortTransaction(None, txnStatus)
+
     def resetIndex(self):
 
         self.store.resetIndex()
@@ -1079,6 +1091,14 @@ class DBTransaction(Transaction):
 
 class DBStore(Store):
 
+    # full text index implementations, imported when selected
+    TEXT_INDEXES = {
+        'lucene': ('chandlerdb.persistence.LuceneContainer',
+                   'IndexContainer', "__index.db"),
+        'native': ('chandlerdb.persistence.TextContainer',
+                   'TextIndexContainer', "__text.db"),
+    }
+
     def __init__(self, repository):
 
         super(DBStore, self).__init__(repository)
@@ -1089,7 +1109,8 @@ class DBStore(Store):
         self._refs = RefContainer(self)
         self._names = NamesContainer(self)
         self._lobs = LOBContainer(self)
-        self._index = IndexContainer(self)
+        self._index = None
+        self._indexName = None
         self._acls = ACLContainer(self)
         self._indexes = IndexesContainer(self)
         self._commits = CommitsContainer(self)
@@ -1116,7 +1137,8 @@ class DBStore(Store):
             self._refs.open("__refs.db", txn, **kwds)
             self._names.open("__names.db", txn, **kwds)
             self._lobs.open("__lobs.db", txn, **kwds)
-            self._index.open("__index.db", txn, **kwds)
+            self._openIndex(kwds.get('textindex', None) or 'lucene', txn,
+                            **kwds)
             self._acls.open("__acls.db", txn, **kwds)
             self._indexes.open("__indexes.db", txn, **kwds)
             self._commits.open("__commits.db", txn, **kwds)
@@ -1135,6 +1157,21 @@ class DBStore(Store):
         else:
             self.commitTransaction(None, txnStatus)
 
+    def _openIndex(self, textIndex, txn, **kwds):
+
+        try:
+            moduleName, className, name = DBStore.TEXT_INDEXES[textIndex]
+        except KeyError:
+            raise ValueError, "Unknown full text index: %s" %(textIndex)
+
+        module = __import__(moduleName, globals(), locals(), [className])
+        self._index = getattr(module, className)(self)
+        self._indexName = name
+        self._index.open(name, txn, **kwds)
+
+        if textIndex != 'lucene':
+            self.repository.logger.info('using %s full text index', textIndex)
+
     def close(self):
 
         self._versions.close()
@@ -1143,7 +1180,8 @@ class DBStore(Store):
         self._refs.close()
         self._names.close()
         self._lobs.close()
-        self._index.close()
+        if self._index is not None:
+            self._index.close()
         self._acls.close()
         self._indexes.close()
         self._commits.close()
@@ -1225,8 +1263,8 @@ class DBStore(Store):
             try:
                 txnStatus = self.startTransaction(None)
                 self._index.remove()
-                self._index = IndexContainer(self)
-                self._index.open("__index.db", self.txn,
+                self._index = type(self._index)(self)
+                self._index.open(self._indexName, self.txn,
                                  mvcc=self._mvcc,
                                  ramdb=self._ramdb,
                                  create=True)
@@ -1254,6 +1292,19 @@ class DBStore(Store):
 
         return itemReader
 
+    def loadItems(self, view, version, uuids):
+
+        # one transaction and one cursor for all items, read in key order
+        finder = self._items._itemFinder(view)
+        dataTypes = ItemContainer.NO_DIRTIES_TYPES
+
+        for uuid in sorted(uuids):
+            vItem, item = finder.findItem(version, uuid, dataTypes)
+            if item is not None:
+                itemReader = DBItemReader(self, uuid, vItem, item)
+                if not itemReader.isDeleted():
+                    yield itemReader
+
     def loadItemName(self, view, version, uuid):
 
         return self._items.getItemName(view, version, uuid)
@@ -1348,10 +1399,10 @@ class DBStore(Store):
 
         return uuid
 
-    def searchItems(self, view, query, uAttr=None):
+    def searchItems(self, view, query, uAttr=None, offset=0, limit=None):
         
         iterator = self._index.searchDocuments(view, view.itsVersion,
-                                               query, uAttr)
+                                               query, uAttr, offset, limit)
         for uItem, uAttr in iterator:
             yield uItem, uAttr
 
@@ -1482,6 +1533,42 @@ class DBStore(Store):
 
         return status
 
+    def startBuffering(self):
+        """
+        Start buffering this thread's record writes for a bulk commit.
+
+        Until L{flushBuffer} is called, records written via the containers'
+        C{put_record} and C{saveValue} methods are collected instead of
+        being written.
+        """
+
+        self._threaded['buffer'] = RecordBuffer(self)
+
+    def flushBuffer(self):
+        """
+        Write this thread's buffered records in key order, db by db.
+
+        @return: the number of records written
+        """
+
+        buffer = self._threaded.get('buffer')
+        if buffer is not None:
+            return buffer.flush()
+
+        return 0
+
+    def stopBuffering(self):
+        """
+        Stop buffering this thread's record writes.
+
+        Records not yet flushed are discarded.
+        """
+
+        buffer = self._threaded.get('buffer')
+        if buffer is not None:
+            buffer.clear()
+            self._threaded['buffer'] = None
+
     def _getEnv(self):
 
         return self.repository._env
@@ -1588,8 +1675,21 @@ class DBCheckpointThread(threading.Thread):
 
 
 class DBIndexerThread(RepositoryThread):
+    """
+    Full text indexes the versions committed since the last run.
+
+    The text of up to C{BATCH_SIZE} items is read in a read-only
+    transaction, outside the store lock. It is then analyzed into
+    in-memory indexes by C{tokenizers} threads and the batch is merged
+    into the index under the lock. The number of items done for a version
+    is saved with each batch so that indexing it resumes where it stopped
+    after a deadlock or a restart.
+    """
+
+    BATCH_SIZE = 256
+    TOKENIZERS = 2
 
-    def __init__(self, repository, interval=60):
+    def __init__(self, repository, interval=60, tokenizers=TOKENIZERS):
 
         super(DBIndexerThread, self).__init__(name='__indexer__',
                                               target=self._run)
@@ -1598,6 +1698,8 @@ class DBIndexerThread(RepositoryThread):
         self._condition = threading.Condition(threading.Lock())
         self._alive = True
         self.interval = interval
+        self.tokenizers = tokenizers
+        self.backlog = 0
 
         self.setDaemon(True)
 
@@ -1639,6 +1741,7 @@ class DBIndexerThread(RepositoryThread):
                         store.abortTransaction(None, txnStatus)
                         break
 
+                self.backlog = latestVersion - indexVersion
                 if indexVersion < latestVersion:
                     if view is None:
                         version = max(indexVersion + 1, earliestVersion)
@@ -1651,9 +1754,14 @@ class DBIndexerThread(RepositoryThread):
                     while indexVersion < latestVersion:
                         version = max(indexVersion + 1, earliestVersion)
                         view.refresh(version=version)
-                        self._indexVersion(view, indexVersion + 1,
-                                           earliestVersion, store)
+                        before = datetime.now()
+                        count = self._indexVersion(view, indexVersion + 1,
+                                                   earliestVersion, store)
                         indexVersion = version
+                        self.backlog = latestVersion - indexVersion
+                        if count:
+                            after = datetime.now()
+                            repository.logger.info("%s indexed %d items in %s, backlog: %d versions", view, count, after - before, self.backlog)
             finally:
                 if self._alive and self.isAlive():
                     try:
@@ -1668,67 +1776,75 @@ class DBIndexerThread(RepositoryThread):
 
     def _indexVersion(self, view, indexVersion, earliestVersion, store):
 
-        items = store._items
+        total = 0
 
         while True:
-            count = 0
-            before = datetime.now()
-            txnStatus = None
-            lock = None
+            batch = self._readBatch(view, indexVersion, earliestVersion, store)
+            if batch is None:  # deadlock, read the batch again
+                continue
 
-            try:
-                lock = store.acquireLock()
+            version, offset, documents, count, done = batch
+            writers = self._tokenize(store, documents)
+            if not self._commitBatch(view, store, writers,
+                                     version, offset + count, done):
+                continue
 
-                try:
-                    txnStatus = view._startTransaction(False, False)
+            total += count
+            if done:
+                return total
 
-                    if indexVersion < earliestVersion:
-                        version = earliestVersion
-                    else:
-                        version = indexVersion
-                        status = store.getViewStatus(version)
-
-                    if indexVersion < version or status & view.TOINDEX:
-                        for (uItem, ver, uKind, status, uParent, pKind,
-                             dirties) in items.iterHistory(view,
-                                                           indexVersion - 1,
-                                                           version):
-                            if status & CItem.TOINDEX:
-                                if status & (CItem.NEW | CItem.MERGED):
-                                    dirties = None
-                                elif indexVersion < version:
-                                    dirties = None
-                                else:
-                                    dirties = list(dirties)
-                                self._indexItem(view, ver, store,
-                                                uItem, dirties)
-                                count += 1
+    def _readBatch(self, view, indexVersion, earliestVersion, store):
 
-                    store.setIndexVersion(version)
-                    view._commitTransaction(txnStatus)
+        documents = []
+        count = 0
+        done = True
 
-                except DBLockDeadlockError:
-                    view._abortTransaction(txnStatus)
-                    store._logDL()
-                    continue
-                except DBInvalidArgError:
-                    view._abortTransaction(txnStatus)
-                    store._logDL()
-                    continue
-                except Exception:
-                    if txnStatus is not None:
-                        view._abortTransaction(txnStatus)
-                    raise
-                else:
-                    if count:
-                        after = datetime.now()
-                        store.repository.logger.info("%s indexed %d items in %s", view, count, after - before)
-                    return
+        txnStatus = view._startTransaction()
+        try:
+            if indexVersion < earliestVersion:
+                version = earliestVersion
+            else:
+                version = indexVersion
+                viewStatus = store.getViewStatus(version)
+
+            offset = store._index.getIndexProgress(version)
+
+            if indexVersion < version or viewStatus & view.TOINDEX:
+                skip = offset
+                for (uItem, ver, uKind, status, uParent, pKind,
+                     dirties) in store._items.iterHistory(view,
+                                                          indexVersion - 1,
+                                                          version):
+                    if status & CItem.TOINDEX:
+                        if skip:
+                            skip -= 1
+                            continue
+                        if count == self.BATCH_SIZE:
+                            done = False
+                            break
+                        if status & (CItem.NEW | CItem.MERGED):
+                            dirties = None
+                        elif indexVersion < version:
+                            dirties = None
+                        else:
+                            dirties = list(dirties)
+                        self._readItem(view, ver, store, uItem, dirties,
+                                       documents)
+                        count += 1
+
+        except DBLockDeadlockError:
+            view._abortTransaction(txnStatus)
+            store._logDL()
+            return None
+        except:
+            view._abortTransaction(txnStatus)
+            raise
+        else:
+            view._abortTransaction(txnStatus)
 
-            finally:
-                lock = store.releaseLock(lock)
+        return version, offset, documents, count, done
 
-    def _indexItem(self, view, version, store, uItem, dirties):
+    def _readItem(self, view, version, store, uItem, dirties, documents):
 
         status, uValues = store._items.findValues(view, version, uItem,
                                                   dirties, True)
@@ -1739,7 +1855,7 @@ class DBIndexerThread(RepositoryThread):
                 uAttr, value = reader.readValue(view, uValue, True)
                 if value is not Nil:
                     if isinstance(value, Indexable):
-                        value.indexValue(view, uItem, uAttr, uValue, version)
+                        text = value.getIndexedText()
                     else:
                         attrType = getattr(view[uAttr], 'type', None)
                         if attrType is None:
@@ -1748,9 +1864,86 @@ class DBIndexerThread(RepositoryThread):
                             valueType = attrType.type(value)
                         else:
                             valueType = attrType
-                        store._index.indexValue(view._getIndexWriter(),
-                                                valueType.makeUnicode(value),
-                                                uItem, uAttr, uValue, version)
+                        text = valueType.makeUnicode(value)
+                    documents.append((uItem, uAttr, uValue, version, text))
+
+    def _tokenize(self, store, documents):
+
+        index = store._index
+        count = min(self.tokenizers, len(documents))
+        writers = [index.getIndexWriter() for i in xrange(count)]
+        errors = []
+
+        def tokenize(writer, documents):
+            try:
+                for uItem, uAttr, uValue, version, text in documents:
+                    index.indexValue(writer, text,
+                                     uItem, uAttr, uValue, version)
+            except Exception, e:
+                errors.append(e)
+
+        if count == 1:
+            tokenize(writers[0], documents)
+        elif count > 1:
+            threads = [RepositoryThread(name='__tokenizer__', target=tokenize,
+                                        args=(writer, documents[i::count]))
+                       for i, writer in enumerate(writers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            for writer in writers:
+                index.abortIndexWriter(writer)
+            raise errors[0]
+
+        return writers
+
+    def _commitBatch(self, view, store, writers, version, count, done):
+
+        txnStatus = None
+        lock = None
+
+        try:
+            lock = store.acquireLock()
+
+            try:
+                txnStatus = view._startTransaction(False, False)
+
+                if writers:
+                    store._index.commitIndexWriters(writers)
+                    writers = None
+                if done:
+                    store.setIndexVersion(version)
+                else:
+                    store._index.setIndexProgress(version, count)
+
+                view._commitTransaction(txnStatus)
+
+            except DBLockDeadlockError:
+                view._abortTransaction(txnStatus)
+                store._logDL()
+                return False
+            except DBInvalidArgError:
+                view._abortTransaction(txnStatus)
+                store._logDL()
+                return False
+            except Exception:
+                if txnStatus is not None:
+                    view._abortTransaction(txnStatus)
+                raise
+
+        finally:
+            lock = store.releaseLock(lock)
+            if writers:
+                for writer in writers:
+                    try:
+                        store._index.abortIndexWriter(writer)
+                    except:
+                        pass # ignorable exception
+
+        return True
 
     def notify(self, wait=False):
 
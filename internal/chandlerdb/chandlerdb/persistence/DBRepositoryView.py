@@ -20,6 +20,7 @@ from time import time, sleep
 
 from chandlerdb.item.c import CItem
 from chandlerdb.util.c import isuuid, Nil, Default, HashTuple
+from chandlerdb.util.Spans import profiler
 from chandlerdb.persistence.c import CView, DBLockDeadlockError, Transaction
 
 from chandlerdb.item.RefCollections import RefList
@@ -284,6 +285,7 @@ class DBRepositoryView(OnDemandRepositoryView):
         if not self._status & RepositoryView.REFRESHING:
             try:
                 self._status |= RepositoryView.REFRESHING
+                profiler.enter('refresh')
                 forwards = False
                 while True:
                     txnStatus = 0
@@ -306,6 +308,7 @@ class DBRepositoryView(OnDemandRepositoryView):
                         self.refreshErrors = 0
                         return self.itsVersion
             finally:
+                profiler.exit('refresh')
                 self._status &= ~RepositoryView.REFRESHING
                 if self._status & RepositoryView.COMMITREQ:
                     self._status &= ~RepositoryView.COMMITREQ
@@ -346,6 +349,10 @@ class DBRepositoryView(OnDemandRepositoryView):
                 self.dispatchQueuedNotifications()
             else:
                 self.cancelQueuedNotifications()
+
+            # idle refreshes drive eviction slices started by a previous prune
+            if self._cache.isPruning():
+                self.prune(self.pruneSize)
             return True
 
         else:
@@ -622,7 +629,8 @@ class DBRepositoryView(OnDemandRepositoryView):
             self._loadTimezone()
             raise
 
-    def commit(self, mergeFn=None, notify=Default, afterCommit=None):
+    def commit(self, mergeFn=None, notify=Default, afterCommit=None,
+               bulk=False):
 
         status = self._status
 
@@ -630,7 +638,8 @@ class DBRepositoryView(OnDemandRepositoryView):
             self.logger.warning('%s: skipping recursive commit', self)
         elif status & RepositoryView.DEFERCOMMIT:
             self._deferredCommitCtx._data.append((self.commit,
-                                                  mergeFn, notify, afterCommit))
+                                                  mergeFn, notify, afterCommit,
+                                                  bulk))
         elif status & RepositoryView.REFRESHING:
             self._status |= RepositoryView.COMMITREQ
         elif self._log or self._deletedRegistry:
@@ -638,6 +647,7 @@ class DBRepositoryView(OnDemandRepositoryView):
                 release = False
                 release = self._acquireExclusive()
                 self._status |= RepositoryView.COMMITTING
+                profiler.enter('commit')
                 
                 store = self.store
                 before = time()
@@ -647,6 +657,8 @@ class DBRepositoryView(OnDemandRepositoryView):
                 lock = None
 
                 def finish(commit):
+                    if bulk:
+                        store.stopBuffering()
                     if txnStatus:
                         if commit:
                             self._commitTransaction(txnStatus)
@@ -691,15 +703,30 @@ class DBRepositoryView(OnDemandRepositoryView):
 
                             newVersion = store.nextVersion()
 
-                            itemWriter = DBItemWriter(store, self)
-                            for item in self._log:
-                                size += self._saveItem(item, newVersion,
-                                                       itemWriter)
-                            for item in self._deletedRegistry.itervalues():
-                                size += self._saveItem(item, newVersion,
-                                                       itemWriter)
-                            if self.isDirty():
-                                size += self._roots._saveValues(newVersion)
+                            if bulk:
+                                store.startBuffering()
+
+                            profiler.enter('write')
+                            try:
+                                # skipping dirty attribute names of new items
+                                # when nothing is going to be notified of them
+                                itemWriter = DBItemWriter(store, self,
+                                                          not (bulk and
+                                                               notify is False))
+                                for item in self._log:
+                                    size += self._saveItem(item, newVersion,
+                                                           itemWriter)
+                                for item in self._deletedRegistry.itervalues():
+                                    size += self._saveItem(item, newVersion,
+                                                           itemWriter)
+                                if self.isDirty():
+                                    size += self._roots._saveValues(newVersion)
+
+                                if bulk:
+                                    store.flushBuffer()
+                                    store.stopBuffering()
+                            finally:
+                                profiler.exit('write')
 
                         newIndexes = self._newIndexes
                         for i in xrange(len(newIndexes) - 1, -1, -1):
@@ -753,9 +780,10 @@ class DBRepositoryView(OnDemandRepositoryView):
                     except ZeroDivisionError:
                         iSpeed = dSpeed = 'speed could not be measured'
 
-                    self.logger.info('%s committed %d items (%d kbytes) in %s, %s (%s)', self, count, size >> 10, timedelta(seconds=duration), iSpeed, dSpeed)
+                    self.logger.info('%s committed %d items (%d kbytes) in %s, %s (%s)%s', self, count, size >> 10, timedelta(seconds=duration), iSpeed, dSpeed, bulk and ', bulk' or '')
 
             finally:
+                profiler.exit('commit')
                 self._status &= ~RepositoryView.COMMITTING
                 if release:
                     self._releaseExclusive()
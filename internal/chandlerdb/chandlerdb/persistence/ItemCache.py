@@ -0,0 +1,312 @@
+#   Copyright (c) 2007 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import sys
+
+from collections import deque
+
+
+class ItemCache(object):
+    """
+    The item cache bookkeeping of an on-demand repository view.
+
+    Items are tracked in two generations as they are loaded. Newly loaded
+    items enter the young generation, a FIFO queue. An item reaching the
+    front of the young generation is promoted to the old generation if it
+    was accessed since it was queued and is evicted otherwise. The old
+    generation is a CLOCK ring: an item accessed since the hand last passed
+    over it gets a second chance, an item that wasn't is evicted.
+
+    Item access is detected by comparing the C{_lastAccess} stamp
+    maintained by the item's attribute descriptors with the stamp recorded
+    when the item was last visited so that no bookkeeping is needed on the
+    item access path itself.
+
+    Eviction is started when the view's item count or estimated byte size
+    goes over a high watermark and proceeds in slices of at most
+    C{sliceSize} items per L{prune} call until the cache is back under the
+    low watermark. No full scan of the view's registry, sort or garbage
+    collection pass is required per call.
+    """
+
+    HIGH = 1.2
+    LOW = 0.8
+
+    def __init__(self, view, maxBytes=0, sliceSize=500, itemSize=1024):
+        """
+        Construct an item cache for a view.
+
+        @param view: the view whose item registry is managed
+        @type view: L{OnDemandRepositoryView}
+        @param maxBytes: the estimated byte size budget, C{0} for none
+        @type maxBytes: integer
+        @param sliceSize: the maximum number of items visited per slice
+        @type sliceSize: integer
+        @param itemSize: the size estimate of items not read from storage
+        @type itemSize: integer
+        """
+
+        self.view = view
+        self.maxBytes = maxBytes
+        self.sliceSize = sliceSize
+        self.itemSize = itemSize
+
+        self._young = deque()
+        self._old = deque()
+        self._entries = {}
+        self._evicted = set()
+        self._bytes = 0
+        self._pruning = False
+        self._untracked = True
+        self._hand = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reloads = 0
+
+    def __len__(self):
+
+        return len(self._entries)
+
+    def _track(self, uuid, size):
+
+        entry = self._entries.get(uuid)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+        entry = self._entries[uuid] = [-1, size]
+        self._bytes += size
+        self._young.append((uuid, entry))
+
+        if len(self._young) > 2 * len(self._entries) + self.sliceSize:
+            self._compact()
+
+    def _compact(self):
+
+        # drop the queue slots of items reloaded or unloaded since queued,
+        # otherwise only reclaimed when visited while over the watermark
+
+        entries = self._entries
+        for queue in (self._young, self._old):
+            slots = [(uuid, entry) for uuid, entry in queue
+                     if entries.get(uuid) is entry]
+            queue.clear()
+            queue.extend(slots)
+
+        if self._hand >= len(self._old):
+            self._hand = 0
+
+    def _loaded(self, item, size):
+        """
+        Record that an item was loaded from storage into the view.
+
+        @param item: the item just loaded
+        @param size: the estimated size of the item, in bytes
+        """
+
+        uuid = item.itsUUID
+
+        self.misses += 1
+        if uuid in self._evicted:
+            self._evicted.remove(uuid)
+            self.reloads += 1
+
+        self._track(uuid, size)
+
+    def _unloaded(self, uuid):
+        """
+        Record that an item left the view's registry.
+
+        Its queue slot is reclaimed when next visited or when the queues
+        are compacted.
+        """
+
+        entry = self._entries.pop(uuid, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+            if (len(self._young) + len(self._old) >
+                2 * len(self._entries) + self.sliceSize):
+                self._compact()
+
+    def _adopt(self):
+
+        # items created in this view, or loaded before the cache existed,
+        # are adopted once per revolution of the old generation's ring
+
+        entries = self._entries
+        for uuid in self.view._registry.iterkeys():
+            if uuid not in entries:
+                self._track(uuid, self.itemSize)
+
+        self._untracked = False
+
+    def _visit(self, queue, promote):
+
+        uuid, entry = queue.popleft()
+        if self._entries.get(uuid) is not entry:
+            return 0
+
+        view = self.view
+        item = view._registry.get(uuid)
+        if item is None:
+            self._unloaded(uuid)
+            return 0
+
+        stamp = item._lastAccess
+        if stamp != entry[0]:
+            if entry[0] == -1:      # first visit, start watching for access
+                entry[0] = stamp
+                queue.append((uuid, entry))
+            else:
+                self.hits += 1
+                entry[0] = stamp
+                if promote:
+                    self._old.append((uuid, entry))
+                else:
+                    queue.append((uuid, entry))
+            return 0
+
+        if item.itsStatus & (item.PINNED | item.DIRTY):
+            queue.append((uuid, entry))
+            return 0
+
+        if view.isRefCounted():
+            # referenced by the registry, this frame and getrefcount()
+            pythonRefs = sys.getrefcount(item)
+            if pythonRefs > 3:
+                if view.isDebug():
+                    view.logger.debug('not pruning %s (refCount %d)',
+                                      item._repr_(), pythonRefs)
+                queue.append((uuid, entry))
+                return 0
+
+        item._unloadItem(False, view)
+        self._unloaded(uuid)
+        self._evicted.add(uuid)
+        self.evictions += 1
+
+        return 1
+
+    def evict(self, count):
+        """
+        Evict up to C{count} items from the view.
+
+        At most C{sliceSize} items are visited, young generation first.
+
+        @param count: the number of items to evict
+        @type count: integer
+        @return: the number of items evicted
+        """
+
+        young = self._young
+        old = self._old
+        evicted = 0
+        visits = self.sliceSize
+
+        while evicted < count and visits > 0:
+            if young:
+                evicted += self._visit(young, True)
+            elif old:
+                evicted += self._visit(old, False)
+                self._hand += 1
+                if self._hand >= len(old):
+                    self._hand = 0
+                    self._untracked = True
+            else:
+                self._untracked = True
+                break
+            visits -= 1
+
+        # bound the reload tracking set to the size of the cache
+        if len(self._evicted) > len(self._entries) * 2:
+            self._evicted.clear()
+
+        return evicted
+
+    def prune(self, size):
+        """
+        Run one eviction slice if the cache is over its watermarks.
+
+        Eviction starts when the view holds more than C{size + 20%} items
+        or C{maxBytes + 20%} estimated bytes and continues, one slice per
+        call, until it holds less than C{size - 20%} items and
+        C{maxBytes - 20%} bytes.
+
+        @param size: the item count threshhold
+        @type size: integer
+        @return: the number of items evicted
+        """
+
+        registry = self.view._registry
+        maxBytes = self.maxBytes
+
+        if not self._pruning:
+            if (len(registry) > size * ItemCache.HIGH or
+                maxBytes and self._bytes > maxBytes * ItemCache.HIGH):
+                self._pruning = True
+            else:
+                return 0
+
+        if self._untracked and len(self._entries) < len(registry):
+            self._adopt()
+
+        count = len(registry) - int(size * ItemCache.LOW)
+        if maxBytes and self._bytes > maxBytes * ItemCache.LOW:
+            count = max(count, 1)
+
+        evicted = 0
+        if count > 0:
+            evicted = self.evict(count)
+
+        if (len(registry) <= size * ItemCache.LOW and
+            not (maxBytes and self._bytes > maxBytes * ItemCache.LOW) or
+            not (evicted or self._young or self._old)):
+            self._pruning = False
+            self.view.logger.info('%s pruned to %d items', self.view,
+                                  len(registry))
+
+        return evicted
+
+    def isPruning(self):
+        """
+        Tell whether eviction is in progress between watermarks.
+        """
+
+        return self._pruning
+
+    def getStatistics(self):
+        """
+        Return a dictionary of the cache's counters and current sizes.
+        """
+
+        return { 'items': len(self.view._registry),
+                 'tracked': len(self._entries),
+                 'young': len(self._young),
+                 'old': len(self._old),
+                 'bytes': self._bytes,
+                 'hits': self.hits,
+                 'misses': self.misses,
+                 'evictions': self.evictions,
+                 'reloads': self.reloads }
+
+    def clear(self):
+
+        self._young.clear()
+        self._old.clear()
+        self._entries.clear()
+        self._evicted.clear()
+        self._bytes = 0
+        self._pruning = False
@@ -13,14 +13,13 @@
 #   limitations under the License.
 
 from struct import pack, unpack
-from heapq import heapify, heappop
 
 from lucene import \
     Document, Field, RAMDirectory, StandardAnalyzer, \
     QueryParser, IndexReader, IndexWriter, IndexSearcher, Term, TermQuery, \
     JavaError, MatchAllDocsQuery, BooleanQuery, BooleanClause, Hit, \
     StringReader, PythonDirectory, PythonIndexOutput, PythonIndexInput, \
-    PythonLock, PythonHitCollector, initVM, CLASSPATH, IOException
+    PythonLock, initVM, CLASSPATH, IOException
 initVM(CLASSPATH, maxstack='2m')
 
 from chandlerdb.util.c import UUID
@@ -98,6 +97,27 @@ class DbIndexInput(PythonIndexInput):
     def seekInternal(self, pos):
         self.stream.seek(pos)
 
+class CachedSearcher(object):
+
+    def __init__(self, container, directory, version):
+
+        self.container = container
+        self.version = version
+        self.searcher = IndexSearcher(directory)
+        self._directory = directory
+        self._refs = 1      # the thread cache's reference
+
+    def acquire(self):
+
+        self._refs += 1
+
+    def release(self):
+
+        self._refs -= 1
+        if self._refs == 0:
+            self.searcher.close()
+            self._directory.close()
+
 class DbDirectory(PythonDirectory):
 
     def __init__(self, fileContainer):
@@ -154,6 +174,9 @@ class IndexContainer(FileContainer):
     BLOCK_SHIFT = 15
     BLOCK_LEN = 1 << BLOCK_SHIFT
     BLOCK_MASK = BLOCK_LEN - 1
+    SEARCH_BATCH = 100
+
+    PROGRESS_KEY = pack('>16si', VersionContainer.VERSION_KEY[0:16], 4)
 
     def open(self, name, txn, **kwds):
 
@@ -165,6 +188,16 @@ class IndexContainer(FileContainer):
             indexWriter.close()
             directory.close()
 
+    def close(self):
+
+        threaded = self.store._threaded
+        searcher = threaded.get('searcher')
+        if searcher is not None and searcher.container is self:
+            threaded['searcher'] = None
+            searcher.release()
+
+        super(IndexContainer, self).close()
+
     def getIndexVersion(self):
 
         value = self.get(VersionContainer.VERSION_KEY, self._blocks)
@@ -177,6 +210,27 @@ class IndexContainer(FileContainer):
 
         self.put(VersionContainer.VERSION_KEY, pack('>i', version),
                  self._blocks)
+        self.put(IndexContainer.PROGRESS_KEY, pack('>ii', 0, 0), self._blocks)
+
+    def getIndexProgress(self, version):
+        """
+        Get the number of items of C{version} already indexed by batches.
+
+        @return: 0 unless indexing C{version} was started and not finished
+        """
+
+        value = self.get(IndexContainer.PROGRESS_KEY, self._blocks)
+        if value is not None:
+            progressVersion, count = unpack('>ii', value)
+            if progressVersion == version:
+                return count
+
+        return 0
+
+    def setIndexProgress(self, version, count):
+
+        self.put(IndexContainer.PROGRESS_KEY, pack('>ii', version, count),
+                 self._blocks)
         
     def getDirectory(self):
 
@@ -190,6 +244,37 @@ class IndexContainer(FileContainer):
 
         return IndexSearcher(self.getDirectory())
 
+    def acquireSearcher(self):
+        """
+        Get this thread's cached searcher, reopened if the index changed.
+
+        The Lucene index version is read in the current transaction and
+        compared with the one the cached searcher was opened at. A searcher
+        replaced while still in use is closed once the last user releases
+        it.
+
+        @return: a L{CachedSearcher} to be released when done
+        """
+
+        threaded = self.store._threaded
+        searcher = threaded.get('searcher')
+
+        directory = self.getDirectory()
+        version = IndexReader.getCurrentVersion(directory)
+
+        if (searcher is None or searcher.container is not self or
+            searcher.version != version):
+            if searcher is not None:
+                searcher.release()
+            searcher = CachedSearcher(self, directory, version)
+            threaded['searcher'] = searcher
+        else:
+            directory.close()
+
+        searcher.acquire()
+
+        return searcher
+
     def getIndexWriter(self):
 
         writer = IndexWriter(RAMDirectory(), StandardAnalyzer(), True)
@@ -199,13 +284,21 @@ class IndexContainer(FileContainer):
 
     def commitIndexWriter(self, writer):
 
-        directory = writer.getDirectory()
-        writer.close()
+        self.commitIndexWriters([writer])
+
+    def commitIndexWriters(self, writers):
+
+        directories = []
+        for writer in writers:
+            directories.append(writer.getDirectory())
+            writer.close()
+
         dbDirectory = self.getDirectory()
         dbWriter = IndexWriter(dbDirectory, StandardAnalyzer(), False)
         dbWriter.setUseCompoundFile(False)
-        dbWriter.addIndexes([directory])
-        directory.close()
+        dbWriter.addIndexes(directories)
+        for directory in directories:
+            directory.close()
         dbWriter.close()
         dbDirectory.close()
 
@@ -252,9 +345,24 @@ class IndexContainer(FileContainer):
 
         indexWriter.optimize()
 
-    def searchDocuments(self, view, version, query=None, attribute=None):
+    def searchDocuments(self, view, version, query=None, attribute=None,
+                        offset=0, limit=None):
+        """
+        Search the index for documents matching a Lucene query.
+
+        Matches are returned by decreasing score as C{(uItem, uAttr)}
+        tuples. Only the top C{offset + limit} hits are collected, more
+        being requested as needed when some are obsolete at C{version}.
+
+        @param offset: the number of valid matches to skip
+        @type offset: int
+        @param limit: the maximum number of matches to return, C{None} for
+        all of them
+        @type limit: int
+        """
 
         store = self.store
+        items = store._items
 
         if query is None:
             query = MatchAllDocsQuery()
@@ -268,58 +376,84 @@ class IndexContainer(FileContainer):
                               BooleanClause.Occur.MUST)
             query = combinedQuery
 
-        class _collector(PythonHitCollector):
+        def _validate(documents):
 
-            def __init__(_self):
+            # check the values of each item once for all its documents
+            values = {}
+            for uItem, uAttr, uValue in documents:
+                if uItem in values:
+                    values[uItem].append(uValue)
+                else:
+                    values[uItem] = [uValue]
 
-                super(_collector, _self).__init__()
-                _self.hits=[]
+            for uItem, uValues in values.iteritems():
+                values[uItem] = set(items.filterValues(view, version,
+                                                       uItem, uValues))
 
-            def collect(_self, id, score):
+            for uItem, uAttr, uValue in documents:
+                if uValue in values[uItem]:
+                    yield uItem, uAttr
 
-                _self.hits.append((-score, id))
-        
         class _iterator(object):
 
             def __init__(_self):
 
                 _self.txnStatus = 0
                 _self.searcher = None
-                _self.collector = None
 
             def __del__(_self):
 
                 try:
                     if _self.searcher is not None:
-                        _self.searcher.close()
+                        _self.searcher.release()
                     store.abortTransaction(view, _self.txnStatus)
                 except:
                     store.repository.logger.exception("in __del__")
 
                 _self.txnStatus = 0
                 _self.searcher = None
-                _self.collector = None
 
             def __iter__(_self):
 
                 _self.txnStatus = store.startTransaction(view)
-                _self.searcher = searcher = self.getIndexSearcher()
-                _self.collector = _collector()
-
-                searcher.search(query, _self.collector)
-                hits = _self.collector.hits
-
-                if hits:
-                    heapify(hits)
-                    while hits:
-                        score, id = heappop(hits)
-                        doc = searcher.doc(id)
-                        uItem = UUID(doc['item'])
-                        
+                _self.searcher = self.acquireSearcher()
+                searcher = _self.searcher.searcher
+
+                if limit is None:
+                    count = offset + self.SEARCH_BATCH
+                else:
+                    count = offset + limit
+                skip = offset
+                found = 0
+                start = 0
+
+                while True:
+                    topDocs = searcher.search(query, None, count)
+                    scoreDocs = topDocs.scoreDocs
+
+                    documents = []
+                    for i in xrange(start, len(scoreDocs)):
+                        doc = searcher.doc(scoreDocs[i].doc)
                         if long(doc['version']) <= version:
-                            if store._items.isValue(view, version, uItem,
-                                                    UUID(doc['value'])):
-                                yield uItem, UUID(doc['attribute'])
+                            documents.append((UUID(doc['item']),
+                                              UUID(doc['attribute']),
+                                              UUID(doc['value'])))
+
+                    for uItem, uAttr in _validate(documents):
+                        if skip:
+                            skip -= 1
+                        else:
+                            yield uItem, uAttr
+                            found += 1
+                            if found == limit:
+                                return
+
+                    start = len(scoreDocs)
+                    if start >= topDocs.totalHits:
+                        return
+
+                    # obsolete hits were dropped, collect a larger top-K
+                    count = min(count * 2, topDocs.totalHits)
 
         return _iterator()
 
@@ -131,6 +131,7 @@ class Repository(CRepository):
         self._deferDelete = not kwds.get('nodeferdelete', False)
 
         self.pruneSize = kwds.get('prune', 10000)
+        self.pruneBytes = kwds.get('pruneBytes', 0)
         self.timezone = kwds.get('timezone', None)
         self.ontzchange = kwds.get('ontzchange', None)
 
@@ -308,6 +309,9 @@ class Store(CStore):
     def loadItem(self, view, version, uuid):
         raise NotImplementedError, "%s.loadItem" %(type(self))
     
+    def loadItems(self, view, version, uuids):
+        raise NotImplementedError, "%s.loadItems" %(type(self))
+    
     def loadItemName(self, view, version, uuid):
         raise NotImplementedError, "%s.loadItemName" %(type(self))
     
@@ -335,7 +339,8 @@ class Store(CStore):
     def kindForKey(self, view, version, uuid):
         raise NotImplementedError, "%s.kindForKey" %(type(self))
     
-    def searchItems(self, view, query, attribute=None):
+    def searchItems(self, view, query, attribute=None, offset=0,
+                    limit=None):
         raise NotImplementedError, "%s.searchItems" %(type(self))
     
     def getItemVersion(self, view, version, uuid):
@@ -355,10 +360,12 @@ class RepositoryThread(threading.Thread):
 
     def run(self):
 
-        from lucene import getVMEnv
-        self._vmEnv = env = getVMEnv()
-        if env is not None:
-            env.attachCurrentThread()
+        # only attach to the JVM if the Lucene full text index loaded it
+        lucene = sys.modules.get('lucene')
+        if lucene is not None:
+            self._vmEnv = env = lucene.getVMEnv()
+            if env is not None:
+                env.attachCurrentThread()
 
         super(RepositoryThread, self).run()
 
@@ -16,7 +16,6 @@ from __future__ import with_statement
 import logging, sys, gc, threading, os, time, contextlib
 
 from Queue import Queue
-from heapq import heapify, heappop
 from pkg_resources import resource_stream
 from PyICU import ICUtzinfo, FloatingTZ
 
@@ -27,7 +26,9 @@ from chandlerdb.persistence.c import CView
 from chandlerdb.util.Path import Path
 from chandlerdb.util.Lob import Lob
 from chandlerdb.util.ClassLoader import ClassLoader
+from chandlerdb.util.Spans import profiler
 from chandlerdb.persistence.RepositoryError import *
+from chandlerdb.persistence.ItemCache import ItemCache
 from chandlerdb.item.Item import Item, MissingClass
 from chandlerdb.item.Children import Children
 from chandlerdb.item.Indexes import NumericIndex, SortedIndex
@@ -143,8 +144,9 @@ class RepositoryView(CView):
     # 0.7.1: added 'notify' attribute to Kind, like Attribute's
     # 0.7.2: DateTime and Time types now implement custom == compare
     # 0.7.3: added support for attribute correlations
+    # 0.7.4: added 'interval' index type
     
-    CORE_SCHEMA_VERSION = 0x00070300
+    CORE_SCHEMA_VERSION = 0x00070400
 
     def __init__(self, repository, name=None, version=None,
                  deferDelete=Default, pruneSize=Default, notify=True,
@@ -518,6 +520,68 @@ class RepositoryView(CView):
 
         return self.find(uuid, load)
 
+    def loadItems(self, uuids):
+        """
+        Find several items by UUID at once.
+
+        Items not yet loaded into this view are loaded in bulk first, see
+        L{prefetch}.
+
+        @param uuids: the UUIDs of the items sought
+        @type uuids: an iterable of L{UUID<chandlerdb.util.c.UUID>}
+        @return: a list of items, in the order of C{uuids}, with C{None}
+        for the items that were not found
+        """
+
+        uuids = list(uuids)
+        self.prefetch(uuids)
+
+        return [self.find(uuid, False) for uuid in uuids]
+
+    def prefetch(self, uuids):
+        """
+        Load the items not yet in this view's cache in one batch.
+
+        @param uuids: the UUIDs of the items to load
+        @type uuids: an iterable of L{UUID<chandlerdb.util.c.UUID>}
+        @return: the number of items loaded
+        """
+
+        return 0
+
+    def iterItems(self, uuids, readAhead=64):
+        """
+        Iterate the items for a sequence of UUIDs, reading ahead.
+
+        The UUIDs are consumed C{readAhead} at a time and each batch is
+        loaded with L{prefetch} before its items are yielded. A
+        C{readAhead} of C{0} loads items one by one.
+
+        @param uuids: the UUIDs of the items to iterate
+        @type uuids: an iterable of L{UUID<chandlerdb.util.c.UUID>}
+        @param readAhead: the batch size
+        @type readAhead: integer
+        """
+
+        if readAhead <= 0:
+            for uuid in uuids:
+                yield self[uuid]
+            return
+
+        batch = []
+        for uuid in uuids:
+            batch.append(uuid)
+            if len(batch) == readAhead:
+                self.prefetch(batch)
+                for uuid in batch:
+                    yield self[uuid]
+                batch = []
+
+        if batch:
+            self.prefetch(batch)
+            for uuid in batch:
+                yield self[uuid]
+
     def findValue(self, uItem, name, default=Default, version=None):
         """
         Find a value for an item attribute.
@@ -931,7 +995,8 @@ class RepositoryView(CView):
         
         raise NotImplementedError, "%s.refresh" %(type(self))
 
-    def commit(self, mergeFn=None, notify=True, afterCommit=None):
+    def commit(self, mergeFn=None, notify=True, afterCommit=None,
+               bulk=False):
         """
         Commit all the changes made to items in this view.
 
@@ -945,6 +1010,12 @@ class RepositoryView(CView):
                {True}, the default.
             4. After commit is completely done, C{afterCommit} is called if
                found to be callable.
+
+        When C{bulk} is C{True}, records are buffered while items are
+        written and are then written to each container in key order. This
+        is meant for mass imports of many new items. If C{notify} is also
+        C{False}, the names of the changed attributes of new items are not
+        saved either.
         """
         
         raise NotImplementedError, "%s.commit" %(type(self))
@@ -994,12 +1065,14 @@ class RepositoryView(CView):
 
         raise NotImplementedError, "%s.kindForKey" %(type(self))
 
-    def searchItems(self, query, attribute=None, load=True):
+    def searchItems(self, query, attribute=None, load=True,
+                    offset=0, limit=None):
         """
         Search this view for items using an Lucene full text query.
 
-        All matches are returned. This method is a generator, iteration may
-        be stopped before all matches are instantiated.
+        Matches are returned by decreasing relevance, a page at a time
+        when C{offset} and C{limit} are used. This method is a generator,
+        iteration may be stopped before all matches are instantiated.
 
         @param query: a lucene query
         @type query: a string
@@ -1008,6 +1081,12 @@ class RepositoryView(CView):
         @type attribute: a string
         @param load: if C{False} only return loaded items
         @type load: boolean
+        @param offset: the number of matches to skip, unloaded items
+        skipped when C{load} is C{False} are counted
+        @type offset: int
+        @param limit: the maximum number of matches to consider, C{None}
+        by default for all of them
+        @type limit: int
         """
 
         if attribute is not None:
@@ -1015,7 +1094,8 @@ class RepositoryView(CView):
         else:
             uAttr = None
 
-        for uItem, uAttr in self.store.searchItems(self, query, uAttr):
+        for uItem, uAttr in self.store.searchItems(self, query, uAttr,
+                                                   offset, limit):
             item = self.find(uItem, load)
             if item is not None:
                 yield item, self[uAttr].itsName
@@ -1519,6 +1599,7 @@ class OnDemandRepositoryView(RepositoryView):
 
         self._exclusive = threading.RLock()
         self._hooks = []
+        self._cache = ItemCache(self, self.repository.pruneBytes)
         
         super(OnDemandRepositoryView, self).openView(version, deferDelete,
                                                      notify, mergeFn,
@@ -1565,6 +1646,7 @@ class OnDemandRepositoryView(RepositoryView):
                 self._hooks = []
             raise
         else:
+            self._cache._loaded(item, itemReader.getSize())
             if not loading:
                 self._setLoading(False, True)
 
@@ -1573,27 +1655,72 @@ class OnDemandRepositoryView(RepositoryView):
             if release:
                 self._releaseExclusive()
 
+    def _checkLoading(self, uuid):
+
+        current = threading.currentThread()
+
+        thread = self._loadingRegistry.get(uuid)
+        if thread is not None:
+            if thread is current:
+                raise RecursiveLoadItemError, uuid
+            raise ConcurrentLoadItemError, (uuid, thread, current)
+
+        return current
+
     def _loadItem(self, uuid):
 
         if not uuid in self._deletedRegistry:
-            current = threading.currentThread()
+            current = self._checkLoading(uuid)
+
+            profiler.enter('load')
+            try:
+                itemReader = self.repository.store.loadItem(self,
+                                                            self.itsVersion,
+                                                            uuid)
+                if itemReader is not None:
+                    try:
+                        self._loadingRegistry[uuid] = current
+                        return self._readItem(itemReader)
+                    finally:
+                        del self._loadingRegistry[uuid]
+            finally:
+                profiler.exit('load')
 
-            thread = self._loadingRegistry.get(uuid)
-            if thread is not None:
-                if thread is current:
-                    raise RecursiveLoadItemError, uuid
-                raise ConcurrentLoadItemError, (uuid, thread, current)
+        return None
+
+    def prefetch(self, uuids):
+
+        registry = self._registry
+        deleted = self._deletedRegistry
+        uuids = set(uuid for uuid in uuids
+                    if uuid not in registry and uuid not in deleted)
+        if not uuids:
+            return 0
+
+        store = self.repository.store
+        count = 0
+
+        txnStatus = store.startTransaction(self)
+        try:
+            for itemReader in store.loadItems(self, self.itsVersion, uuids):
+                uuid = itemReader.getUUID()
+
+                # may have been loaded already as another item's kind or
+                # parent while reading this batch
+                if uuid in registry:
+                    continue
 
-            itemReader = self.repository.store.loadItem(self, self.itsVersion,
-                                                        uuid)
-            if itemReader is not None:
+                current = self._checkLoading(uuid)
                 try:
                     self._loadingRegistry[uuid] = current
-                    return self._readItem(itemReader)
+                    self._readItem(itemReader)
+                    count += 1
                 finally:
                     del self._loadingRegistry[uuid]
+        finally:
+            store.commitTransaction(self, txnStatus)
 
-        return None
+        return count
 
     def _findSchema(self, spec, withSchema):
 
@@ -1626,41 +1753,35 @@ class OnDemandRepositoryView(RepositoryView):
 
         item.setPinned(False)
         
+    def _unregisterItem(self, item, reloadable):
+
+        super(OnDemandRepositoryView, self)._unregisterItem(item, reloadable)
+        self._cache._unloaded(item.itsUUID)
+
     def prune(self, size):
+        """
+        Evict least-used items from the view's item cache.
 
-        registry = self._registry
-        viewSize = len(registry)
-
-        if viewSize > size * 1.2:
-            gc.collect()
-            heap = [(item._lastAccess, item.itsUUID)
-                    for item in registry.itervalues()
-                    if not item.itsStatus & (item.PINNED | item.DIRTY)]
-            heapSize = len(heap)
-            heapify(heap)
-
-            count = viewSize - int(size * 0.8)
-            if count > 0:
-                debug = self.isDebug()
-
-                if self.isRefCounted():
-                    for i in xrange(heapSize):
-                        item = registry[heappop(heap)[1]]
-                        pythonRefs = sys.getrefcount(item)
-                        if pythonRefs <= 3:
-                            item._unloadItem(False, self)
-                            count -= 1
-                            if count == 0:
-                                break
-                        elif debug:
-                            self.logger.debug('not pruning %s (refCount %d)',
-                                              item._repr_(), pythonRefs)
-                else:
-                    for i in xrange(count):
-                        registry[heappop(heap)[1]]._unloadItem(False, self)
+        Eviction is incremental: each call does at most one bounded slice
+        of work, see L{ItemCache<chandlerdb.persistence.ItemCache.ItemCache>}
+        for details.
+
+        @param size: the threshhold value
+        @type size: integer
+        @return: the number of items evicted
+        """
+
+        return self._cache.prune(size)
+
+    def getCacheStatistics(self):
+        """
+        Return the view's item cache counters.
+
+        The returned dictionary contains the C{items}, C{bytes}, C{hits},
+        C{misses}, C{evictions} and C{reloads} counts among others.
+        """
 
-                gc.collect()
-                self.logger.info('%s pruned to %d items', self, len(registry))
+        return self._cache.getStatistics()
 
 
 class NullRepositoryView(RepositoryView):
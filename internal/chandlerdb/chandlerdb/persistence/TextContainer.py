@@ -0,0 +1,714 @@
+#   Copyright (c) 2004-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+A full text index stored in Berkeley DB, without Lucene.
+
+It implements the same interface as L{LuceneContainer.IndexContainer}:
+documents are indexed per item value version and searched with a subset
+of the Lucene query syntax: words, C{"quoted phrases"}, C{+required} and
+C{-prohibited} clauses, C{AND}, C{OR}, C{NOT} and parentheses.
+
+Three dbs are used:
+
+    - the main db maps a 4 byte document id to its item, attribute, value
+      and version uuids and also holds the index and document counters
+    - the postings db maps a term and the id of the first document of a
+      commit to that commit's posting list for the term: document id
+      deltas, term frequencies and position deltas, all varint encoded
+    - the items db maps an item uuid and a document id to the document's
+      version and terms, for purging and undoing an item's documents and
+      removing them from the posting lists
+
+The number of documents not purged or undone is kept for scoring.
+"""
+
+import re
+
+from struct import pack, unpack
+from math import log
+from heapq import nsmallest
+
+from chandlerdb.util.c import UUID
+from chandlerdb.persistence.c import DBNotFoundError
+from chandlerdb.persistence.DBContainer import DBContainer, VersionContainer
+
+
+# the stop words of Lucene's StandardAnalyzer
+STOP_WORDS = frozenset(('a', 'an', 'and', 'are', 'as', 'at', 'be', 'but',
+                        'by', 'for', 'if', 'in', 'into', 'is', 'it', 'no',
+                        'not', 'of', 'on', 'or', 'such', 'that', 'the',
+                        'their', 'then', 'there', 'these', 'they', 'this',
+                        'to', 'was', 'will', 'with'))
+
+_words = re.compile(r"\w+", re.UNICODE)
+_queryTokens = re.compile(r'\s*(?:([()+-])|"([^"]*)"?|([^\s()"]+))',
+                          re.UNICODE)
+
+MUST, SHOULD, MUST_NOT = '+', '', '-'
+
+
+def analyze(text):
+    """
+    Split text into lowercase words, leaving out stop words.
+
+    @return: a list of words, the index of a word being its position
+    """
+
+    return [word for word in _words.findall(text.lower())
+            if word not in STOP_WORDS]
+
+
+def encodeNumbers(numbers):
+
+    bytes = []
+    for n in numbers:
+        while n >= 0x80:
+            bytes.append(chr(n & 0x7f | 0x80))
+            n >>= 7
+        bytes.append(chr(n))
+
+    return ''.join(bytes)
+
+
+def decodeNumbers(data):
+
+    numbers = []
+    n = shift = 0
+    for c in data:
+        b = ord(c)
+        n |= (b & 0x7f) << shift
+        if b & 0x80:
+            shift += 7
+        else:
+            numbers.append(n)
+            n = shift = 0
+
+    return numbers
+
+
+def parseQuery(query):
+    """
+    Parse a query string into a boolean query tree.
+
+    A query is a C{('bool', clauses)} tuple, a clause being an C{(occur,
+    query)} tuple where occur is one of L{MUST}, L{SHOULD} or
+    L{MUST_NOT}. The leaves are C{('term', word)} and C{('phrase',
+    words)} tuples. As with Lucene's QueryParser, clauses are optional
+    unless marked otherwise.
+    """
+
+    tokens = []
+    for op, phrase, word in _queryTokens.findall(query):
+        if op:
+            tokens.append(('op', op))
+        elif phrase:
+            tokens.append(('phrase', phrase))
+        elif word in ('AND', 'OR', 'NOT', '&&', '||', '!'):
+            tokens.append(('conj', {'&&': 'AND', '||': 'OR',
+                                    '!': 'NOT'}.get(word, word)))
+        elif word:
+            tokens.append(('word', word))
+    tokens.reverse()
+
+    def _words(text):
+        words = analyze(text)
+        if len(words) == 1:
+            return ('term', words[0])
+        if words:
+            return ('phrase', words)
+        return None
+
+    def _clauses():
+        clauses = []
+        occur = None
+        conjunction = None
+
+        while tokens:
+            kind, value = tokens.pop()
+
+            if kind == 'op':
+                if value == ')':
+                    break
+                if value in (MUST, MUST_NOT):
+                    occur = value
+                    continue
+                query = _clauses()       # '('
+            elif kind == 'conj':
+                if value == 'NOT':
+                    occur = MUST_NOT
+                else:
+                    conjunction = value
+                    if value == 'AND' and clauses:
+                        previous, query = clauses[-1]
+                        if previous == SHOULD:
+                            clauses[-1] = (MUST, query)
+                continue
+            else:
+                query = _words(value)
+
+            if occur is None:
+                if conjunction == 'AND':
+                    occur = MUST
+                else:
+                    occur = SHOULD
+            if query is not None:
+                clauses.append((occur, query))
+            occur = None
+            conjunction = None
+
+        return ('bool', clauses)
+
+    return _clauses()
+
+
+class TextIndexWriter(object):
+    """
+    The documents analyzed for a commit, kept in memory until committed.
+    """
+
+    def __init__(self):
+
+        self.documents = []
+
+    def addDocument(self, uItem, uAttr, uValue, version, text):
+
+        terms = {}
+        for position, word in enumerate(analyze(text)):
+            if word in terms:
+                terms[word].append(position)
+            else:
+                terms[word] = [position]
+
+        self.documents.append((uItem, uAttr, uValue, version, terms))
+
+    def close(self):
+
+        del self.documents[:]
+
+
+class TextIndexReader(object):
+    """
+    Documents are deleted directly in the dbs, there is nothing to close.
+    """
+
+    def close(self):
+        pass
+
+
+class TextIndexContainer(DBContainer):
+
+    SEARCH_BATCH = 100
+
+    INDEX_VERSION_KEY = VersionContainer.VERSION_KEY
+    PROGRESS_KEY = pack('>16si', VersionContainer.VERSION_KEY[0:16], 4)
+    NEXT_DOC_KEY = pack('>16si', VersionContainer.VERSION_KEY[0:16], 5)
+    DOC_COUNT_KEY = pack('>16si', VersionContainer.VERSION_KEY[0:16], 6)
+
+    def __init__(self, store):
+
+        self._postings = None
+        self._items = None
+        super(TextIndexContainer, self).__init__(store)
+
+    def open(self, name, txn, **kwds):
+
+        # always created when missing, to be built by the indexer when
+        # switching an existing repository to this full text index
+        kwds['create'] = True
+
+        super(TextIndexContainer, self).open(name, txn, dbname='documents',
+                                             **kwds)
+        self._postings = self.openDB(txn, name, 'postings',
+                                     kwds.get('ramdb', False), True, False)
+        self._items = self.openDB(txn, name, 'items',
+                                  kwds.get('ramdb', False), True, False)
+
+    def close(self):
+
+        if self._postings is not None:
+            self._postings.close()
+            self._postings = None
+        if self._items is not None:
+            self._items.close()
+            self._items = None
+
+        super(TextIndexContainer, self).close()
+
+    def compact(self, txn=None):
+
+        super(TextIndexContainer, self).compact(txn)
+        self._compact(txn, self._postings, 'postings')
+        self._compact(txn, self._items, 'items')
+
+    def _getInt(self, key, format='>i'):
+
+        value = self.get(key)
+        if value is None:
+            return 0
+
+        return unpack(format, value)[0]
+
+    def _deleteKey(self, db, key):
+
+        try:
+            db.delete(key, self.store.txn)
+        except DBNotFoundError:
+            pass
+
+    def getIndexVersion(self):
+
+        return self._getInt(TextIndexContainer.INDEX_VERSION_KEY)
+
+    def setIndexVersion(self, version):
+
+        self.put(TextIndexContainer.INDEX_VERSION_KEY, pack('>i', version))
+        self.put(TextIndexContainer.PROGRESS_KEY, pack('>ii', 0, 0))
+
+    def getIndexProgress(self, version):
+
+        value = self.get(TextIndexContainer.PROGRESS_KEY)
+        if value is not None:
+            progressVersion, count = unpack('>ii', value)
+            if progressVersion == version:
+                return count
+
+        return 0
+
+    def setIndexProgress(self, version, count):
+
+        self.put(TextIndexContainer.PROGRESS_KEY, pack('>ii', version, count))
+
+    def getIndexReader(self):
+
+        return TextIndexReader()
+
+    def getIndexSearcher(self):
+
+        return TextIndexReader()
+
+    def getIndexWriter(self):
+
+        return TextIndexWriter()
+
+    def commitIndexWriter(self, writer):
+
+        self.commitIndexWriters([writer])
+
+    def commitIndexWriters(self, writers):
+
+        nextDoc = self._getInt(TextIndexContainer.NEXT_DOC_KEY, '>I')
+        docCount = self._getInt(TextIndexContainer.DOC_COUNT_KEY, '>I')
+        postings = {}
+
+        for writer in writers:
+            docCount += len(writer.documents)
+            for uItem, uAttr, uValue, version, terms in writer.documents:
+                docKey = pack('>I', nextDoc)
+                self.put(docKey, pack('>16s16s16si', uItem._uuid, uAttr._uuid,
+                                      uValue._uuid, version))
+                self.put(uItem._uuid + docKey,
+                         pack('>i', version) +
+                         '\0'.join([term.encode('utf-8') for term in terms]),
+                         self._items)
+                for term, positions in terms.iteritems():
+                    if term in postings:
+                        postings[term].append((nextDoc, positions))
+                    else:
+                        postings[term] = [(nextDoc, positions)]
+                nextDoc += 1
+            writer.close()
+
+        self.put(TextIndexContainer.NEXT_DOC_KEY, pack('>I', nextDoc))
+        self.put(TextIndexContainer.DOC_COUNT_KEY, pack('>I', docCount))
+
+        for term, docs in postings.iteritems():
+            self._putPostings(term.encode('utf-8'), docs)
+
+    def _putPostings(self, term, docs):
+
+        firstDoc = docs[0][0]
+        numbers = []
+        for docId, positions in docs:
+            numbers.append(docId - firstDoc)
+            numbers.append(len(positions))
+            previous = 0
+            for position in positions:
+                numbers.append(position - previous)
+                previous = position
+            firstDoc = docId
+
+        self.put(term + '\0' + pack('>I', docs[0][0]),
+                 encodeNumbers(numbers), self._postings)
+
+    def _decodePostings(self, key, data):
+
+        docId = unpack('>I', key[-4:])[0]
+        numbers = decodeNumbers(data)
+        docs = []
+        i = 0
+
+        while i < len(numbers):
+            docId += numbers[i]
+            count = numbers[i + 1]
+            i += 2
+            positions = []
+            position = 0
+            for delta in numbers[i:i + count]:
+                position += delta
+                positions.append(position)
+            docs.append((docId, positions))
+            i += count
+
+        return docs
+
+    def abortIndexWriter(self, writer):
+
+        writer.close()
+
+    def indexValue(self, indexWriter, value, uItem, uAttr, uValue, version):
+
+        indexWriter.addDocument(uItem, uAttr, uValue, version, value)
+
+    def indexReader(self, indexWriter, reader, uItem, uAttr, uValue, version):
+
+        indexWriter.addDocument(uItem, uAttr, uValue, version, reader.read())
+
+    def optimizeIndex(self, indexWriter):
+
+        pass
+
+    def readPostings(self, term):
+        """
+        Read the posting lists of a term.
+
+        @return: a dict mapping document ids to lists of positions
+        """
+
+        postings = {}
+        prefix = term.encode('utf-8') + '\0'
+        cursor = None
+
+        try:
+            cursor = self.c.openCursor(self._postings)
+            value = cursor.set_range(prefix, self.c.flags, None)
+
+            while value is not None and value[0].startswith(prefix):
+                postings.update(self._decodePostings(value[0], value[1]))
+                value = cursor.next(self.c.flags, None)
+
+        finally:
+            self.c.closeCursor(cursor, self._postings)
+
+        return postings
+
+    def _score(self, query, count, cache):
+
+        kind = query[0]
+
+        if kind == 'term':
+            term = query[1]
+            postings = cache.get(term)
+            if postings is None:
+                postings = cache[term] = self.readPostings(term)
+            if not postings:
+                return {}
+            idf = log(float(count) / len(postings) + 1.0)
+            return dict((docId, len(positions) * idf)
+                        for docId, positions in postings.iteritems())
+
+        if kind == 'phrase':
+            lists = []
+            idf = 0.0
+            for term in query[1]:
+                postings = cache.get(term)
+                if postings is None:
+                    postings = cache[term] = self.readPostings(term)
+                if not postings:
+                    return {}
+                idf += log(float(count) / len(postings) + 1.0)
+                lists.append(postings)
+
+            scores = {}
+            for docId, positions in lists[0].iteritems():
+                others = []
+                for postings in lists[1:]:
+                    if docId not in postings:
+                        break
+                    others.append(set(postings[docId]))
+                else:
+                    matches = 0
+                    for position in positions:
+                        for offset, other in enumerate(others):
+                            if position + offset + 1 not in other:
+                                break
+                        else:
+                            matches += 1
+                    if matches:
+                        scores[docId] = matches * idf
+            return scores
+
+        required = None
+        optional = {}
+        prohibited = set()
+
+        for occur, clause in query[1]:
+            scores = self._score(clause, count, cache)
+            if occur == MUST:
+                if required is None:
+                    required = scores
+                else:
+                    required = dict((docId, score + scores[docId])
+                                    for docId, score in required.iteritems()
+                                    if docId in scores)
+            elif occur == MUST_NOT:
+                prohibited.update(scores)
+            else:
+                for docId, score in scores.iteritems():
+                    optional[docId] = optional.get(docId, 0.0) + score
+
+        if required is None:
+            result = optional
+        else:
+            result = required
+            for docId, score in optional.iteritems():
+                if docId in result:
+                    result[docId] += score
+
+        for docId in prohibited:
+            result.pop(docId, None)
+
+        return result
+
+    def _allDocuments(self):
+
+        scores = {}
+        cursor = None
+
+        try:
+            cursor = self.c.openCursor()
+            value = cursor.set_range(pack('>I', 0), self.c.flags, None)
+
+            while value is not None:
+                if len(value[0]) == 4:
+                    scores[unpack('>I', value[0])[0]] = 1.0
+                value = cursor.next(self.c.flags, None)
+
+        finally:
+            self.c.closeCursor(cursor)
+
+        return scores
+
+    def searchDocuments(self, view, version, query=None, attribute=None,
+                        offset=0, limit=None):
+        """
+        Search the index for documents matching a query.
+
+        See L{LuceneContainer.IndexContainer.searchDocuments}.
+        """
+
+        store = self.store
+        items = store._items
+
+        def _validate(documents):
+
+            values = {}
+            for uItem, uAttr, uValue in documents:
+                if uItem in values:
+                    values[uItem].append(uValue)
+                else:
+                    values[uItem] = [uValue]
+
+            for uItem, uValues in values.iteritems():
+                values[uItem] = set(items.filterValues(view, version,
+                                                       uItem, uValues))
+
+            for uItem, uAttr, uValue in documents:
+                if uValue in values[uItem]:
+                    yield uItem, uAttr
+
+        class _iterator(object):
+
+            def __init__(_self):
+
+                _self.txnStatus = 0
+
+            def __del__(_self):
+
+                try:
+                    store.abortTransaction(view, _self.txnStatus)
+                except:
+                    store.repository.logger.exception("in __del__")
+
+                _self.txnStatus = 0
+
+            def __iter__(_self):
+
+                _self.txnStatus = store.startTransaction(view)
+
+                if query is None:
+                    scores = self._allDocuments()
+                else:
+                    count = max(self._getInt(TextIndexContainer.DOC_COUNT_KEY,
+                                             '>I'), 1)
+                    scores = self._score(parseQuery(query), count, {})
+
+                if limit is None:
+                    count = offset + self.SEARCH_BATCH
+                else:
+                    count = offset + limit
+                skip = offset
+                found = 0
+                start = 0
+
+                while True:
+                    hits = nsmallest(count, ((-score, docId) for docId, score
+                                             in scores.iteritems()))
+
+                    documents = []
+                    for score, docId in hits[start:]:
+                        value = self.get(pack('>I', docId))
+                        if value is None:   # purged
+                            continue
+                        uItem, uAttr, uValue, docVersion = \
+                            unpack('>16s16s16si', value)
+                        if docVersion > version:
+                            continue
+                        if attribute and uAttr != attribute._uuid:
+                            continue
+                        documents.append((UUID(uItem), UUID(uAttr),
+                                          UUID(uValue)))
+
+                    for uItem, uAttr in _validate(documents):
+                        if skip:
+                            skip -= 1
+                        else:
+                            yield uItem, uAttr
+                            found += 1
+                            if found == limit:
+                                return
+
+                    start = len(hits)
+                    if start >= len(scores):
+                        return
+
+                    count = min(count * 2, len(scores))
+
+        return _iterator()
+
+    def _itemDocuments(self, uItem):
+
+        documents = []
+        prefix = uItem._uuid
+        cursor = None
+
+        try:
+            cursor = self.c.openCursor(self._items)
+            value = cursor.set_range(prefix, self.c.flags, None)
+
+            while value is not None and value[0].startswith(prefix):
+                documents.append((value[0][16:],
+                                  unpack('>i', value[1][:4])[0]))
+                value = cursor.next(self.c.flags, None)
+
+        finally:
+            self.c.closeCursor(cursor, self._items)
+
+        return documents
+
+    def _deleteDocuments(self, uItem, docKeys):
+
+        terms = {}
+        count = 0
+        for docKey in docKeys:
+            value = self.get(uItem._uuid + docKey, self._items)
+            if value is None:
+                continue
+            count += 1
+            docId = unpack('>I', docKey)[0]
+            if len(value) > 4:
+                for term in value[4:].split('\0'):
+                    if term in terms:
+                        terms[term].add(docId)
+                    else:
+                        terms[term] = set([docId])
+            self._deleteKey(self._db, docKey)
+            self._deleteKey(self._items, uItem._uuid + docKey)
+
+        if count:
+            for term, docIds in terms.iteritems():
+                self._deletePostings(term, docIds)
+
+            docCount = self._getInt(TextIndexContainer.DOC_COUNT_KEY, '>I')
+            self.put(TextIndexContainer.DOC_COUNT_KEY,
+                     pack('>I', max(docCount - count, 0)))
+
+    def _deletePostings(self, term, docIds):
+
+        # the posting lists of a term are keyed by their first document id
+        prefix = term + '\0'
+        firstDoc, lastDoc = min(docIds), max(docIds)
+        lists = []
+        cursor = None
+
+        try:
+            cursor = self.c.openCursor(self._postings)
+            value = cursor.set_range(prefix, self.c.flags, None)
+
+            while value is not None and value[0].startswith(prefix):
+                if unpack('>I', value[0][-4:])[0] > lastDoc:
+                    break
+                docs = self._decodePostings(value[0], value[1])
+                if docs[-1][0] >= firstDoc:
+                    lists.append((value[0], docs))
+                value = cursor.next(self.c.flags, None)
+
+        finally:
+            self.c.closeCursor(cursor, self._postings)
+
+        for key, docs in lists:
+            kept = [doc for doc in docs if doc[0] not in docIds]
+            if len(kept) < len(docs):
+                self._deleteKey(self._postings, key)
+                if kept:
+                    self._putPostings(term, kept)
+
+    def purgeDocuments(self, txn, counter, indexSearcher, indexReader,
+                       uItem, toVersion=None):
+
+        if toVersion is None:
+            docKeys = [docKey for docKey, version
+                       in self._itemDocuments(uItem)]
+
+        else:
+            x, keep = self.store._items.findValues(None, toVersion,
+                                                   uItem, None, True)
+            keep = set([uValue._uuid for uValue in keep])
+
+            docKeys = []
+            for docKey, version in self._itemDocuments(uItem):
+                if version <= toVersion:
+                    value = self.get(docKey)
+                    if value is None or value[32:48] not in keep:
+                        docKeys.append(docKey)
+
+        self._deleteDocuments(uItem, docKeys)
+        counter.documentCount += len(docKeys)
+
+    def undoDocuments(self, indexSearcher, indexReader, uItem, version):
+
+        self._deleteDocuments(uItem,
+                              [docKey for docKey, docVersion
+                               in self._itemDocuments(uItem)
+                               if docVersion == version])
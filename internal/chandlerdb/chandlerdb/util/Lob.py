@@ -40,6 +40,14 @@ class Lob(Indexable):
 
         return self._indexed
 
+    def getIndexedText(self):
+
+        reader = self.getPlainTextReader(replace=True)
+        try:
+            return reader.read()
+        finally:
+            reader.close()
+
     def getOutputStream(self, compression=None,
                         encryption=None, key=None, iv=None,
                         append=False):
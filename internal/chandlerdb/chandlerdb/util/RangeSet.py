@@ -212,6 +212,52 @@ class RangeSet(object):
                     if range[1] >= rightRange[0]:
                         self.ranges [insertIndex] = (range[1] + 1, rightRange[1])
 
+    def selectIndexes (self, indexes):
+        # Select an iterable of indexes, in any order. Consecutive
+        # indexes are combined into ranges before being selected.
+        start = end = None
+        for index in sorted (indexes):
+            if start is None:
+                start = end = index
+            elif index <= end + 1:
+                if index > end:
+                    end = index
+            else:
+                self.selectRange ((start, end))
+                start = end = index
+        if start is not None:
+            self.selectRange ((start, end))
+
+    def unselectedRanges (self, first, last):
+        # Return the list of ranges of unselected indexes between first
+        # and last, inclusive.
+        ranges = []
+        for (start, end) in self.ranges:
+            if end < first:
+                continue
+            if start > last:
+                break
+            if start > first:
+                ranges.append ((first, start - 1))
+            first = end + 1
+        if first <= last:
+            ranges.append ((first, last))
+        return ranges
+
+    def unselectedIndexes (self, indexes):
+        # Return the sorted list of indexes that are not selected,
+        # walking the ranges once for all of them.
+        result = []
+        ranges = self.ranges
+        rangesLength = len (ranges)
+        rangeIndex = 0
+        for index in sorted (indexes):
+            while rangeIndex < rangesLength and ranges[rangeIndex][1] < index:
+                rangeIndex = rangeIndex + 1
+            if rangeIndex == rangesLength or index < ranges[rangeIndex][0]:
+                result.append (index)
+        return result
+
     def insertOrDeleteRange (self, itemIndex, elementCount):
         # At itemIndex in the ranges, insert elementCount unselected
         # items. If elementCount is negative then count items are removed
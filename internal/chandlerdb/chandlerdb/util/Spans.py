@@ -0,0 +1,435 @@
+#   Copyright (c) 2003-2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Hierarchical timing of named spans of code.
+
+A span is entered and exited by name, either explicitly::
+
+    from chandlerdb.util.Spans import profiler
+
+    profiler.enter('commit')
+    try:
+        ...
+    finally:
+        profiler.exit('commit')
+
+or with the C{span} context manager or the C{spanned} decorator::
+
+    with profiler.span('sync'):
+        ...
+
+    @spanned('synchronizeWidget')
+    def synchronizeWidget(self):
+        ...
+
+Spans nest: each thread keeps its own stack of entered spans and its own
+tree of timings, so a span's timings are kept per path of enclosing spans.
+The trees of threads that exited are merged into one and dropped.
+Durations are recorded in logarithmic histograms from which percentiles
+are estimated. Spans lasting longer than C{slowThreshold} are also kept
+in a ring buffer of recent slow operations.
+
+The module's C{profiler} is disabled by default; entering a span then
+costs one attribute check.
+"""
+
+import threading
+
+from weakref import ref
+from math import log
+from time import time, strftime, localtime
+
+
+class Histogram(object):
+    """
+    Durations counted in logarithmic buckets, C{RESOLUTION} per power of
+    two from C{BASE} seconds up. Percentiles are estimated within 20% with
+    a bounded number of buckets.
+    """
+
+    BASE = 1e-6
+    RESOLUTION = 4
+
+    def __init__(self):
+
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+
+        if duration > Histogram.BASE:
+            bucket = int(log(duration / Histogram.BASE, 2) *
+                         Histogram.RESOLUTION) + 1
+        else:
+            bucket = 0
+
+        buckets = self.buckets
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def merge(self, histogram):
+
+        buckets = self.buckets
+        for bucket, count in histogram.buckets.items():
+            buckets[bucket] = buckets.get(bucket, 0) + count
+        self.count += histogram.count
+        self.total += histogram.total
+        if histogram.max > self.max:
+            self.max = histogram.max
+
+    def percentile(self, percent):
+        """
+        Estimate the duration under which C{percent}% of durations fall.
+        """
+
+        if not self.count:
+            return 0.0
+
+        threshold = self.count * percent / 100.0
+        running = 0
+        for bucket in sorted(self.buckets):
+            running += self.buckets[bucket]
+            if running >= threshold:
+                break
+
+        upper = Histogram.BASE * 2 ** (bucket / float(Histogram.RESOLUTION))
+        return min(upper, self.max)
+
+
+class SpanNode(object):
+
+    __slots__ = ('name', 'histogram', 'children')
+
+    def __init__(self, name):
+
+        self.name = name
+        self.histogram = Histogram()
+        self.children = {}
+
+    def child(self, name):
+
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = SpanNode(name)
+
+        return node
+
+    def merge(self, node):
+
+        self.histogram.merge(node.histogram)
+        for name, child in node.children.items():
+            self.child(name).merge(child)
+
+
+class _ThreadSpans(object):
+
+    def __init__(self, thread):
+
+        self.name = thread.getName()
+        self.thread = ref(thread)
+        self.root = SpanNode(None)
+        self.stack = []
+
+    def isAlive(self):
+
+        thread = self.thread()
+        return thread is not None and thread.isAlive()
+
+
+class _SpanContext(object):
+
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+
+        self.profiler.enter(self.name)
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+
+        self.profiler.exit(self.name)
+        return False
+
+
+class Profiler(object):
+    """
+    The per-thread span stacks and timing trees of a process.
+    """
+
+    def __init__(self, enabled=False, slowThreshold=0.25, slowCount=100):
+        """
+        Construct a profiler.
+
+        @param enabled: whether spans are recorded
+        @type enabled: boolean
+        @param slowThreshold: the duration, in seconds, from which a span
+        is recorded as a slow operation
+        @type slowThreshold: float
+        @param slowCount: the number of recent slow operations kept
+        @type slowCount: integer
+        """
+
+        self.enabled = enabled
+        self.slowThreshold = slowThreshold
+
+        self._local = threading.local()
+        self._threads = []
+        self._exited = SpanNode(None)
+        self._lock = threading.Lock()
+        self._slow = [None] * slowCount
+        self._slowIndex = 0
+
+    def _getThreadSpans(self):
+
+        spans = getattr(self._local, 'spans', None)
+        if spans is None:
+            spans = _ThreadSpans(threading.currentThread())
+            self._local.spans = spans
+            self._lock.acquire()
+            try:
+                self._prune()
+                self._threads.append(spans)
+            finally:
+                self._lock.release()
+
+        return spans
+
+    def _prune(self):
+
+        # merge the trees of exited threads, called with the lock held
+        threads = []
+        for spans in self._threads:
+            if spans.isAlive():
+                threads.append(spans)
+            else:
+                self._exited.merge(spans.root)
+        self._threads = threads
+
+    def enter(self, name):
+        """
+        Enter a span in the current thread.
+        """
+
+        if self.enabled:
+            spans = self._getThreadSpans()
+            stack = spans.stack
+            if stack:
+                node = stack[-1][0].child(name)
+            else:
+                node = spans.root.child(name)
+            stack.append((node, time()))
+
+    def exit(self, name):
+        """
+        Exit the innermost span of this name in the current thread.
+
+        Spans entered within it but not exited are unwound first. Exiting a
+        span entered while the profiler was disabled is ignored.
+        """
+
+        spans = getattr(self._local, 'spans', None)
+        if spans is None or not spans.stack:
+            return
+
+        stack = spans.stack
+        for i in xrange(len(stack) - 1, -1, -1):
+            if stack[i][0].name == name:
+                break
+        else:
+            return
+
+        now = time()
+        node, start = stack[i]
+        path = [entry[0].name for entry in stack[:i + 1]]
+        del stack[i:]
+
+        duration = now - start
+        node.histogram.add(duration)
+
+        if duration >= self.slowThreshold and self._slow:
+            self._lock.acquire()
+            try:
+                self._slow[self._slowIndex] = (now, spans.name,
+                                               '/'.join(path), duration)
+                self._slowIndex = (self._slowIndex + 1) % len(self._slow)
+            finally:
+                self._lock.release()
+
+    def span(self, name):
+        """
+        Return a context manager entering and exiting a span.
+        """
+
+        return _SpanContext(self, name)
+
+    def reset(self):
+        """
+        Forget all timings and slow operations recorded so far.
+
+        Spans currently entered are still exited normally.
+        """
+
+        self._lock.acquire()
+        try:
+            self._prune()
+            self._exited = SpanNode(None)
+            for spans in self._threads:
+                spans.root = SpanNode(None)
+                spans.stack = [(spans.root.child(node.name), start)
+                               for node, start in spans.stack]
+            self._slow = [None] * len(self._slow)
+            self._slowIndex = 0
+        finally:
+            self._lock.release()
+
+    def getTree(self):
+        """
+        Return the timing trees of all threads merged into one.
+
+        @return: a L{SpanNode} whose children are the outermost spans
+        """
+
+        root = SpanNode(None)
+        self._lock.acquire()
+        try:
+            self._prune()
+            root.merge(self._exited)
+            threads = list(self._threads)
+        finally:
+            self._lock.release()
+
+        for spans in threads:
+            root.merge(spans.root)
+
+        return root
+
+    def getStatistics(self):
+        """
+        Return the merged timings as a tree of dictionaries.
+
+        Each span is a dictionary keyed by name with its C{count},
+        C{total}, C{max}, C{p50}, C{p95} and C{p99} durations, in seconds,
+        and its nested spans under C{children}.
+        """
+
+        def statistics(node):
+            histogram = node.histogram
+            return { 'count': histogram.count,
+                     'total': histogram.total,
+                     'max': histogram.max,
+                     'p50': histogram.percentile(50),
+                     'p95': histogram.percentile(95),
+                     'p99': histogram.percentile(99),
+                     'children': dict((name, statistics(child))
+                                      for name, child
+                                      in node.children.iteritems()) }
+
+        return statistics(self.getTree())['children']
+
+    def getSlowOperations(self):
+        """
+        Return the recent slow operations, oldest first.
+
+        @return: a list of C{(time, thread, path, duration)} tuples
+        """
+
+        self._lock.acquire()
+        try:
+            index = self._slowIndex
+            slow = self._slow[index:] + self._slow[:index]
+        finally:
+            self._lock.release()
+
+        return [entry for entry in slow if entry is not None]
+
+    def report(self, output):
+        """
+        Write a text report of the timings and slow operations.
+
+        @param output: a file-like object open for writing
+        """
+
+        format = "%-48s %8s %10s %10s %10s %10s %10s\n"
+        output.write(format %('span', 'count', 'total', 'p50', 'p95',
+                              'p99', 'max'))
+
+        def write(node, level):
+            for name, child in sorted(node.children.iteritems()):
+                histogram = child.histogram
+                output.write(format %('  ' * level + name, histogram.count,
+                                      "%.4f" %(histogram.total),
+                                      "%.4f" %(histogram.percentile(50)),
+                                      "%.4f" %(histogram.percentile(95)),
+                                      "%.4f" %(histogram.percentile(99)),
+                                      "%.4f" %(histogram.max)))
+                write(child, level + 1)
+
+        write(self.getTree(), 0)
+
+        slow = self.getSlowOperations()
+        if slow:
+            output.write("\nslow operations (over %.3fs):\n"
+                         %(self.slowThreshold))
+            for when, thread, path, duration in slow:
+                output.write("%s %-16s %-48s %.4f\n"
+                             %(strftime('%H:%M:%S', localtime(when)),
+                               thread, path, duration))
+
+    def dump(self, path):
+        """
+        Write a text report of the timings to a file.
+        """
+
+        output = file(path, 'w')
+        try:
+            self.report(output)
+        finally:
+            output.close()
+
+
+profiler = Profiler()
+
+
+def spanned(name, profiler=profiler):
+    """
+    A decorator making calls to a function spans of the given name.
+    """
+
+    def decorator(fn):
+        def spannedFn(*args, **kwds):
+            if not profiler.enabled:
+                return fn(*args, **kwds)
+            profiler.enter(name)
+            try:
+                return fn(*args, **kwds)
+            finally:
+                profiler.exit(name)
+
+        spannedFn.__name__ = fn.__name__
+        spannedFn.__doc__ = fn.__doc__
+
+        return spannedFn
+
+    return decorator
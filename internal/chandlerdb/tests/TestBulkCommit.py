@@ -0,0 +1,94 @@
+#   Copyright (c) 2007 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Unit tests for bulk commits
+"""
+
+from chandlerdb.util.RepositoryTestCase import RepositoryTestCase
+
+
+class TestBulkCommit(RepositoryTestCase):
+
+    def _movies(self):
+
+        k = self.view.findPath('//CineGuide/KHepburn')
+        return [(movie.itsUUID, movie.title)
+                for movie in k.movies]
+
+    def testBulkLoad(self):
+
+        self.loadCineguide(self.view, False)
+        movies = self._movies()
+
+        self.view.commit(bulk=True)
+        self.assert_(self.rep.store._threaded.get('buffer') is None)
+
+        self._reopenRepository()
+        self.assertEqual(self._movies(), movies)
+        self.assert_(self.view.check())
+
+    def testBulkLoadNewIndex(self):
+
+        self.loadCineguide(self.view, False)
+        self.view.findPath('//CineGuide/KHepburn').movies.addIndex('n',
+                                                                   'numeric')
+        self.view.commit(bulk=True)
+
+        version = self.view.itsVersion
+        status, timezone, newIndexes = self.rep.store.getViewData(version)
+        self.assertEqual(timezone, str(self.view.tzinfo.default))
+        self.assertEqual([(attr, name) for uItem, attr, name in newIndexes],
+                         [('movies', 'n')])
+
+        view = self.rep.createView('other')
+        try:
+            movies = view.findPath('//CineGuide/KHepburn').movies
+            self.assert_(movies.hasIndex('n'))
+            self.assertEqual(movies.getIndexSize('n'), len(movies))
+        finally:
+            view.closeView()
+
+    def testBulkLoadWithoutNotifications(self):
+
+        self.loadCineguide(self.view, False)
+        movies = self._movies()
+
+        self.view.commit(notify=False, bulk=True)
+
+        self._reopenRepository()
+        self.assertEqual(self._movies(), movies)
+        self.assert_(self.view.check())
+
+    def testBulkChanges(self):
+
+        self.loadCineguide(self.view)
+
+        k = self.view.findPath('//CineGuide/KHepburn')
+        movie = k.movies.first()
+        movie.title = 'changed'
+        uuid = movie.itsUUID
+        k.movies.remove(k.movies.last())
+        movies = self._movies()
+
+        self.view.commit(bulk=True)
+
+        self._reopenRepository()
+        self.assertEqual(self._movies(), movies)
+        self.assertEqual(self.view.find(uuid).title, 'changed')
+
+
+if __name__ == "__main__":
+    import unittest
+    unittest.main()
@@ -0,0 +1,124 @@
+#   Copyright (c) 2007 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Unit tests for the item cache of on-demand views
+"""
+
+from chandlerdb.util.c import UUID
+from chandlerdb.util.RepositoryTestCase import RepositoryTestCase
+
+
+class TestItemCache(RepositoryTestCase):
+
+    def setUp(self):
+
+        super(TestItemCache, self).setUp()
+        self.loadCineguide(self.view)
+        self._reopenRepository()
+
+    def _loadMovies(self):
+
+        k = self.view.findPath('//CineGuide/KHepburn')
+        return [movie.itsUUID for movie in k.movies]
+
+    def testStatistics(self):
+
+        view = self.view
+        misses = view.getCacheStatistics()['misses']
+
+        self._loadMovies()
+        stats = view.getCacheStatistics()
+
+        self.assert_(stats['misses'] > misses)
+        self.assert_(stats['bytes'] > 0)
+        self.assert_(stats['tracked'] <= stats['items'])
+
+    def testNoPruneUnderWatermark(self):
+
+        view = self.view
+        self._loadMovies()
+
+        self.assertEqual(view.prune(len(view._registry)), 0)
+        self.assert_(not view._cache.isPruning())
+
+    def testSlicedPrune(self):
+
+        view = self.view
+        cache = view._cache
+        cache.sliceSize = 5
+
+        self._loadMovies()
+        size = len(view._registry) / 2
+
+        evictions = 0
+        for i in xrange(1000):
+            evicted = view.prune(size)
+            self.assert_(evicted <= cache.sliceSize)
+            evictions += evicted
+            if not cache.isPruning():
+                break
+
+        self.assert_(evictions > 0)
+        self.assertEqual(cache.evictions, evictions)
+
+        uuid = iter(cache._evicted).next()
+        self.assert_(uuid not in view._registry)
+        self.assert_(view.find(uuid) is not None)
+        self.assertEqual(cache.reloads, 1)
+
+    def testReloadsUnderWatermark(self):
+
+        view = self.view
+        cache = view._cache
+
+        uuids = self._loadMovies()
+        for i in xrange(100):
+            for uuid in uuids:
+                cache._loaded(view.find(uuid), 1024)
+            view.prune(len(view._registry) * 2)
+
+        self.assert_(not cache.isPruning())
+        self.assert_(len(cache._young) + len(cache._old) <=
+                     2 * len(cache) + cache.sliceSize)
+
+    def testLoadItems(self):
+
+        uuids = self._loadMovies()
+        self._reopenRepository()
+        view = self.view
+
+        self.assert_(not [uuid for uuid in uuids if uuid in view._registry])
+
+        missing = UUID()
+        items = view.loadItems(uuids + [missing])
+
+        self.assertEqual(len(items), len(uuids) + 1)
+        self.assert_(items[-1] is None)
+        self.assertEqual([item.itsUUID for item in items[:-1]], uuids)
+        self.assertEqual(view.prefetch(uuids), 0)
+
+    def testIterItems(self):
+
+        uuids = self._loadMovies()
+        self._reopenRepository()
+        view = self.view
+
+        items = list(view.iterItems(iter(uuids), 2))
+        self.assertEqual([item.itsUUID for item in items], uuids)
+
+
+if __name__ == "__main__":
+    import unittest
+    unittest.main()
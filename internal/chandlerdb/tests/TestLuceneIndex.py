@@ -0,0 +1,139 @@
+#   Copyright (c) 2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Unit tests for the Lucene full text index
+"""
+
+from chandlerdb.util.c import UUID
+from chandlerdb.util.RepositoryTestCase import RepositoryTestCase
+
+
+class TestLuceneIndex(RepositoryTestCase):
+
+    def setUp(self):
+
+        super(TestLuceneIndex, self).setUp()
+        self.loadCineguide(self.view)
+
+        khepburn = self.view.findPath('//CineGuide/KHepburn')
+        self.movies = list(khepburn.movies)
+
+    def _setSynopsis(self, movie, text):
+
+        lobType = movie.getAttributeAspect('synopsis', 'type')
+        movie.synopsis = lobType.makeValue(text, indexed=True)
+
+    def _search(self, query, **kwds):
+
+        return [item for item, name in self.view.searchItems(query, **kwds)]
+
+    def _acquireSearcher(self):
+
+        store = self.rep.store
+        txnStatus = store.startTransaction(self.view)
+        try:
+            return store._index.acquireSearcher()
+        finally:
+            store.abortTransaction(self.view, txnStatus)
+
+    def testAcquireSearcher(self):
+
+        self._setSynopsis(self.movies[0], u"A rich heiress")
+        self.view.commit()
+
+        searcher = self._acquireSearcher()
+        self.assert_(self._acquireSearcher() is searcher)
+        self.assertEqual(searcher._refs, 3)
+        searcher.release()
+        searcher.release()
+
+        # a commit to the index replaces the cached searcher
+        self._setSynopsis(self.movies[1], u"An aviator")
+        self.view.commit()
+
+        newSearcher = self._acquireSearcher()
+        self.assert_(newSearcher is not searcher)
+        self.assertNotEqual(newSearcher.version, searcher.version)
+        self.assertEqual(searcher._refs, 0)
+        newSearcher.release()
+
+    def testSearchAfterCommit(self):
+
+        m0, m1 = self.movies[:2]
+        self._setSynopsis(m0, u"A rich heiress")
+        self.view.commit()
+
+        threaded = self.rep.store._threaded
+        self.assertEqual(self._search(u'heiress'), [m0])
+        searcher = threaded.get('searcher')
+        self.assertEqual(self._search(u'heiress'), [m0])
+        self.assert_(threaded.get('searcher') is searcher)
+        self.assertEqual(searcher._refs, 1)
+
+        self._setSynopsis(m0, u"An aviator")
+        self._setSynopsis(m1, u"The heiress in Philadelphia")
+        self.view.commit()
+
+        self.assertEqual(self._search(u'heiress'), [m1])
+        self.assertEqual(self._search(u'aviator'), [m0])
+        self.assert_(threaded.get('searcher') is not searcher)
+
+    def testLimit(self):
+
+        for i, movie in enumerate(self.movies):
+            self._setSynopsis(movie, u"screenplay number %d" %(i))
+        self.view.commit()
+
+        matches = self._search(u'screenplay')
+        self.assertEqual(set(matches), set(self.movies))
+        self.assertEqual(self._search(u'screenplay', limit=2), matches[:2])
+        self.assertEqual(self._search(u'screenplay', offset=2, limit=3),
+                         matches[2:5])
+
+        # hits of values no longer current don't count towards the limit
+        for movie in matches[:3]:
+            self._setSynopsis(movie, u"screenplay screenplay rewritten")
+        self.view.commit()
+
+        page = self._search(u'screenplay', limit=5)
+        self.assertEqual(len(page), 5)
+        self.assertEqual(len(set(page)), 5)
+
+    def testFilterValues(self):
+
+        view = self.view
+        items = self.rep.store._items
+        movie = self.movies[0]
+
+        self._setSynopsis(movie, u"A rich heiress")
+        view.commit()
+        x, oldValues = items.findValues(view, view.itsVersion, movie.itsUUID)
+
+        self._setSynopsis(movie, u"An aviator")
+        view.commit()
+        x, values = items.findValues(view, view.itsVersion, movie.itsUUID)
+
+        self.assert_(values)
+        self.assertEqual(set(items.filterValues(view, view.itsVersion,
+                                                movie.itsUUID,
+                                                oldValues + values)),
+                         set(values))
+        self.assertEqual(items.filterValues(view, view.itsVersion,
+                                            UUID(), values), [])
+
+
+if __name__ == "__main__":
+    import unittest
+    unittest.main()
@@ -0,0 +1,89 @@
+#   Copyright (c) 2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+from unittest import TestCase, main
+
+from chandlerdb.util.RangeSet import RangeSet
+
+
+class TestRangeSet(TestCase):
+    """
+    RangeSet unit tests
+    """
+
+    def testSelectIndexes(self):
+
+        rangeSet = RangeSet()
+        rangeSet.selectIndexes([])
+        self.assertEqual(rangeSet.ranges, [])
+
+        # unsorted and duplicate indexes, consecutive ones are combined
+        rangeSet.selectIndexes([7, 3, 4, 5, 5, 12, 8])
+        self.assertEqual(rangeSet.ranges, [(3, 5), (7, 8), (12, 12)])
+
+        # indexes touching existing ranges extend and join them
+        rangeSet.selectIndexes([2, 6, 13])
+        self.assertEqual(rangeSet.ranges, [(2, 8), (12, 13)])
+
+        rangeSet.selectIndexes([0])
+        self.assertEqual(rangeSet.ranges, [(0, 0), (2, 8), (12, 13)])
+        self.assert_(rangeSet.rangesAreValid())
+
+    def testUnselectedRanges(self):
+
+        rangeSet = RangeSet()
+        self.assertEqual(rangeSet.unselectedRanges(1, 10), [(1, 10)])
+        self.assertEqual(rangeSet.unselectedRanges(5, 5), [(5, 5)])
+
+        rangeSet.selectIndexes([3, 4, 5, 9])
+        self.assertEqual(rangeSet.unselectedRanges(1, 12),
+                         [(1, 2), (6, 8), (10, 12)])
+
+        # bounds on the edges of selected ranges
+        self.assertEqual(rangeSet.unselectedRanges(3, 9), [(6, 8)])
+        self.assertEqual(rangeSet.unselectedRanges(5, 10), [(6, 8), (10, 10)])
+        self.assertEqual(rangeSet.unselectedRanges(2, 6), [(2, 2), (6, 6)])
+
+        # bounds within or spanning only selected indexes
+        self.assertEqual(rangeSet.unselectedRanges(3, 5), [])
+        self.assertEqual(rangeSet.unselectedRanges(9, 9), [])
+        self.assertEqual(rangeSet.unselectedRanges(4, 4), [])
+
+        # bounds outside every range
+        self.assertEqual(rangeSet.unselectedRanges(0, 1), [(0, 1)])
+        self.assertEqual(rangeSet.unselectedRanges(7, 7), [(7, 7)])
+        self.assertEqual(rangeSet.unselectedRanges(20, 30), [(20, 30)])
+
+    def testUnselectedIndexes(self):
+
+        rangeSet = RangeSet()
+        self.assertEqual(rangeSet.unselectedIndexes([]), [])
+        self.assertEqual(rangeSet.unselectedIndexes([4, 1]), [1, 4])
+
+        rangeSet.selectIndexes([3, 4, 5, 9])
+        self.assertEqual(rangeSet.unselectedIndexes([]), [])
+
+        # indexes on the edges of selected ranges
+        self.assertEqual(rangeSet.unselectedIndexes([2, 3, 5, 6, 8, 9, 10]),
+                         [2, 6, 8, 10])
+
+        # indexes outside every range, in any order
+        self.assertEqual(rangeSet.unselectedIndexes([20, 0, 7, 4, 7]),
+                         [0, 7, 7, 20])
+        self.assertEqual(rangeSet.unselectedIndexes([9, 4]), [])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#   Copyright (c) 2007 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+from unittest import TestCase, main
+from threading import Thread
+from cStringIO import StringIO
+
+from chandlerdb.util.Spans import Profiler, Histogram
+
+
+class TestSpans(TestCase):
+    """
+    Span profiler unit tests
+    """
+
+    def testDisabled(self):
+
+        profiler = Profiler()
+        profiler.enter('commit')
+        profiler.exit('commit')
+
+        self.assertEqual(profiler.getStatistics(), {})
+
+    def testNesting(self):
+
+        profiler = Profiler(enabled=True)
+        for i in xrange(3):
+            profiler.enter('commit')
+            profiler.enter('write')
+            profiler.exit('write')
+            profiler.exit('commit')
+
+        # exiting an outer span unwinds the inner one left open
+        profiler.enter('commit')
+        profiler.enter('write')
+        profiler.exit('commit')
+
+        commit = profiler.getStatistics()['commit']
+        self.assertEqual(commit['count'], 4)
+        self.assertEqual(commit['children']['write']['count'], 3)
+        self.assertEqual(profiler._local.spans.stack, [])
+
+    def testPercentiles(self):
+
+        histogram = Histogram()
+        for i in xrange(1, 101):
+            histogram.add(i / 1000.0)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.max, 0.1)
+        for percent, duration in ((50, 0.05), (95, 0.095), (99, 0.099)):
+            estimate = histogram.percentile(percent)
+            self.assert_(duration <= estimate <= duration * 1.2,
+                         (percent, estimate))
+
+    def testSlowOperations(self):
+
+        profiler = Profiler(enabled=True, slowThreshold=0.0, slowCount=3)
+        for name in ('a', 'b', 'c', 'd'):
+            profiler.enter('sync')
+            profiler.enter(name)
+            profiler.exit(name)
+            profiler.exit('sync')
+
+        paths = [path for time, thread, path, duration
+                 in profiler.getSlowOperations()]
+        self.assertEqual(paths, ['sync', 'sync/d', 'sync'])
+
+        profiler.reset()
+        self.assertEqual(profiler.getSlowOperations(), [])
+
+    def testThreads(self):
+
+        profiler = Profiler(enabled=True)
+
+        def run():
+            profiler.enter('refresh')
+            profiler.exit('refresh')
+
+        profiler.enter('commit')
+        threads = [Thread(target=run) for i in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        profiler.exit('commit')
+
+        statistics = profiler.getStatistics()
+        self.assertEqual(statistics['refresh']['count'], 4)
+        self.assertEqual(statistics['commit']['children'], {})
+
+        output = StringIO()
+        profiler.report(output)
+        self.assert_('refresh' in output.getvalue())
+
+        # the timings of exited threads are kept, not their state
+        self.assertEqual(len(profiler._threads), 1)
+        thread = Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(profiler.getStatistics()['refresh']['count'], 5)
+        self.assertEqual(len(profiler._threads), 1)
+
+        profiler.reset()
+        self.assertEqual(profiler.getStatistics(), {})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#   Copyright (c) 2008 Open Source Applications Foundation
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+import os
+from unittest import TestCase, main
+
+from chandlerdb.persistence.DBRepository import DBRepository
+from chandlerdb.persistence.TextContainer import \
+    analyze, parseQuery, encodeNumbers, decodeNumbers, \
+    MUST, SHOULD, MUST_NOT
+from chandlerdb.util.RepositoryTestCase import RepositoryTestCase
+
+
+class TestTextIndex(TestCase):
+    """
+    Native full text index unit tests
+    """
+
+    def testAnalyze(self):
+
+        self.assertEqual(analyze(u"The Quick brown-fox is HERE"),
+                         [u'quick', u'brown', u'fox', u'here'])
+
+    def testNumbers(self):
+
+        numbers = [0, 1, 127, 128, 300, 70000, 2 ** 31]
+        self.assertEqual(decodeNumbers(encodeNumbers(numbers)), numbers)
+        self.assertEqual(len(encodeNumbers([127, 128])), 3)
+
+    def testQuery(self):
+
+        self.assertEqual(parseQuery(u'cat dog'),
+                         ('bool', [(SHOULD, ('term', u'cat')),
+                                   (SHOULD, ('term', u'dog'))]))
+        self.assertEqual(parseQuery(u'cat AND "the black dog" -mouse'),
+                         ('bool', [(MUST, ('term', u'cat')),
+                                   (MUST, ('phrase', [u'black', u'dog'])),
+                                   (MUST_NOT, ('term', u'mouse'))]))
+        self.assertEqual(parseQuery(u'+cat (bird OR NOT e-mail)'),
+                         ('bool', [(MUST, ('term', u'cat')),
+                                   (SHOULD, ('bool', [
+                                       (SHOULD, ('term', u'bird')),
+                                       (MUST_NOT, ('phrase', [u'e', u'mail']))
+                                   ]))]))
+
+    def testStopWords(self):
+
+        self.assertEqual(parseQuery(u'the'), ('bool', []))
+
+
+class TestTextIndexContainer(RepositoryTestCase):
+    """
+    Native full text index repository tests
+    """
+
+    def _openRepository(self, ramdb=True):
+
+        self.rep = DBRepository(os.path.join(self.testdir, '__repository__'))
+
+        self.rep.create(ramdb=self.ramdb, refcounted=True, textindex='native')
+        self.rep.logger.setLevel(self.logLevel)
+
+        self.view = view = self.rep.createView("Test")
+        view.commit()
+
+    def setUp(self):
+
+        super(TestTextIndexContainer, self).setUp()
+        self.loadCineguide(self.view)
+
+        khepburn = self.view.findPath('//CineGuide/KHepburn')
+        self.movies = list(khepburn.movies)
+        self.synopsis = self.movies[0].itsKind.getAttribute('synopsis')
+
+    def _setSynopsis(self, movie, text):
+
+        lobType = movie.getAttributeAspect('synopsis', 'type')
+        movie.synopsis = lobType.makeValue(text, indexed=True)
+
+    def _search(self, query, **kwds):
+
+        return [item for item, name in self.view.searchItems(query, **kwds)]
+
+    def testSearch(self):
+
+        m0, m1, m2 = self.movies[:3]
+        self._setSynopsis(m0, u"A rich heiress falls for a penniless reporter")
+        self._setSynopsis(m1, u"The reporter meets the heiress in Philadelphia")
+        self._setSynopsis(m2, u"Black cats and a dog")
+        self.view.commit()
+
+        self.assertEqual(set(self._search(u'heiress')), set([m0, m1]))
+        self.assertEqual(self._search(u'heiress -philadelphia'), [m0])
+        self.assertEqual(self._search(u'heiress AND dog'), [])
+        self.assertEqual(self._search(u'"penniless reporter"'), [m0])
+        self.assertEqual(self._search(u'"reporter penniless"'), [])
+
+        # attribute filtering
+        self.assertEqual(self._search(u'dog', attribute=self.synopsis), [m2])
+        title = m2.itsKind.getAttribute('title')
+        self.assertEqual(self._search(u'dog', attribute=title), [])
+
+        # documents of values no longer current are not matched
+        self._setSynopsis(m0, u"An aviator crosses the ocean")
+        self.view.commit()
+        self.assertEqual(self._search(u'heiress'), [m1])
+        self.assertEqual(self._search(u'aviator'), [m0])
+
+    def testPaging(self):
+
+        for i, movie in enumerate(self.movies):
+            self._setSynopsis(movie, u"screenplay number %d" %(i))
+        self.view.commit()
+
+        index = self.rep.store._index
+        index.SEARCH_BATCH = 4
+        count = len(self.movies)
+
+        matches = self._search(u'screenplay')
+        self.assertEqual(len(matches), count)
+        self.assertEqual(set(matches), set(self.movies))
+
+        pages = []
+        for offset in xrange(0, count, 10):
+            page = self._search(u'screenplay', offset=offset, limit=10)
+            self.assertEqual(len(page), min(10, count - offset))
+            pages.extend(page)
+        self.assertEqual(pages, matches)
+
+        self.assertEqual(self._search(u'screenplay', offset=count), [])
+
+    def testUndo(self):
+
+        movie = self.movies[0]
+        self._setSynopsis(movie, u"A rich heiress")
+        self.view.commit()
+        self._setSynopsis(movie, u"An aviator")
+        self.view.commit()
+        self.assertEqual(self._search(u'aviator'), [movie])
+
+        self.view.closeView()
+        self.rep.undo()
+        self.view.openView()
+
+        movie = self.view.find(movie.itsUUID)
+        self.assertEqual(self._search(u'aviator'), [])
+        self.assertEqual(self._search(u'heiress'), [movie])
+
+        # the undone document is removed from the posting lists
+        self.assertEqual(self.rep.store._index.readPostings(u'aviator'), {})
+
+    def testPurge(self):
+
+        movie = self.movies[0]
+        self._setSynopsis(movie, u"A rich heiress")
+        self.view.commit()
+        self._setSynopsis(movie, u"An aviator")
+        self.view.commit()
+
+        store = self.rep.store
+        index = store._index
+        documents = len(index._itemDocuments(movie.itsUUID))
+        docCount = index._getInt(index.DOC_COUNT_KEY, '>I')
+        self.assertEqual(len(index.readPostings(u'heiress')), 1)
+
+        class counter(object):
+            documentCount = 0
+
+        txnStatus = store.startTransaction(None, True)
+        try:
+            # only the documents of values no longer current are purged
+            index.purgeDocuments(store.txn, counter, None, None,
+                                 movie.itsUUID, self.view.itsVersion)
+        finally:
+            store.commitTransaction(None, txnStatus)
+
+        self.assert_(counter.documentCount > 0)
+        self.assertEqual(len(index._itemDocuments(movie.itsUUID)),
+                         documents - counter.documentCount)
+        self.assertEqual(self._search(u'aviator'), [movie])
+
+        # purged documents no longer count towards term frequencies
+        self.assertEqual(index.readPostings(u'heiress'), {})
+        self.assertEqual(len(index.readPostings(u'aviator')), 1)
+        self.assertEqual(index._getInt(index.DOC_COUNT_KEY, '>I'),
+                         docCount - counter.documentCount)
+
+        txnStatus = store.startTransaction(None, True)
+        try:
+            index.purgeDocuments(store.txn, counter, None, None,
+                                 movie.itsUUID)
+        finally:
+            store.commitTransaction(None, txnStatus)
+
+        self.assertEqual(index._itemDocuments(movie.itsUUID), [])
+        self.assertEqual(self._search(u'aviator'), [])
+        self.assertEqual(index.readPostings(u'aviator'), {})
+
+
+if __name__ == "__main__":
+    main()